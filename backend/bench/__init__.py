@@ -0,0 +1 @@
+"""benchmarks for backend startup and hot paths"""
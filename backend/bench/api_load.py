@@ -0,0 +1,582 @@
+"""
+API load test and latency benchmark
+
+Runs the API app from btrixcloud.main against a local MongoDB and a local
+S3 stand-in (eg. `moto_server -p 5000` or minio), generates orgs with
+crawls, pages, logs and collections, and drives hot endpoints with
+concurrent requests, recording throughput and tail latency per endpoint.
+Reports can be saved as json and compared against a previous run.
+
+Only the k8s client is replaced, the benchmarked endpoints do not use it.
+
+Usage (from backend/), each in a separate shell:
+
+    python -m bench.api_load serve [--port 8000]
+    python -m bench.api_load generate [--orgs N] [--crawls N] [--pages N]
+                                      [--logs N] [--collections N]
+    python -m bench.api_load run [--concurrency N] [--duration SECS]
+                                 [--endpoint NAME ...] [--output FILE]
+                                 [--compare BASELINE_FILE]
+
+Mongo is configured with MONGO_DB_URL, or MONGO_HOST,
+MONGO_INITDB_ROOT_USERNAME and MONGO_INITDB_ROOT_PASSWORD (default
+localhost, root / example). The S3 endpoint is set with BENCH_S3_ENDPOINT
+(default http://127.0.0.1:5000/).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Callable
+
+import aiohttp
+
+SUPERUSER_EMAIL = "bench-admin@example.com"
+SUPERUSER_PASSWORD = "bench-PASSWORD-1234"
+
+ORG_SLUG_PREFIX = "bench-org-"
+
+S3_ENDPOINT = os.environ.get("BENCH_S3_ENDPOINT") or "http://127.0.0.1:5000/"
+S3_BUCKET = "btrix-bench"
+
+# endpoint name -> path template, filled in from targets of generated data
+ENDPOINTS: dict[str, str] = {
+    "list_crawls": "/api/orgs/{oid}/crawls?pageSize=50",
+    "list_pages": "/api/orgs/{oid}/crawls/{crawl_id}/pages?pageSize=50",
+    "crawl_errors": "/api/orgs/{oid}/crawls/{crawl_id}/errors?pageSize=50",
+    "list_workflows": "/api/orgs/{oid}/crawlconfigs?pageSize=50",
+    "list_collections": "/api/orgs/{oid}/collections?pageSize=50",
+    "collection_replay_json": "/api/orgs/{oid}/collections/{coll_id}/replay.json",
+    "org_metrics": "/api/orgs/{oid}/metrics",
+}
+
+
+# ============================================================================
+def setup_env(tmpdir: str) -> None:
+    """env and config files for running the api and generator locally"""
+    os.environ.setdefault("MONGO_HOST", "localhost")
+    os.environ.setdefault("MONGO_INITDB_ROOT_USERNAME", "root")
+    os.environ.setdefault("MONGO_INITDB_ROOT_PASSWORD", "example")
+
+    os.environ.setdefault("SUPERUSER_EMAIL", SUPERUSER_EMAIL)
+    os.environ.setdefault("SUPERUSER_PASSWORD", SUPERUSER_PASSWORD)
+    os.environ.setdefault("PASSWORD_SECRET", "bench-password-secret")
+    os.environ.setdefault("DEFAULT_CRAWL_FILENAME_TEMPLATE", "@ts-@hostsuffix.wacz")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    # checked by main, k8s access itself is replaced in serve
+    os.environ.setdefault("KUBERNETES_SERVICE_HOST", "bench-offline")
+
+    configs = {
+        "STORAGES_JSON": [
+            {
+                "name": "default",
+                "type": "s3",
+                "access_key": "bench",
+                "secret_key": "bench-secret",
+                "bucket_name": S3_BUCKET,
+                "endpoint_url": S3_ENDPOINT,
+                "is_default_primary": True,
+            }
+        ],
+        "CRAWLER_CHANNELS_JSON": [
+            {"id": "default", "image": "webrecorder/browsertrix-crawler:latest"}
+        ],
+    }
+    for env_name, data in configs.items():
+        path = os.path.join(tmpdir, env_name.lower() + ".json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.environ.setdefault(env_name, path)
+
+    os.environ.setdefault("CRAWLER_PROXIES_JSON", os.path.join(tmpdir, "proxies.json"))
+    os.environ.setdefault(
+        "CRAWLER_PROXIES_LAST_UPDATE", os.path.join(tmpdir, "proxies-ts")
+    )
+
+
+# ============================================================================
+def serve(args) -> int:
+    """prepare db as the migrations init container does, then run api"""
+    # pylint: disable=import-outside-toplevel
+    import uvicorn
+    from kubernetes_asyncio import config
+
+    # no cluster, endpoints that need k8s will fail
+    config.load_incluster_config = lambda *_args, **_kwargs: None
+
+    from btrixcloud import main_migrations
+
+    if asyncio.run(main_migrations.main()):
+        return 1
+
+    uvicorn.run(
+        "btrixcloud.main:app_root",
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+        access_log=False,
+    )
+    return 0
+
+
+# ============================================================================
+async def ensure_bucket() -> None:
+    """create bucket on s3 stand-in, if not already present"""
+    # pylint: disable=import-outside-toplevel
+    from aiobotocore.session import get_session
+
+    session = get_session()
+    async with session.create_client(
+        "s3",
+        endpoint_url=S3_ENDPOINT,
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench-secret",
+        region_name="us-east-1",
+    ) as client:
+        try:
+            await client.create_bucket(Bucket=S3_BUCKET)
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            if "BucketAlready" not in str(exc):
+                raise
+
+
+# pylint: disable=too-many-locals, too-many-arguments
+async def generate(
+    mdb,
+    num_orgs: int,
+    num_crawls: int,
+    num_pages: int,
+    num_logs: int,
+    num_collections: int,
+    batch_size: int = 1000,
+) -> dict[str, int]:
+    """insert generated orgs with workflows, crawls, pages, logs and
+    collections, return number of documents inserted per collection"""
+    # pylint: disable=import-outside-toplevel
+    from btrixcloud.models import (
+        Collection,
+        Crawl,
+        CrawlConfig,
+        CrawlFile,
+        CrawlLogLine,
+        CrawlStats,
+        Organization,
+        Page,
+        RawCrawlConfig,
+        Seed,
+        StorageRef,
+        UserRole,
+    )
+    from btrixcloud.utils import dt_now
+
+    counts: dict[str, int] = {}
+
+    async def insert(coll_name: str, docs: list[dict], force=False) -> None:
+        if docs and (force or len(docs) >= batch_size):
+            await mdb[coll_name].insert_many(docs, ordered=False)
+            counts[coll_name] = counts.get(coll_name, 0) + len(docs)
+            docs.clear()
+
+    user = await mdb["users"].find_one({"email": SUPERUSER_EMAIL})
+    userid = user["_id"] if user else uuid.uuid4()
+
+    storage = StorageRef(name="default")
+    now = dt_now()
+    page_size = 20_000
+    file_size = 50_000_000
+
+    for org_num in range(num_orgs):
+        oid = uuid.uuid4()
+        slug = f"{ORG_SLUG_PREFIX}{org_num}"
+        await mdb["organizations"].delete_many({"slug": slug})
+
+        colls = [
+            Collection(
+                id=uuid.uuid4(),
+                name=f"Bench Collection {num}",
+                slug=f"bench-collection-{num}",
+                oid=oid,
+                created=now,
+                modified=now,
+            )
+            for num in range(num_collections)
+        ]
+
+        workflows: list[dict] = []
+        crawls: list[dict] = []
+        pages: list[dict] = []
+        logs: list[dict] = []
+
+        for crawl_num in range(num_crawls):
+            seed = f"https://example-{crawl_num}.com/"
+            config = RawCrawlConfig(seeds=[Seed(url=seed)])
+            started = now - timedelta(days=crawl_num, hours=1)
+            finished = now - timedelta(days=crawl_num)
+            crawl_id = f"bench-{org_num}-{crawl_num:05d}"
+
+            coll = colls[crawl_num % num_collections] if colls else None
+            if coll:
+                coll.crawlCount = (coll.crawlCount or 0) + 1
+                coll.pageCount = (coll.pageCount or 0) + num_pages
+                coll.totalSize = (coll.totalSize or 0) + file_size
+
+            workflow = CrawlConfig(
+                id=uuid.uuid4(),
+                name=f"Bench Workflow {crawl_num}",
+                oid=oid,
+                created=started,
+                createdBy=userid,
+                modified=started,
+                modifiedBy=userid,
+                config=config,
+                crawlCount=1,
+                crawlSuccessfulCount=1,
+                lastCrawlId=crawl_id,
+                lastCrawlState="complete",
+                lastCrawlStartTime=started,
+                lastCrawlTime=finished,
+                totalSize=file_size,
+            )
+            workflows.append(workflow.to_dict())
+
+            crawl = Crawl(
+                id=crawl_id,
+                type="crawl",
+                oid=oid,
+                cid=workflow.id,
+                userid=userid,
+                config=config,
+                started=started,
+                finished=finished,
+                state="complete",
+                stats=CrawlStats(found=num_pages, done=num_pages, size=file_size),
+                files=[
+                    CrawlFile(
+                        filename=f"{oid}/{crawl_id}.wacz",
+                        hash="sha256:" + "0" * 64,
+                        size=file_size,
+                        storage=storage,
+                    )
+                ],
+                fileSize=file_size,
+                fileCount=1,
+                pageCount=num_pages,
+                uniquePageCount=num_pages,
+                collectionIds=[coll.id] if coll else [],
+            )
+            crawls.append(crawl.to_dict())
+
+            for page_num in range(num_pages):
+                page = Page(
+                    id=uuid.uuid4(),
+                    oid=oid,
+                    crawl_id=crawl_id,
+                    url=f"{seed}page/{page_num}",
+                    title=f"Page {page_num}",
+                    ts=started + timedelta(seconds=page_num),
+                    loadState=4,
+                    status=200 if page_num % 20 else 404,
+                    mime="text/html",
+                    filename=f"rec-{crawl_id}-0.warc.gz",
+                    depth=min(page_num, 3),
+                    isSeed=page_num == 0,
+                )
+                page.compute_page_type()
+                pages.append(page.to_dict())
+                await insert("pages", pages)
+
+            for log_num in range(num_logs):
+                log = CrawlLogLine(
+                    id=uuid.uuid4(),
+                    crawlId=crawl_id,
+                    oid=oid,
+                    timestamp=started + timedelta(seconds=log_num),
+                    logLevel="error" if log_num % 2 else "warn",
+                    context="general" if log_num % 3 else "behaviorScript",
+                    message=f"Bench log message {log_num}",
+                    details={"page": f"{seed}page/{log_num}"},
+                )
+                logs.append(log.to_dict())
+                await insert("crawl_logs", logs)
+
+            await insert("crawl_configs", workflows)
+            await insert("crawls", crawls)
+
+        for coll_name, docs in (
+            ("crawl_configs", workflows),
+            ("crawls", crawls),
+            ("pages", pages),
+            ("crawl_logs", logs),
+        ):
+            await insert(coll_name, docs, force=True)
+
+        await insert("collections", [coll.to_dict() for coll in colls], force=True)
+
+        org = Organization(
+            id=oid,
+            name=f"Bench Org {org_num}",
+            slug=slug,
+            users={str(userid): UserRole.OWNER},
+            storage=storage,
+            bytesStored=file_size * num_crawls,
+            bytesStoredCrawls=file_size * num_crawls,
+        )
+        await insert("organizations", [org.to_dict()], force=True)
+
+    return counts
+
+
+async def run_generate(args) -> int:
+    """generate data in configured mongo"""
+    # pylint: disable=import-outside-toplevel
+    from btrixcloud.db import init_db
+
+    if not args.no_bucket:
+        await ensure_bucket()
+
+    _, mdb = init_db()
+    start = time.perf_counter()
+    counts = await generate(
+        mdb, args.orgs, args.crawls, args.pages, args.logs, args.collections
+    )
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"inserted": counts, "seconds": round(elapsed, 1)}, indent=2))
+    return 0
+
+
+# ============================================================================
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """nearest-rank percentile of sorted values"""
+    index = max(math.ceil(len(sorted_values) * pct / 100) - 1, 0)
+    return sorted_values[index]
+
+
+async def login(session: aiohttp.ClientSession, base_url: str) -> str:
+    """log in as superuser, return bearer token"""
+    async with session.post(
+        f"{base_url}/api/auth/jwt/login",
+        data={
+            "username": os.environ.get("SUPERUSER_EMAIL", SUPERUSER_EMAIL),
+            "password": os.environ.get("SUPERUSER_PASSWORD", SUPERUSER_PASSWORD),
+        },
+    ) as resp:
+        resp.raise_for_status()
+        return (await resp.json())["access_token"]
+
+
+async def get_targets(
+    session: aiohttp.ClientSession, base_url: str, max_targets: int
+) -> list[dict[str, str]]:
+    """ids of generated orgs, crawls and collections to request"""
+
+    async def get_items(path: str) -> list[dict[str, Any]]:
+        async with session.get(f"{base_url}{path}") as resp:
+            resp.raise_for_status()
+            return (await resp.json())["items"]
+
+    targets = []
+    for org in await get_items("/api/orgs?pageSize=1000"):
+        if not org["slug"].startswith(ORG_SLUG_PREFIX):
+            continue
+
+        oid = org["id"]
+        crawls = await get_items(f"/api/orgs/{oid}/crawls?pageSize={max_targets}")
+        colls = await get_items(f"/api/orgs/{oid}/collections?pageSize={max_targets}")
+        for num, crawl in enumerate(crawls):
+            targets.append(
+                {
+                    "oid": oid,
+                    "crawl_id": crawl["id"],
+                    "coll_id": colls[num % len(colls)]["id"] if colls else "",
+                }
+            )
+
+    return targets
+
+
+async def load_endpoint(
+    session: aiohttp.ClientSession,
+    make_url: Callable[[int], str],
+    concurrency: int,
+    duration: float,
+    warmup: int,
+) -> dict[str, Any]:
+    """request endpoint from concurrent workers for duration, return stats"""
+    for num in range(warmup):
+        async with session.get(make_url(num)) as resp:
+            await resp.read()
+
+    times: list[float] = []
+    errors: dict[str, int] = {}
+    counter = iter(range(sys.maxsize))
+    end = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < end:
+            url = make_url(next(counter))
+            start = time.perf_counter()
+            try:
+                async with session.get(url) as resp:
+                    await resp.read()
+                    status = resp.status
+            except aiohttp.ClientError as exc:
+                status = type(exc).__name__
+
+            times.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    times.sort()
+    if not times:
+        return {"requests": 0, "errors": errors}
+
+    return {
+        "requests": len(times),
+        "errors": errors,
+        "rps": round(len(times) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(times), 2),
+        "p50_ms": round(percentile(times, 50), 2),
+        "p95_ms": round(percentile(times, 95), 2),
+        "p99_ms": round(percentile(times, 99), 2),
+        "max_ms": round(times[-1], 2),
+    }
+
+
+async def run_load(args) -> dict[str, Any]:
+    """log in, find targets and load each endpoint in turn"""
+    base_url = args.url.rstrip("/")
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        token = await login(session, base_url)
+        session.headers["Authorization"] = f"Bearer {token}"
+
+        targets = await get_targets(session, base_url, args.max_targets)
+        if not targets:
+            raise RuntimeError("no generated data found, run generate first")
+
+        results = {}
+        for name in args.endpoint or ENDPOINTS:
+            template = ENDPOINTS[name]
+
+            def make_url(num: int, template=template) -> str:
+                return base_url + template.format(**targets[num % len(targets)])
+
+            results[name] = await load_endpoint(
+                session, make_url, args.concurrency, args.duration, args.warmup
+            )
+            print(f"{name}: {results[name]}", file=sys.stderr)
+
+    return {
+        "meta": {
+            "url": base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "targets": len(targets),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "endpoints": results,
+    }
+
+
+# ============================================================================
+def print_report(report: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    """print endpoint stats, with change from baseline if provided"""
+    base = (baseline or {}).get("endpoints", {})
+
+    def change(name: str, field: str) -> str:
+        prev = base.get(name, {}).get(field)
+        value = report["endpoints"][name].get(field)
+        if not prev or value is None:
+            return ""
+        return f"({(value - prev) / prev * 100:+.0f}%)"
+
+    print(
+        f"{'endpoint':<26}{'reqs':>7}{'err':>6}{'rps':>16}"
+        f"{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}"
+    )
+    for name, res in report["endpoints"].items():
+        errors = sum(res.get("errors", {}).values())
+        cols = [
+            f"{res.get(field, '-')} {change(name, field)}".strip()
+            for field in ("rps", "p50_ms", "p95_ms", "p99_ms")
+        ]
+        print(
+            f"{name:<26}{res['requests']:>7}{errors:>6}{cols[0]:>16}"
+            f"{cols[1]:>18}{cols[2]:>18}{cols[3]:>18}"
+        )
+
+
+def main() -> int:
+    """run command"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_cmd = commands.add_parser("serve", help="prepare db and run api")
+    serve_cmd.add_argument("--host", default="127.0.0.1")
+    serve_cmd.add_argument("--port", type=int, default=8000)
+
+    gen_cmd = commands.add_parser("generate", help="generate orgs and data")
+    gen_cmd.add_argument("--orgs", type=int, default=2)
+    gen_cmd.add_argument("--crawls", type=int, default=50)
+    gen_cmd.add_argument("--pages", type=int, default=200, help="per crawl")
+    gen_cmd.add_argument("--logs", type=int, default=100, help="per crawl")
+    gen_cmd.add_argument("--collections", type=int, default=5, help="per org")
+    gen_cmd.add_argument("--no-bucket", action="store_true")
+
+    run_cmd = commands.add_parser("run", help="load endpoints and report")
+    run_cmd.add_argument("--url", default="http://127.0.0.1:8000")
+    run_cmd.add_argument("--concurrency", type=int, default=8)
+    run_cmd.add_argument("--duration", type=float, default=10)
+    run_cmd.add_argument("--warmup", type=int, default=5)
+    run_cmd.add_argument("--max-targets", type=int, default=50)
+    run_cmd.add_argument("--endpoint", action="append", choices=list(ENDPOINTS))
+    run_cmd.add_argument("--output", help="save report as json")
+    run_cmd.add_argument("--compare", help="baseline report to compare with")
+    run_cmd.add_argument("--json", action="store_true")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_env(tmpdir)
+
+        if args.command == "serve":
+            return serve(args)
+
+        if args.command == "generate":
+            return asyncio.run(run_generate(args))
+
+        report = asyncio.run(run_load(args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+
+    print_report(report, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
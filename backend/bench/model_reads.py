@@ -0,0 +1,146 @@
+"""
+Microbenchmark for reading mongo documents into models on list endpoints
+
+Compares per-item cost of BaseMongoModel.from_dict, which validates every
+field, with from_dict_trusted used on the hot list endpoints, both for the
+read alone and for the read plus response validation and serialization as
+done by FastAPI for the endpoint's response model. Documents are generated
+as by bench.api_load, no database is needed.
+
+Usage (from backend/):
+
+    python -m bench.model_reads [--items N] [--rounds N] [--json]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any
+from uuid import uuid4
+
+from pydantic import TypeAdapter
+
+from bench.api_load import generate
+from bench.standins import MemoryDB
+from btrixcloud.models import (
+    CollOut,
+    CrawlLogLine,
+    CrawlOut,
+    PageOut,
+    PageOutWithSingleQA,
+)
+
+
+# ============================================================================
+def make_docs(num_items: int) -> dict[str, tuple[type, list[dict[str, Any]]]]:
+    """generated documents for each list endpoint model"""
+    mdb = MemoryDB()
+    num_crawls = max(num_items // 50, 1)
+    asyncio.run(
+        generate(mdb, 1, num_crawls, 50, 50, max(num_crawls // 10, 1), batch_size=1000)
+    )
+
+    pages = list(mdb["pages"].docs.values())[:num_items]
+    qa_pages = []
+    for page in pages:
+        page = copy.deepcopy(page)
+        page["qa"] = {
+            "screenshotMatch": 0.92,
+            "textMatch": 0.88,
+            "resourceCounts": {"crawlGood": 40, "crawlBad": 1, "replayGood": 39},
+        }
+        page["notes"] = [
+            {
+                "id": uuid4(),
+                "text": "checked",
+                "created": datetime.now(),
+                "userid": uuid4(),
+                "userName": "bench",
+            }
+        ]
+        qa_pages.append(page)
+
+    colls = []
+    for coll in mdb["collections"].docs.values():
+        colls.append({**coll, "orgName": "Bench Org", "orgPublicProfile": False})
+
+    crawls = []
+    for crawl in mdb["crawls"].docs.values():
+        crawl = {**crawl, "crawlerChannel": "default"}
+        crawl.pop("files", None)
+        crawls.append(crawl)
+
+    return {
+        "pages": (PageOut, pages),
+        "pages_with_qa": (PageOutWithSingleQA, qa_pages),
+        "crawls": (CrawlOut, crawls),
+        "collections": (CollOut, colls),
+        "crawl_logs": (CrawlLogLine, list(mdb["crawl_logs"].docs.values())[:num_items]),
+    }
+
+
+def run(cls: type, docs: list[dict[str, Any]], rounds: int, trusted: bool):
+    """return read and read + response microseconds per item"""
+    read = cls.from_dict_trusted if trusted else cls.from_dict
+    response = TypeAdapter(list[cls])
+
+    read_secs = 0.0
+    total_secs = 0.0
+    for _ in range(rounds):
+        # from_dict modifies the dict, as motor returns new dicts each time
+        batch = [dict(doc) for doc in docs]
+
+        start = time.perf_counter()
+        items = [read(doc) for doc in batch]
+        read_secs += time.perf_counter() - start
+
+        response.dump_python(response.validate_python(items), mode="json")
+        total_secs += time.perf_counter() - start
+
+    count = len(docs) * rounds
+    return {
+        "read_us": round(read_secs / count * 1e6, 2),
+        "total_us": round(total_secs / count * 1e6, 2),
+    }
+
+
+def main() -> int:
+    """run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (cls, docs) in make_docs(args.items).items():
+        results[name] = {
+            "items": len(docs),
+            "from_dict": run(cls, docs, args.rounds, trusted=False),
+            "trusted": run(cls, docs, args.rounds, trusted=True),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print("microseconds per item, read only / read + response")
+    print(f"{'model':<16}{'items':>7}{'from_dict':>20}{'trusted':>20}")
+    for name, res in results.items():
+        before = res["from_dict"]
+        after = res["trusted"]
+        print(
+            f"{name:<16}{res['items']:>7}"
+            f"{before['read_us']:>10} /{before['total_us']:>8}"
+            f"{after['read_us']:>10} /{after['total_us']:>8}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Benchmark for rendering crawl child objects in the operator
+
+Measures the part of each CrawlOperator.sync_crawls call that renders the
+redis and crawler pod templates for simulated running crawls, with and
+without the per-crawl cache of rendered objects. Templates are loaded from
+chart/app-templates, no k8s cluster, database or redis is needed.
+
+Usage (from backend/):
+
+    python -m bench.operator_render [--crawls N] [--rounds N] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import jinja2
+
+from btrixcloud.models import Organization, StorageRef
+from btrixcloud.operator.crawls import POD, CrawlOperator
+from btrixcloud.operator.models import CrawlSpec, CrawlStatus
+
+APP_TEMPLATES_DIR = Path(__file__).resolve().parents[2] / "chart" / "app-templates"
+
+# typical values from chart config.yaml
+SHARED_PARAMS = {
+    "namespace": "crawlers",
+    "termination_grace_secs": "600",
+    "volume_storage_class": "",
+    "redis_image": "redis",
+    "redis_image_pull_policy": "IfNotPresent",
+    "redis_cpu": "0.2",
+    "redis_memory": "200Mi",
+    "redis_storage": "3Gi",
+    "crawler_image_pull_policy": "IfNotPresent",
+    "crawler_browser_instances": "2",
+    "qa_browser_instances": "1",
+    "crawler_cpu": "1.2",
+    "crawler_memory": "2400Mi",
+    "crawler_storage": "26Gi",
+    "crawler_workers": 2,
+    "crawler_liveness_port": "6065",
+    "crawler_uid": "201407",
+    "crawler_gid": "201407",
+    "crawler_fsgroup": "201407",
+    "crawler_node_type": "",
+    "redis_node_type": "",
+    "signing_secret": "",
+}
+
+
+# ============================================================================
+def make_operator() -> CrawlOperator:
+    """create operator with only what is needed to render crawl children"""
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(str(APP_TEMPLATES_DIR)), autoescape=False
+    )
+    operator = CrawlOperator.__new__(CrawlOperator)
+    operator.k8s = SimpleNamespace(  # type: ignore
+        templates=SimpleNamespace(env=env),
+        shared_params=SHARED_PARAMS,
+        enable_auto_resize=False,
+        max_crawler_memory_size=0,
+        max_redis_memory_size=0,
+    )
+    operator.rendered = {}
+    return operator
+
+
+def make_crawls(num_crawls: int) -> list[tuple[CrawlSpec, CrawlStatus, int]]:
+    """simulated running crawls, with 1 to 4 crawler pods each"""
+    org = Organization(
+        id=uuid.uuid4(), name="bench", slug="bench", storage=StorageRef(name="default")
+    )
+    crawls = []
+    for i in range(num_crawls):
+        crawl = CrawlSpec(
+            id=f"bench-crawl-{i}",
+            cid=uuid.uuid4(),
+            oid=org.id,
+            org=org,
+            storage=StorageRef(name="default"),
+            started="2026-01-01T00:00:00Z",
+            crawler_channel="default",
+        )
+        browser_windows = 2 * (i % 4 + 1)
+        status = CrawlStatus(state="running", pagesFound=1000)
+        status.desiredScale = browser_windows // 2
+        crawls.append((crawl, status, browser_windows))
+
+    return crawls
+
+
+def render_crawl(
+    operator: CrawlOperator, crawl: CrawlSpec, status: CrawlStatus, windows: int
+) -> list[Any]:
+    """render children for one crawl sync, as done in sync_crawls"""
+    params: dict[str, Any] = dict(SHARED_PARAMS)
+    params.update(
+        id=crawl.id,
+        cid=str(crawl.cid),
+        oid=str(crawl.oid),
+        userid="",
+        crawler_image="webrecorder/browsertrix-crawler:latest",
+        storage_path=f"{crawl.oid}/",
+        storage_secret="storage-default",
+        storage_filename="@ts-@hostsuffix.wacz",
+        redis_url=f"redis://redis-{crawl.id}.redis.crawlers/0",
+        redis_dedupe_url="",
+        force_restart=False,
+    )
+    children = {POD: {}}
+
+    objs = operator._load_redis(params, status, crawl, children)
+    for i in range(status.desiredScale):
+        objs.extend(
+            operator._load_crawler(params, i, windows, status, children, False, False)
+        )
+    return objs
+
+
+def run(num_crawls: int, rounds: int, cached: bool) -> dict[str, Any]:
+    """sync all crawls for each round, return per-sync latency in ms"""
+    operator = make_operator()
+    crawls = make_crawls(num_crawls)
+    times = []
+    num_objs = 0
+
+    for _ in range(rounds):
+        for crawl, status, windows in crawls:
+            if not cached:
+                operator.clear_rendered(crawl.id)
+
+            start = time.perf_counter()
+            num_objs = len(render_crawl(operator, crawl, status, windows))
+            times.append((time.perf_counter() - start) * 1000)
+
+    times.sort()
+    return {
+        "syncs": len(times),
+        "objects_per_sync": num_objs,
+        "p50_ms": round(statistics.median(times), 3),
+        "p99_ms": round(times[int(len(times) * 0.99) - 1], 3),
+        "total_ms": round(sum(times), 1),
+    }
+
+
+def main() -> int:
+    """run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--crawls", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "uncached": run(args.crawls, args.rounds, cached=False),
+        "cached": run(args.crawls, args.rounds, cached=True),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{args.crawls} crawls x {args.rounds} syncs")
+    print(f"{'mode':<12}{'p50 ms':>10}{'p99 ms':>10}{'total ms':>12}")
+    for mode, res in results.items():
+        print(
+            f"{mode:<12}{res['p50_ms']:>10}{res['p99_ms']:>10}{res['total_ms']:>12}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
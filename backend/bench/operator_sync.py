@@ -0,0 +1,556 @@
+"""
+Offline benchmark for operator sync handlers
+
+Replays synthetic metacontroller sync payloads against the crawl, cronjob
+and collection index operators, without a k8s cluster, mongo or redis:
+databases are replaced with the in-memory stand-ins in bench.standins and
+templates are loaded from chart/app-templates. Each run syncs N crawls with
+M crawler pods each for a number of rounds, feeding the status returned by
+one sync into the next as metacontroller does.
+
+Reports p50 / p99 sync latency, cpu time per sync and mongo / redis calls
+per sync for each handler.
+
+Usage (from backend/):
+
+    python -m bench.operator_sync [--crawls N] [--pods M] [--rounds R]
+                                  [--pages-per-sync P] [--json]
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from fastapi.templating import Jinja2Templates
+
+from .standins import CallCounter, MemoryDB, MemoryRedisServer
+
+APP_TEMPLATES_DIR = Path(__file__).resolve().parents[2] / "chart" / "app-templates"
+
+# typical values from chart config.yaml
+SHARED_PARAMS = {
+    "namespace": "crawlers",
+    "termination_grace_secs": "600",
+    "volume_storage_class": "",
+    "redis_image": "redis",
+    "redis_image_pull_policy": "IfNotPresent",
+    "redis_cpu": "0.2",
+    "redis_memory": "200Mi",
+    "redis_storage": "3Gi",
+    "dedupe_storage": "1Gi",
+    "dedupe_memory": "1Gi",
+    "dedupe_cpu": "0.5",
+    "dedupe_idle_secs": 60,
+    "dedupe_use_kvrocks": True,
+    "dedupe_image": "kvrocks",
+    "dedupe_image_pull_policy": "IfNotPresent",
+    "crawler_image_pull_policy": "IfNotPresent",
+    "crawler_browser_instances": "2",
+    "qa_browser_instances": "1",
+    "crawler_cpu_base": "900m",
+    "crawler_memory_base": "1024Mi",
+    "crawler_extra_cpu_per_browser": "600m",
+    "crawler_extra_memory_per_browser": "768Mi",
+    "crawler_storage": "26Gi",
+    "crawler_liveness_port": "6065",
+    "crawler_uid": "201407",
+    "crawler_gid": "201407",
+    "crawler_fsgroup": "201407",
+    "crawler_node_type": "",
+    "redis_node_type": "",
+    "signing_secret": "",
+}
+
+
+# ============================================================================
+def setup_env(tmpdir: str) -> None:
+    """config files and env needed to create the ops classes"""
+    paths = {
+        "STORAGES_JSON": [
+            {
+                "name": "default",
+                "type": "s3",
+                "access_key": "access",
+                "secret_key": "secret",
+                "bucket_name": "btrix-data",
+                "endpoint_url": "http://local-minio.default:9000/",
+                "is_default_primary": True,
+            }
+        ],
+        "CRAWLER_CHANNELS_JSON": [
+            {"id": "default", "image": "webrecorder/browsertrix-crawler:latest"}
+        ],
+    }
+    for env_name, data in paths.items():
+        path = os.path.join(tmpdir, env_name.lower() + ".json")
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.environ[env_name] = path
+
+    os.environ["CRAWLER_PROXIES_JSON"] = os.path.join(tmpdir, "proxies.json")
+    os.environ["CRAWLER_PROXIES_LAST_UPDATE"] = os.path.join(tmpdir, "proxies-ts")
+    os.environ.setdefault("DEFAULT_CRAWL_FILENAME_TEMPLATE", "@ts-@hostsuffix.wacz")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+    # pylint: disable=import-outside-toplevel
+    from btrixcloud.logger import init_logging
+
+    init_logging()
+
+
+# ============================================================================
+def make_k8s(redis_server: MemoryRedisServer, counter: CallCounter):
+    """operator k8s api with cluster access replaced by in-memory stand-ins"""
+    # pylint: disable=import-outside-toplevel
+    from btrixcloud.operator.baseoperator import K8sOpAPI
+
+    # pylint: disable=too-few-public-methods
+    class OfflineK8sOpAPI(K8sOpAPI):
+        """k8s api without a cluster, k8s calls are only counted"""
+
+        # pylint: disable=super-init-not-called
+        def __init__(self):
+            self.namespace = "crawlers"
+            self.crawler_fqdn_suffix = ".crawlers.svc.cluster.local"
+            self.custom_resources = {}
+            self.templates = Jinja2Templates(
+                directory=str(APP_TEMPLATES_DIR), autoescape=False
+            )
+            self.shared_params = dict(SHARED_PARAMS)
+
+            self.has_pod_metrics = False
+            self.enable_auto_resize = False
+            self.max_crawler_memory_size = 0
+            self.max_redis_memory_size = 0
+            self.crawler_browser_slots = 0
+            self.compute_crawler_resources()
+
+        async def get_redis_client(self, redis_url):
+            return redis_server.get(redis_url)
+
+        def __getattribute__(self, name: str) -> Any:
+            value = super().__getattribute__(name)
+            if name in K8S_CALLS:
+
+                async def k8s_call(*_args, **_kwargs):
+                    counter.count("k8s", name)
+
+                return k8s_call
+            return value
+
+    return OfflineK8sOpAPI()
+
+
+# k8s api calls that would reach the cluster
+K8S_CALLS = {
+    "create_or_update_coll_index",
+    "delete_crawl_job",
+    "delete_custom_object",
+    "get_pod_logs",
+    "print_pod_logs",
+    "send_signal_to_pod",
+    "unsuspend_k8s_job",
+}
+
+
+# ============================================================================
+class Harness:
+    """operators backed by in-memory stand-ins, with synthetic payloads"""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, num_crawls: int, num_pods: int, pages_per_sync: int):
+        # pylint: disable=import-outside-toplevel
+        from btrixcloud.operator import CollIndexOperator, CrawlOperator
+        from btrixcloud.operator import CronJobOperator
+        from btrixcloud.ops import Ops
+
+        self.num_crawls = num_crawls
+        self.num_pods = num_pods
+        self.pages_per_sync = pages_per_sync
+
+        self.counter = CallCounter()
+        self.mdb = MemoryDB(self.counter)
+        self.redis = MemoryRedisServer(self.counter)
+        self.k8s = make_k8s(self.redis, self.counter)
+
+        ops = Ops()
+        ops.dbclient = self.mdb  # type: ignore
+        ops.mdb = self.mdb  # type: ignore
+        ops.crawl_manager = self.k8s  # type: ignore
+
+        args = (
+            self.k8s,
+            ops.crawl_config_ops,
+            ops.crawl_ops,
+            ops.org_ops,
+            ops.coll_ops,
+            ops.storage_ops,
+            ops.event_webhook_ops,
+            ops.background_job_ops,
+            ops.page_ops,
+            ops.crawl_log_ops,
+            ops.file_ops,
+        )
+        self.crawl_operator = CrawlOperator(*args)
+        self.cronjob_operator = CronJobOperator(*args)
+        self.index_operator = CollIndexOperator(*args)
+
+        self.crawl_payloads: list[dict] = []
+        self.cronjob_payloads: list[dict] = []
+        self.index_payloads: list[dict] = []
+
+    async def seed(self) -> None:
+        """create org, workflows, crawls, collections and sync payloads"""
+        # pylint: disable=import-outside-toplevel
+        from btrixcloud.models import (
+            Collection,
+            Crawl,
+            CrawlConfig,
+            Organization,
+            RawCrawlConfig,
+            Seed,
+            StorageRef,
+        )
+        from btrixcloud.utils import date_to_str, dt_now
+
+        org = Organization(
+            id=uuid.uuid4(),
+            name="Bench Org",
+            slug="bench-org",
+            storage=StorageRef(name="default"),
+        )
+        await self.mdb["organizations"].insert_one(org.to_dict())
+
+        userid = uuid.uuid4()
+        started = dt_now() - timedelta(minutes=10)
+        config = RawCrawlConfig(seeds=[Seed(url="https://example.com/")])
+
+        for i in range(self.num_crawls):
+            crawl_id = f"bench-{i:04d}"
+            workflow = CrawlConfig(
+                id=uuid.uuid4(),
+                name=f"Workflow {i}",
+                oid=org.id,
+                created=started,
+                createdBy=userid,
+                modifiedBy=userid,
+                config=config,
+                browserWindows=self.num_pods * 2,
+                lastCrawlId=crawl_id,
+                lastCrawlState="running",
+            )
+            await self.mdb["crawl_configs"].insert_one(workflow.to_dict())
+
+            crawl = Crawl(
+                id=crawl_id,
+                oid=org.id,
+                cid=workflow.id,
+                userid=userid,
+                config=config,
+                started=started,
+                state="running",
+                browserWindows=self.num_pods * 2,
+            )
+            await self.mdb["crawls"].insert_one(crawl.to_dict())
+            await self.seed_crawl_redis(crawl_id)
+
+            self.crawl_payloads.append(
+                self.crawl_payload(crawl_id, workflow.id, org.id, date_to_str(started))
+            )
+            self.cronjob_payloads.append(
+                self.cronjob_payload(crawl_id, workflow.id, org.id, userid)
+            )
+
+            if i % 10 == 0:
+                coll = Collection(
+                    id=uuid.uuid4(),
+                    name=f"Collection {i}",
+                    slug=f"collection-{i}",
+                    oid=org.id,
+                    indexState="ready",
+                )
+                await self.mdb["collections"].insert_one(coll.to_dict())
+                self.index_payloads.append(self.index_payload(coll.id, org.id))
+
+    async def seed_crawl_redis(self, crawl_id: str) -> None:
+        """crawler state in redis for running crawl"""
+        redis = self.redis.get(self.k8s.get_redis_url(crawl_id))
+        for i in range(self.num_pods):
+            await redis.hset(f"{crawl_id}:status", f"crawl-{crawl_id}-{i}", "running")
+            await redis.hset(f"{crawl_id}:size", f"crawl-{crawl_id}-{i}", "1000000")
+        seen = [f"https://example.com/{num}" for num in range(50)]
+        await redis.sadd(f"{crawl_id}:s", *seen)
+        await redis.set(f"{crawl_id}:d", 10)
+
+    async def queue_pages(self, crawl_id: str, round_num: int) -> None:
+        """pages crawled since last sync, as pushed by the crawler"""
+        if not self.pages_per_sync:
+            return
+
+        # add directly, not counted as calls made by the operator
+        pages = self.redis.get(self.k8s.get_redis_url(crawl_id)).data.setdefault(
+            f"{crawl_id}:pages", []
+        )
+        for num in range(self.pages_per_sync):
+            page = {
+                "id": str(uuid.uuid4()),
+                "url": f"https://example.com/{round_num}/{num}",
+                "title": "Example",
+                "loadState": 4,
+                "status": 200,
+                "ts": "2026-01-01T00:00:00Z",
+                "filename": "rec-0.warc.gz",
+            }
+            pages.insert(0, json.dumps(page))
+
+    def pod(self, name: str, role: str) -> dict:
+        """running pod as returned in metacontroller children"""
+        return {
+            "metadata": {"name": name, "labels": {"role": role}},
+            "spec": {
+                "containers": [
+                    {"resources": {"requests": {"memory": "1Gi", "cpu": "1"}}}
+                ]
+            },
+            "status": {
+                "phase": "Running",
+                "containerStatuses": [{"state": {"running": {}}, "restartCount": 0}],
+            },
+        }
+
+    def crawl_payload(self, crawl_id, cid, oid, started) -> dict:
+        """CrawlJob sync payload for running crawl"""
+        pods = {f"redis-{crawl_id}": self.pod(f"redis-{crawl_id}", "redis")}
+        pvcs = {}
+        for i in range(self.num_pods):
+            name = f"crawl-{crawl_id}-{i}"
+            pods[name] = self.pod(name, "crawler")
+            pvcs[name] = {
+                "metadata": {"name": name},
+                "status": {"capacity": {"storage": "26Gi"}},
+            }
+
+        configmap_name = f"crawl-config-{crawl_id}"
+        return {
+            "parent": {
+                "metadata": {
+                    "name": f"crawljob-{crawl_id}",
+                    "creationTimestamp": started,
+                },
+                "spec": {
+                    "id": crawl_id,
+                    "cid": str(cid),
+                    "oid": str(oid),
+                    "storageName": "default",
+                    "browserWindows": self.num_pods * 2,
+                    "manual": "1",
+                    "storage_filename": "@ts-@hostsuffix.wacz",
+                },
+                "status": {"state": "running", "pagesFound": 50, "initRedis": True},
+            },
+            "controller": {},
+            "children": {
+                "Pod.v1": pods,
+                "PersistentVolumeClaim.v1": pvcs,
+                "ConfigMap.v1": {
+                    configmap_name: {
+                        "metadata": {
+                            "name": configmap_name,
+                            "namespace": "crawlers",
+                            "labels": {"crawl": crawl_id},
+                        },
+                        "data": {},
+                    }
+                },
+            },
+            "related": {},
+        }
+
+    def cronjob_payload(self, crawl_id, cid, oid, userid) -> dict:
+        """Job decorator sync payload for job spawned by cronjob"""
+        labels = {
+            "btrix.crawlconfig": str(cid),
+            "btrix.org": str(oid),
+            "btrix.userid": str(userid),
+        }
+        crawljob_name = f"crawljob-{crawl_id}"
+        return {
+            "object": {
+                "metadata": {"name": crawl_id, "labels": labels},
+                "status": {},
+            },
+            "controller": {},
+            "attachments": {
+                "CrawlJob.btrix.cloud/v1": {
+                    crawljob_name: {
+                        "metadata": {"name": crawljob_name, "labels": labels},
+                        "spec": {"id": crawl_id},
+                        "status": {"state": "running"},
+                    }
+                }
+            },
+            "related": {},
+        }
+
+    def index_payload(self, coll_id, oid) -> dict:
+        """CollIndex sync payload for ready index"""
+        name = f"redis-coll-{coll_id}"
+        return {
+            "parent": {
+                "metadata": {"name": f"collindex-{coll_id}"},
+                "spec": {"id": str(coll_id), "oid": str(oid)},
+                "status": {"state": "ready"},
+            },
+            "controller": {},
+            "children": {"Pod.v1": {name: self.pod(name, "redis")}},
+            "related": {},
+        }
+
+    async def run_sync(
+        self,
+        name: str,
+        payloads: list[dict],
+        sync: Callable[[Any], Awaitable[Any]],
+        make_data: Callable[[dict], Any],
+        rounds: int,
+        before_sync: Callable[[dict, int], Awaitable[None]] | None = None,
+    ) -> dict[str, Any]:
+        """sync each payload for each round, return stats per sync"""
+        times = []
+        cpu_times = []
+        self.counter.reset()
+        errors = 0
+
+        for round_num in range(rounds):
+            for payload in payloads:
+                if before_sync:
+                    await before_sync(payload, round_num)
+
+                data = make_data(copy.deepcopy(payload))
+
+                cpu_start = time.process_time()
+                start = time.perf_counter()
+                try:
+                    response = await sync(data)
+                # pylint: disable=broad-exception-caught
+                except Exception as exc:
+                    errors += 1
+                    if errors == 1:
+                        print(f"{name}: sync failed: {exc!r}", file=sys.stderr)
+                    continue
+                finally:
+                    times.append((time.perf_counter() - start) * 1000)
+                    cpu_times.append((time.process_time() - cpu_start) * 1000)
+
+                status = response.get("status") if isinstance(response, dict) else None
+                if status is not None:
+                    payload["parent"]["status"] = status
+
+        syncs = len(times) or 1
+        times.sort()
+        calls = dict(sorted(self.counter.calls.items()))
+        return {
+            "syncs": len(times),
+            "errors": errors,
+            "p50_ms": round(statistics.median(times), 3) if times else None,
+            "p99_ms": round(times[math.ceil(len(times) * 0.99) - 1], 3)
+            if times
+            else None,
+            "cpu_ms": round(sum(cpu_times) / syncs, 3),
+            "mongo_calls": round(self.counter.total("mongo.") / syncs, 2),
+            "redis_calls": round(self.counter.total("redis.") / syncs, 2),
+            "k8s_calls": round(self.counter.total("k8s.") / syncs, 2),
+            "calls": {key: round(num / syncs, 2) for key, num in calls.items()},
+        }
+
+    async def run(self, rounds: int) -> dict[str, dict[str, Any]]:
+        """run all handlers"""
+        # pylint: disable=import-outside-toplevel
+        from btrixcloud.operator.models import MCDecoratorSyncData, MCSyncData
+
+        async def before_crawl_sync(payload: dict, round_num: int):
+            await self.queue_pages(payload["parent"]["spec"]["id"], round_num)
+
+        return {
+            "sync_crawls": await self.run_sync(
+                "sync_crawls",
+                self.crawl_payloads,
+                self.crawl_operator.sync_crawls,
+                lambda payload: MCSyncData(**payload),
+                rounds,
+                before_crawl_sync,
+            ),
+            "sync_cronjob_crawl": await self.run_sync(
+                "sync_cronjob_crawl",
+                self.cronjob_payloads,
+                self.cronjob_operator.sync_cronjob_crawl,
+                lambda payload: MCDecoratorSyncData(**payload),
+                rounds,
+            ),
+            "sync_index": await self.run_sync(
+                "sync_index",
+                self.index_payloads,
+                self.index_operator.sync_index,
+                lambda payload: MCSyncData(**payload),
+                rounds,
+            ),
+        }
+
+
+# ============================================================================
+async def run_bench(args) -> dict[str, dict[str, Any]]:
+    """create harness, seed data and run handlers"""
+    harness = Harness(args.crawls, args.pods, args.pages_per_sync)
+    await harness.seed()
+    return await harness.run(args.rounds)
+
+
+def main() -> int:
+    """run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--crawls", type=int, default=100)
+    parser.add_argument("--pods", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--pages-per-sync", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        setup_env(tmpdir)
+        results = asyncio.run(run_bench(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(
+        f"{args.crawls} crawls x {args.pods} pods, {args.rounds} rounds, "
+        f"{args.pages_per_sync} pages per sync"
+    )
+    print(
+        f"{'handler':<20}{'syncs':>7}{'p50 ms':>9}{'p99 ms':>9}{'cpu ms':>9}"
+        f"{'mongo':>8}{'redis':>8}{'k8s':>6}{'errors':>8}"
+    )
+    for name, res in results.items():
+        print(
+            f"{name:<20}{res['syncs']:>7}{res['p50_ms'] or '-':>9}"
+            f"{res['p99_ms'] or '-':>9}{res['cpu_ms']:>9}{res['mongo_calls']:>8}"
+            f"{res['redis_calls']:>8}{res['k8s_calls']:>6}{res['errors']:>8}"
+        )
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
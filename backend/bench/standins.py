@@ -0,0 +1,690 @@
+"""
+In-memory stand-ins for mongo (motor) and redis, for running benchmarks
+without a database or cluster
+
+Only the subset of queries, updates and commands used by the code paths
+being benchmarked is supported, unsupported operators raise
+NotImplementedError so that gaps are not silently mis-measured. Every
+database and redis call is counted.
+"""
+
+import copy
+import fnmatch
+import itertools
+import re
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Iterable
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+MISSING = object()
+
+
+# ============================================================================
+class CallCounter:
+    """Counts calls by target and method"""
+
+    def __init__(self):
+        self.calls: Counter[str] = Counter()
+
+    def count(self, target: str, method: str) -> None:
+        """record one call"""
+        self.calls[f"{target}.{method}"] += 1
+
+    def total(self, prefix: str = "") -> int:
+        """total calls with name starting with prefix"""
+        return sum(num for name, num in self.calls.items() if name.startswith(prefix))
+
+    def reset(self) -> None:
+        """clear all counts"""
+        self.calls.clear()
+
+
+# ============================================================================
+def get_path(doc: Any, path: str) -> Any:
+    """return value at dotted path, or MISSING"""
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit():
+            index = int(part)
+            value = value[index] if index < len(value) else MISSING
+        else:
+            return MISSING
+
+        if value is MISSING:
+            return MISSING
+
+    return value
+
+
+def set_path(doc: dict, path: str, value: Any) -> None:
+    """set value at dotted path, creating sub documents"""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def unset_path(doc: dict, path: str) -> None:
+    """remove value at dotted path if present"""
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+
+def _compare(value: Any, other: Any, op: str) -> bool:
+    if value is MISSING or value is None or other is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > other
+        if op == "$gte":
+            return value >= other
+        if op == "$lt":
+            return value < other
+        return value <= other
+    except TypeError:
+        return False
+
+
+def _values(value: Any) -> list[Any]:
+    """values to match a query against, including array elements"""
+    if isinstance(value, list):
+        return [value, *value]
+    return [value]
+
+
+def match_value(value: Any, cond: Any) -> bool:
+    """match a single field value against a query condition"""
+    if isinstance(cond, dict) and cond and next(iter(cond)).startswith("$"):
+        return all(_match_op(value, op, arg) for op, arg in cond.items())
+
+    if isinstance(cond, re.Pattern):
+        return any(isinstance(val, str) and cond.search(val) for val in _values(value))
+
+    if value is MISSING:
+        return cond is None
+
+    return any(val == cond for val in _values(value))
+
+
+def _match_op(value: Any, op: str, arg: Any) -> bool:
+    if op == "$eq":
+        return match_value(value, arg)
+    if op == "$ne":
+        return not match_value(value, arg)
+    if op == "$in":
+        return any(match_value(value, item) for item in arg)
+    if op == "$nin":
+        return not any(match_value(value, item) for item in arg)
+    if op == "$exists":
+        return (value is not MISSING) == bool(arg)
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        return any(_compare(val, arg, op) for val in _values(value))
+    if op == "$not":
+        return not match_value(value, arg)
+    if op == "$regex":
+        return match_value(value, re.compile(arg))
+    if op == "$size":
+        return isinstance(value, list) and len(value) == arg
+    if op == "$elemMatch":
+        return isinstance(value, list) and any(matches(item, arg) for item in value)
+
+    raise NotImplementedError(f"query operator {op}")
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    """return true if doc matches query"""
+    for key, cond in (query or {}).items():
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in cond):
+                return False
+        elif key.startswith("$"):
+            raise NotImplementedError(f"query operator {key}")
+        elif not match_value(get_path(doc, key), cond):
+            return False
+
+    return True
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> None:
+    """apply update operators to doc in place"""
+    if isinstance(update, list):
+        raise NotImplementedError("pipeline updates")
+
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current = get_path(doc, path)
+            if op == "$set":
+                set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                unset_path(doc, path)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is MISSING else current) + arg)
+            elif op in ("$max", "$min"):
+                if (
+                    current is MISSING
+                    or (op == "$max" and arg > current)
+                    or (op == "$min" and arg < current)
+                ):
+                    set_path(doc, path, arg)
+            elif op in ("$push", "$addToSet"):
+                items = [arg]
+                if isinstance(arg, dict) and "$each" in arg:
+                    items = arg["$each"]
+                values = [] if current is MISSING else current
+                for item in items:
+                    if op == "$push" or item not in values:
+                        values.append(copy.deepcopy(item))
+                set_path(doc, path, values)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    set_path(
+                        doc,
+                        path,
+                        [item for item in current if not match_value(item, arg)],
+                    )
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def project(doc: dict, projection: Any) -> dict:
+    """apply inclusion or exclusion projection"""
+    if not projection:
+        return copy.deepcopy(doc)
+
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include = [key for key, val in projection.items() if val and key != "_id"]
+    if include:
+        res = {}
+        if projection.get("_id", 1):
+            res["_id"] = doc.get("_id")
+        for path in include:
+            value = get_path(doc, path)
+            if value is not MISSING:
+                set_path(res, path, copy.deepcopy(value))
+        return res
+
+    res = copy.deepcopy(doc)
+    for path in projection:
+        unset_path(res, path)
+    return res
+
+
+def sort_docs(docs: list[dict], sort: Iterable[tuple[str, int]]) -> list[dict]:
+    """sort docs by list of (field, direction), missing values first"""
+
+    def key(value):
+        value = None if value is MISSING else value
+        if value is None:
+            return (0, "")
+        if isinstance(value, datetime):
+            return (2, value.timestamp())
+        if isinstance(value, (int, float)):
+            return (1, value)
+        return (3, str(value))
+
+    for field, direction in reversed(list(sort)):
+        docs.sort(key=lambda doc: key(get_path(doc, field)), reverse=direction < 0)
+    return docs
+
+
+# ============================================================================
+class MemoryCursor:
+    """async cursor over a list of documents"""
+
+    def __init__(self, docs: list[dict]):
+        self.docs = docs
+        self._sort: list[tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int | None = None) -> "MemoryCursor":
+        """sort by field, or list of (field, direction)"""
+        if isinstance(key, str):
+            self._sort = [(key, direction or 1)]
+        else:
+            self._sort = list(key)
+        return self
+
+    def skip(self, num: int) -> "MemoryCursor":
+        """skip first num docs"""
+        self._skip = num
+        return self
+
+    def limit(self, num: int) -> "MemoryCursor":
+        """limit number of docs"""
+        self._limit = num
+        return self
+
+    def batch_size(self, _num: int) -> "MemoryCursor":
+        """no-op, all docs are in memory"""
+        return self
+
+    def _results(self) -> list[dict]:
+        docs = sort_docs(list(self.docs), self._sort)[self._skip :]
+        return docs[: self._limit] if self._limit else docs
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        """return docs as list"""
+        docs = self._results()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self._results():
+            yield doc
+
+
+# ============================================================================
+class MemoryCollection:
+    """motor-compatible in-memory collection"""
+
+    def __init__(self, name: str, counter: CallCounter):
+        self.name = name
+        self.counter = counter
+        self.docs: dict[Any, dict] = {}
+        self._ids = itertools.count(1)
+
+    def _find(self, query: dict | None) -> list[dict]:
+        if query and "_id" in query and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return [doc] if doc is not None and matches(doc, query) else []
+
+        return [doc for doc in self.docs.values() if matches(doc, query)]
+
+    def _insert(self, doc: dict) -> Any:
+        if "_id" not in doc:
+            doc["_id"] = next(self._ids)
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']}")
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return doc["_id"]
+
+    def _upsert(self, query: dict, update: dict) -> dict:
+        doc = {
+            key: val
+            for key, val in query.items()
+            if not key.startswith("$") and not isinstance(val, dict)
+        }
+        apply_update(doc, update, inserting=True)
+        self._insert(doc)
+        return self.docs[doc["_id"]]
+
+    async def find_one(self, query=None, projection=None, **_kwargs):
+        """find first matching doc"""
+        self.counter.count("mongo", "find_one")
+        found = self._find(query)
+        return project(found[0], projection) if found else None
+
+    def find(self, query=None, projection=None, **_kwargs) -> MemoryCursor:
+        """find matching docs"""
+        self.counter.count("mongo", "find")
+        return MemoryCursor([project(doc, projection) for doc in self._find(query)])
+
+    async def count_documents(self, query=None, **_kwargs) -> int:
+        """count matching docs"""
+        self.counter.count("mongo", "count_documents")
+        return len(self._find(query))
+
+    async def insert_one(self, doc: dict, **_kwargs):
+        """insert doc"""
+        self.counter.count("mongo", "insert_one")
+        inserted_id = self._insert(doc)
+        return type("InsertOneResult", (), {"inserted_id": inserted_id})()
+
+    async def insert_many(self, docs: list[dict], **_kwargs):
+        """insert docs"""
+        self.counter.count("mongo", "insert_many")
+        ids = [self._insert(doc) for doc in docs]
+        return type("InsertManyResult", (), {"inserted_ids": ids})()
+
+    async def update_one(self, query, update, upsert=False, **_kwargs):
+        """update first matching doc"""
+        self.counter.count("mongo", "update_one")
+        found = self._find(query)
+        if found:
+            apply_update(found[0], update)
+        elif upsert:
+            self._upsert(query, update)
+        return type("UpdateResult", (), {"modified_count": len(found[:1])})()
+
+    async def update_many(self, query, update, upsert=False, **_kwargs):
+        """update all matching docs"""
+        self.counter.count("mongo", "update_many")
+        found = self._find(query)
+        for doc in found:
+            apply_update(doc, update)
+        if not found and upsert:
+            self._upsert(query, update)
+        return type("UpdateResult", (), {"modified_count": len(found)})()
+
+    async def find_one_and_update(
+        self,
+        query,
+        update,
+        projection=None,
+        upsert=False,
+        return_document=ReturnDocument.BEFORE,
+        sort=None,
+        **_kwargs,
+    ):
+        """update first matching doc, return doc before or after"""
+        self.counter.count("mongo", "find_one_and_update")
+        found = sort_docs(self._find(query), sort or [])
+        if not found:
+            if not upsert:
+                return None
+            doc = self._upsert(query, update)
+            if return_document == ReturnDocument.AFTER:
+                return project(doc, projection)
+            return None
+
+        doc = found[0]
+        before = project(doc, projection)
+        apply_update(doc, update)
+        if return_document == ReturnDocument.AFTER:
+            return project(doc, projection)
+        return before
+
+    async def find_one_and_delete(self, query, projection=None, **_kwargs):
+        """delete first matching doc and return it"""
+        self.counter.count("mongo", "find_one_and_delete")
+        found = self._find(query)
+        if not found:
+            return None
+        return project(self.docs.pop(found[0]["_id"]), projection)
+
+    async def delete_one(self, query, **_kwargs):
+        """delete first matching doc"""
+        self.counter.count("mongo", "delete_one")
+        found = self._find(query)
+        if found:
+            self.docs.pop(found[0]["_id"])
+        return type("DeleteResult", (), {"deleted_count": len(found[:1])})()
+
+    async def delete_many(self, query, **_kwargs):
+        """delete all matching docs"""
+        self.counter.count("mongo", "delete_many")
+        found = self._find(query)
+        for doc in found:
+            self.docs.pop(doc["_id"])
+        return type("DeleteResult", (), {"deleted_count": len(found)})()
+
+    def aggregate(self, pipeline: list[dict], **_kwargs) -> MemoryCursor:
+        """run pipeline, supporting only simple stages"""
+        self.counter.count("mongo", "aggregate")
+        docs = [copy.deepcopy(doc) for doc in self.docs.values()]
+        for stage in pipeline:
+            name, arg = next(iter(stage.items()))
+            if name == "$match":
+                docs = [doc for doc in docs if matches(doc, arg)]
+            elif name == "$sort":
+                docs = sort_docs(docs, arg.items())
+            elif name == "$skip":
+                docs = docs[arg:]
+            elif name == "$limit":
+                docs = docs[:arg]
+            elif name == "$count":
+                docs = [{arg: len(docs)}] if docs else []
+            elif name == "$project":
+                docs = [project(doc, arg) for doc in docs]
+            else:
+                raise NotImplementedError(f"aggregation stage {name}")
+        return MemoryCursor(docs)
+
+    def watch(self, *_args, **_kwargs):
+        """change streams are not supported, as on a standalone server"""
+        raise OperationFailure("change streams not supported", code=40573)
+
+    async def create_index(self, *_args, **_kwargs):
+        """indexes are not used"""
+
+    async def drop_indexes(self, *_args, **_kwargs):
+        """indexes are not used"""
+
+
+# ============================================================================
+class MemoryDB:
+    """motor-compatible in-memory database, also used as the client"""
+
+    def __init__(self, counter: CallCounter | None = None):
+        self.counter = counter or CallCounter()
+        self.collections: dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        coll = self.collections.get(name)
+        if not coll:
+            coll = MemoryCollection(name, self.counter)
+            self.collections[name] = coll
+        return coll
+
+    get_collection = __getitem__
+
+    async def start_session(self, *_args, **_kwargs):
+        """sessions are not supported"""
+        raise NotImplementedError("sessions")
+
+
+# ============================================================================
+class MemoryRedisPipeline:
+    """non-transactional pipeline, queued commands run on execute"""
+
+    def __init__(self, redis: "MemoryRedis"):
+        self.redis = redis
+        self.queued: list[tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            self.queued.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self) -> list[Any]:
+        """run queued commands, counted as a single round trip"""
+        self.redis.counter.count("redis", "pipeline")
+        results = [
+            await getattr(self.redis, f"_{name}")(*args, **kwargs)
+            for name, args, kwargs in self.queued
+        ]
+        self.queued = []
+        return results
+
+
+# pylint: disable=too-many-public-methods
+class MemoryRedis:
+    """in-memory stand-in for redis.asyncio client with decode_responses"""
+
+    def __init__(self, counter: CallCounter | None = None):
+        self.counter = counter or CallCounter()
+        self.data: dict[str, Any] = {}
+
+    def __getattr__(self, name: str):
+        impl = getattr(type(self), f"_{name}", None)
+        if name.startswith("_") or not impl:
+            raise AttributeError(name)
+
+        async def command(*args, **kwargs):
+            self.counter.count("redis", name)
+            return await impl(self, *args, **kwargs)
+
+        return command
+
+    def pipeline(self, transaction: bool = True) -> MemoryRedisPipeline:
+        """return pipeline"""
+        # pylint: disable=unused-argument
+        return MemoryRedisPipeline(self)
+
+    def _typed(self, key: str, factory):
+        value = self.data.get(key)
+        if value is None:
+            value = factory()
+            self.data[key] = value
+        return value
+
+    async def _ping(self):
+        return True
+
+    async def _close(self):
+        return None
+
+    async def _get(self, key):
+        return self.data.get(key)
+
+    async def _set(self, key, value, nx=False, ex=None):
+        # pylint: disable=unused-argument
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value)
+        return True
+
+    async def _incr(self, key, amount=1):
+        value = int(self.data.get(key) or 0) + amount
+        self.data[key] = str(value)
+        return value
+
+    async def _delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+    async def _exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    async def _expire(self, key, _secs):
+        return key in self.data
+
+    async def _keys(self, pattern="*"):
+        return [key for key in self.data if fnmatch.fnmatchcase(key, pattern)]
+
+    async def _hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    async def _hset(self, key, field=None, value=None, mapping=None):
+        values = self._typed(key, dict)
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = len(set(items) - set(values))
+        values.update({name: str(val) for name, val in items.items()})
+        return added
+
+    async def _hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def _hdel(self, key, *fields):
+        values = self.data.get(key, {})
+        return sum(1 for field in fields if values.pop(field, None) is not None)
+
+    async def _hexists(self, key, field):
+        return field in self.data.get(key, {})
+
+    async def _hlen(self, key):
+        return len(self.data.get(key, {}))
+
+    async def _hvals(self, key):
+        return list(self.data.get(key, {}).values())
+
+    async def _hkeys(self, key):
+        return list(self.data.get(key, {}))
+
+    async def _hincrby(self, key, field, amount=1):
+        values = self._typed(key, dict)
+        values[field] = str(int(values.get(field, 0)) + amount)
+        return int(values[field])
+
+    async def _lpush(self, key, *values):
+        items = self._typed(key, list)
+        for value in values:
+            items.insert(0, str(value))
+        return len(items)
+
+    async def _rpush(self, key, *values):
+        items = self._typed(key, list)
+        items.extend(str(value) for value in values)
+        return len(items)
+
+    async def _lpop(self, key):
+        items = self.data.get(key)
+        return items.pop(0) if items else None
+
+    async def _rpop(self, key):
+        items = self.data.get(key)
+        return items.pop() if items else None
+
+    async def _llen(self, key):
+        return len(self.data.get(key, []))
+
+    async def _lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[start : None if end == -1 else end + 1]
+
+    async def _ltrim(self, key, start, end):
+        items = self.data.get(key, [])
+        items[:] = items[start : None if end == -1 else end + 1]
+        if not items:
+            self.data.pop(key, None)
+        return True
+
+    async def _sadd(self, key, *members):
+        values = self._typed(key, set)
+        added = len(set(members) - values)
+        values.update(members)
+        return added
+
+    async def _scard(self, key):
+        return len(self.data.get(key, set()))
+
+    async def _smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def _sismember(self, key, member):
+        return member in self.data.get(key, set())
+
+    async def _info(self, section=None):
+        if section == "keyspace":
+            return {}
+        return {"used_memory": 0, "rdb_bgsave_in_progress": 0}
+
+    async def _config_set(self, *_args):
+        return True
+
+    async def _bgsave(self, *_args, **_kwargs):
+        return True
+
+
+# ============================================================================
+class MemoryRedisServer:
+    """redis instances by url, all sharing one call counter"""
+
+    def __init__(self, counter: CallCounter):
+        self.counter = counter
+        self.instances: dict[str, MemoryRedis] = defaultdict(
+            lambda: MemoryRedis(counter)
+        )
+
+    def get(self, url: str) -> MemoryRedis:
+        """return redis instance for url"""
+        return self.instances[url]
@@ -0,0 +1,219 @@
+"""
+Startup benchmark for background jobs
+
+Measures time-to-first-work for each background job type run by main_bg:
+the time from starting a fresh python process until the job issues its first
+database operation, ie. imports plus creating the ops classes the job needs.
+No database or k8s cluster is needed, the first database operation is
+intercepted and ends the run.
+
+Usage (from backend/):
+
+    python -m bench.startup [--runs N] [--job-type TYPE ...] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from typing import Any
+
+# only job types run by main_bg, replica jobs use a separate image
+JOB_TYPES = [
+    "optimize-pages",
+    "cleanup-seed-files",
+    "retry-stuck-uploads",
+    "delete-org",
+    "recalculate-org-stats",
+    "readd-org-pages",
+    "update-coll-stats",
+    "postprocess-upload",
+]
+
+# modules that are slow to import and should only be loaded when needed
+HEAVY_MODULES = [
+    "kubernetes_asyncio",
+    "aiobotocore",
+    "types_aiobotocore_s3",
+    "jinja2",
+    "remotezip",
+]
+
+# motor collection and client methods that perform a database operation
+DB_OPERATIONS = {
+    "aggregate",
+    "bulk_write",
+    "count_documents",
+    "delete_many",
+    "delete_one",
+    "distinct",
+    "estimated_document_count",
+    "find",
+    "find_one",
+    "find_one_and_delete",
+    "find_one_and_replace",
+    "find_one_and_update",
+    "insert_many",
+    "insert_one",
+    "replace_one",
+    "start_session",
+    "update_many",
+    "update_one",
+}
+
+
+# ============================================================================
+class FirstWork(BaseException):
+    """raised on first database operation, derived from BaseException so it is
+    not caught by job error handling"""
+
+
+class FirstWorkDB:
+    """Stand-in for mongo client, database and collections, recording the
+    time of the first database operation"""
+
+    first_work: float | None = None
+
+    def __getitem__(self, _name: str) -> "FirstWorkDB":
+        return self
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+
+        if name in DB_OPERATIONS:
+            return self._first_work
+
+        return self
+
+    def __call__(self, *args, **kwargs) -> "FirstWorkDB":
+        return self
+
+    def _first_work(self, *args, **kwargs):
+        FirstWorkDB.first_work = time.time()
+        raise FirstWork()
+
+
+# ============================================================================
+def run_child(job_type: str) -> None:
+    """run job in this process until first database operation, print result"""
+    # pylint: disable=import-outside-toplevel
+    from btrixcloud.main_bg import run_job
+    from btrixcloud.ops import Ops
+
+    ops = Ops()
+    ops.dbclient = FirstWorkDB()  # type: ignore
+    ops.mdb = FirstWorkDB()  # type: ignore
+
+    error = None
+    try:
+        asyncio.run(
+            run_job(
+                ops,
+                job_type,
+                oid=str(uuid.uuid4()),
+                crawl_id="bench-crawl",
+                coll_id=str(uuid.uuid4()),
+            )
+        )
+    except FirstWork:
+        pass
+    # pylint: disable=broad-exception-caught
+    except Exception as exc:
+        error = repr(exc)
+
+    result = {
+        "first_work": FirstWorkDB.first_work,
+        "ops_created": sorted(
+            name
+            for name in ops.__dict__
+            if not name.startswith("_") and name not in ("dbclient", "mdb")
+        ),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+        "btrixcloud_modules": len(
+            [name for name in sys.modules if name.startswith("btrixcloud.")]
+        ),
+        "error": error,
+    }
+    print(json.dumps(result))
+
+
+def run_once(job_type: str) -> dict[str, Any]:
+    """run job type in a fresh process, return result with elapsed time"""
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "ERROR")
+
+    start = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-m", "bench.startup", "--child", job_type],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode or not lines:
+        return {"error": proc.stderr.strip().splitlines()[-1:] or "no output"}
+
+    result = json.loads(lines[-1])
+    if result["first_work"]:
+        result["ms"] = (result["first_work"] - start) * 1000
+    return result
+
+
+def main() -> int:
+    """run benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--job-type", action="append", choices=JOB_TYPES)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    results = {}
+    for job_type in args.job_type or JOB_TYPES:
+        runs = [run_once(job_type) for _ in range(args.runs)]
+        times = [run["ms"] for run in runs if "ms" in run]
+        last = runs[-1]
+        results[job_type] = {
+            "median_ms": round(statistics.median(times), 1) if times else None,
+            "min_ms": round(min(times), 1) if times else None,
+            "ops_created": last.get("ops_created"),
+            "heavy_modules": last.get("heavy_modules"),
+            "btrixcloud_modules": last.get("btrixcloud_modules"),
+            "error": last.get("error"),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(
+        f"{'job type':<24}{'median ms':>10}{'min ms':>10}  "
+        "ops created / heavy modules"
+    )
+    for job_type, res in results.items():
+        median = res["median_ms"] if res["median_ms"] is not None else "-"
+        fastest = res["min_ms"] if res["min_ms"] is not None else "-"
+        print(
+            f"{job_type:<24}{median:>10}{fastest:>10}  "
+            f"{','.join(res['ops_created'] or [])} / "
+            f"{','.join(res['heavy_modules'] or []) or '-'}"
+        )
+        if res["error"]:
+            print(f"{'':<44}error: {res['error']}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
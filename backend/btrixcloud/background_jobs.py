@@ -1,18 +1,18 @@
 """k8s background jobs"""
 
+import asyncio
 import os
 import secrets
 from collections.abc import AsyncGenerator, Callable
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import TYPE_CHECKING, cast
 from urllib.parse import urlsplit
 from uuid import UUID
 
 import structlog
+import pymongo
 from fastapi import APIRouter, Depends, HTTPException
-from kubernetes_asyncio.utils.create_from_yaml import FailToCreateError
 
-from .crawlmanager import CrawlManager
 from .models import (
     CRAWL_TYPES,
     AnyJob,
@@ -37,17 +37,28 @@ from .models import (
     User,
 )
 from .pagination import DEFAULT_PAGE_SIZE, paginated_format
-from .storages import StorageOps
 from .utils import dt_now, run_async_task
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 if TYPE_CHECKING:
     from .basecrawls import BaseCrawlOps
+    from .colls import CollectionOps
+    from .crawlmanager import CrawlManager
     from .orgs import OrgOps
     from .profiles import ProfileOps
+    from .storages import StorageOps
 else:
-    OrgOps = CrawlManager = BaseCrawlOps = ProfileOps = object
+    OrgOps = CrawlManager = BaseCrawlOps = ProfileOps = CollectionOps = object
+    StorageOps = object
+
+# a pending or running collection stats job older than this is considered lost
+# and a new one may be dispatched in its place
+COLL_STATS_JOB_STALE_SECONDS = 3600
+
+# attempts to start a collection stats job while the previous k8s job for
+# the same collection is still being removed
+COLL_STATS_DISPATCH_RETRIES = 5
 
 
 # ============================================================================
@@ -61,6 +72,7 @@ class BackgroundJobOps:
 
     base_crawl_ops: BaseCrawlOps
     profile_ops: ProfileOps
+    coll_ops: CollectionOps
 
     migration_jobs_scale: int
 
@@ -78,6 +90,7 @@ class BackgroundJobOps:
 
         self.base_crawl_ops = cast(BaseCrawlOps, None)
         self.profile_ops = cast(ProfileOps, None)
+        self.coll_ops = cast(CollectionOps, None)
 
         self.migration_jobs_scale = int(os.environ.get("MIGRATION_JOBS_SCALE", 1))
 
@@ -92,6 +105,22 @@ class BackgroundJobOps:
         self.base_crawl_ops = base_crawl_ops
         self.profile_ops = profile_ops
 
+    async def init_index(self):
+        """init index for background jobs"""
+        await self.jobs.create_index(
+            [
+                ("workerQueued", pymongo.ASCENDING),
+                ("type", pymongo.ASCENDING),
+                ("finished", pymongo.ASCENDING),
+                ("started", pymongo.ASCENDING),
+            ],
+            partialFilterExpression={"workerQueued": True},
+        )
+
+    def set_coll_ops(self, coll_ops: CollectionOps) -> None:
+        """collection ops for re-dispatching coalesced stats updates"""
+        self.coll_ops = coll_ops
+
     def strip_bucket(self, endpoint_url: str) -> tuple[str, str]:
         """split the endpoint_url into the origin and return rest of endpoint as bucket path"""
         parts = urlsplit(endpoint_url)
@@ -323,6 +352,23 @@ class BackgroundJobOps:
             )
             return ""
 
+    async def _queue_for_worker(self, job_id: str, job_type: BgJobType) -> None:
+        """queue job for background job worker, if it is run by the worker"""
+        if not self.crawl_manager.is_bg_worker_job(job_type):
+            return
+
+        await self.jobs.find_one_and_update(
+            {"_id": job_id},
+            {
+                "$set": {
+                    "workerQueued": True,
+                    "leaseOwner": None,
+                    "leaseExpires": None,
+                    "leaseAttempts": 0,
+                }
+            },
+        )
+
     async def create_delete_org_job(
         self,
         org: Organization,
@@ -358,6 +404,7 @@ class BackgroundJobOps:
             await self.jobs.find_one_and_update(
                 {"_id": job_id}, {"$set": delete_org_job.to_dict()}, upsert=True
             )
+            await self._queue_for_worker(job_id, BgJobType.DELETE_ORG)
 
             return job_id
         # pylint: disable=broad-exception-caught
@@ -407,6 +454,7 @@ class BackgroundJobOps:
             await self.jobs.find_one_and_update(
                 {"_id": job_id}, {"$set": recalculate_job.to_dict()}, upsert=True
             )
+            await self._queue_for_worker(job_id, BgJobType.RECALCULATE_ORG_STATS)
 
             return job_id
         # pylint: disable=broad-exception-caught
@@ -463,6 +511,7 @@ class BackgroundJobOps:
             await self.jobs.find_one_and_update(
                 {"_id": job_id}, {"$set": readd_pages_job.to_dict()}, upsert=True
             )
+            await self._queue_for_worker(job_id, BgJobType.READD_ORG_PAGES)
 
             return job_id
         # pylint: disable=broad-exception-caught
@@ -526,37 +575,164 @@ class BackgroundJobOps:
         collection_id: UUID,
         existing_job_id: str | None = None,
     ):
-        """Create job to update collection stats"""
+        """Create job to update collection stats
+
+        Requests are coalesced per collection: if a job for the collection is
+        already pending or running, it is marked dirty instead of starting
+        another job. A running job recomputes until the collection is no
+        longer modified, and a dirty job is re-dispatched once finished if
+        changes arrived after its last recompute.
+        """
+        # pylint: disable=import-outside-toplevel
+        from kubernetes_asyncio.utils.create_from_yaml import FailToCreateError
+
+        job_id = existing_job_id or f"update-coll-{collection_id}"
+        coll_logger = logger.bind(oid=oid, coll_id=collection_id, job_id=job_id)
+
+        if existing_job_id:
+            return await self._retry_update_collection_stats_job(
+                oid, collection_id, existing_job_id
+            )
+
+        if not await self._claim_update_coll_stats_job(job_id, oid, collection_id):
+            coll_logger.debug(
+                "update_collection_stats_job_coalesced",
+                unstructured_message="Stats job already pending, marked dirty",
+            )
+            return job_id
+
         try:
-            job_id = await self.crawl_manager.run_update_coll_stats_job(
+            await self.crawl_manager.run_update_coll_stats_job(
                 oid=str(oid),
                 collection_id=str(collection_id),
-                existing_job_id=existing_job_id,
+                existing_job_id=job_id,
             )
-            if existing_job_id:
-                update_coll_job = await self.get_background_job(existing_job_id)
-                previous_attempt = {
-                    "started": update_coll_job.started,
-                    "finished": update_coll_job.finished,
-                }
-                if update_coll_job.previousAttempts:
-                    update_coll_job.previousAttempts.append(previous_attempt)
-                else:
-                    update_coll_job.previousAttempts = [previous_attempt]
-                update_coll_job.started = dt_now()
-                update_coll_job.finished = None
-                update_coll_job.success = None
-            else:
-                update_coll_job = UpdateCollStatsJob(
-                    id=job_id,
-                    oid=oid,
-                    collection_id=collection_id,
-                    started=dt_now(),
+            await self._queue_for_worker(job_id, BgJobType.UPDATE_COLL_STATS)
+            return job_id
+        except FailToCreateError as exc:
+            # previous k8s job for this collection has finished but is still
+            # being removed, keep claim and retry in the background
+            if any(e.status == 409 for e in exc.api_exceptions):
+                run_async_task(
+                    self._redispatch_update_coll_stats_job(oid, collection_id, job_id)
                 )
+                return job_id
+
+            coll_logger.warning(
+                "update_collection_stats_job_start_failed", exc_info=True
+            )
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            coll_logger.warning(
+                "update_collection_stats_job_start_failed",
+                exc_info=True,
+                unstructured_message="warning: update collection stats job could "
+                f"not be started: {exc}",
+            )
+
+        await self._release_update_coll_stats_job(job_id)
+        return None
+
+    async def _claim_update_coll_stats_job(
+        self, job_id: str, oid: UUID, collection_id: UUID
+    ) -> bool:
+        """atomically claim the stats job for a collection, returns false and
+        marks existing job dirty if one is already pending or running"""
+        now = dt_now()
+        stale = now - timedelta(seconds=COLL_STATS_JOB_STALE_SECONDS)
+
+        update_coll_job = UpdateCollStatsJob(
+            id=job_id,
+            oid=oid,
+            collection_id=collection_id,
+            started=now,
+        )
+
+        try:
+            await self.jobs.find_one_and_update(
+                {
+                    "_id": job_id,
+                    "$or": [{"finished": {"$ne": None}}, {"started": {"$lt": stale}}],
+                },
+                {"$set": update_coll_job.to_dict()},
+                upsert=True,
+            )
+            return True
+        except pymongo.errors.DuplicateKeyError:
+            # job exists and is not finished, let it pick up the change
+            await self.jobs.find_one_and_update(
+                {"_id": job_id, "finished": None}, {"$set": {"dirty": True}}
+            )
+            return False
+
+    async def _release_update_coll_stats_job(self, job_id: str) -> None:
+        """release claim on stats job that could not be started"""
+        await self.jobs.find_one_and_update(
+            {"_id": job_id, "finished": None},
+            {"$set": {"finished": dt_now(), "success": False}},
+        )
+
+    async def _redispatch_update_coll_stats_job(
+        self, oid: UUID, collection_id: UUID, job_id: str
+    ) -> None:
+        """start claimed stats job once previous k8s job has been removed"""
+        # pylint: disable=import-outside-toplevel
+        from kubernetes_asyncio.utils.create_from_yaml import FailToCreateError
+
+        for attempt in range(COLL_STATS_DISPATCH_RETRIES):
+            await asyncio.sleep(2**attempt)
+            try:
+                await self.crawl_manager.run_update_coll_stats_job(
+                    oid=str(oid),
+                    collection_id=str(collection_id),
+                    existing_job_id=job_id,
+                )
+                return
+            except FailToCreateError as exc:
+                if not any(e.status == 409 for e in exc.api_exceptions):
+                    break
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                break
+
+        logger.warning(
+            "update_collection_stats_job_start_failed",
+            oid=oid,
+            coll_id=collection_id,
+            job_id=job_id,
+        )
+        await self._release_update_coll_stats_job(job_id)
+
+    async def _retry_update_collection_stats_job(
+        self, oid: UUID, collection_id: UUID, job_id: str
+    ):
+        """retry previously failed stats job"""
+        try:
+            await self.crawl_manager.run_update_coll_stats_job(
+                oid=str(oid),
+                collection_id=str(collection_id),
+                existing_job_id=job_id,
+            )
+            update_coll_job = cast(
+                UpdateCollStatsJob, await self.get_background_job(job_id)
+            )
+            previous_attempt = {
+                "started": update_coll_job.started,
+                "finished": update_coll_job.finished,
+            }
+            if update_coll_job.previousAttempts:
+                update_coll_job.previousAttempts.append(previous_attempt)
+            else:
+                update_coll_job.previousAttempts = [previous_attempt]
+            update_coll_job.started = dt_now()
+            update_coll_job.finished = None
+            update_coll_job.success = None
+            update_coll_job.dirty = False
 
             await self.jobs.find_one_and_update(
                 {"_id": job_id}, {"$set": update_coll_job.to_dict()}, upsert=True
             )
+            await self._queue_for_worker(job_id, BgJobType.UPDATE_COLL_STATS)
 
             return job_id
         # pylint: disable=broad-exception-caught
@@ -571,6 +747,22 @@ class BackgroundJobOps:
             )
             return None
 
+    async def _update_coll_stats_job_finished(self, job: UpdateCollStatsJob) -> None:
+        """re-dispatch stats job if collection changed after its last recompute"""
+        try:
+            if await self.coll_ops.should_update_stats(job.collection_id, job.oid):
+                await self.create_update_collection_stats_job(
+                    job.oid, job.collection_id
+                )
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            logger.warning(
+                "update_collection_stats_redispatch_failed",
+                exc_info=True,
+                oid=job.oid,
+                coll_id=job.collection_id,
+            )
+
     async def create_postprocess_upload_job(
         self,
         oid: UUID,
@@ -579,6 +771,9 @@ class BackgroundJobOps:
     ):
         """Create job to post-process uploaded crawl"""
 
+        # pylint: disable=import-outside-toplevel
+        from kubernetes_asyncio.utils.create_from_yaml import FailToCreateError
+
         pp_logger = logger.bind(
             crawl_id=crawl_id, oid=oid, existing_job_id=existing_job_id
         )
@@ -612,6 +807,7 @@ class BackgroundJobOps:
             await self.jobs.find_one_and_update(
                 {"_id": job_id}, {"$set": postprocess_job.to_dict()}, upsert=True
             )
+            await self._queue_for_worker(job_id, BgJobType.POSTPROCESS_UPLOAD)
 
             return job_id
         except FailToCreateError as exc:
@@ -692,11 +888,17 @@ class BackgroundJobOps:
         if job_type == BgJobType.DELETE_REPLICA:
             await self.handle_delete_replica_job_finished(cast(DeleteReplicaJob, job))
 
-        await self.jobs.find_one_and_update(
+        res = await self.jobs.find_one_and_update(
             {"_id": job_id, "oid": oid},
             {"$set": {"success": success, "finished": finished}},
+            return_document=pymongo.ReturnDocument.AFTER,
         )
 
+        # dirty flag is read atomically with marking job finished, so any
+        # later request will claim a new job instead of being coalesced
+        if job_type == BgJobType.UPDATE_COLL_STATS and res and res.get("dirty"):
+            await self._update_coll_stats_job_finished(cast(UpdateCollStatsJob, job))
+
         if not success:
             await self._send_bg_job_failure_email(job, finished)
 
@@ -1065,7 +1267,7 @@ def init_background_jobs_api(
         "/orgs/all/jobs/migrateCrawls", response_model=SuccessResponseId, tags=["jobs"]
     )
     async def create_migrate_crawls_job(job_id: str, user: User = Depends(user_dep)):
-        """Launch background job to migrate all crawls to v2 with optimized pages"""
+        """Launch background job to migrate all crawls to latest pages version"""
         if not user.is_superuser:
             raise HTTPException(status_code=403, detail="Not Allowed")
 
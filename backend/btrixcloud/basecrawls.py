@@ -14,6 +14,7 @@ from fastapi import Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
 
+from .db import analytics_reads, max_time
 from .models import (
     CRAWL_TYPES,
     RUNNING_AND_WAITING_STATES,
@@ -66,6 +67,7 @@ class BaseCrawlOps:
 
     # pylint: disable=duplicate-code, too-many-arguments, too-many-locals
 
+    mdb: AsyncIOMotorDatabase
     crawl_configs: CrawlConfigOps
     user_manager: UserManager
     orgs: OrgOps
@@ -88,6 +90,7 @@ class BaseCrawlOps:
         background_job_ops: BackgroundJobOps,
         crawl_log_ops: CrawlLogOps,
     ):
+        self.mdb = mdb
         self.crawls = mdb["crawls"]
         self.presigned_urls = mdb["presigned_urls"]
         self.crawl_configs = crawl_configs
@@ -180,7 +183,7 @@ class BaseCrawlOps:
             if coll_ids:
                 res["collections"] = await self.colls.get_collection_names(coll_ids)
 
-            if res.get("version", 1) == 2:
+            if (res.get("version") or 1) >= 2:
                 res["initialPages"], _ = await self.page_ops.list_pages(
                     crawl_ids=[crawlid], page_size=25
                 )
@@ -653,7 +656,7 @@ class BaseCrawlOps:
         sign_files = []
 
         async for result in cursor:
-            pages_optimized = result.get("version") == 2
+            pages_optimized = (result.get("version") or 1) >= 2
 
             mapping = {}
             # create mapping of filename -> file data
@@ -970,7 +973,7 @@ class BaseCrawlOps:
         )
 
         # Get total
-        cursor = self.crawls.aggregate(aggregate)  # type: ignore
+        cursor = self.crawls.aggregate(aggregate, **max_time(self.crawls))  # type: ignore
         # pylint: disable=line-too-long
         # Argument 1 to "aggregate" of "AsyncIOMotorCollection" has incompatible type "list[object]"; expected "Sequence[Mapping[str, Any]]"
         results = await cursor.to_list(length=1)
@@ -984,7 +987,7 @@ class BaseCrawlOps:
 
         crawls = []
         for res in items:
-            crawl = cls_type.from_dict(res)
+            crawl = cls_type.from_dict_trusted(res)
 
             if resources or crawl.type == "crawl":
                 # pass files only if we want to include resolved resources
@@ -1063,11 +1066,12 @@ class BaseCrawlOps:
         if collection_id:
             match_query["collectionIds"] = {"$in": [collection_id]}
 
-        ids = await self.crawls.distinct("_id", match_query)
-        names = await self.crawls.distinct("name", match_query)
-        descriptions = await self.crawls.distinct("description", match_query)
+        crawls = analytics_reads(self.crawls)
+        ids = await crawls.distinct("_id", match_query)
+        names = await crawls.distinct("name", match_query)
+        descriptions = await crawls.distinct("description", match_query)
         cids = (
-            await self.crawls.distinct("cid", match_query)
+            await crawls.distinct("cid", match_query)
             if not type_ or type_ == "crawl"
             else []
         )
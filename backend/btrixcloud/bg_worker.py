@@ -0,0 +1,214 @@
+"""long-running background job worker"""
+
+import asyncio
+import os
+import secrets
+from collections import Counter
+from datetime import timedelta
+
+import structlog
+import pymongo
+
+from .logger import set_log_context
+from .crawlmanager import BG_WORKER_JOB_TYPES
+from .main_bg import run_job
+from .models import BackgroundJob, BgJobType
+from .ops import Ops
+from .utils import dt_now
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# max number of jobs of each type run concurrently by one worker
+DEFAULT_CONCURRENCY = {
+    BgJobType.DELETE_ORG: 1,
+    BgJobType.RECALCULATE_ORG_STATS: 2,
+    BgJobType.READD_ORG_PAGES: 1,
+    BgJobType.UPDATE_COLL_STATS: 4,
+    BgJobType.POSTPROCESS_UPLOAD: 4,
+}
+
+
+# ============================================================================
+def parse_concurrency(value: str) -> dict[str, int]:
+    """parse per job type concurrency limits from
+    'job-type=N,job-type=N' string, on top of the defaults"""
+    concurrency: dict[str, int] = {str(k): v for k, v in DEFAULT_CONCURRENCY.items()}
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+        job_type, limit = part.split("=", 1)
+        job_type = job_type.strip()
+        if job_type in concurrency:
+            concurrency[job_type] = int(limit)
+
+    return concurrency
+
+
+# ============================================================================
+# pylint: disable=too-many-instance-attributes
+class BgJobWorker:
+    """Runs background jobs queued in the jobs collection, holding a lease on
+    each running job that is renewed by heartbeats. Jobs whose lease expires,
+    eg. if the worker pod is restarted, are picked up again by any worker."""
+
+    def __init__(self, ops: Ops):
+        self.ops = ops
+        self.background_job_ops = ops.background_job_ops
+        self.jobs = ops.mdb["jobs"]
+
+        self.worker_id = (
+            os.environ.get("HOSTNAME") or f"bg-worker-{secrets.token_hex(5)}"
+        )
+
+        self.lease_secs = int(os.environ.get("BG_WORKER_LEASE_SECONDS", 60))
+        self.poll_secs = float(os.environ.get("BG_WORKER_POLL_SECONDS", 2))
+        self.max_attempts = int(os.environ.get("BG_WORKER_MAX_ATTEMPTS", 3))
+        self.concurrency = parse_concurrency(
+            os.environ.get("BG_WORKER_CONCURRENCY", "")
+        )
+
+        self.running: dict[str, asyncio.Task] = {}
+        self.running_types: Counter[str] = Counter()
+
+    async def run(self) -> None:
+        """poll for queued jobs until cancelled"""
+        logger.info(
+            "bg_worker_started",
+            worker_id=self.worker_id,
+            concurrency=self.concurrency,
+        )
+
+        heartbeat = asyncio.create_task(self.heartbeat_loop())
+        try:
+            while True:
+                try:
+                    claimed = await self.claim_jobs()
+                # pylint: disable=broad-exception-caught
+                except Exception:
+                    logger.exception("bg_worker_claim_failed")
+                    claimed = 0
+
+                if not claimed:
+                    await asyncio.sleep(self.poll_secs)
+        finally:
+            heartbeat.cancel()
+
+    async def claim_jobs(self) -> int:
+        """claim queued jobs up to concurrency limit of each job type,
+        returns number of jobs claimed"""
+        claimed = 0
+        for job_type in BG_WORKER_JOB_TYPES:
+            while self.running_types[job_type] < self.concurrency.get(job_type, 1):
+                job = await self.claim_job(job_type)
+                if not job:
+                    break
+
+                claimed += 1
+                self.running_types[job_type] += 1
+                task = asyncio.create_task(self.run_claimed_job(job))
+                self.running[job.id] = task
+
+        return claimed
+
+    async def claim_job(self, job_type: str) -> BackgroundJob | None:
+        """atomically lease oldest queued job of type that is not leased"""
+        now = dt_now()
+        res = await self.jobs.find_one_and_update(
+            {
+                "workerQueued": True,
+                "type": job_type,
+                "finished": None,
+                "$or": [{"leaseExpires": None}, {"leaseExpires": {"$lt": now}}],
+            },
+            {
+                "$set": {
+                    "leaseOwner": self.worker_id,
+                    "leaseExpires": now + timedelta(seconds=self.lease_secs),
+                },
+                "$inc": {"leaseAttempts": 1},
+            },
+            sort=[("started", pymongo.ASCENDING)],
+            return_document=pymongo.ReturnDocument.AFTER,
+        )
+        if not res:
+            return None
+
+        return await self.background_job_ops.get_background_job(res["_id"])
+
+    async def run_claimed_job(self, job: BackgroundJob) -> None:
+        """run job and mark as finished, releasing lease"""
+        if job.oid:
+            set_log_context(oid=job.oid)
+
+        job_logger = logger.bind(job_id=job.id, job_type=job.type)
+
+        try:
+            if job.leaseAttempts > self.max_attempts:
+                # lease repeatedly lost while running, eg. worker crashing
+                job_logger.error(
+                    "bg_worker_job_max_attempts", attempts=job.leaseAttempts
+                )
+                success = False
+            else:
+                job_logger.info("bg_worker_job_started", attempt=job.leaseAttempts)
+                code = await run_job(
+                    self.ops,
+                    job.type,
+                    oid=str(job.oid) if job.oid else None,
+                    crawl_type=(
+                        "upload"
+                        if job.type == BgJobType.POSTPROCESS_UPLOAD
+                        else getattr(job, "crawl_type", None)
+                    ),
+                    crawl_id=getattr(job, "crawl_id", None),
+                    coll_id=(
+                        str(job.collection_id)
+                        if hasattr(job, "collection_id")
+                        else None
+                    ),
+                )
+                success = code == 0
+
+            await self.background_job_ops.job_finished(
+                job.id,
+                job.type,
+                success=success,
+                started=job.started,
+                finished=dt_now(),
+                oid=job.oid,
+            )
+            job_logger.info("bg_worker_job_finished", success=success)
+
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            # lease will expire and job will be retried
+            job_logger.exception("bg_worker_job_error")
+
+        finally:
+            self.running.pop(job.id, None)
+            self.running_types[job.type] -= 1
+
+    async def heartbeat_loop(self) -> None:
+        """renew leases of running jobs"""
+        while True:
+            await asyncio.sleep(self.lease_secs / 3)
+            if not self.running:
+                continue
+
+            try:
+                await self.jobs.update_many(
+                    {
+                        "_id": {"$in": list(self.running.keys())},
+                        "leaseOwner": self.worker_id,
+                        "finished": None,
+                    },
+                    {
+                        "$set": {
+                            "leaseExpires": dt_now()
+                            + timedelta(seconds=self.lease_secs)
+                        }
+                    },
+                )
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.exception("bg_worker_heartbeat_failed")
@@ -18,7 +18,7 @@ from fastapi.responses import StreamingResponse
 from starlette.requests import Request
 
 from .auth import get_custom_jwt_token
-from .crawlmanager import CrawlManager
+from .db import analytics_reads, max_time
 from .models import (
     MIN_UPLOAD_PART_SIZE,
     SUCCESSFUL_STATES,
@@ -59,6 +59,7 @@ from .models import (
     UserFilePreparer,
 )
 from .pagination import DEFAULT_PAGE_SIZE, paginated_format
+from .responsecache import ResponseCache, set_public_preflight_headers
 from .utils import (
     case_insensitive_collation,
     dt_now,
@@ -70,6 +71,7 @@ from .utils import (
 
 if TYPE_CHECKING:
     from .background_jobs import BackgroundJobOps
+    from .crawlmanager import CrawlManager
     from .crawls import CrawlOps
     from .orgs import OrgOps
     from .pages import PageOps
@@ -79,11 +81,14 @@ else:
     OrgOps = StorageOps = EventWebhookOps = CrawlOps = PageOps = BackgroundJobOps = (
         object
     )
+    CrawlManager = object
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 THUMBNAIL_MAX_SIZE = 2_000_000
 
+THUMBNAIL_CACHE_CONTROL = "max-age=3600, stale-while-revalidate=86400"
+
 
 # ============================================================================
 class CollectionOps:
@@ -114,6 +119,8 @@ class CollectionOps:
         self.pages = mdb["pages"]
         self.crawl_ops = cast(CrawlOps, None)
 
+        self.response_cache = ResponseCache(mdb)
+
         self.orgs = orgs
         self.storage_ops = storage_ops
         self.crawl_manager = crawl_manager
@@ -151,6 +158,8 @@ class CollectionOps:
             [("oid", pymongo.ASCENDING), ("description", pymongo.ASCENDING)]
         )
 
+        await self.response_cache.init_index()
+
     async def add_collection(self, org: Organization, coll_in: CollIn):
         """Add new collection"""
         crawl_ids = coll_in.crawlIds if coll_in.crawlIds else []
@@ -502,7 +511,7 @@ class CollectionOps:
 
     async def get_public_thumbnail(
         self, slug: str, org: Organization, headers: dict
-    ) -> StreamingResponse:
+    ) -> StreamingResponse | Response:
         """return thumbnail of public collection, if any"""
         result = await self.get_collection_raw_by_slug(
             slug, org.id, public_or_unlisted_only=True
@@ -513,6 +522,14 @@ class CollectionOps:
             raise HTTPException(status_code=404, detail="thumbnail_not_found")
 
         image_file = UserFile(**thumbnail)
+        etag = f'"{image_file.hash}"'
+
+        if etag in (headers.get("if-none-match") or ""):
+            return Response(
+                status_code=304,
+                headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL, "Etag": etag},
+            )
+
         image_file_out = await image_file.get_public_file_out(
             org, self.storage_ops, headers
         )
@@ -526,9 +543,9 @@ class CollectionOps:
                         yield chunk
 
         headers = {
-            "Cache-Control": "max-age=3600, stale-while-revalidate=86400",
+            "Cache-Control": THUMBNAIL_CACHE_CONTROL,
             "Content-Length": f"{image_file.size}",
-            "Etag": f'"{image_file.hash}"',
+            "Etag": etag,
         }
         return StreamingResponse(reader(), media_type=image_file.mime, headers=headers)
 
@@ -611,7 +628,9 @@ class CollectionOps:
         )
 
         cursor = self.collections.aggregate(
-            aggregate, collation=case_insensitive_collation
+            aggregate,
+            collation=case_insensitive_collation,
+            **max_time(self.collections),
         )
         results = await cursor.to_list(length=1)
         result = results[0]
@@ -642,9 +661,9 @@ class CollectionOps:
             res["orgPublicProfile"] = org.enablePublicProfile
 
             if public_colls_out:
-                collections.append(PublicCollOut.from_dict(res))
+                collections.append(PublicCollOut.from_dict_trusted(res))
             else:
-                collections.append(CollOut.from_dict(res))
+                collections.append(CollOut.from_dict_trusted(res))
 
         return collections, total
 
@@ -681,7 +700,9 @@ class CollectionOps:
 
     async def get_collection_search_values(self, org: Organization):
         """Return list of collection names"""
-        names = await self.collections.distinct("name", {"oid": org.id})
+        names = await analytics_reads(self.collections).distinct(
+            "name", {"oid": org.id}
+        )
         # Remove empty strings
         names = [name for name in names if name]
         return {"names": names}
@@ -1498,20 +1519,28 @@ def init_collections_api(
     )
     async def get_collection_public_replay(
         request: Request,
-        response: Response,
         coll_id: UUID,
         org: Organization = Depends(org_public),
     ):
-        coll = await colls.get_collection_out(
-            coll_id,
-            org,
-            resources=True,
-            public_or_unlisted_only=True,
-            headers=dict(request.headers),
+        headers = dict(request.headers)
+        coll_raw = await colls.get_collection_raw(
+            coll_id, org.id, public_or_unlisted_only=True
+        )
+
+        async def render():
+            return await colls.get_collection_out(
+                coll_id,
+                org,
+                resources=True,
+                public_or_unlisted_only=True,
+                headers=headers,
+            )
+
+        return await colls.response_cache.get_public_response(
+            headers,
+            ["public_replay", coll_raw, org.slug, get_origin(headers)],
+            render,
         )
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        return coll
 
     @app.options(
         "/orgs/{oid}/collections/{coll_id}/public/replay.json",
@@ -1519,9 +1548,7 @@ def init_collections_api(
         response_model=EmptyResponse,
     )
     async def get_replay_preflight(response: Response):
-        response.headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
+        set_public_preflight_headers(response)
         return {}
 
     @app.patch(
@@ -1628,9 +1655,23 @@ def init_collections_api(
             raise HTTPException(status_code=404, detail="collection_not_found")
 
         coll = await colls.get_collection_by_slug(coll_slug, org.id)
+        headers = dict(request.headers)
+
+        async def render():
+            return await colls.get_public_collection_out(
+                coll.id, org, headers, allow_unlisted=True
+            )
 
-        return await colls.get_public_collection_out(
-            coll.id, org, dict(request.headers), allow_unlisted=True
+        return await colls.response_cache.get_response(
+            headers,
+            [
+                "public_coll",
+                coll.dict(),
+                org.name,
+                org.enablePublicProfile,
+                get_origin(headers),
+            ],
+            render,
         )
 
     @app.get(
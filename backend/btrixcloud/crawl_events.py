@@ -0,0 +1,260 @@
+"""
+Live crawl and workflow status, pushed to clients as server-sent events.
+Each api process watches one change stream on crawls and crawl_configs and
+fans changes out to the clients of each org connected to it.
+"""
+
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator
+from typing import Any
+from uuid import UUID
+
+import structlog
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+
+from .metrics import CRAWL_EVENT_SUBSCRIBERS
+from .orgs import CHANGE_STREAM_UNSUPPORTED_CODES
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# seconds between keepalive comments on idle event streams
+CRAWL_EVENTS_KEEPALIVE = int(os.environ.get("CRAWL_EVENTS_KEEPALIVE_SECONDS") or 20)
+
+# events buffered per client, slower clients are disconnected and reconnect
+CRAWL_EVENTS_QUEUE_SIZE = 100
+
+# last sent values are kept for at most this many crawls and workflows
+CRAWL_EVENTS_MAX_TRACKED = 10000
+
+# fields pushed to clients, per event type
+CRAWL_EVENT_FIELDS = {
+    "crawl": (
+        "cid",
+        "state",
+        "stats",
+        "fileCount",
+        "fileSize",
+        "finished",
+        "qa.id",
+        "qa.state",
+        "qa.stats",
+    ),
+    "workflow": (
+        "lastCrawlId",
+        "lastCrawlState",
+        "lastCrawlSize",
+        "lastCrawlStartTime",
+        "lastCrawlTime",
+        "isCrawlRunning",
+        "crawlCount",
+        "crawlSuccessfulCount",
+    ),
+}
+
+EVENT_TYPES = {"crawls": "crawl", "crawl_configs": "workflow"}
+
+
+# ============================================================================
+def get_event_delta(
+    event_type: str, doc: dict[str, Any], last: dict[str, Any] | None
+) -> dict[str, Any]:
+    """Return pushed fields of doc that differ from last sent values"""
+    values: dict[str, Any] = {}
+    for field in CRAWL_EVENT_FIELDS[event_type]:
+        value: Any = doc
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values[field] = value
+
+    if last is None:
+        return values
+
+    return {field: value for field, value in values.items() if last.get(field) != value}
+
+
+# ============================================================================
+class CrawlEventOps:
+    """Change stream fan-out of crawl and workflow status to org clients"""
+
+    def __init__(self, mdb: AsyncIOMotorDatabase):
+        self.mdb = mdb
+        self.subscribers: dict[UUID, set[asyncio.Queue]] = {}
+        self.last_sent: dict[tuple[str, Any], dict[str, Any]] = {}
+        # crawls and workflows each client has been sent full values for
+        self.sent_keys: dict[asyncio.Queue, set[tuple[str, Any]]] = {}
+        self.watch_task: asyncio.Task | None = None
+        self.supported = True
+
+    def subscribe(self, oid: UUID) -> asyncio.Queue:
+        """add client for org, starting change stream if not yet running"""
+        queue: asyncio.Queue = asyncio.Queue(CRAWL_EVENTS_QUEUE_SIZE)
+        self.subscribers.setdefault(oid, set()).add(queue)
+        self.sent_keys[queue] = set()
+        CRAWL_EVENT_SUBSCRIBERS.set(self.num_subscribers())
+
+        if not self.watch_task or self.watch_task.done():
+            self.watch_task = asyncio.create_task(self.watch_changes())
+
+        return queue
+
+    def unsubscribe(self, oid: UUID, queue: asyncio.Queue) -> None:
+        """remove client for org"""
+        queues = self.subscribers.get(oid)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                self.subscribers.pop(oid, None)
+
+        self.sent_keys.pop(queue, None)
+        CRAWL_EVENT_SUBSCRIBERS.set(self.num_subscribers())
+
+    def num_subscribers(self) -> int:
+        """number of connected clients"""
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    def _end_stream(self, queue: asyncio.Queue) -> None:
+        """end client stream, dropping its oldest event if queue is full"""
+        self.sent_keys.pop(queue, None)
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def _close_all(self) -> None:
+        """end all client streams, clients reconnect or fall back to polling"""
+        for queues in self.subscribers.values():
+            for queue in queues:
+                self._end_stream(queue)
+        self.subscribers = {}
+        CRAWL_EVENT_SUBSCRIBERS.set(0)
+
+    def handle_change(self, change: dict[str, Any]) -> None:
+        """send delta for changed crawl or workflow to clients of its org.
+        Clients load current state from the api, then apply deltas to it.
+        A client's first event for a crawl or workflow has all fields, as it
+        may have connected after the last sent values"""
+        event_type = EVENT_TYPES.get(change.get("ns", {}).get("coll"))
+        doc = change.get("fullDocument")
+        if not event_type or not doc:
+            return
+
+        if event_type == "crawl" and doc.get("type") != "crawl":
+            return
+
+        queues = self.subscribers.get(doc.get("oid"))
+        key = (event_type, doc["_id"])
+        if not queues:
+            self.last_sent.pop(key, None)
+            return
+
+        delta = get_event_delta(event_type, doc, self.last_sent.get(key))
+        if not delta:
+            return
+
+        if len(self.last_sent) >= CRAWL_EVENTS_MAX_TRACKED:
+            self.last_sent.clear()
+            for sent in self.sent_keys.values():
+                sent.clear()
+
+        values = get_event_delta(event_type, doc, None)
+        self.last_sent[key] = values
+
+        messages = {}
+        for full, data in ((False, delta), (True, values)):
+            data = {**data, "id": doc["_id"]}
+            messages[full] = (
+                f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+            )
+
+        for queue in list(queues):
+            sent = self.sent_keys.setdefault(queue, set())
+            try:
+                queue.put_nowait(messages[key not in sent])
+            except asyncio.QueueFull:
+                # client is not keeping up, end its stream so it reconnects
+                queues.discard(queue)
+                self._end_stream(queue)
+            else:
+                sent.add(key)
+
+    async def watch_changes(self) -> None:
+        """watch crawls and workflows while there are clients connected"""
+        pipeline: list[dict[str, Any]] = [
+            {
+                "$match": {
+                    "operationType": {"$in": ["insert", "update", "replace"]},
+                    "ns.coll": {"$in": list(EVENT_TYPES)},
+                }
+            },
+            {
+                "$project": {
+                    "ns": 1,
+                    "fullDocument._id": 1,
+                    "fullDocument.oid": 1,
+                    "fullDocument.type": 1,
+                    **{
+                        f"fullDocument.{field}": 1
+                        for fields in CRAWL_EVENT_FIELDS.values()
+                        for field in fields
+                    },
+                }
+            },
+        ]
+        while self.subscribers:
+            try:
+                async with self.mdb.watch(
+                    pipeline, full_document="updateLookup"
+                ) as stream:
+                    async for change in stream:
+                        self.handle_change(change)
+                        if not self.subscribers:
+                            break
+
+            except OperationFailure as exc:
+                if exc.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.info(
+                        "crawl_events_change_stream_unsupported",
+                        unstructured_message="Live crawl updates unavailable",
+                    )
+                    self.supported = False
+                    self._close_all()
+                    return
+
+                logger.warning("crawl_events_change_stream_failed", exc_info=True)
+
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.warning("crawl_events_change_stream_failed", exc_info=True)
+
+            else:
+                continue
+
+            # stream may have missed changes, clients refetch when reconnecting
+            self._close_all()
+            self.last_sent.clear()
+            return
+
+        self.last_sent.clear()
+
+    async def stream_events(self, oid: UUID) -> AsyncIterator[str]:
+        """server-sent events for org, until client disconnects"""
+        queue = self.subscribe(oid)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(
+                        queue.get(), timeout=CRAWL_EVENTS_KEEPALIVE
+                    )
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+
+                if message is None:
+                    return
+
+                yield message
+        finally:
+            self.unsubscribe(oid, queue)
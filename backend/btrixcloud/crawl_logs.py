@@ -1,22 +1,52 @@
 """crawl logs"""
 
+import gzip
+import heapq
 import json
+import os
+from collections import Counter
+from collections.abc import AsyncIterator
 from typing import TYPE_CHECKING, Any
-from uuid import UUID, uuid4
+from uuid import NAMESPACE_URL, UUID, uuid4, uuid5
 
 import structlog
 import pymongo
 from fastapi import HTTPException
 
-from .models import CrawlLogLine, Organization
+from .db import max_time
+from .metrics import CRAWL_LOG_LINES_ADDED
+from .models import (
+    CrawlLogLine,
+    CrawlLogSegment,
+    CrawlLogSegmentBlock,
+    Organization,
+)
 from .pagination import DEFAULT_PAGE_SIZE
+from .utils import dt_now, is_bool
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 if TYPE_CHECKING:
     from .orgs import OrgOps
+    from .storages import StorageOps
 else:
-    OrgOps = object
+    OrgOps = StorageOps = object
+
+# if set, logs of finished crawls and QA runs are moved from the db to a
+# gzipped log segment in the org's storage
+CRAWL_LOG_SEGMENTS_ENABLED = is_bool(os.environ.get("CRAWL_LOG_SEGMENTS_ENABLED"))
+
+# lines per independently gzipped block of a log segment, a query reads
+# only the blocks with lines on the requested page
+CRAWL_LOG_SEGMENT_BLOCK_LINES = 1000
+
+# number of logs deleted per query once written to a segment
+DELETE_BATCH_SIZE = 5000
+
+# fields of log lines stored in log segments
+SEGMENT_LINE_FIELDS = ("timestamp", "logLevel", "context", "message", "details")
+
+SORT_FIELDS = ("timestamp", "logLevel", "context", "message")
 
 
 # ============================================================================
@@ -24,12 +54,15 @@ class CrawlLogOps:
     """crawl log management"""
 
     org_ops: OrgOps
+    storage_ops: StorageOps
 
     # pylint: disable=too-many-locals, too-many-arguments, invalid-name
 
-    def __init__(self, mdb, org_ops):
+    def __init__(self, mdb, org_ops, storage_ops):
         self.logs = mdb["crawl_logs"]
+        self.segments = mdb["crawl_log_segments"]
         self.org_ops = org_ops
+        self.storage_ops = storage_ops
 
     async def init_index(self):
         """init index for crawl logs"""
@@ -65,6 +98,97 @@ class CrawlLogOps:
                 ("message", pymongo.ASCENDING),
             ]
         )
+        await self.segments.create_index(
+            [("crawlId", pymongo.ASCENDING), ("qaRunId", pymongo.ASCENDING)],
+            unique=True,
+        )
+
+    def _get_log_line(
+        self,
+        crawl_id: str,
+        oid: UUID,
+        log_line: str,
+        qa_run_id: str | None,
+        log_id: UUID,
+    ) -> CrawlLogLine:
+        """parse log line from crawler"""
+        log_dict = json.loads(log_line)
+
+        # Ensure details are a dictionary
+        # If they are a list, convert to a dict
+        details = None
+        log_dict_details = log_dict.get("details")
+        if log_dict_details:
+            if isinstance(log_dict_details, dict):
+                details = log_dict_details
+            else:
+                details = {"items": log_dict_details}
+
+        return CrawlLogLine(
+            id=log_id,
+            crawlId=crawl_id,
+            oid=oid,
+            qaRunId=qa_run_id,
+            timestamp=log_dict["timestamp"],
+            logLevel=log_dict["logLevel"],
+            context=log_dict["context"],
+            message=log_dict["message"],
+            details=details,
+        )
+
+    async def add_log_lines(
+        self,
+        crawl_id: str,
+        oid: UUID,
+        log_lines: list[str],
+        qa_run_id: str | None = None,
+        offset: int = 0,
+    ) -> int:
+        """add batch of crawl log lines to database in one insert.
+
+        Log line ids are derived from the crawl, QA run, position of the line
+        in the crawl's log, starting at offset for the batch, and the line.
+        A batch can be added again from the same offset after a failure
+        without duplicating lines, while identical lines are kept. Lines that
+        can't be parsed are skipped. Raises if batch is not added.
+        """
+        logs_to_add = []
+        for index, log_line in enumerate(log_lines, offset):
+            log_id = uuid5(
+                NAMESPACE_URL, f"{crawl_id}:{qa_run_id or ''}:{index}:{log_line}"
+            )
+            try:
+                logs_to_add.append(
+                    self._get_log_line(crawl_id, oid, log_line, qa_run_id, log_id)
+                )
+            # pylint: disable=broad-exception-caught
+            except Exception as err:
+                logger.warning(
+                    "crawl_log_line_invalid",
+                    crawl_id=crawl_id,
+                    oid=oid,
+                    qa_run_id=qa_run_id,
+                    log_line=log_line,
+                    unstructured_message=f"Skipping invalid log line: {err}",
+                )
+
+        if not logs_to_add:
+            return 0
+
+        try:
+            await self.logs.insert_many(
+                [log.to_dict() for log in logs_to_add], ordered=False
+            )
+        except pymongo.errors.BulkWriteError as bwe:
+            for write_error in bwe.details.get("writeErrors", []):
+                # already added by an earlier attempt
+                if write_error.get("code") != 11000:
+                    raise
+
+        for level, count in Counter(log.logLevel for log in logs_to_add).items():
+            CRAWL_LOG_LINES_ADDED.inc(level, amount=count)
+
+        return len(logs_to_add)
 
     async def add_log_line(
         self,
@@ -75,30 +199,9 @@ class CrawlLogOps:
     ) -> bool:
         """add crawl log line to database"""
         try:
-            log_dict = json.loads(log_line)
-
-            # Ensure details are a dictionary
-            # If they are a list, convert to a dict
-            details = None
-            log_dict_details = log_dict.get("details")
-            if log_dict_details:
-                if isinstance(log_dict_details, dict):
-                    details = log_dict_details
-                else:
-                    details = {"items": log_dict_details}
-
-            log_to_add = CrawlLogLine(
-                id=uuid4(),
-                crawlId=crawl_id,
-                oid=oid,
-                qaRunId=qa_run_id,
-                timestamp=log_dict["timestamp"],
-                logLevel=log_dict["logLevel"],
-                context=log_dict["context"],
-                message=log_dict["message"],
-                details=details,
-            )
+            log_to_add = self._get_log_line(crawl_id, oid, log_line, qa_run_id, uuid4())
             res = await self.logs.insert_one(log_to_add.to_dict())
+            CRAWL_LOG_LINES_ADDED.inc(log_to_add.logLevel)
             return res is not None
         # pylint: disable=broad-exception-caught
         except Exception as err:
@@ -126,19 +229,81 @@ class CrawlLogOps:
         log_levels: list[str] | None = None,
         qa_run_id: str | None = None,
     ) -> tuple[list[CrawlLogLine], int]:
-        """list all logs for particular crawl"""
+        """list all logs for particular crawl, from log segment in storage
+        if logs have been moved there, otherwise from db"""
         # pylint: disable=too-many-locals, duplicate-code
 
         # Zero-index page for query
         page = page - 1
         skip = page_size * page
 
+        if sort_by:
+            if sort_by not in SORT_FIELDS:
+                raise HTTPException(status_code=400, detail="invalid_sort_by")
+            if sort_direction not in (1, -1):
+                raise HTTPException(status_code=400, detail="invalid_sort_direction")
+
         match_query: dict[str, Any] = {
             "oid": org.id,
             "crawlId": crawl_id,
             "qaRunId": qa_run_id,
         }
 
+        segment_raw = await self.segments.find_one(match_query)
+        if not segment_raw:
+            return await self._get_db_logs(
+                match_query,
+                skip,
+                page_size,
+                sort_by,
+                sort_direction,
+                contexts,
+                log_levels,
+            )
+
+        segment = CrawlLogSegment.from_dict(segment_raw)
+
+        if not await self.logs.find_one(match_query, projection=["_id"]):
+            return await self.get_segment_logs(
+                org,
+                segment,
+                skip,
+                page_size,
+                sort_by,
+                sort_direction,
+                contexts,
+                log_levels,
+            )
+
+        # lines added after logs were moved stay in db until moved by the
+        # operator, merge them with lines of the segment up to the page
+        limit = skip + page_size
+        segment_lines, segment_total = await self.get_segment_logs(
+            org, segment, 0, limit, sort_by, sort_direction, contexts, log_levels
+        )
+        db_lines, db_total = await self._get_db_logs(
+            match_query, 0, limit, sort_by, sort_direction, contexts, log_levels
+        )
+        merged = heapq.merge(
+            segment_lines,
+            db_lines,
+            key=lambda line: getattr(line, sort_by or "timestamp"),
+            reverse=sort_direction == -1,
+        )
+        return list(merged)[skip:limit], segment_total + db_total
+
+    async def _get_db_logs(
+        self,
+        match_query: dict[str, Any],
+        skip: int,
+        page_size: int,
+        sort_by: str,
+        sort_direction: int,
+        contexts: list[str] | None,
+        log_levels: list[str] | None,
+    ) -> tuple[list[CrawlLogLine], int]:
+        """list logs from db"""
+        match_query = dict(match_query)
         if contexts:
             match_query["context"] = {"$in": contexts}
 
@@ -148,16 +313,6 @@ class CrawlLogOps:
         aggregate: list[dict[str, Any]] = [{"$match": match_query}]
 
         if sort_by:
-            if sort_by not in (
-                "timestamp",
-                "logLevel",
-                "context",
-                "message",
-            ):
-                raise HTTPException(status_code=400, detail="invalid_sort_by")
-            if sort_direction not in (1, -1):
-                raise HTTPException(status_code=400, detail="invalid_sort_direction")
-
             aggregate.extend([{"$sort": {sort_by: sort_direction}}])
 
         aggregate.extend(
@@ -174,7 +329,7 @@ class CrawlLogOps:
             ]
         )
 
-        cursor = self.logs.aggregate(aggregate)
+        cursor = self.logs.aggregate(aggregate, **max_time(self.logs))
         results = await cursor.to_list(length=1)
         result = results[0]
         items = result["items"]
@@ -184,16 +339,336 @@ class CrawlLogOps:
         except (IndexError, ValueError):
             total = 0
 
-        log_lines = [CrawlLogLine.from_dict(res) for res in items]
+        log_lines = [CrawlLogLine.from_dict_trusted(res) for res in items]
 
         return log_lines, total
 
+    async def get_segment_logs(
+        self,
+        org: Organization,
+        segment: CrawlLogSegment,
+        skip: int,
+        page_size: int,
+        sort_by: str,
+        sort_direction: int,
+        contexts: list[str] | None,
+        log_levels: list[str] | None,
+    ) -> tuple[list[CrawlLogLine], int]:
+        """list logs from log segment, reading only blocks needed for page.
+
+        Lines are stored sorted by timestamp, so for timestamp order (or no
+        order) only blocks with lines on the page are read. For other sort
+        orders, all blocks with matching lines are read and sorted.
+        """
+
+        def matches(level: str, context: str) -> bool:
+            return (not log_levels or level in log_levels) and (
+                not contexts or context in contexts
+            )
+
+        counts = [
+            sum(
+                count
+                for level, context, count in block.counts
+                if matches(level, context)
+            )
+            for block in segment.blocks
+        ]
+        total = sum(counts)
+
+        order = list(range(len(segment.blocks)))
+        reverse = sort_direction == -1
+        if reverse:
+            order.reverse()
+
+        # blocks to read, and matching lines in them before the page
+        indexes: list[int] = []
+        block_skip = skip
+        if sort_by in ("timestamp", ""):
+            pos = 0
+            for index in order:
+                if pos + counts[index] <= skip:
+                    pos += counts[index]
+                    continue
+                if pos >= skip + page_size:
+                    break
+                if not indexes:
+                    block_skip = skip - pos
+                indexes.append(index)
+                pos += counts[index]
+        else:
+            indexes = [index for index in order if counts[index]]
+
+        if not indexes or skip >= total:
+            return [], total
+
+        blocks = [segment.blocks[index] for index in indexes]
+        start = min(block.offset for block in blocks)
+        end = max(block.offset + block.length for block in blocks)
+
+        data = await self.storage_ops.get_file_range(
+            org, segment.storage, segment.filename, start, end - 1
+        )
+
+        lines: list[dict[str, Any]] = []
+        for block in blocks:
+            block_data = data[
+                block.offset - start : block.offset - start + block.length
+            ]
+            block_lines = [
+                line
+                for line in map(json.loads, gzip.decompress(block_data).splitlines())
+                if matches(line["logLevel"], line["context"])
+            ]
+            if reverse:
+                block_lines.reverse()
+            lines.extend(block_lines)
+
+        if sort_by not in ("timestamp", ""):
+            lines.sort(key=lambda line: line[sort_by], reverse=reverse)
+
+        log_lines = [
+            CrawlLogLine(
+                **line,
+                crawlId=segment.crawlId,
+                oid=segment.oid,
+                qaRunId=segment.qaRunId,
+            )
+            for line in lines[block_skip : block_skip + page_size]
+        ]
+
+        return log_lines, total
+
+    async def move_logs_to_segment(
+        self, crawl_id: str, oid: UUID, qa_run_id: str | None = None
+    ) -> None:
+        """Move logs of finished crawl or QA run from db to a gzipped log
+        segment in the org's primary storage, if enabled.
+
+        Lines are sorted by timestamp and written in blocks, with the byte
+        range and count of lines per log level and context of each block
+        stored in the db. If logs were already moved, lines added since are
+        merged with the segment's lines into a new segment replacing it.
+        Only lines written to the segment are deleted from the db, if storing
+        it fails they stay in the db.
+        """
+        if not CRAWL_LOG_SEGMENTS_ENABLED:
+            return
+
+        query: dict[str, Any] = {"crawlId": crawl_id, "oid": oid, "qaRunId": qa_run_id}
+
+        segment_logger = logger.bind(crawl_id=crawl_id, oid=oid, qa_run_id=qa_run_id)
+
+        try:
+            segment_raw = await self.segments.find_one(query)
+            prev = CrawlLogSegment.from_dict(segment_raw) if segment_raw else None
+
+            segment, log_ids = await self._write_segment(
+                crawl_id, oid, qa_run_id, query, prev
+            )
+            if segment and not await self._store_segment(segment, prev):
+                # segment stored by another process at the same time, lines
+                # it didn't include are moved next time
+                segment_logger.info(
+                    "crawl_logs_segment_superseded", filename=segment.filename
+                )
+                await self._delete_segment_file(segment, segment.filename)
+                return
+
+            if segment:
+                segment_logger.info(
+                    "crawl_logs_moved_to_segment",
+                    total=segment.total,
+                    size=segment.size,
+                    filename=segment.filename,
+                )
+
+            for i in range(0, len(log_ids), DELETE_BATCH_SIZE):
+                await self.logs.delete_many(
+                    {"_id": {"$in": log_ids[i : i + DELETE_BATCH_SIZE]}}
+                )
+
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            segment_logger.exception(
+                "crawl_logs_segment_failed",
+                unstructured_message=f"Error moving logs for {crawl_id} to storage",
+            )
+
+    async def _store_segment(
+        self, segment: CrawlLogSegment, prev: CrawlLogSegment | None
+    ) -> bool:
+        """store segment, replacing prev segment only if it hasn't been
+        replaced since it was read. Returns false if not stored.
+
+        Readers may still be reading the previous file, so it is kept until
+        the segment is replaced again, and the file replaced before it is
+        deleted instead."""
+        if not prev:
+            try:
+                await self.segments.insert_one(segment.to_dict())
+                return True
+            except pymongo.errors.DuplicateKeyError:
+                return False
+
+        segment.id = prev.id
+        segment.prevFilename = prev.filename
+        result = await self.segments.replace_one(
+            {"_id": prev.id, "filename": prev.filename}, segment.to_dict()
+        )
+        if not result.matched_count:
+            return False
+
+        if prev.prevFilename:
+            await self._delete_segment_file(prev, prev.prevFilename)
+
+        return True
+
+    async def _read_segment_lines(
+        self, segment: CrawlLogSegment
+    ) -> list[dict[str, Any]]:
+        """read all lines of segment, in timestamp order"""
+        org = await self.org_ops.get_org_by_id(segment.oid)
+        data = await self.storage_ops.get_file_range(
+            org, segment.storage, segment.filename, 0, segment.size - 1
+        )
+        return [json.loads(line) for line in gzip.decompress(data).splitlines()]
+
+    async def _get_db_lines(
+        self, query: dict[str, Any], log_ids: list[UUID], skip_ids: set[str]
+    ) -> AsyncIterator[dict[str, Any]]:
+        """yield lines of logs in db in timestamp order, in segment line
+        format, adding ids to log_ids. Lines with ids in skip_ids are not
+        yielded, but still added"""
+        cursor = self.logs.find(query).sort("timestamp", pymongo.ASCENDING)
+        async for log_raw in cursor:
+            log_ids.append(log_raw["_id"])
+            line = {field: log_raw.get(field) for field in SEGMENT_LINE_FIELDS}
+            line["id"] = str(log_raw["_id"])
+            if line["id"] in skip_ids:
+                continue
+
+            line["timestamp"] = log_raw["timestamp"].isoformat()
+            yield line
+
+    async def _write_segment(
+        self,
+        crawl_id: str,
+        oid: UUID,
+        qa_run_id: str | None,
+        query: dict[str, Any],
+        prev: CrawlLogSegment | None,
+    ) -> tuple[CrawlLogSegment | None, list[UUID]]:
+        """write logs to segment in storage, merged with lines of previous
+        segment if any. returns segment, or None if there are no new lines,
+        and ids of logs in db that are now in storage"""
+        blocks: list[CrawlLogSegmentBlock] = []
+        chunks: list[bytes] = []
+        offset = 0
+        total = 0
+
+        def add_block(lines: list[bytes], counts: Counter) -> None:
+            nonlocal offset
+            chunk = gzip.compress(b"".join(lines))
+            blocks.append(
+                CrawlLogSegmentBlock(
+                    offset=offset,
+                    length=len(chunk),
+                    counts=[
+                        (level, context, n) for (level, context), n in counts.items()
+                    ],
+                )
+            )
+            chunks.append(chunk)
+            offset += len(chunk)
+
+        prev_lines = await self._read_segment_lines(prev) if prev else []
+        # lines may already be in previous segment if deleting them failed
+        prev_ids = {line["id"] for line in prev_lines}
+
+        log_ids: list[UUID] = []
+        db_lines = [line async for line in self._get_db_lines(query, log_ids, prev_ids)]
+        if not db_lines:
+            return None, log_ids
+
+        lines: list[bytes] = []
+        counts: Counter = Counter()
+
+        for line in heapq.merge(
+            prev_lines, db_lines, key=lambda line: line["timestamp"]
+        ):
+            lines.append(json.dumps(line, default=str).encode("utf-8") + b"\n")
+            counts[(line["logLevel"], line["context"])] += 1
+            total += 1
+
+            if len(lines) >= CRAWL_LOG_SEGMENT_BLOCK_LINES:
+                add_block(lines, counts)
+                lines = []
+                counts = Counter()
+
+        if lines:
+            add_block(lines, counts)
+
+        org = await self.org_ops.get_org_by_id(oid)
+
+        # gzip members concatenated are a valid gzip file
+        data = b"".join(chunks)
+        segment_id = uuid4()
+        filename = org.storage.get_storage_extra_path(str(oid)) + "logs/" + crawl_id
+        if qa_run_id:
+            filename += "-" + qa_run_id
+        # replacement segment is written to a new file, previous file may
+        # still be read until segment is replaced
+        if prev:
+            filename += "-" + str(segment_id)
+        filename += ".log.gz"
+
+        await self.storage_ops.do_upload_single(org, filename, data)
+
+        segment = CrawlLogSegment(
+            id=segment_id,
+            crawlId=crawl_id,
+            oid=oid,
+            qaRunId=qa_run_id,
+            filename=filename,
+            storage=org.storage,
+            size=len(data),
+            total=total,
+            blocks=blocks,
+            created=dt_now(),
+        )
+        return segment, log_ids
+
+    async def _delete_segment_file(
+        self, segment: CrawlLogSegment, filename: str
+    ) -> None:
+        """delete file of segment from storage, logging any error"""
+        try:
+            org = await self.org_ops.get_org_by_id(segment.oid)
+            await self.storage_ops.delete_file(org, filename, segment.storage)
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            logger.exception(
+                "crawl_log_segment_delete_failed",
+                crawl_id=segment.crawlId,
+                oid=segment.oid,
+                filename=filename,
+            )
+
     async def delete_crawl_logs(
         self, crawl_id: str, oid: UUID, qa_run_id: str | None = None
     ):
-        """Delete all logs from a specific crawl"""
+        """Delete all logs from a specific crawl, including log segments"""
         query: dict[str, str | UUID] = {"crawlId": crawl_id, "oid": oid}
         if qa_run_id:
             query["qaRunId"] = qa_run_id
 
+        async for segment_raw in self.segments.find(query):
+            segment = CrawlLogSegment.from_dict(segment_raw)
+            for filename in (segment.filename, segment.prevFilename):
+                if filename:
+                    await self._delete_segment_file(segment, filename)
+
+        await self.segments.delete_many(query)
+
         return await self.logs.delete_many(query)
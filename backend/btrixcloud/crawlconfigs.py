@@ -26,6 +26,7 @@ from motor.motor_asyncio import (
     AsyncIOMotorDatabase,
 )
 
+from .db import analytics_reads, max_time
 from .models import (
     ALL_CRAWL_STATES,
     SUCCESSFUL_STATES,
@@ -241,6 +242,10 @@ class CrawlConfigOps:
             [("name", pymongo.ASCENDING), ("firstSeed", pymongo.ASCENDING)]
         )
 
+        await self.crawl_configs.create_index(
+            [("config.seedFileId", pymongo.ASCENDING)], sparse=True
+        )
+
         await self.config_revs.create_index([("cid", pymongo.HASHED)])
 
         await self.config_revs.create_index(
@@ -942,7 +947,9 @@ class CrawlConfigOps:
         )
 
         cursor = self.crawl_configs.aggregate(
-            aggregate, collation=case_insensitive_collation
+            aggregate,
+            collation=case_insensitive_collation,
+            **max_time(self.crawl_configs),
         )
         results = await cursor.to_list(length=1)
         result = results[0]
@@ -1322,10 +1329,11 @@ class CrawlConfigOps:
         if profile_ids:
             query["profileid"] = {"$in": profile_ids}
 
-        names = await self.crawl_configs.distinct("name", query)
-        descriptions = await self.crawl_configs.distinct("description", query)
-        workflow_ids = await self.crawl_configs.distinct("_id", query)
-        first_seeds = await self.crawl_configs.distinct("firstSeed", query)
+        crawl_configs = analytics_reads(self.crawl_configs)
+        names = await crawl_configs.distinct("name", query)
+        descriptions = await crawl_configs.distinct("description", query)
+        workflow_ids = await crawl_configs.distinct("_id", query)
+        first_seeds = await crawl_configs.distinct("firstSeed", query)
 
         # Remove empty strings
         names = [name for name in names if name]
@@ -17,7 +17,7 @@ from .models import (
     ProfileBrowserMetadata,
     StorageRef,
 )
-from .utils import date_to_str, dt_now, scale_from_browser_windows
+from .utils import date_to_str, dt_now, is_bool, scale_from_browser_windows
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -28,6 +28,18 @@ DEFAULT_NAMESPACE: str = os.environ.get("DEFAULT_NAMESPACE", "default")
 
 BACKEND_ORIGIN: str = os.environ.get("BACKEND_ORIGIN", "")
 
+# if enabled, these job types are queued for the long-running background job
+# worker (main_bg_worker) instead of each being run as a new k8s Job
+BG_JOB_WORKER_ENABLED = is_bool(os.environ.get("BG_JOB_WORKER_ENABLED"))
+
+BG_WORKER_JOB_TYPES = (
+    BgJobType.DELETE_ORG,
+    BgJobType.RECALCULATE_ORG_STATS,
+    BgJobType.READD_ORG_PAGES,
+    BgJobType.UPDATE_COLL_STATS,
+    BgJobType.POSTPROCESS_UPLOAD,
+)
+
 
 # ============================================================================
 # pylint: disable=too-many-public-methods
@@ -240,6 +252,10 @@ class CrawlManager(K8sAPI):
             crawl_id=crawl_id,
         )
 
+    def is_bg_worker_job(self, job_type: str) -> bool:
+        """return true if job type is run by background job worker"""
+        return BG_JOB_WORKER_ENABLED and job_type in BG_WORKER_JOB_TYPES
+
     async def _run_bg_job_with_ops_classes(
         self,
         job_id: str,
@@ -249,6 +265,10 @@ class CrawlManager(K8sAPI):
     ) -> str:
         """run background job with access to ops classes"""
 
+        # job record is queued for the worker by the caller
+        if self.is_bg_worker_job(job_type):
+            return job_id
+
         params = {
             "id": job_id,
             "job_type": job_type,
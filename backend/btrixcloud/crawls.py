@@ -7,10 +7,17 @@ import contextlib
 import json
 import os
 import re
+import time
 import urllib.parse
-from collections.abc import AsyncGenerator, AsyncIterator, Callable, Sequence
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Sequence,
+)
 from datetime import datetime
-from typing import Annotated, Any
+from typing import TYPE_CHECKING, Annotated, Any
 from uuid import UUID
 
 import structlog
@@ -20,12 +27,15 @@ from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from redis import asyncio as exceptions
 from redis.asyncio.client import Redis
+from redis.commands.core import AsyncScript
 
 from .basecrawls import BaseCrawlOps
-from .crawlmanager import CrawlManager
+from .crawl_events import CrawlEventOps
+from .db import max_time
 from .models import (
     ALL_CRAWL_STATES,
     NON_RUNNING_STATES,
+    PAGES_VERSION,
     RUNNING_AND_WAITING_STATES,
     SUCCESSFUL_STATES,
     TYPE_ALL_CRAWL_STATES,
@@ -77,11 +87,96 @@ from .utils import (
     validate_regexes,
 )
 
+if TYPE_CHECKING:
+    from .crawlmanager import CrawlManager
+else:
+    CrawlManager = object
+
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 MAX_MATCH_SIZE = 500000
 DEFAULT_RANGE_LIMIT = 50
 
+# number of queue entries read from redis per script call when matching
+QUEUE_SCAN_LIMIT = 5000
+
+# queue snapshots are kept for this many seconds, and for at most this many
+# crawls / urls each, before being rescanned from redis
+QUEUE_SNAPSHOT_TTL = 15
+QUEUE_SNAPSHOT_MAX_CRAWLS = 16
+QUEUE_SNAPSHOT_MAX_URLS = 100000
+
+# oldest snapshots of other crawls are dropped when the snapshots of all
+# crawls hold more urls than this
+QUEUE_SNAPSHOT_MAX_TOTAL_URLS = 400000
+
+# return only the url of each queued entry in the given range,
+# decoding the JSON queue entries inside redis
+QUEUE_URLS_SCRIPT = """
+local entries = redis.call('ZRANGEBYSCORE', KEYS[1], 0, '+inf', 'LIMIT', ARGV[1], ARGV[2])
+local urls = {}
+for i, entry in ipairs(entries) do
+  local ok, data = pcall(cjson.decode, entry)
+  if ok and type(data) == 'table' and type(data['url']) == 'string' then
+    urls[i] = data['url']
+  else
+    urls[i] = ''
+  end
+end
+return urls
+"""
+
+
+# ============================================================================
+class CrawlQueueSnapshot:
+    """Short-lived, lazily filled snapshot of queued urls for a running crawl,
+    shared by successive queue match requests"""
+
+    urls: list[str]
+    total: int
+    created: float
+    lock: asyncio.Lock
+
+    def __init__(self, total: int):
+        self.urls = []
+        self.total = total
+        self.created = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def is_fresh(self, total: int) -> bool:
+        """snapshot can be reused if not expired and queue size has not
+        changed by more than 10%"""
+        if time.monotonic() - self.created > QUEUE_SNAPSHOT_TTL:
+            return False
+
+        return abs(total - self.total) <= max(self.total // 10, DEFAULT_RANGE_LIMIT)
+
+    async def get_range(
+        self,
+        read_urls: Callable[[int, int], Awaitable[list[str]]],
+        offset: int,
+        count: int,
+    ) -> list[str]:
+        """return urls in range, filling snapshot up to end of range first.
+        filled under lock so concurrent requests don't add the same urls"""
+        end = min(offset + count, self.total)
+
+        async with self.lock:
+            while len(self.urls) < end:
+                if len(self.urls) >= QUEUE_SNAPSHOT_MAX_URLS:
+                    # snapshot is full, read remaining range directly
+                    return await read_urls(offset, count)
+
+                urls = await read_urls(len(self.urls), QUEUE_SCAN_LIMIT)
+                if not urls:
+                    # queue shrank since snapshot was started
+                    self.total = len(self.urls)
+                    break
+
+                self.urls.extend(urls)
+
+        return self.urls[offset:end]
+
 
 # ============================================================================
 # pylint: disable=too-many-arguments, too-many-instance-attributes, too-many-public-methods
@@ -103,6 +198,15 @@ class CrawlOps(BaseCrawlOps):
 
         self.min_qa_crawler_image = os.environ.get("MIN_QA_CRAWLER_IMAGE")
 
+        self.queue_snapshots: dict[str, CrawlQueueSnapshot] = {}
+        # script is run on each crawl's redis, loaded on first use there
+        self.queue_urls_script = AsyncScript(
+            None,  # type: ignore[arg-type]
+            QUEUE_URLS_SCRIPT.encode("utf-8"),
+        )
+
+        self.crawl_events = CrawlEventOps(self.mdb)
+
     async def init_index(self):
         """init index for crawls db collection"""
         await self.crawls.create_index([("type", pymongo.HASHED)])
@@ -137,6 +241,9 @@ class CrawlOps(BaseCrawlOps):
         await self.crawls.create_index([("cid", pymongo.HASHED)])
         await self.crawls.create_index([("state", pymongo.HASHED)])
         await self.crawls.create_index([("fileSize", pymongo.DESCENDING)])
+        await self.crawls.create_index(
+            [("oid", pymongo.ASCENDING), ("collectionIds", pymongo.ASCENDING)]
+        )
 
     async def get_crawl(
         self,
@@ -351,7 +458,11 @@ class CrawlOps(BaseCrawlOps):
         )
 
         # Get total
-        cursor = self.crawls.aggregate(aggregate, session=session)  # type: ignore
+        cursor = self.crawls.aggregate(
+            aggregate,  # type: ignore
+            session=session,
+            **max_time(self.crawls),
+        )
         # pylint: disable=line-too-long
         # Argument 1 to "aggregate" of "AsyncIOMotorCollection" has incompatible type "list[object]"; expected "Sequence[Mapping[str, Any]]"
         results = await cursor.to_list(length=1)
@@ -369,7 +480,7 @@ class CrawlOps(BaseCrawlOps):
 
         crawls = []
         for result in items:
-            crawl = cls.from_dict(result)
+            crawl = cls.from_dict_trusted(result)
             files = result.get("files") if resources else None
             crawl = await self._resolve_crawl_refs(
                 crawl, org, files=files, session=session
@@ -493,7 +604,7 @@ class CrawlOps(BaseCrawlOps):
             crawlerChannel=crawlconfig.crawlerChannel,
             proxyId=crawlconfig.proxyId,
             image=image,
-            version=2,
+            version=PAGES_VERSION,
             firstSeed=crawlconfig.firstSeed,
             seedCount=crawlconfig.seedCount,
             dedupeCollId=crawlconfig.dedupeCollId,
@@ -587,52 +698,107 @@ class CrawlOps(BaseCrawlOps):
 
         return CrawlQueueResponse(total=total, results=results, matched=matched)
 
-    # pylint: disable=too-many-locals
+    async def _crawl_queue_urls(
+        self, redis: Redis, key: str, offset: int, count: int
+    ) -> list[str]:
+        try:
+            return await self.queue_urls_script(
+                keys=[key], args=[offset, count], client=redis
+            )
+        except exceptions.ResponseError:
+            # fallback to old crawler queue or redis without scripting
+            results = await self._crawl_queue_range(redis, key, offset, count)
+            return [json.loads(result)["url"] for result in results]
+
+    def _get_queue_snapshot(self, crawl_id: str, total: int) -> CrawlQueueSnapshot:
+        snapshot = self.queue_snapshots.get(crawl_id)
+        if snapshot and snapshot.is_fresh(total):
+            return snapshot
+
+        self.queue_snapshots.pop(crawl_id, None)
+        while len(self.queue_snapshots) >= QUEUE_SNAPSHOT_MAX_CRAWLS:
+            # evict oldest snapshot
+            del self.queue_snapshots[next(iter(self.queue_snapshots))]
+
+        snapshot = CrawlQueueSnapshot(total)
+        self.queue_snapshots[crawl_id] = snapshot
+        return snapshot
+
+    def _trim_queue_snapshots(self, crawl_id: str) -> None:
+        """drop oldest snapshots of other crawls until urls in all snapshots
+        are within limit"""
+        total = sum(len(snapshot.urls) for snapshot in self.queue_snapshots.values())
+        for other_id in list(self.queue_snapshots):
+            if total <= QUEUE_SNAPSHOT_MAX_TOTAL_URLS:
+                return
+            if other_id != crawl_id:
+                total -= len(self.queue_snapshots.pop(other_id).urls)
+
+    async def _match_queue_snapshot(
+        self,
+        redis: Redis,
+        key: str,
+        snapshot: CrawlQueueSnapshot,
+        regex_re: re.Pattern,
+        offset: int,
+    ) -> tuple[list[str], int]:
+        """return urls in snapshot from offset matching regex, and next offset
+        if response size limit was reached, or -1"""
+
+        async def read_urls(start: int, count: int) -> list[str]:
+            return await self._crawl_queue_urls(redis, key, start, count)
+
+        matched = []
+        size = 0
+        step = DEFAULT_RANGE_LIMIT
+
+        for count in range(offset, snapshot.total, step):
+            for url in await snapshot.get_range(read_urls, count, step):
+                if url and regex_re.search(url):
+                    size += len(url)
+                    matched.append(url)
+
+            # if size of match response exceeds size limit, return nextOffset
+            if size > MAX_MATCH_SIZE:
+                return matched, count + step
+
+        return matched, -1
+
     async def match_crawl_queue(
         self, crawl_id: str, regex: str, offset: int = 0
     ) -> MatchCrawlQueueResponse:
         """get list of urls that match regex, starting at offset and at most
         around 'limit'. (limit rounded to next step boundary, so
-        limit <= next_offset < limit + step"""
+        limit <= next_offset < limit + step
+
+        queued urls are read from a short-lived per-crawl snapshot, so that
+        successive regex edits do not rescan the queue unless it has changed
+        """
         state, _ = await self.get_crawl_state(crawl_id, False)
 
         if state not in RUNNING_AND_WAITING_STATES:
             raise HTTPException(status_code=400, detail="crawl_not_running")
 
+        try:
+            regex_re = re.compile(regex)
+        except re.error as exc:
+            raise HTTPException(status_code=400, detail="invalid_regex") from exc
+
         total = 0
-        matched = []
-        step = DEFAULT_RANGE_LIMIT
+        key = f"{crawl_id}:q"
 
         async with self.get_redis(crawl_id) as redis:
             try:
-                total = await self._crawl_queue_len(redis, f"{crawl_id}:q")
+                total = await self._crawl_queue_len(redis, key)
             except exceptions.ConnectionError:
                 # can't connect to redis, likely not initialized yet
                 pass
 
-            try:
-                regex_re = re.compile(regex)
-            except re.error as exc:
-                raise HTTPException(status_code=400, detail="invalid_regex") from exc
-
-            next_offset = -1
-            size = 0
-
-            for count in range(offset, total, step):
-                results = await self._crawl_queue_range(
-                    redis, f"{crawl_id}:q", count, step
-                )
-                for result in results:
-                    url = json.loads(result)["url"]
-                    if regex_re.search(url):
-                        size += len(url)
-                        matched.append(url)
-
-                # if size of match response exceeds size limit, set nextOffset
-                # and break
-                if size > MAX_MATCH_SIZE:
-                    next_offset = count + step
-                    break
+            snapshot = self._get_queue_snapshot(crawl_id, total)
+            matched, next_offset = await self._match_queue_snapshot(
+                redis, key, snapshot, regex_re, offset
+            )
+            self._trim_queue_snapshots(crawl_id)
 
         return MatchCrawlQueueResponse(
             total=total, matched=matched, nextOffset=next_offset
@@ -667,6 +833,9 @@ class CrawlOps(BaseCrawlOps):
             for i in range(0, scale):
                 await redis.rpush(f"crawl-{crawl_id}-{i}:msg", query_str)
 
+        # queue will change once crawler applies exclusion, don't reuse snapshot
+        self.queue_snapshots.pop(crawl_id, None)
+
         new_config = await self.crawl_configs.add_or_remove_exclusion(
             regex, cid, org, user, add
         )
@@ -919,6 +1088,25 @@ class CrawlOps(BaseCrawlOps):
             {"$set": {"rateLimitedAt": dt}},
         )
 
+    async def set_queue_position(
+        self,
+        crawl_id: str,
+        oid: UUID,
+        position: int | None,
+        estimated_start: datetime | None,
+    ):
+        """set position in admission queue and estimated start time of waiting
+        crawl, or clear once admitted"""
+        await self.crawls.update_one(
+            {"_id": crawl_id, "type": "crawl", "oid": oid},
+            {
+                "$set": {
+                    "queuePosition": position,
+                    "estimatedStartTime": estimated_start,
+                }
+            },
+        )
+
     async def shutdown_crawl(
         self, crawl_id: str, org: Organization, graceful: bool
     ) -> dict[str, bool]:
@@ -1037,6 +1225,8 @@ class CrawlOps(BaseCrawlOps):
                 },
             )
 
+            await self.page_ops.init_qa_run_histogram(crawl_id, qa_run_id)
+
             return qa_run_id
 
         except Exception as exc:
@@ -1246,11 +1436,21 @@ class CrawlOps(BaseCrawlOps):
         thresholds: dict[str, list[float]],
     ) -> QARunAggregateStatsOut:
         """Get aggregate stats for QA run"""
+        # histograms missing for QA runs from before they were stored are
+        # recomputed, unless the QA run is still running
+        crawl = await self.crawls.find_one(
+            {"_id": crawl_id}, projection={"qa.id": True}
+        )
+        running = ((crawl or {}).get("qa") or {}).get("id") == qa_run_id
+        histogram = await self.page_ops.get_qa_run_histogram(
+            crawl_id, qa_run_id, backfill=not running
+        )
+
         screenshot_results = await self.page_ops.get_qa_run_aggregate_counts(
-            crawl_id, qa_run_id, thresholds, key="screenshotMatch"
+            crawl_id, qa_run_id, thresholds, key="screenshotMatch", histogram=histogram
         )
         text_results = await self.page_ops.get_qa_run_aggregate_counts(
-            crawl_id, qa_run_id, thresholds, key="textMatch"
+            crawl_id, qa_run_id, thresholds, key="textMatch", histogram=histogram
         )
         return QARunAggregateStatsOut(
             screenshotMatch=screenshot_results,
@@ -1596,6 +1796,23 @@ def init_crawls_api(
         crawl_stats = await ops.get_crawl_stats(org)
         return stream_dict_list_as_csv(crawl_stats, f"crawling-stats-{org.id}.csv")
 
+    @app.get(
+        "/orgs/{oid}/crawls/events",
+        tags=["crawls"],
+        response_class=StreamingResponse,
+    )
+    async def get_org_crawl_events(
+        org: Organization = Depends(org_viewer_dep),
+    ):
+        if not ops.crawl_events.supported:
+            raise HTTPException(status_code=503, detail="live_updates_unavailable")
+
+        return StreamingResponse(
+            ops.crawl_events.stream_events(org.id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.get(
         "/orgs/all/crawls/{crawl_id}/replay.json",
         tags=["crawls"],
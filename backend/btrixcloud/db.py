@@ -11,11 +11,18 @@ from typing import TYPE_CHECKING, Any, Literal, TypeVar
 from uuid import UUID, uuid4
 
 import structlog
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-from pydantic import BaseModel, ValidationError, WrapValidator
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase,
+)
+from pydantic import BaseModel, ValidationError, ValidationInfo, WrapValidator
+from pymongo import read_preferences
 from pymongo.errors import InvalidName
 
+from .metrics import get_mongo_event_listeners
 from .migrations import BaseMigration
+from .query_listener import get_slow_query_listeners
 
 if TYPE_CHECKING:
     from .background_jobs import BackgroundJobOps
@@ -39,12 +46,46 @@ else:
     ) = object
 
 
-CURR_DB_VERSION = "0058"
+CURR_DB_VERSION = "0059"
+
+# doc in migration_progress with currently running migration
+MIGRATION_STATUS_ID = "status"
 
 MIN_DB_VERSION = 7.0
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
+# default (max, min) connection pool size per process role, can be set with
+# MONGO_<ROLE>_MAX_POOL_SIZE and MONGO_<ROLE>_MIN_POOL_SIZE
+DB_POOL_SIZES = {
+    "api": (100, 0),
+    "operator": (50, 5),
+    "bg": (20, 0),
+}
+
+# read preference for analytics reads that can lag slightly behind the
+# primary: org metrics, org exports and search values
+ANALYTICS_READ_PREFERENCE = (
+    os.environ.get("MONGO_ANALYTICS_READ_PREFERENCE") or "secondaryPreferred"
+)
+
+# max replication lag of secondaries used for analytics reads, min 90
+ANALYTICS_MAX_STALENESS_SECS = int(
+    os.environ.get("MONGO_ANALYTICS_MAX_STALENESS_SECS") or -1
+)
+
+# time budget for user-facing aggregations, so one slow query can't hold
+# pool connections, 0 for no limit. Can be set per collection with
+# MONGO_MAX_TIME_MS_<COLLECTION>, eg. MONGO_MAX_TIME_MS_PAGES
+MAX_TIME_MS = int(os.environ.get("MONGO_MAX_TIME_MS") or 30000)
+
+READ_PREFERENCES = {
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
 
 # ============================================================================
 def resolve_db_url() -> str:
@@ -62,24 +103,74 @@ def resolve_db_url() -> str:
 
 
 # ============================================================================
-def init_db() -> tuple[AsyncIOMotorClient, AsyncIOMotorDatabase]:
+def get_pool_options(role: str) -> dict[str, Any]:
+    """connection pool options for process role: api, operator or bg"""
+    max_pool_size, min_pool_size = DB_POOL_SIZES[role]
+    prefix = f"MONGO_{role.upper()}_"
+
+    options: dict[str, Any] = {
+        "maxPoolSize": int(os.environ.get(prefix + "MAX_POOL_SIZE") or max_pool_size),
+        "minPoolSize": int(os.environ.get(prefix + "MIN_POOL_SIZE") or min_pool_size),
+    }
+
+    max_idle_time_ms = int(os.environ.get("MONGO_MAX_IDLE_TIME_MS") or 0)
+    if max_idle_time_ms:
+        options["maxIdleTimeMS"] = max_idle_time_ms
+
+    return options
+
+
+# ============================================================================
+def init_db(role: str = "api") -> tuple[AsyncIOMotorClient, AsyncIOMotorDatabase]:
     """initialize the mongodb connector"""
 
     db_url = resolve_db_url()
 
+    pool_options = get_pool_options(role)
+
     client = AsyncIOMotorClient(
         db_url,
         tz_aware=True,
         uuidRepresentation="standard",
         connectTimeoutMS=120000,
         serverSelectionTimeoutMS=120000,
+        event_listeners=get_mongo_event_listeners() + get_slow_query_listeners(),
+        **pool_options,
     )
 
+    logger.info("db_client_created", role=role, **pool_options)
+
     mdb = client["browsertrixcloud"]
 
     return client, mdb
 
 
+# ============================================================================
+def analytics_reads(coll: AsyncIOMotorCollection) -> AsyncIOMotorCollection:
+    """return collection using analytics read preference, for reads that
+    don't need to see the latest writes"""
+    pref_cls = READ_PREFERENCES.get(ANALYTICS_READ_PREFERENCE)
+    if not pref_cls:
+        return coll
+
+    return coll.with_options(
+        read_preference=pref_cls(  # type: ignore
+            max_staleness=ANALYTICS_MAX_STALENESS_SECS
+        )
+    )
+
+
+# ============================================================================
+def max_time(coll: AsyncIOMotorCollection) -> dict[str, int]:
+    """maxTimeMS option for user-facing aggregations on collection, if any"""
+    max_time_ms = MAX_TIME_MS
+    coll_max_time_ms = os.environ.get("MONGO_MAX_TIME_MS_" + str(coll.name).upper())
+    if coll_max_time_ms:
+        max_time_ms = int(coll_max_time_ms)
+
+    return {"maxTimeMS": max_time_ms} if max_time_ms > 0 else {}
+
+
 # ============================================================================
 async def ensure_feature_version(client: AsyncIOMotorClient):
     """ensures the minimum feature compatibility version is set"""
@@ -191,6 +282,7 @@ async def update_and_prepare_db(
         file_ops,
         crawl_log_ops,
         profile_ops,
+        background_job_ops,
     )
     await user_manager.create_super_user()
     await org_ops.create_default_org()
@@ -225,7 +317,16 @@ async def run_db_migrations(
         )
         return False
 
-    migrations_run = False
+    # only import migrations that need to run
+    base_migration = BaseMigration(mdb, CURR_DB_VERSION)
+    db_version = await base_migration.get_db_version()
+    rerun_from = base_migration.rerun_from_migration
+
+    def is_pending(version: str) -> bool:
+        if not db_version or version > db_version:
+            return True
+        return bool(rerun_from and rerun_from <= version)
+
     migrations_path = "/app/btrixcloud/migrations"
     module_files = [
         f
@@ -233,11 +334,14 @@ async def run_db_migrations(
         if not os.path.isdir(os.path.join(migrations_path, f))
         and f.startswith("migration_")
         and f.endswith(".py")
+        and is_pending(f.removeprefix("migration_")[:4])
     ]
+
+    migrations = []
     for module_file in module_files:
         module_path = os.path.join(migrations_path, module_file)
         try:
-            migration_name = os.path.basename(module_file).rstrip(".py")
+            migration_name = os.path.basename(module_file).removesuffix(".py")
             spec = importlib.util.spec_from_file_location(
                 f".migrations.{migration_name}", module_path
             )
@@ -245,25 +349,50 @@ async def run_db_migrations(
             assert spec.loader
             migration_module = importlib.util.module_from_spec(spec)
             spec.loader.exec_module(migration_module)
-            migration = migration_module.Migration(
-                mdb,
-                page_ops=page_ops,
-                org_ops=org_ops,
-                background_job_ops=background_job_ops,
-                coll_ops=coll_ops,
-                file_ops=file_ops,
-                crawl_log_ops=crawl_log_ops,
-                crawl_config_ops=crawl_config_ops,
-                crawl_manager=crawl_manager,
+            migrations.append(
+                migration_module.Migration(
+                    mdb,
+                    page_ops=page_ops,
+                    org_ops=org_ops,
+                    background_job_ops=background_job_ops,
+                    coll_ops=coll_ops,
+                    file_ops=file_ops,
+                    crawl_log_ops=crawl_log_ops,
+                    crawl_config_ops=crawl_config_ops,
+                    crawl_manager=crawl_manager,
+                )
             )
-            if await migration.run():
-                migrations_run = True
         except ImportError:
             logger.exception(
                 "migration_import_error",
                 module_file=module_file,
                 unstructured_message=f"Error importing Migration class from module {module_file}",
             )
+
+    # let api know which migration is running and if it can serve reads
+    progress = mdb["migration_progress"]
+
+    # clear status left by a previous run that didn't finish
+    await progress.delete_one({"_id": MIGRATION_STATUS_ID})
+
+    migrations_run = False
+    try:
+        for i, migration in enumerate(migrations):
+            await progress.update_one(
+                {"_id": MIGRATION_STATUS_ID},
+                {
+                    "$set": {
+                        "running": migration.migration_version,
+                        "onlineSafe": all(m.online_safe for m in migrations[i:]),
+                    }
+                },
+                upsert=True,
+            )
+            if await migration.run():
+                migrations_run = True
+    finally:
+        await progress.delete_one({"_id": MIGRATION_STATUS_ID})
+
     return migrations_run
 
 
@@ -274,19 +403,37 @@ async def await_db_and_migrations(mdb, db_inited):
     logger.info("db_setup_started", unstructured_message="Database setup started")
 
     base_migration = BaseMigration(mdb, CURR_DB_VERSION)
+    progress = mdb["migration_progress"]
     while await base_migration.migrate_up_needed(ignore_rerun=True):
         version = await base_migration.get_db_version()
+        status = await progress.find_one({"_id": MIGRATION_STATUS_ID}) or {}
+        running = status.get("running")
+        current = await progress.find_one({"_id": running}) if running else None
         logger.info(
             "migration_waiting",
             db_version=version,
             latest_version=CURR_DB_VERSION,
+            running=running,
+            count=current.get("count") if current else None,
+            total=current.get("total") if current else None,
             unstructured_message=(
                 f"Waiting for migrations to finish, DB at {version}, latest {CURR_DB_VERSION}"
             ),
         )
 
+        # remaining migrations don't break reads, start serving read-only
+        if status.get("onlineSafe") and not db_inited.get("inited"):
+            logger.info(
+                "db_ready_read_only",
+                running=running,
+                unstructured_message="Serving read-only requests during migration",
+            )
+            db_inited["read_only"] = True
+            db_inited["inited"] = True
+
         await asyncio.sleep(5)
 
+    db_inited["read_only"] = False
     db_inited["inited"] = True
     logger.info("db_updated_ready", unstructured_message="Database updated and ready")
 
@@ -326,6 +473,7 @@ async def create_indexes(
     file_ops,
     crawl_log_ops,
     profile_ops,
+    background_job_ops,
 ):
     """Create database indexes."""
     logger.info("db_creating_indexes", unstructured_message="Creating database indexes")
@@ -340,6 +488,9 @@ async def create_indexes(
     await file_ops.init_index()
     await crawl_log_ops.init_index()
     await profile_ops.init_index()
+    await background_job_ops.init_index()
+    await invite_ops.email.init_index()
+    await crawl_ops.event_webhook_ops.init_index()
 
 
 _LENIENT_CTX = contextvars.ContextVar[Literal[False] | dict[str, Any]](
@@ -356,8 +507,24 @@ def is_lenient_read() -> bool:
     return bool(_LENIENT_CTX.get())
 
 
+# validation context for trusted reads, see BaseMongoModel.from_dict_trusted
+TRUSTED_READ_CTX = {"trusted_read": True}
+
+
+def is_trusted_read(info: ValidationInfo) -> bool:
+    """Return True if validating a document we wrote ourselves.
+
+    Validators that only re-check values already validated when the document
+    was stored, e.g. url parsing, may return the value as is when this
+    returns True.
+    """
+    return bool(info.context and info.context.get("trusted_read"))
+
+
 def _lenient_str(v, handler, info):
     """WrapValidator: skip string validation when reading from DB."""
+    if isinstance(v, str) and is_trusted_read(info):
+        return v
     ctx = _LENIENT_CTX.get()
     if ctx and isinstance(v, str):
         try:
@@ -389,7 +556,7 @@ length constraints on text fields.
 """
 
 # ============================================================================
-T = TypeVar("T")
+T = TypeVar("T", bound="BaseMongoModel")
 
 
 # ============================================================================
@@ -406,12 +573,26 @@ class BaseMongoModel(BaseModel):
     @classmethod
     def from_dict(cls: type[T], data: dict) -> T:
         """convert dict from mongo to a class"""
+        return cls.from_mongo(data)
+
+    @classmethod
+    def from_dict_trusted(cls: type[T], data: dict) -> T:
+        """convert dict from mongo to a class on hot list endpoints
+
+        Types are still checked, but string constraints and url parsing are
+        skipped, as the document was validated when it was written.
+        """
+        return cls.from_mongo(data, TRUSTED_READ_CTX)
+
+    @classmethod
+    def from_mongo(cls: type[T], data: dict, context: dict | None = None) -> T:
+        """convert dict from mongo to a class, with optional validation context"""
         if not data:
-            return cls()
+            return cls.model_validate({})
         data["id"] = data.pop("_id")
         token = _LENIENT_CTX.set({"id": data.get("id"), "model": cls.__name__})
         try:
-            return cls(**data)
+            return cls.model_validate(data, context=context)
         finally:
             _LENIENT_CTX.reset(token)
 
@@ -1,20 +1,29 @@
 """Basic Email Sending Support"""
 
+import asyncio
+import base64
+import hashlib
+import json
 import os
 import re
 import smtplib
 import ssl
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
 from email.message import EmailMessage
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Literal
-from uuid import UUID
+from typing import TYPE_CHECKING, Any, Literal
+from uuid import UUID, uuid4
 
 import structlog
 import aiohttp
+import pymongo
+from cryptography.fernet import Fernet, InvalidToken
 from fastapi import HTTPException
 
+from .auth import PASSWORD_SECRET
 from .models import (
     TYPE_AUTO_PAUSED_STATES,
     CreateReplicaJob,
@@ -23,10 +32,16 @@ from .models import (
     Organization,
     Subscription,
 )
-from .utils import get_origin, is_bool, is_production
+from .utils import dt_now, get_origin, is_bool, is_production
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorCollection
+else:
+    AsyncIOMotorCollection = object
+
+
 # JWTs have three base64url parts separated by dots and always start with eyJ
 _JWT_RE = re.compile(r"eyJ[a-zA-Z0-9_-]{5,}\.[a-zA-Z0-9_-]{5,}\.[a-zA-Z0-9_-]{5,}")
 
@@ -37,6 +52,36 @@ _INVITE_UUID_RE = re.compile(
 )
 
 
+# number of persistent SMTP connections, and seconds an idle connection is kept
+EMAIL_SMTP_POOL_SIZE = int(os.environ.get("EMAIL_SMTP_POOL_SIZE") or 2)
+EMAIL_SMTP_IDLE_SECS = 60
+
+# seconds an SMTP connect or command may block, below EMAIL_LEASE_SECS so a
+# hung send fails and is retried rather than sent again by another process
+EMAIL_SMTP_TIMEOUT_SECS = 30
+
+# queued emails: max per batch, delivery lease, retry backoff base and attempts
+EMAIL_BATCH_SIZE = 20
+EMAIL_LEASE_SECS = 120
+EMAIL_RETRY_SECS = 30
+EMAIL_MAX_ATTEMPTS = 8
+
+# seconds to wait for new queued emails before checking for due retries
+EMAIL_QUEUE_POLL_SECS = 30
+
+# queued emails, including permanently failed, are removed after a week
+EMAIL_QUEUE_EXPIRE_SECS = 7 * 24 * 3600
+
+# queued email text and html may contain tokens, and are stored encrypted
+EMAIL_QUEUE_KEY = base64.urlsafe_b64encode(
+    hashlib.sha256(f"email_queue:{PASSWORD_SECRET}".encode()).digest()
+)
+
+# rendered templates cached by template name and params
+TEMPLATE_CACHE_SIZE = 256
+TEMPLATE_CACHE_SECS = 600
+
+
 def _redact_email_text(text: str) -> str:
     """Redact sensitive tokens from rendered email text before logging"""
 
@@ -51,6 +96,100 @@ def _redact_email_text(text: str) -> str:
     return text
 
 
+# ============================================================================
+# pylint: disable=too-few-public-methods
+class SMTPConnectionPool:
+    """Persistent, authenticated SMTP connections reused across messages.
+    smtplib is blocking, so connections are only used from worker threads,
+    one thread per connection at a time."""
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        use_tls: bool,
+        username: str,
+        password: str,
+        size: int = EMAIL_SMTP_POOL_SIZE,
+    ):
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+
+        self.idle: list[tuple[float, smtplib.SMTP]] = []
+        self.slots = asyncio.Semaphore(max(size, 1))
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=EMAIL_SMTP_TIMEOUT_SECS)
+        try:
+            if self.use_tls:
+                server.ehlo()
+                server.starttls(context=ssl.create_default_context())
+            server.ehlo()
+            if self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except smtplib.SMTPException:
+            server.close()
+
+    def _send_all(
+        self, server: smtplib.SMTP | None, msgs: list
+    ) -> tuple[smtplib.SMTP | None, list[Exception | None]]:
+        """send messages on one connection, reconnecting once if dropped"""
+        errors: list[Exception | None] = []
+        for msg in msgs:
+            try:
+                if not server:
+                    server = self._connect()
+                try:
+                    server.send_message(msg)
+                except smtplib.SMTPServerDisconnected:
+                    server = self._connect()
+                    server.send_message(msg)
+                errors.append(None)
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                errors.append(exc)
+                # recipient refused, connection still usable
+                if not isinstance(exc, smtplib.SMTPRecipientsRefused) and server:
+                    server.close()
+                    server = None
+
+        return server, errors
+
+    async def send_batch(self, msgs: list) -> list[Exception | None]:
+        """send messages over a pooled connection, returns error or None
+        for each message"""
+        async with self.slots:
+            server = None
+            while self.idle:
+                last_used, idle_server = self.idle.pop()
+                if time.monotonic() - last_used < EMAIL_SMTP_IDLE_SECS:
+                    server = idle_server
+                    break
+
+                await asyncio.to_thread(self._close, idle_server)
+
+            server, errors = await asyncio.to_thread(self._send_all, server, msgs)
+            if server:
+                self.idle.append((time.monotonic(), server))
+
+            return errors
+
+
+# ============================================================================
 # pylint: disable=too-few-public-methods, too-many-instance-attributes
 class EmailSender:
     """SMTP Email Sender"""
@@ -68,6 +207,15 @@ class EmailSender:
 
     log_sent_emails: bool
 
+    smtp_pool: SMTPConnectionPool | None
+    session: aiohttp.ClientSession | None
+    rendered: OrderedDict[str, tuple[float, tuple[str, str, str]]]
+
+    emails: AsyncIOMotorCollection | None
+    queue_event: asyncio.Event
+    delivery_task: asyncio.Task | None
+    cipher: Fernet
+
     def __init__(self):
         self.sender = os.environ.get("EMAIL_SENDER") or "Browsertrix admin"
         self.password = os.environ.get("EMAIL_PASSWORD") or ""
@@ -118,72 +266,80 @@ class EmailSender:
             )
         self.email_template_endpoint = email_template_endpoint
 
+        self.smtp_pool = None
+        if self.smtp_server:
+            self.smtp_pool = SMTPConnectionPool(
+                self.smtp_server,
+                self.smtp_port,
+                self.smtp_use_tls,
+                self.sender,
+                self.password,
+            )
+
+        self.session = None
+        self.rendered = OrderedDict()
+
+        self.emails = None
+        self.queue_event = asyncio.Event()
+        self.delivery_task = None
+        self.cipher = Fernet(EMAIL_QUEUE_KEY)
+
+    def set_mdb(self, mdb) -> None:
+        """queue emails in db for delivery, instead of sending inline"""
+        self.emails = mdb["email_queue"]
+
+    async def init_index(self) -> None:
+        """init index for queued emails"""
+        if self.emails is None:
+            return
+
+        await self.emails.create_index("nextAttempt")
+        await self.emails.create_index(
+            "created", expireAfterSeconds=EMAIL_QUEUE_EXPIRE_SECS
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if not self.session or self.session.closed:
+            self.session = aiohttp.ClientSession()
+
+        return self.session
+
+    async def _render(self, name: str, kwargs: dict) -> tuple[str, str, str]:
+        """render template with email template service, returns html, text
+        and subject, cached for repeated sends with same params"""
+        key = name + ":" + json.dumps(kwargs, sort_keys=True, default=str)
+        cached = self.rendered.get(key)
+        if cached and time.monotonic() - cached[0] < TEMPLATE_CACHE_SECS:
+            self.rendered.move_to_end(key)
+            return cached[1]
+
+        async with self._get_session().post(
+            self.email_template_endpoint + "/" + name,
+            json=kwargs,
+        ) as resp:
+            if resp.status != 200:
+                raise HTTPException(
+                    status_code=resp.status,
+                    detail=await resp.text(),
+                )
+
+            data = await resp.json()
+
+        rendered = (data["html"], data["plainText"], data["subject"])
+
+        self.rendered[key] = (time.monotonic(), rendered)
+        self.rendered.move_to_end(key)
+        if len(self.rendered) > TEMPLATE_CACHE_SIZE:
+            self.rendered.popitem(last=False)
+
+        return rendered
+
     async def _send_encrypted(self, receiver: str, name: str, **kwargs) -> None:
-        """Send Encrypted SMTP Message using given template name"""
+        """Render message using given template name, then queue it for
+        delivery, or send directly over encrypted SMTP if no queue"""
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.email_template_endpoint + "/" + name,
-                    json=kwargs,
-                ) as resp:
-                    if resp.status != 200:
-                        raise HTTPException(
-                            status_code=resp.status,
-                            detail=await resp.text(),
-                        )
-
-                    json = await resp.json()
-
-                    html = json["html"]
-                    text = json["plainText"]
-                    subject = json["subject"]
-
-                    if self.log_sent_emails:
-                        if is_production:
-                            log_text = _redact_email_text(text)
-                        else:
-                            log_text = text
-                        logger.info(
-                            "email_log",
-                            email_text=log_text,
-                        )
-
-                    if not self.smtp_server:
-                        logger.info(
-                            "email_created_not_sent_no_smtp",
-                            template_name=name,
-                            receiver=receiver,
-                            unstructured_message=f'Email: created "{name}" msg for "{receiver}", '
-                            "but not sent (no SMTP server set)",
-                        )
-                        return
-
-                    msg: EmailMessage | MIMEMultipart
-
-                    if html:
-                        msg = MIMEMultipart("alternative")
-                        msg.attach(MIMEText(text.strip(), "plain"))
-                        msg.attach(MIMEText(html.strip(), "html"))
-                    else:
-                        msg = EmailMessage()
-                        msg.set_content(text.strip())
-
-                    msg["Subject"] = subject.strip()
-                    msg["From"] = self.reply_to
-                    msg["To"] = receiver
-                    msg["Reply-To"] = msg["From"]
-
-                    context = ssl.create_default_context()
-                    with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                        if self.smtp_use_tls:
-                            server.ehlo()
-                            server.starttls(context=context)
-                        server.ehlo()
-                        if self.password:
-                            server.login(self.sender, self.password)
-                        server.send_message(msg)
-                        # server.sendmail(self.sender, receiver, message)
+            html, text, subject = await self._render(name, kwargs)
         # pylint: disable=broad-exception-caught
         except Exception as exc:
             logger.exception(
@@ -192,6 +348,178 @@ class EmailSender:
             )
             raise exc
 
+        if self.log_sent_emails:
+            if is_production:
+                log_text = _redact_email_text(text)
+            else:
+                log_text = text
+            logger.info(
+                "email_log",
+                email_text=log_text,
+            )
+
+        if not self.smtp_pool:
+            logger.info(
+                "email_created_not_sent_no_smtp",
+                template_name=name,
+                receiver=receiver,
+                unstructured_message=f'Email: created "{name}" msg for "{receiver}", '
+                "but not sent (no SMTP server set)",
+            )
+            return
+
+        email: dict[str, Any] = {
+            "receiver": receiver,
+            "template": name,
+            "subject": subject.strip(),
+            "text": text.strip(),
+            "html": html.strip(),
+        }
+
+        if self.emails is None:
+            (error,) = await self.smtp_pool.send_batch([self._make_message(email)])
+            if error:
+                raise error
+            return
+
+        now = dt_now()
+        body = json.dumps({"text": email.pop("text"), "html": email.pop("html")})
+        email.update(
+            {
+                "_id": uuid4(),
+                "body": self.cipher.encrypt(body.encode()).decode(),
+                "created": now,
+                "nextAttempt": now,
+                "attempts": 0,
+            }
+        )
+        await self.emails.insert_one(email)
+
+        self.queue_event.set()
+        self.start_delivery()
+
+    def start_delivery(self) -> None:
+        """start delivering queued emails, unless already delivering"""
+        if not self.delivery_task or self.delivery_task.done():
+            self.delivery_task = asyncio.create_task(self.run_delivery())
+
+    def _make_message(self, email: dict) -> EmailMessage | MIMEMultipart:
+        msg: EmailMessage | MIMEMultipart
+
+        if email["html"]:
+            msg = MIMEMultipart("alternative")
+            msg.attach(MIMEText(email["text"], "plain"))
+            msg.attach(MIMEText(email["html"], "html"))
+        else:
+            msg = EmailMessage()
+            msg.set_content(email["text"])
+
+        msg["Subject"] = email["subject"]
+        msg["From"] = self.reply_to
+        msg["To"] = email["receiver"]
+        msg["Reply-To"] = msg["From"]
+        return msg
+
+    def _make_queued_message(self, email: dict) -> EmailMessage | MIMEMultipart:
+        body = json.loads(self.cipher.decrypt(email["body"].encode()))
+        return self._make_message({**email, **body})
+
+    async def run_delivery(self) -> None:
+        """deliver queued emails in batches until no more are due, then wait
+        for new emails or for retries to become due"""
+        if not self.smtp_pool or self.emails is None:
+            return
+
+        while True:
+            try:
+                if await self.deliver_batch():
+                    continue
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                logger.exception("email_queue_error", error=str(exc))
+
+            self.queue_event.clear()
+            try:
+                await asyncio.wait_for(self.queue_event.wait(), EMAIL_QUEUE_POLL_SECS)
+            except TimeoutError:
+                pass
+
+    async def claim_batch(self) -> list[dict]:
+        """claim due queued emails, leasing them until delivery attempted"""
+        batch: list[dict] = []
+        if self.emails is None:
+            return batch
+
+        while len(batch) < EMAIL_BATCH_SIZE:
+            now = dt_now()
+            email = await self.emails.find_one_and_update(
+                {"nextAttempt": {"$lte": now}},
+                {"$set": {"nextAttempt": now + timedelta(seconds=EMAIL_LEASE_SECS)}},
+                sort=[("nextAttempt", pymongo.ASCENDING)],
+            )
+            if not email:
+                break
+
+            batch.append(email)
+
+        return batch
+
+    async def deliver_batch(self) -> int:
+        """send batch of due emails over one pooled connection,
+        returns number of emails attempted"""
+        if not self.smtp_pool or self.emails is None:
+            return 0
+
+        batch = await self.claim_batch()
+        if not batch:
+            return 0
+
+        msgs = []
+        errors: dict[UUID, Exception | None] = {}
+        for email in batch:
+            try:
+                msgs.append((email["_id"], self._make_queued_message(email)))
+            except InvalidToken:
+                # PASSWORD_SECRET changed since email was queued
+                errors[email["_id"]] = ValueError("queued email can't be decrypted")
+
+        send_errors = await self.smtp_pool.send_batch([msg for _, msg in msgs])
+        errors.update(zip((email_id for email_id, _ in msgs), send_errors))
+
+        for email in batch:
+            error = errors[email["_id"]]
+            if not error:
+                await self.emails.delete_one({"_id": email["_id"]})
+                continue
+
+            attempts = email["attempts"] + 1
+            next_attempt = None
+            if attempts < EMAIL_MAX_ATTEMPTS:
+                next_attempt = dt_now() + timedelta(
+                    seconds=min(EMAIL_RETRY_SECS * 2 ** (attempts - 1), 3600)
+                )
+
+            logger.warning(
+                "email_send_failed",
+                template_name=email["template"],
+                attempts=attempts,
+                will_retry=bool(next_attempt),
+                error=str(error),
+            )
+
+            await self.emails.update_one(
+                {"_id": email["_id"]},
+                {
+                    "$set": {
+                        "attempts": attempts,
+                        "nextAttempt": next_attempt,
+                        "lastError": str(error),
+                    }
+                },
+            )
+
+        return len(batch)
+
     async def send_user_validation(
         self, receiver_email: str, token: str, headers: dict | None = None
     ):
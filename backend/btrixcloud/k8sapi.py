@@ -14,9 +14,9 @@ from kubernetes_asyncio.client.exceptions import ApiException
 from kubernetes_asyncio.client.models import V1CronJob
 from kubernetes_asyncio.stream import WsApiClient
 from kubernetes_asyncio.utils import create_from_dict
-from redis import asyncio as aioredis
 from redis.asyncio.client import Redis
 
+from .metrics import MetricsRedis
 from .utils import dt_now, get_templates_dir
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
@@ -73,7 +73,7 @@ class K8sAPI:
 
     async def get_redis_client(self, redis_url):
         """return redis client with correct params for one-time use"""
-        return aioredis.from_url(
+        return MetricsRedis.from_url(
             redis_url,
             decode_responses=True,
             auto_close_connection_pool=True,
@@ -27,6 +27,7 @@ from structlog.contextvars import (
 )
 from structlog.typing import EventDict, Processor
 
+from .metrics import observe_http_request
 from .version import __branch__, __commit_hash__, __version__
 
 
@@ -78,7 +79,7 @@ def create_request_logging_middleware(logger):
             return f"{client.host}:{client.port}"
         return ""
 
-    SKIP_PATHS = ("/healthz", "/healthzStartup")
+    SKIP_PATHS = ("/healthz", "/healthzStartup", "/metrics")
 
     async def request_logging_middleware(request, call_next):
         if request.url.path in SKIP_PATHS:
@@ -103,6 +104,7 @@ def create_request_logging_middleware(logger):
             raise e
         finally:
             duration = time.time() - start_time
+            observe_http_request(request, response, duration)
             logger.debug(
                 "http_request",
                 http_method=request.method,
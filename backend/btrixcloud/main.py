@@ -13,6 +13,7 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
 from fastapi.routing import APIRouter
 from pydantic import BaseModel
+from pymongo.errors import ExecutionTimeout
 
 from .logger import create_request_logging_middleware, init_logging
 from .auth import JWT_TOKEN_LIFETIME
@@ -27,14 +28,22 @@ from .db import await_db_and_migrations, init_db
 from .emailsender import EmailSender
 from .file_uploads import init_file_uploads_api
 from .invites import init_invites
+from .metrics import init_metrics_api
 from .orgs import init_orgs_api
 from .pages import init_pages_api
 from .profiles import init_profiles_api
+from .query_profiler import init_query_profiler_api
 from .storages import init_storages_api
 from .subs import init_subs_api
 from .uploads import init_uploads_api
 from .users import init_user_manager, init_users_api
-from .utils import btrix_env, is_bool, register_exit_handler, run_async_task
+from .utils import (
+    btrix_env,
+    is_bool,
+    kubernetes_detected,
+    register_exit_handler,
+    run_async_task,
+)
 from .version import __version__
 from .webhooks import init_event_webhooks_api
 
@@ -53,7 +62,37 @@ app_root = FastAPI(
 
 app_root.middleware("http")(create_request_logging_middleware(logger))
 
-db_inited = {"inited": False}
+db_inited = {"inited": False, "read_only": False}
+
+# requests allowed while serving read-only during online-safe migrations
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+READ_ONLY_ALLOWED_PATHS = (
+    API_PREFIX + "/auth/jwt/login",
+    API_PREFIX + "/auth/jwt/refresh",
+)
+
+
+@app_root.middleware("http")
+async def read_only_during_migration(request, call_next):
+    """reject writes while api serves reads during online-safe migrations"""
+    if (
+        db_inited.get("read_only")
+        and request.method not in READ_ONLY_METHODS
+        and request.url.path not in READ_ONLY_ALLOWED_PATHS
+    ):
+        return JSONResponse(
+            status_code=503, content={"detail": "migration_in_progress"}
+        )
+
+    return await call_next(request)
+
+
+@app_root.exception_handler(ExecutionTimeout)
+async def query_timeout(request, _exc):
+    """return 503 for queries exceeding their time budget, client may retry"""
+    logger.warning("db_query_timeout", path=request.url.path)
+    return JSONResponse(status_code=503, content={"detail": "query_timeout"})
+
 
 tags = [
     "crawlconfigs",
@@ -148,34 +187,9 @@ def main() -> None:
 
     dbclient, mdb = init_db()
 
-    crawl_manager = CrawlManager()
+    email.set_mdb(mdb)
 
-    settings = SettingsResponse(
-        registrationEnabled=is_bool(os.environ.get("REGISTRATION_ENABLED")),
-        jwtTokenLifetime=JWT_TOKEN_LIFETIME,
-        defaultBehaviorTimeSeconds=int(
-            os.environ.get("DEFAULT_BEHAVIOR_TIME_SECONDS", 300)
-        ),
-        defaultPageLoadTimeSeconds=int(
-            os.environ.get("DEFAULT_PAGE_LOAD_TIME_SECONDS", 120)
-        ),
-        maxPagesPerCrawl=int(os.environ.get("MAX_PAGES_PER_CRAWL", 0)),
-        numBrowsersPerInstance=int(os.environ.get("NUM_BROWSERS", 1)),
-        maxBrowserWindows=int(os.environ.get("MAX_BROWSER_WINDOWS", 8)),
-        billingEnabled=is_bool(os.environ.get("BILLING_ENABLED")),
-        signUpUrl=os.environ.get("SIGN_UP_URL", ""),
-        salesEmail=os.environ.get("SALES_EMAIL", ""),
-        supportEmail=os.environ.get("EMAIL_SUPPORT", ""),
-        localesEnabled=(
-            [lang.strip() for lang in os.environ.get("LOCALES_ENABLED", "").split(",")]
-            if os.environ.get("LOCALES_ENABLED")
-            else None
-        ),
-        pausedExpiryMinutes=int(os.environ.get("PAUSED_CRAWL_LIMIT_MINUTES", 10080)),
-        rateLimitDurationMinutes=int(
-            os.environ.get("RATE_LIMIT_DURATION_MINUTES", 720)
-        ),
-    )
+    crawl_manager = CrawlManager()
 
     invites = init_invites(mdb, email)
 
@@ -195,25 +209,19 @@ def main() -> None:
 
     init_subs_api(app, mdb, org_ops, user_manager, shared_secret_or_superuser)
 
+    query_profiler = init_query_profiler_api(app, mdb, current_active_user)
+
     event_webhook_ops = init_event_webhooks_api(mdb, org_ops, app_root)
 
-    # pylint: disable=import-outside-toplevel
-    if not os.environ.get("KUBERNETES_SERVICE_HOST"):
-        logger.critical(
-            "kubernetes_not_detected",
-            message=(
-                "Sorry, the Browsertrix Backend must be run inside a Kubernetes environment. "
-                "Kubernetes not detected (KUBERNETES_SERVICE_HOST is not set), Exiting"
-            ),
-        )
+    if not kubernetes_detected():
         sys.exit(1)
 
-    crawl_log_ops = CrawlLogOps(mdb, org_ops)
-
     storage_ops = init_storages_api(
         org_ops, crawl_manager, app, mdb, current_active_user
     )
 
+    crawl_log_ops = CrawlLogOps(mdb, org_ops, storage_ops)
+
     file_ops = init_file_uploads_api(mdb, org_ops, storage_ops, current_active_user)
 
     background_job_ops = init_background_jobs_api(
@@ -313,6 +321,8 @@ def main() -> None:
 
     crawl_config_ops.set_coll_ops(coll_ops)
 
+    background_job_ops.set_coll_ops(coll_ops)
+
     coll_ops.set_page_ops(page_ops)
 
     # await db init, migrations should have already completed in init containers
@@ -320,14 +330,64 @@ def main() -> None:
 
     run_async_task(background_job_ops.ensure_cron_jobs_exist())
 
+    run_async_task(query_profiler.run_flush())
+
+    # deliver emails and webhooks queued by this and other processes
+    email.start_delivery()
+    event_webhook_ops.wake_dispatcher()
+
     app.include_router(org_ops.router)
 
+    init_settings_api(app)
+
+    init_internal_routes(app)
+
+    init_metrics_api(app_root)
+
+    app_root.include_router(app, prefix=API_PREFIX)
+
+
+# ============================================================================
+def init_settings_api(app: APIRouter) -> None:
+    """init settings route, with settings read from env"""
+    settings = SettingsResponse(
+        registrationEnabled=is_bool(os.environ.get("REGISTRATION_ENABLED")),
+        jwtTokenLifetime=JWT_TOKEN_LIFETIME,
+        defaultBehaviorTimeSeconds=int(
+            os.environ.get("DEFAULT_BEHAVIOR_TIME_SECONDS", 300)
+        ),
+        defaultPageLoadTimeSeconds=int(
+            os.environ.get("DEFAULT_PAGE_LOAD_TIME_SECONDS", 120)
+        ),
+        maxPagesPerCrawl=int(os.environ.get("MAX_PAGES_PER_CRAWL", 0)),
+        numBrowsersPerInstance=int(os.environ.get("NUM_BROWSERS", 1)),
+        maxBrowserWindows=int(os.environ.get("MAX_BROWSER_WINDOWS", 8)),
+        billingEnabled=is_bool(os.environ.get("BILLING_ENABLED")),
+        signUpUrl=os.environ.get("SIGN_UP_URL", ""),
+        salesEmail=os.environ.get("SALES_EMAIL", ""),
+        supportEmail=os.environ.get("EMAIL_SUPPORT", ""),
+        localesEnabled=(
+            [lang.strip() for lang in os.environ.get("LOCALES_ENABLED", "").split(",")]
+            if os.environ.get("LOCALES_ENABLED")
+            else None
+        ),
+        pausedExpiryMinutes=int(os.environ.get("PAUSED_CRAWL_LIMIT_MINUTES", 10080)),
+        rateLimitDurationMinutes=int(
+            os.environ.get("RATE_LIMIT_DURATION_MINUTES", 720)
+        ),
+    )
+
     @app.get("/settings", tags=["settings"], response_model=SettingsResponse)
     async def get_settings() -> SettingsResponse:
         if not db_inited.get("inited"):
             raise HTTPException(status_code=503, detail="not_ready_yet")
         return settings
 
+
+# ============================================================================
+def init_internal_routes(app: APIRouter) -> None:
+    """init openapi schema, docs and health check routes"""
+
     # internal routes
     @app.get("/openapi.json", include_in_schema=False)
     async def openapi() -> JSONResponse:
@@ -347,8 +407,6 @@ def main() -> None:
     async def healthz():
         return {}
 
-    app_root.include_router(app, prefix=API_PREFIX)
-
     # API Configurations -- needed to provide custom favicon
     @app_root.get(API_PREFIX + "/docs", include_in_schema=False)
     def overridden_swagger():
@@ -9,21 +9,13 @@ import structlog
 
 from .logger import init_logging, set_log_context
 from .models import BgJobType
-from .ops import init_ops
-from .utils import btrix_env
+from .ops import Ops
+from .utils import btrix_env, kubernetes_detected
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
-job_type = os.environ.get("BG_JOB_TYPE")
-oid = os.environ.get("OID")
-crawl_type = os.environ.get("CRAWL_TYPE")
-crawl_id = os.environ.get("CRAWL_ID")
-coll_id = os.environ.get("COLLECTION_ID")
-
 
 # ============================================================================
-# pylint: disable=too-many-function-args, duplicate-code, too-many-locals, too-many-return-statements
-# pylint: disable=too-many-branches, too-many-statements
 async def main():
     """run background job with access to ops classes"""
 
@@ -31,49 +23,45 @@ async def main():
 
     logger.info("starting", btrix_env=btrix_env)
 
+    job_type = os.environ.get("BG_JOB_TYPE")
+    oid = os.environ.get("OID")
+    crawl_type = os.environ.get("CRAWL_TYPE")
+    crawl_id = os.environ.get("CRAWL_ID")
+    coll_id = os.environ.get("COLLECTION_ID")
+
     if oid:
         set_log_context(oid=oid)
 
+    if not kubernetes_detected():
+        return 1
+
+    return await run_job(Ops("bg"), job_type, oid, crawl_type, crawl_id, coll_id)
+
+
+# ============================================================================
+# pylint: disable=too-many-return-statements, too-many-branches, too-many-statements
+# pylint: disable=too-many-arguments
+async def run_job(
+    ops: Ops,
+    job_type: str | None,
+    oid: str | None = None,
+    crawl_type: str | None = None,
+    crawl_id: str | None = None,
+    coll_id: str | None = None,
+) -> int:
+    """run background job of given type, returns process exit code (0 on success)
+
+    ops classes are created on first use, so each job type only loads the
+    ops classes it needs"""
+
     crawl_logger = logger.bind(
         job_type=job_type, crawl_type=crawl_type, crawl_id=crawl_id, coll_id=coll_id
     )
 
-    # pylint: disable=import-outside-toplevel
-    if not os.environ.get("KUBERNETES_SERVICE_HOST"):
-        logger.critical(
-            "kubernetes_not_detected",
-            message=(
-                "Sorry, the Browsertrix Backend must be run inside a Kubernetes environment. "
-                "Kubernetes not detected (KUBERNETES_SERVICE_HOST is not set), Exiting"
-            ),
-        )
-        return 1
-
-    (
-        org_ops,
-        _,
-        _,
-        _,
-        upload_ops,
-        page_ops,
-        coll_ops,
-        _,
-        _,
-        _,
-        _,
-        user_manager,
-        _,
-        file_ops,
-        _,
-        _,
-        _,
-        _,
-    ) = init_ops()
-
     # Run job (generic)
     if job_type == BgJobType.OPTIMIZE_PAGES:
         try:
-            await page_ops.optimize_crawl_pages(version=2)
+            await ops.page_ops.optimize_crawl_pages()
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -85,7 +73,7 @@ async def main():
 
     if job_type == BgJobType.CLEANUP_SEED_FILES:
         try:
-            await file_ops.cleanup_unused_seed_files()
+            await ops.file_ops.cleanup_unused_seed_files()
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -97,7 +85,7 @@ async def main():
 
     if job_type == BgJobType.RETRY_STUCK_UPLOADS:
         try:
-            await upload_ops.retry_stuck_uploads()
+            await ops.upload_ops.retry_stuck_uploads()
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -114,7 +102,7 @@ async def main():
         )
         return 1
 
-    org = await org_ops.get_org_by_id(UUID(oid))
+    org = await ops.org_ops.get_org_by_id(UUID(oid))
     if not org:
         crawl_logger.error(
             "org_id_invalid",
@@ -124,7 +112,7 @@ async def main():
 
     if job_type == BgJobType.DELETE_ORG:
         try:
-            await org_ops.delete_org_and_data(org, user_manager)
+            await ops.org_ops.delete_org_and_data(org, ops.user_manager)
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -136,7 +124,7 @@ async def main():
 
     if job_type == BgJobType.RECALCULATE_ORG_STATS:
         try:
-            await org_ops.recalculate_storage(org)
+            await ops.org_ops.recalculate_storage(org)
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -149,11 +137,11 @@ async def main():
     if job_type == BgJobType.READD_ORG_PAGES:
         try:
             if not crawl_id:
-                await page_ops.re_add_all_crawl_pages(org, crawl_type=crawl_type)
+                await ops.page_ops.re_add_all_crawl_pages(org, crawl_type=crawl_type)
             else:
-                await page_ops.re_add_crawl_pages(crawl_id=crawl_id, oid=org.id)
+                await ops.page_ops.re_add_crawl_pages(crawl_id=crawl_id, oid=org.id)
 
-            await coll_ops.recalculate_org_collection_stats(org)
+            await ops.coll_ops.recalculate_org_collection_stats(org)
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
@@ -174,7 +162,7 @@ async def main():
             # calculation started, the job will re-calculate the stats again
             # before quitting
             while True:
-                if not await coll_ops.should_update_stats(UUID(coll_id), org.id):
+                if not await ops.coll_ops.should_update_stats(UUID(coll_id), org.id):
                     break
 
                 count += 1
@@ -183,7 +171,7 @@ async def main():
                     count=count,
                     unstructured_message=f"Starting update number {count}",
                 )
-                await coll_ops.update_collection_stats(UUID(coll_id), org.id)
+                await ops.coll_ops.update_collection_stats(UUID(coll_id), org.id)
 
             crawl_logger.info(
                 "collection_update_complete",
@@ -207,7 +195,7 @@ async def main():
             )
             return 1
         try:
-            await upload_ops.post_process_upload(crawl_id, org)
+            await ops.upload_ops.post_process_upload(crawl_id, org)
             return 0
         # pylint: disable=broad-exception-caught
         except Exception:
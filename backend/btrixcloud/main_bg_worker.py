@@ -0,0 +1,36 @@
+"""entrypoint module for long-running background job worker"""
+
+import asyncio
+import sys
+
+import structlog
+
+from .logger import init_logging
+from .bg_worker import BgJobWorker
+from .ops import Ops
+from .utils import btrix_env, kubernetes_detected, register_exit_handler
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+
+# ============================================================================
+async def main():
+    """run background job worker"""
+
+    init_logging()
+    register_exit_handler()
+
+    logger.info("starting", btrix_env=btrix_env)
+
+    if not kubernetes_detected():
+        return 1
+
+    worker = BgJobWorker(Ops("bg"))
+    await worker.run()
+    return 0
+
+
+# # ============================================================================
+if __name__ == "__main__":
+    return_code = asyncio.run(main())
+    sys.exit(return_code)
@@ -1,7 +1,6 @@
 """entrypoint module for init_container, handles db migration"""
 
 import asyncio
-import os
 import sys
 
 import structlog
@@ -9,7 +8,7 @@ import structlog
 from .logger import init_logging
 from .db import ensure_feature_version, update_and_prepare_db
 from .ops import init_ops
-from .utils import btrix_env
+from .utils import btrix_env, kubernetes_detected
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -22,15 +21,7 @@ async def main() -> int:
 
     logger.info("starting", btrix_env=btrix_env)
 
-    # pylint: disable=import-outside-toplevel
-    if not os.environ.get("KUBERNETES_SERVICE_HOST"):
-        logger.critical(
-            "kubernetes_not_detected",
-            unstructured_message=(
-                "Sorry, the Browsertrix Backend must be run inside a Kubernetes environment. "
-                "Kubernetes not detected (KUBERNETES_SERVICE_HOST is not set), Exiting"
-            ),
-        )
+    if not kubernetes_detected():
         return 1
 
     (
@@ -52,7 +43,7 @@ async def main() -> int:
         crawl_manager,
         dbclient,
         mdb,
-    ) = init_ops()
+    ) = init_ops("bg")
 
     await ensure_feature_version(dbclient)
 
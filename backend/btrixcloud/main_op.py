@@ -1,15 +1,21 @@
 """entrypoint module for operator"""
 
-import os
 import sys
 
 import structlog
 from fastapi import FastAPI
 
 from .logger import create_request_logging_middleware, init_logging
+from .metrics import init_metrics_api
 from .operator import init_operator_api
-from .ops import init_ops
-from .utils import btrix_env, register_exit_handler
+from .ops import Ops
+from .query_profiler import QueryProfilerOps
+from .utils import (
+    btrix_env,
+    kubernetes_detected,
+    register_exit_handler,
+    run_async_task,
+)
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -18,6 +24,8 @@ app_root = FastAPI()
 
 app_root.middleware("http")(create_request_logging_middleware(logger))
 
+init_metrics_api(app_root)
+
 
 # ============================================================================
 # pylint: disable=too-many-function-args, duplicate-code
@@ -26,50 +34,26 @@ def main():
 
     logger.info("starting", btrix_env=btrix_env)
 
-    # pylint: disable=import-outside-toplevel
-    if not os.environ.get("KUBERNETES_SERVICE_HOST"):
-        logger.critical(
-            "kubernetes_not_detected",
-            message=(
-                "Sorry, the Browsertrix Backend must be run inside a Kubernetes environment. "
-                "Kubernetes not detected (KUBERNETES_SERVICE_HOST is not set), Exiting"
-            ),
-        )
+    if not kubernetes_detected():
         sys.exit(1)
 
-    (
-        org_ops,
-        crawl_config_ops,
-        _,
-        crawl_ops,
-        _,
-        page_ops,
-        coll_ops,
-        _,
-        storage_ops,
-        background_job_ops,
-        event_webhook_ops,
-        _,
-        _,
-        file_ops,
-        crawl_log_ops,
-        _,
-        _,
-        _,
-    ) = init_ops()
+    # ops classes not used by the operator, eg. users and invites, are not created
+    ops = Ops("operator")
+
+    run_async_task(QueryProfilerOps(ops.mdb).run_flush())
 
     return init_operator_api(
         app_root,
-        crawl_config_ops,
-        crawl_ops,
-        org_ops,
-        coll_ops,
-        storage_ops,
-        event_webhook_ops,
-        background_job_ops,
-        page_ops,
-        crawl_log_ops,
-        file_ops,
+        ops.crawl_config_ops,
+        ops.crawl_ops,
+        ops.org_ops,
+        ops.coll_ops,
+        ops.storage_ops,
+        ops.event_webhook_ops,
+        ops.background_job_ops,
+        ops.page_ops,
+        ops.crawl_log_ops,
+        ops.file_ops,
     )
 
 
@@ -0,0 +1,438 @@
+"""
+Prometheus metrics for the API, operator and background jobs
+
+Metrics are collected in-process and rendered in the Prometheus text
+exposition format on /metrics. Label values are restricted to route
+templates, collection and command names, storage hosts, CRD kinds and job
+types, and each metric caps its number of label sets, so cardinality stays
+bounded regardless of traffic.
+"""
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from pymongo import monitoring
+from redis.asyncio.client import Pipeline, Redis
+
+from .utils import is_falsy_bool
+
+metrics_enabled = not is_falsy_bool(os.environ.get("METRICS_ENABLED"))
+
+# label sets beyond this are folded into a single "other" series
+MAX_SERIES_PER_METRIC = 500
+
+OTHER = "other"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+MONGO_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+JOB_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+
+# ============================================================================
+def _format_labels(names: Sequence[str], values: Sequence[str], extra="") -> str:
+    parts = [
+        f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True)
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# ============================================================================
+# pylint: disable=too-few-public-methods
+class Metric:
+    """Base class for a metric with a fixed set of label names"""
+
+    kind = ""
+
+    name: str
+    documentation: str
+    label_names: tuple[str, ...]
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series: dict[tuple[str, ...], Any] = {}
+
+        registry.append(self)
+
+    def _get_series(self, label_values: Sequence[Any]) -> Any:
+        key = tuple(str(value) for value in label_values)
+        series = self._series.get(key)
+        if series is None:
+            if len(self._series) >= MAX_SERIES_PER_METRIC:
+                key = tuple(OTHER for _ in self.label_names)
+                series = self._series.get(key)
+
+            if series is None:
+                series = self._new_series()
+                self._series[key] = series
+
+        return series
+
+    def _new_series(self) -> Any:
+        raise NotImplementedError()
+
+    def render(self) -> list[str]:
+        """render metric in prometheus text format"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            for key, series in self._series.items():
+                lines.extend(self._render_series(key, series))
+        return lines
+
+    def _render_series(self, key: tuple[str, ...], series: Any) -> list[str]:
+        raise NotImplementedError()
+
+
+# ============================================================================
+class Counter(Metric):
+    """Monotonically increasing counter"""
+
+    kind = "counter"
+
+    def _new_series(self) -> list[float]:
+        return [0.0]
+
+    def inc(self, *label_values: Any, amount: float = 1) -> None:
+        """increment counter for label values"""
+        if not metrics_enabled:
+            return
+
+        with self._lock:
+            self._get_series(label_values)[0] += amount
+
+    def _render_series(self, key, series) -> list[str]:
+        labels = _format_labels(self.label_names, key)
+        return [f"{self.name}{labels} {series[0]}"]
+
+
+# ============================================================================
+class Gauge(Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def _new_series(self) -> list[float]:
+        return [0.0]
+
+    def set(self, value: float, *label_values: Any) -> None:
+        """set gauge for label values"""
+        if not metrics_enabled:
+            return
+
+        with self._lock:
+            self._get_series(label_values)[0] = value
+
+    def _render_series(self, key, series) -> list[str]:
+        labels = _format_labels(self.label_names, key)
+        return [f"{self.name}{labels} {series[0]}"]
+
+
+# ============================================================================
+class Histogram(Metric):
+    """Histogram with fixed buckets"""
+
+    kind = "histogram"
+
+    buckets: tuple[float, ...]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, label_names)
+
+    def _new_series(self) -> list[float]:
+        # bucket counts, followed by +Inf count and sum
+        return [0.0] * (len(self.buckets) + 2)
+
+    def observe(self, value: float, *label_values: Any) -> None:
+        """record an observation for label values"""
+        if not metrics_enabled:
+            return
+
+        with self._lock:
+            series = self._get_series(label_values)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[-2] += 1
+            series[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *label_values: Any) -> Iterator[None]:
+        """observe duration of the wrapped block"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, *label_values)
+
+    def _render_series(self, key, series) -> list[str]:
+        lines = []
+        total = 0.0
+        for bound, count in zip(self.buckets, series, strict=False):
+            total += count
+            labels = _format_labels(self.label_names, key, f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{labels} {total}")
+
+        total += series[-2]
+        labels = _format_labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{labels} {total}")
+
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {series[-1]}")
+        lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+registry: list[Metric] = []
+
+
+# ============================================================================
+HTTP_REQUEST_DURATION = Histogram(
+    "btrix_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+MONGO_COMMAND_DURATION = Histogram(
+    "btrix_mongo_command_duration_seconds",
+    "MongoDB command latency by collection and operation",
+    ["collection", "op"],
+    MONGO_BUCKETS,
+)
+
+S3_REQUEST_DURATION = Histogram(
+    "btrix_s3_request_duration_seconds",
+    "S3 request latency by storage endpoint and operation",
+    ["storage", "op"],
+)
+
+OPERATOR_SYNC_DURATION = Histogram(
+    "btrix_operator_sync_duration_seconds",
+    "Operator sync handler duration by CRD kind",
+    ["kind"],
+)
+
+OPERATOR_SYNC_REDIS_CALLS = Histogram(
+    "btrix_operator_sync_redis_calls",
+    "Redis round-trips made during one operator sync",
+    ["kind"],
+    COUNT_BUCKETS,
+)
+
+PAGES_ADDED = Counter(
+    "btrix_pages_added_total",
+    "Pages ingested from crawls and QA runs",
+    ["type"],
+)
+
+CRAWL_LOG_LINES_ADDED = Counter(
+    "btrix_crawl_log_lines_added_total",
+    "Crawl log lines ingested by log level",
+    ["level"],
+)
+
+BG_JOB_DURATION = Histogram(
+    "btrix_background_job_duration_seconds",
+    "Background job duration by job type",
+    ["job_type", "success"],
+    JOB_BUCKETS,
+)
+
+WEBHOOK_REQUEST_DURATION = Histogram(
+    "btrix_webhook_request_duration_seconds",
+    "Webhook POST latency by event type and result",
+    ["event", "success"],
+)
+
+WEBHOOK_DELIVERY_DELAY = Histogram(
+    "btrix_webhook_delivery_delay_seconds",
+    "Time from webhook event creation to successful delivery",
+    ["event"],
+    JOB_BUCKETS,
+)
+
+WEBHOOK_BACKLOG = Gauge(
+    "btrix_webhook_backlog",
+    "Webhook notifications waiting for delivery or retry",
+)
+
+CRAWL_EVENT_SUBSCRIBERS = Gauge(
+    "btrix_crawl_event_subscribers",
+    "Clients connected to live crawl status event streams",
+)
+
+# known mongo command names, anything else is reported as "other"
+MONGO_OPS = {
+    "find",
+    "insert",
+    "update",
+    "delete",
+    "aggregate",
+    "count",
+    "distinct",
+    "findAndModify",
+    "getMore",
+    "createIndexes",
+    "listIndexes",
+    "dropIndexes",
+}
+
+
+# ============================================================================
+def render_metrics() -> str:
+    """render all registered metrics"""
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def init_metrics_api(app: FastAPI) -> None:
+    """add /metrics endpoint to app, if metrics are enabled"""
+    if not metrics_enabled:
+        return
+
+    @app.get("/metrics", include_in_schema=False)
+    async def get_metrics():
+        return PlainTextResponse(
+            render_metrics(), media_type="text/plain; version=0.0.4"
+        )
+
+
+def observe_http_request(request, response, duration: float) -> None:
+    """record request latency, labeled by route template, not full path"""
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", None) or "unmatched"
+    status = f"{response.status_code // 100}xx" if response else "5xx"
+    HTTP_REQUEST_DURATION.observe(duration, request.method, route_path, status)
+
+
+# ============================================================================
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo command listener recording command latency"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else OTHER
+            )
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+    def _finished(self, event) -> None:
+        with self._lock:
+            collection = self._pending.pop(
+                (event.connection_id, event.request_id), None
+            )
+
+        if collection is None:
+            return
+
+        op = event.command_name if event.command_name in MONGO_OPS else OTHER
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, collection, op)
+
+
+def get_mongo_event_listeners() -> list[monitoring.CommandListener]:
+    """command listeners to pass to mongo client"""
+    return [MongoCommandMetrics()] if metrics_enabled else []
+
+
+# ============================================================================
+def register_s3_metrics(client, storage: str) -> None:
+    """record latency of each S3 request made by client"""
+    if not metrics_enabled:
+        return
+
+    def before_call(context: dict, **_):
+        context["btrix_start"] = time.monotonic()
+
+    def after_call(model, context: dict, **_):
+        start = context.get("btrix_start")
+        if start is not None:
+            S3_REQUEST_DURATION.observe(time.monotonic() - start, storage, model.name)
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+
+
+# ============================================================================
+redis_calls: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "redis_calls", default=None
+)
+
+
+def _count_redis_call() -> None:
+    counter = redis_calls.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+# redis commands are all inherited, none are implemented here
+# pylint: disable=abstract-method,too-many-ancestors
+class MetricsRedis(Redis):
+    """Redis client counting round-trips for the current operator sync"""
+
+    async def execute_command(self, *args, **options):
+        _count_redis_call()
+        return await super().execute_command(*args, **options)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> Pipeline:
+        # a pipeline is sent as a single round-trip
+        _count_redis_call()
+        return super().pipeline(transaction, shard_hint)
+
+
+@contextlib.contextmanager
+def track_operator_sync(kind: str) -> Iterator[None]:
+    """record sync duration and redis round-trips for operator sync handler"""
+    counter = [0]
+    token = redis_calls.set(counter)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        redis_calls.reset(token)
+        OPERATOR_SYNC_DURATION.observe(time.monotonic() - start, kind)
+        OPERATOR_SYNC_REDIS_CALLS.observe(counter[0], kind)
@@ -2,11 +2,15 @@
 BaseMigration class to subclass in each migration module
 """
 
+import asyncio
 import os
+from typing import Any
 
 import structlog
 from pymongo.errors import OperationFailure
 
+from btrixcloud.utils import dt_now
+
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 
@@ -17,6 +21,9 @@ class MigrationError(Exception):
 class BaseMigration:
     """Base Migration class."""
 
+    # if true, api may serve read-only requests while this migration runs
+    online_safe = False
+
     def __init__(self, mdb, migration_version="0001"):
         self.mdb = mdb
         self.migration_version = migration_version
@@ -113,3 +120,133 @@ class BaseMigration:
             unstructured_message=f"Database successfully migrated to {self.migration_version}",
         )
         return True
+
+
+class BatchedMigration(BaseMigration):
+    """Migration applied to each matching document of a collection.
+
+    Documents are read in _id order in batches, and batches are processed
+    concurrently by MIGRATION_WORKERS workers. Progress is checkpointed in the
+    migration_progress collection after each completed run of batches, so a
+    restarted migration resumes from the last checkpoint. Batches completed
+    after the checkpoint are processed again on resume, so migrate_doc must
+    be idempotent.
+    """
+
+    collection = ""
+    query: dict[str, Any] = {}
+    projection: dict[str, Any] | None = None
+    batch_size = 100
+
+    def __init__(self, mdb, migration_version="0001"):
+        super().__init__(mdb, migration_version)
+        self.progress = mdb["migration_progress"]
+        self.num_workers = max(int(os.environ.get("MIGRATION_WORKERS") or 4), 1)
+
+    async def migrate_doc(self, doc: dict[str, Any]) -> None:
+        """Migrate a single document."""
+        raise NotImplementedError(
+            "Not implemented in base class - implement in subclass"
+        )
+
+    async def migrate_batch(self, docs: list[dict[str, Any]]) -> None:
+        """Migrate a batch of documents, override to use bulk writes."""
+        for doc in docs:
+            await self.migrate_doc(doc)
+
+    async def migrate_up(self):
+        """Migrate all matching documents in batches, resuming from checkpoint."""
+        coll = self.mdb[self.collection]
+
+        checkpoint = await self.progress.find_one({"_id": self.migration_version})
+        checkpoint = checkpoint or {}
+        last_id = checkpoint.get("lastId")
+        count = checkpoint.get("count", 0)
+
+        query = dict(self.query)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+            logger.info(
+                "migration_resuming",
+                migration_version=self.migration_version,
+                count=count,
+                unstructured_message=f"Resuming migration after {count} documents",
+            )
+
+        total = count + await coll.count_documents(query)
+        await self.progress.update_one(
+            {"_id": self.migration_version},
+            {"$set": {"total": total, "count": count, "updated": dt_now()}},
+            upsert=True,
+        )
+
+        batches: asyncio.Queue[tuple[int, list[dict]] | None] = asyncio.Queue(
+            maxsize=self.num_workers
+        )
+        done: dict[int, list[dict]] = {}
+        next_seq = 0
+
+        async def read_batches():
+            seq = 0
+            batch: list[dict] = []
+            cursor = coll.find(query, self.projection).sort("_id", 1)
+            async for doc in cursor.batch_size(self.batch_size):
+                batch.append(doc)
+                if len(batch) >= self.batch_size:
+                    await batches.put((seq, batch))
+                    seq += 1
+                    batch = []
+
+            if batch:
+                await batches.put((seq, batch))
+
+            for _ in range(self.num_workers):
+                await batches.put(None)
+
+        async def checkpoint_done():
+            nonlocal next_seq, count
+            advanced = None
+            while next_seq in done:
+                batch = done.pop(next_seq)
+                count += len(batch)
+                advanced = batch[-1]["_id"]
+                next_seq += 1
+
+            if advanced is None:
+                return
+
+            # if workers checkpoint concurrently, never move checkpoint back
+            await self.progress.update_one(
+                {"_id": self.migration_version, "count": {"$lt": count}},
+                {"$set": {"lastId": advanced, "count": count, "updated": dt_now()}},
+            )
+            logger.info(
+                "migration_progress",
+                migration_version=self.migration_version,
+                count=count,
+                total=total,
+                unstructured_message=(
+                    f"Migration {self.migration_version}: {count} / {total} documents"
+                ),
+            )
+
+        async def work():
+            while True:
+                item = await batches.get()
+                if item is None:
+                    return
+
+                seq, batch = item
+                await self.migrate_batch(batch)
+                done[seq] = batch
+                await checkpoint_done()
+
+        tasks = [asyncio.create_task(read_batches())]
+        tasks.extend(asyncio.create_task(work()) for _ in range(self.num_workers))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        await self.progress.delete_one({"_id": self.migration_version})
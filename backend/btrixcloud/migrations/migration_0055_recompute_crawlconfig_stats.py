@@ -6,16 +6,23 @@ import structlog
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from btrixcloud.crawlconfigs import stats_recompute_all
-from btrixcloud.migrations import BaseMigration
+from btrixcloud.migrations import BatchedMigration
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
 MIGRATION_VERSION = "0055"
 
 
-class Migration(BaseMigration):
+class Migration(BatchedMigration):
     """Migration class."""
 
+    collection = "crawl_configs"
+    query = {"inactive": {"$ne": True}}
+    projection = {"_id": 1}
+
+    # only recomputes workflow stats, reads are unaffected
+    online_safe = True
+
     # pylint: disable=unused-argument
     def __init__(self, mdb: AsyncIOMotorDatabase, **kwargs):
         super().__init__(mdb, migration_version=MIGRATION_VERSION)
@@ -28,10 +35,6 @@ class Migration(BaseMigration):
         Recompute crawl workflow stats to fix issue with failed crawls
         being added to successfulCrawlCount and workflow size totals.
         """
-        # pylint: disable=duplicate-code
-        crawl_configs = self.mdb["crawl_configs"]
-        crawls = self.mdb["crawls"]
-
         if self.crawl_config_ops is None:
             logger.warning(
                 "crawlconfig_stats_recompute_missing_ops",
@@ -42,32 +45,28 @@ class Migration(BaseMigration):
             )
             return
 
-        count = 0
-        async for config in crawl_configs.find({"inactive": {"$ne": True}}):
-            config_id = config["_id"]
-            try:
-                await stats_recompute_all(
-                    self.crawl_config_ops, crawl_configs, crawls, config_id
-                )
-                count += 1
-            # pylint: disable=broad-exception-caught
-            except Exception:
-                logger.warning(
-                    "workflow_stats_update_warning",
-                    config_id=config_id,
-                    exc_info=True,
-                    unstructured_message=f"Unable to update workflow {config_id}",
-                )
+        await super().migrate_up()
 
-            if count % 100 == 0:
-                logger.info(
-                    "workflows_migrated_progress",
-                    count=count,
-                    unstructured_message=f"Migrated {count} workflows",
-                )
+    async def migrate_doc(self, doc):
+        """Recompute stats for one workflow"""
+        # checked in migrate_up
+        crawl_config_ops = self.crawl_config_ops
+        if crawl_config_ops is None:
+            return
 
-        logger.info(
-            "workflows_migrated_total",
-            count=count,
-            unstructured_message=f"Migrated {count} workflows total, done",
-        )
+        config_id = doc["_id"]
+        try:
+            await stats_recompute_all(
+                crawl_config_ops,
+                self.mdb["crawl_configs"],
+                self.mdb["crawls"],
+                config_id,
+            )
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            logger.warning(
+                "workflow_stats_update_warning",
+                config_id=config_id,
+                exc_info=True,
+                unstructured_message=f"Unable to update workflow {config_id}",
+            )
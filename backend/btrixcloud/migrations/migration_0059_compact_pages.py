@@ -0,0 +1,22 @@
+"""
+Migration 0059 - Compact pages, with url host stored for indexing
+"""
+
+from btrixcloud.migrations.migration_0042_page_filenames import (
+    Migration as OptimizePagesMigration,
+)
+
+MIGRATION_VERSION = "0059"
+
+
+class Migration(OptimizePagesMigration):
+    """Migration class.
+
+    Migrate crawl pages to v3 in background job, setting host and removing
+    stored empty and default values. Crawls not yet migrated to v2 are also
+    optimized as in migration 0042, which starts the same job.
+    """
+
+    def __init__(self, mdb, **kwargs):
+        super().__init__(mdb, **kwargs)
+        self.migration_version = MIGRATION_VERSION
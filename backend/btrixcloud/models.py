@@ -13,6 +13,7 @@ import os
 from datetime import datetime
 from enum import IntEnum, StrEnum
 from typing import Annotated, Any, Literal, Self, get_args, get_origin
+from urllib.parse import urlsplit
 from uuid import UUID
 
 from pydantic import (
@@ -25,6 +26,7 @@ from pydantic import (
     Field,
     RootModel,
     TypeAdapter,
+    ValidationInfo,
     create_model,
     model_validator,
     validate_email,
@@ -41,7 +43,7 @@ from typing_extensions import deprecated
 # from fastapi_users import models as fastapi_users_models
 from .crawl_validator import validate_crawl_filename_template
 from .cron_validator import validate_cron_schedule
-from .db import LENIENT_ON_READ, BaseMongoModel
+from .db import LENIENT_ON_READ, BaseMongoModel, is_trusted_read
 from .utils import is_bool
 
 # num browsers per crawler instance
@@ -73,6 +75,11 @@ PRESIGN_DURATION_SECONDS = min(PRESIGN_DURATION_MINUTES, PRESIGN_MINUTES_MAX) *
 # Minimum part size for file uploads
 MIN_UPLOAD_PART_SIZE = 10000000
 
+# Page schema version, stored as crawl version once its pages are migrated
+# 2: pages include filename for optimized replay
+# 3: compact pages, default values omitted and url host stored for indexing
+PAGES_VERSION = 3
+
 # enable dedupe by default
 DEDUPE_FEATURE_ENABLED_DEFAULT = is_bool(
     os.environ.get("DEDUPE_FEATURE_ENABLED_DEFAULT")
@@ -93,14 +100,22 @@ BrowserWindowCount = Annotated[int, Field(strict=True, ge=1, le=MAX_BROWSER_WIND
 ReviewStatus = Annotated[int, Field(strict=True, ge=1, le=5)] | None
 
 any_http_url_adapter = TypeAdapter(AnyHttpUrlNonStr)
-AnyHttpUrl = Annotated[
-    str, BeforeValidator(lambda value: str(any_http_url_adapter.validate_python(value)))
-]
-
 http_url_adapter = TypeAdapter(HttpUrlNonStr)
-HttpUrl = Annotated[
-    str, BeforeValidator(lambda value: str(http_url_adapter.validate_python(value)))
-]
+
+
+def _url_validator(adapter: TypeAdapter):
+    """validate url with adapter, unless already validated when stored"""
+
+    def validate(value, info: ValidationInfo):
+        if isinstance(value, str) and is_trusted_read(info):
+            return value
+        return str(adapter.validate_python(value))
+
+    return validate
+
+
+AnyHttpUrl = Annotated[str, BeforeValidator(_url_validator(any_http_url_adapter))]
+HttpUrl = Annotated[str, BeforeValidator(_url_validator(http_url_adapter))]
 
 Name = Annotated[str, Field(min_length=1, max_length=1000), LENIENT_ON_READ]
 NameOrEmptyStr = Annotated[str, Field(min_length=0, max_length=1000), LENIENT_ON_READ]
@@ -1047,6 +1062,10 @@ class CrawlOut(BaseMongoModel):
     shouldPause: bool | None = False
     pausedAt: datetime | None = None
     rateLimitedAt: datetime | None = None
+
+    # set while waiting for cluster capacity
+    queuePosition: int | None = None
+    estimatedStartTime: datetime | None = None
     manual: bool = False
     cid_rev: int | None = None
     scale: Annotated[Scale | None, Field(deprecated=True)] = None
@@ -1072,7 +1091,7 @@ class CrawlOut(BaseMongoModel):
     errorPageCount: int | None = 0
 
     # Set to older version by default, crawls with optimized
-    # pages will have this explicitly set to 2
+    # pages will have this explicitly set to 2 or later, see PAGES_VERSION
     version: int | None = 1
 
     # Retained for backward compatibility
@@ -1222,6 +1241,10 @@ class Crawl(BaseCrawl, CrawlConfigCore):
 
     rateLimitedAt: datetime | None = None
 
+    # set while waiting for cluster capacity
+    queuePosition: int | None = None
+    estimatedStartTime: datetime | None = None
+
     qaCrawlExecSeconds: int = 0
 
     qa: QARun | None = None
@@ -1340,6 +1363,42 @@ class CrawlLogLine(BaseMongoModel):
         return bool(self.qaRunId)
 
 
+# ============================================================================
+class CrawlLogSegmentBlock(BaseModel):
+    """Independently compressed block of log lines in a log segment"""
+
+    offset: int
+    length: int
+
+    # number of lines per [logLevel, context, count]
+    counts: list[tuple[str, str, int]]
+
+
+# ============================================================================
+class CrawlLogSegment(BaseMongoModel):
+    """Logs of finished crawl or QA run, moved from db to a gzipped jsonl
+    file in storage, with lines sorted by timestamp"""
+
+    id: UUID
+
+    crawlId: str
+    oid: UUID
+
+    qaRunId: str | None = None
+
+    filename: str
+    storage: StorageRef
+    size: int
+
+    # file of segment this replaced, kept for readers of previous segment
+    prevFilename: str | None = None
+
+    total: int
+    blocks: list[CrawlLogSegmentBlock]
+
+    created: datetime
+
+
 # ============================================================================
 
 ### USER-UPLOADED FILES ###
@@ -1588,6 +1647,9 @@ class Page(BaseMongoModel):
     favIconUrl: str | None = None
     isSeed: bool | None = False
 
+    # url host, set from url on insert for indexed per-host queries
+    host: str | None = None
+
     # manual review
     userid: UUID | None = None
     modified: datetime | None = None
@@ -1611,6 +1673,15 @@ class Page(BaseMongoModel):
         elif self.loadState == 0:
             self.isError = True
 
+    def compute_host(self):
+        """sets self.host from url"""
+        self.host = urlsplit(str(self.url)).netloc or None
+
+    def to_compact_dict(self) -> dict[str, Any]:
+        """dict for storing page, empty and default values are omitted
+        and filled in again from model defaults when the page is loaded"""
+        return self.to_dict(exclude_none=True, exclude_defaults=True)
+
 
 # ============================================================================
 class PageWithAllQA(Page):
@@ -3228,6 +3299,8 @@ class WebhookNotification(BaseMongoModel):
     attempts: int = 0
     created: datetime
     lastAttempted: datetime | None = None
+    # set while waiting for delivery or retry
+    nextAttempt: datetime | None = None
 
 
 # ============================================================================
@@ -3264,6 +3337,13 @@ class BackgroundJob(BaseMongoModel):
 
     previousAttempts: list[dict[str, datetime | None]] | None = None
 
+    # set if job is run by the background job worker, which holds a lease
+    # on the job while running it
+    workerQueued: bool = False
+    leaseOwner: str | None = None
+    leaseExpires: datetime | None = None
+    leaseAttempts: int = 0
+
 
 # ============================================================================
 class CreateReplicaJob(BackgroundJob):
@@ -3333,6 +3413,9 @@ class UpdateCollStatsJob(BackgroundJob):
     oid: UUID
     collection_id: UUID
 
+    # set when stats updates were requested while job was pending or running
+    dirty: bool = False
+
 
 # ============================================================================
 class PostProcessUploadJob(BackgroundJob):
@@ -3630,6 +3713,34 @@ class PageUrlCountResponse(BaseModel):
     items: list[PageUrlCount]
 
 
+# ============================================================================
+class SlowQueryShape(BaseModel):
+    """Slow mongo query shape, with suggested index if not supported by one"""
+
+    shapeId: str
+    collection: str
+    command: str
+    filter: dict[str, Any]
+    sort: dict[str, Any] | None = None
+
+    count: int
+    totalMs: float
+    maxMs: float
+    lastSeen: datetime
+
+    plan: dict[str, Any] | None = None
+
+    suggestedIndex: list[tuple[str, int]] | None = None
+    existingIndex: str | None = None
+
+
+# ============================================================================
+class SlowQueriesResponse(BaseModel):
+    """Response model for slow query shapes, slowest total time first"""
+
+    items: list[SlowQueryShape]
+
+
 # FILTER UTILITIES
 
 
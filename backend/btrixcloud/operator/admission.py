@@ -0,0 +1,291 @@
+"""Cluster-wide fair-share admission of crawls to crawler browser slots"""
+
+import heapq
+import math
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from uuid import UUID
+
+import structlog
+
+from btrixcloud.utils import dt_now, str_to_date
+
+from .models import AdmissionEntry, AdmissionQueue, CrawlSpec
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# weights for fair share, a higher weight gets a larger share of browser slots
+MANUAL_WEIGHT = 4
+SCHEDULED_WEIGHT = 2
+QA_WEIGHT = 1
+
+# crawls not synced for this long are assumed to no longer exist
+ENTRY_EXPIRE_SECS = 300
+
+# after operator start, wait for running crawls to sync before admitting more
+WARMUP_SECS = int(os.environ.get("CRAWL_ADMISSION_WARMUP_SECONDS") or 60)
+
+# assumed crawl duration for estimates until crawls have finished
+DEFAULT_DURATION_SECS = 3600
+
+# weight of latest finished crawl in average crawl duration
+DURATION_SMOOTHING = 0.2
+
+
+# ============================================================================
+class CrawlAdmission:
+    """Admits crawls to a fixed number of browser slots across the cluster.
+
+    Waiting crawls are ordered by weighted fair share: the crawl whose org
+    would hold the smallest share of slots (relative to the crawl's priority
+    weight) after admission goes first. Crawls are admitted strictly in that
+    order, so large crawls are not starved by smaller ones.
+
+    State is kept in memory and rebuilt from crawl syncs, running crawls
+    register on each sync and are released when finished. The ordered queue
+    is only recomputed when running or waiting crawls change.
+    """
+
+    capacity: int
+    running: dict[str, AdmissionEntry]
+    waiting: dict[str, AdmissionEntry]
+    avg_duration: float
+    admit_after: float
+    _queue: AdmissionQueue | None
+
+    def __init__(self, capacity: int, warmup_secs: int = WARMUP_SECS):
+        self.capacity = capacity
+        self.running = {}
+        self.waiting = {}
+        self.avg_duration = DEFAULT_DURATION_SECS
+        self.admit_after = time.monotonic() + warmup_secs
+        self._queue = None
+
+    @property
+    def enabled(self) -> bool:
+        """admission is only limited if cluster capacity is known"""
+        return self.capacity > 0
+
+    def _make_entry(self, crawl: CrawlSpec, slots: int, since: datetime):
+        if crawl.is_qa:
+            weight = QA_WEIGHT
+        elif crawl.scheduled:
+            weight = SCHEDULED_WEIGHT
+        else:
+            weight = MANUAL_WEIGHT
+
+        return AdmissionEntry(
+            crawl_id=crawl.id,
+            oid=crawl.oid,
+            # a crawl larger than the cluster can still run on its own
+            slots=min(max(slots, 1), self.capacity),
+            weight=weight,
+            since=since,
+            timeout=crawl.timeout,
+            last_seen=time.monotonic(),
+        )
+
+    def _expire(self) -> None:
+        expire_before = time.monotonic() - ENTRY_EXPIRE_SECS
+        for entries in (self.running, self.waiting):
+            for crawl_id in [
+                crawl_id
+                for crawl_id, entry in entries.items()
+                if entry.last_seen < expire_before
+            ]:
+                entries.pop(crawl_id)
+                self._queue = None
+
+    def set_running(self, crawl: CrawlSpec, slots: int) -> None:
+        """register crawl past admission as holding its browser slots"""
+        if not self.enabled:
+            return
+
+        entry = self.running.get(crawl.id)
+        if entry:
+            entry.last_seen = time.monotonic()
+            return
+
+        self.waiting.pop(crawl.id, None)
+        self.running[crawl.id] = self._make_entry(
+            crawl, slots, str_to_date(crawl.started) or dt_now()
+        )
+        self._queue = None
+
+    def release(self, crawl_id: str) -> None:
+        """release browser slots of finished or paused crawl"""
+        if self.waiting.pop(crawl_id, None):
+            self._queue = None
+
+        entry = self.running.pop(crawl_id, None)
+        if not entry:
+            return
+
+        self._queue = None
+
+        duration = (dt_now() - entry.since).total_seconds()
+        if duration > 0:
+            self.avg_duration += DURATION_SMOOTHING * (duration - self.avg_duration)
+
+    def request(
+        self, crawl: CrawlSpec, slots: int
+    ) -> tuple[bool, int | None, datetime | None]:
+        """request admission for crawl, returns if admitted, and if not,
+        position in queue and estimated start time"""
+        if not self.enabled:
+            return True, None, None
+
+        entry = self.running.get(crawl.id)
+        if entry:
+            entry.last_seen = time.monotonic()
+            return True, None, None
+
+        self._expire()
+
+        entry = self.waiting.get(crawl.id)
+        if entry:
+            entry.last_seen = time.monotonic()
+        else:
+            since = str_to_date(crawl.started) or dt_now()
+            entry = self._make_entry(crawl, slots, since)
+            self.waiting[crawl.id] = entry
+            self._queue = None
+
+        queue = self._get_ordered_queue()
+        index = queue.positions[crawl.id]
+
+        if index < queue.num_fit and time.monotonic() >= self.admit_after:
+            self.waiting.pop(crawl.id)
+            entry.since = dt_now()
+            self.running[crawl.id] = entry
+            self._queue = None
+            logger.debug(
+                "crawl_admitted",
+                crawl_id=crawl.id,
+                oid=str(crawl.oid),
+                slots=entry.slots,
+                free_slots=queue.free - entry.slots,
+            )
+            return True, None, None
+
+        needed = queue.slots_through[index] - queue.free
+        return False, index + 1, self._estimate_start(needed)
+
+    def get_queue(self) -> tuple[list[AdmissionEntry], int, int]:
+        """return waiting crawls in fair share order, the number of crawls
+        at the front of the queue that fit in free slots now, and free slots"""
+        queue = self._get_ordered_queue()
+        return queue.entries, queue.num_fit, queue.free
+
+    def _get_ordered_queue(self) -> AdmissionQueue:
+        if self._queue is None:
+            self._queue = self._order_waiting()
+
+        return self._queue
+
+    def _order_waiting(self) -> AdmissionQueue:
+        used: dict[UUID, int] = defaultdict(int)
+        for entry in self.running.values():
+            used[entry.oid] += entry.slots
+
+        free = max(self.capacity - sum(used.values()), 0)
+        remaining = free
+
+        queue = self._fair_share_order(used)
+        slots_through: list[int] = []
+        num_fit = 0
+
+        for entry in queue:
+            if num_fit == len(slots_through) and entry.slots <= remaining:
+                remaining -= entry.slots
+                num_fit += 1
+
+            slots_through.append(
+                (slots_through[-1] if slots_through else 0) + entry.slots
+            )
+
+        return AdmissionQueue(
+            entries=queue,
+            positions={entry.crawl_id: index for index, entry in enumerate(queue)},
+            slots_through=slots_through,
+            num_fit=num_fit,
+            free=free,
+        )
+
+    def _fair_share_order(self, used: dict[UUID, int]) -> list[AdmissionEntry]:
+        """order waiting crawls by fair share, given slots used per org"""
+
+        def fair_share(entry: AdmissionEntry):
+            share = (used[entry.oid] + entry.slots) / entry.weight
+            return (share, entry.since, entry.crawl_id)
+
+        # within an org and weight, order doesn't depend on slots the org
+        # already uses, so each group is sorted once (last entry is next)
+        groups: dict[tuple[UUID, int], list[AdmissionEntry]] = defaultdict(list)
+        for entry in self.waiting.values():
+            groups[(entry.oid, entry.weight)].append(entry)
+
+        # heap of group heads, keyed by fair share when pushed. taking an
+        # entry only raises the shares of its org, so heads pushed before
+        # that are re-keyed when they reach the top
+        taken: dict[UUID, int] = defaultdict(int)
+        heads = []
+        for group, entries in groups.items():
+            entries.sort(
+                key=lambda entry: (entry.slots, entry.since, entry.crawl_id),
+                reverse=True,
+            )
+            heads.append((fair_share(entries[-1]), 0, group))
+
+        heapq.heapify(heads)
+
+        queue: list[AdmissionEntry] = []
+        while heads:
+            _, num_taken, group = heapq.heappop(heads)
+            oid = group[0]
+            entries = groups[group]
+
+            if num_taken != taken[oid]:
+                heapq.heappush(heads, (fair_share(entries[-1]), taken[oid], group))
+                continue
+
+            entry = entries.pop()
+            used[oid] += entry.slots
+            taken[oid] += 1
+            queue.append(entry)
+
+            if entries:
+                heapq.heappush(heads, (fair_share(entries[-1]), taken[oid], group))
+
+        return queue
+
+    def _expected_end(self, entry: AdmissionEntry, now: datetime) -> datetime:
+        duration = self.avg_duration
+        if entry.timeout:
+            duration = min(duration, entry.timeout)
+
+        return max(entry.since + timedelta(seconds=duration), now)
+
+    def _estimate_start(self, needed: int) -> datetime:
+        """estimate when slots needed beyond free slots will be available,
+        assuming running crawls end in order of expected end time"""
+        now = dt_now()
+        if needed <= 0:
+            return now
+
+        ends = sorted(
+            (self._expected_end(entry, now), entry.slots)
+            for entry in self.running.values()
+        )
+        freed = 0
+        for end, slots in ends:
+            freed += slots
+            if freed >= needed:
+                return end
+
+        # remaining slots are only freed once crawls ahead in queue finish
+        last_end = ends[-1][0] if ends else now
+        rounds = math.ceil((needed - freed) / self.capacity)
+        return last_end + timedelta(seconds=self.avg_duration * rounds)
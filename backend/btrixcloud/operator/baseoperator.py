@@ -1,5 +1,6 @@
 """Base Operator class for all operators"""
 
+import hashlib
 import json
 import os
 from typing import TYPE_CHECKING, Any
@@ -45,6 +46,7 @@ class K8sOpAPI(K8sAPI):
     enable_auto_resize: bool
     max_crawler_memory_size: int
     max_redis_memory_size: int
+    crawler_browser_slots: int
 
     def __init__(self):
         super().__init__()
@@ -56,8 +58,10 @@ class K8sOpAPI(K8sAPI):
         self.enable_auto_resize = False
         self.max_crawler_memory_size = 0
         self.max_redis_memory_size = 0
+        self.crawler_browser_slots = 0
 
         self.compute_crawler_resources()
+        self.compute_crawler_browser_slots()
         self.compute_profile_resources()
 
     def compute_crawler_resources(self) -> None:
@@ -117,6 +121,36 @@ class K8sOpAPI(K8sAPI):
         p["qa_workers"] = qa_num_workers
         p["memory_limit"] = self.max_crawler_memory_size
 
+    def compute_crawler_browser_slots(self) -> None:
+        """compute total browser slots available to crawls across the cluster,
+        either set directly or from cpu / memory reserved for crawler pods.
+        if 0, crawl admission is not limited by cluster capacity"""
+        slots = int(os.environ.get("CRAWLER_BROWSER_SLOTS") or 0)
+
+        cluster_cpu = os.environ.get("CRAWLER_CLUSTER_CPU")
+        cluster_memory = os.environ.get("CRAWLER_CLUSTER_MEMORY")
+
+        if not slots and (cluster_cpu or cluster_memory):
+            p = self.shared_params
+            num_pods = []
+            if cluster_cpu and p["crawler_cpu"]:
+                num_pods.append(float(parse_quantity(cluster_cpu)) / p["crawler_cpu"])
+            if cluster_memory and p["crawler_memory"]:
+                num_pods.append(
+                    int(parse_quantity(cluster_memory)) / p["crawler_memory"]
+                )
+            if num_pods:
+                slots = max(int(min(num_pods)), 1) * p["crawler_workers"]
+
+        self.crawler_browser_slots = slots
+
+        if slots:
+            logger.debug(
+                "crawler_browser_slots_computed",
+                browser_slots=slots,
+                unstructured_message=f"crawler browser slots: {slots}",
+            )
+
     def compute_for_num_browsers(
         self, num_browsers, crawler_memory_fixed="", crawler_cpu_fixed=""
     ) -> tuple[int, float]:
@@ -211,6 +245,10 @@ class BaseOperator:
 
     fast_retry_secs: int
 
+    # parsed objects rendered from templates, by owner and object, with
+    # hash of the params used to render them
+    rendered: dict[str, dict[str, tuple[bytes, list[Any]]]]
+
     def __init__(
         self,
         k8s,
@@ -240,6 +278,8 @@ class BaseOperator:
 
         self.fast_retry_secs = int(os.environ.get("FAST_RETRY_SECS") or 0)
 
+        self.rendered = {}
+
     def init_routes(self, app) -> None:
         """init routes for this operator"""
 
@@ -291,10 +331,34 @@ class BaseOperator:
 
         return False
 
-    def load_from_yaml(self, filename, params) -> list[Any]:
-        """load and parse k8s template from yaml file"""
-        return list(
+    def load_from_yaml(self, filename, params, owner: str = "") -> list[Any]:
+        """load and parse k8s template from yaml file
+
+        if owner is set, the parsed objects are cached for the owner and
+        reused without rendering again while params are unchanged"""
+        if owner:
+            key = f"{filename}:{params.get('name', '')}"
+            params_hash = hashlib.sha1(
+                json.dumps(params, sort_keys=True, default=str).encode("utf-8"),
+                usedforsecurity=False,
+            ).digest()
+
+            prev = self.rendered.get(owner, {}).get(key)
+            if prev and prev[0] == params_hash:
+                return list(prev[1])
+
+        objs = list(
             yaml.safe_load_all(
                 self.k8s.templates.env.get_template(filename).render(params)
             )
         )
+
+        if owner:
+            self.rendered.setdefault(owner, {})[key] = (params_hash, objs)
+            return list(objs)
+
+        return objs
+
+    def clear_rendered(self, owner: str) -> None:
+        """remove cached rendered objects for owner"""
+        self.rendered.pop(owner, None)
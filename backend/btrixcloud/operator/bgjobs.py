@@ -4,6 +4,7 @@ from uuid import UUID
 
 import structlog
 
+from btrixcloud.metrics import BG_JOB_DURATION
 from btrixcloud.utils import (
     dt_now,
     str_to_date,
@@ -68,6 +69,11 @@ class BgJobOperator(BaseOperator):
         if not finished:
             finished = dt_now()
 
+        if started:
+            BG_JOB_DURATION.observe(
+                (finished - started).total_seconds(), job_type, str(success).lower()
+            )
+
         try:
             org_id = UUID(oid)
         # pylint: disable=broad-except
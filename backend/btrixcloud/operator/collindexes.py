@@ -12,6 +12,7 @@ from kubernetes.utils import parse_quantity
 from pydantic import BaseModel
 from redis.asyncio.client import Redis
 
+from btrixcloud.metrics import track_operator_sync
 from btrixcloud.models import (
     TYPE_DEDUPE_INDEX_STATES,
     DedupeIndexFile,
@@ -132,11 +133,13 @@ class CollIndexOperator(BaseOperator):
 
         @app.post("/op/collindexes/sync")
         async def mc_sync_index(data: MCSyncData):
-            return await self.sync_index(data)
+            with track_operator_sync("CollIndex"):
+                return await self.sync_index(data)
 
         @app.post("/op/collindexes/finalize")
         async def mc_finalize_index(data: MCSyncData):
-            return await self.sync_index(data)
+            with track_operator_sync("CollIndex"):
+                return await self.sync_index(data)
 
         @app.post("/op/collindexes/customize")
         async def mc_related(data: MCBaseRequest):
@@ -13,6 +13,7 @@ import humanize
 from fastapi import HTTPException
 from kubernetes.utils import parse_quantity
 
+from btrixcloud.metrics import track_operator_sync
 from btrixcloud.models import (
     FAILED_STATES,
     PAUSED_STATES,
@@ -39,6 +40,7 @@ from btrixcloud.utils import (
     str_to_date,
 )
 
+from .admission import CrawlAdmission
 from .baseoperator import BaseOperator, Redis
 from .models import (
     BTRIX_API,
@@ -53,6 +55,7 @@ from .models import (
     PodInfo,
     StopReason,
 )
+from .resync import CrawlResync
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -64,6 +67,9 @@ DEFAULT_TTL = 30
 
 REDIS_TTL = 60
 
+# max crawl log lines queued in redis added to db in one insert
+CRAWL_LOG_BATCH_SIZE = 1000
+
 # time in seconds before a crawl is deemed 'waiting' instead of 'starting'
 STARTING_TIME_SECS = 150
 
@@ -83,6 +89,9 @@ MEM_SOFT_OOM_THRESHOLD = 1.0
 # set memory limit to this much of request for extra padding
 MEM_LIMIT_PADDING = 1.2
 
+# min change in estimated start time of queued crawl to update crawl
+QUEUE_ESTIMATE_UPDATE_SECS = 60
+
 
 # ============================================================================
 # pylint: disable=too-few-public-methods
@@ -123,15 +132,25 @@ class CrawlOperator(BaseOperator):
 
     log_failed_crawl_lines: int
 
+    qa_page_batch_size: int
+
     min_avail_storage_ratio: float
 
     paused_expires_delta: timedelta
 
     rate_limit_duration_delta: timedelta | None = None
 
+    admission: CrawlAdmission
+
+    resync: CrawlResync
+
     def __init__(self, *args):
         super().__init__(*args)
 
+        self.admission = CrawlAdmission(self.k8s.crawler_browser_slots)
+
+        self.resync = CrawlResync()
+
         self.done_key = "crawls-done"
         self.pages_key = "pages"
         self.errors_key = "e"
@@ -139,6 +158,11 @@ class CrawlOperator(BaseOperator):
 
         self.log_failed_crawl_lines = int(os.environ.get("LOG_FAILED_CRAWL_LINES") or 0)
 
+        # pages from QA runs are written to db in batches of up to this size
+        self.qa_page_batch_size = max(
+            int(os.environ.get("QA_PAGE_BATCH_SIZE") or 500), 1
+        )
+
         # ensure available storage is at least this much times used storage
         self.min_avail_storage_ratio = float(
             os.environ.get("CRAWLER_MIN_AVAIL_STORAGE_RATIO") or 0
@@ -165,19 +189,46 @@ class CrawlOperator(BaseOperator):
 
         @app.post("/op/crawls/sync")
         async def mc_sync_crawls(data: MCSyncData):
-            return await self.sync_crawls(data)
+            with track_operator_sync("CrawlJob"):
+                return await self.sync_crawls(data)
 
         # reuse sync path, but distinct endpoint for better logging
         @app.post("/op/crawls/finalize")
         async def mc_sync_finalize(data: MCSyncData):
-            return await self.sync_crawls(data)
+            with track_operator_sync("CrawlJob"):
+                return await self.sync_crawls(data)
 
         @app.post("/op/crawls/customize")
         async def mc_related(data: MCBaseRequest):
             return self.get_related(data)
 
     async def sync_crawls(self, data: MCSyncData):
-        """sync crawls"""
+        """sync crawls, resyncing sooner if crawl is active"""
+        response = await self.sync_crawl_job(data)
+
+        crawl_id = data.parent.get("spec", {}).get("id")
+        status = response.get("status") or {}
+
+        if (
+            data.finalizing
+            or response.get("finalized")
+            or status.get("finished")
+            or status.get("state") == "canceled"
+        ):
+            self.resync.remove(crawl_id)
+        else:
+            response["resyncAfterSeconds"] = self.resync.get_resync_after(
+                crawl_id,
+                data.parent.get("spec", {}),
+                status,
+                data.children[POD],
+                response.get("resyncAfterSeconds"),
+            )
+
+        return response
+
+    async def sync_crawl_job(self, data: MCSyncData):
+        """sync crawl job state and children"""
 
         status = CrawlStatus(**data.parent.get("status", {}))
         status.last_state = status.state
@@ -198,7 +249,7 @@ class CrawlOperator(BaseOperator):
 
         pods = data.children[POD]
         try:
-            org = await self.org_ops.get_org_by_id(UUID(oid))
+            org = await self.org_ops.get_org_snapshot(UUID(oid))
         except HTTPException as e:
             # org likely deleted, should delete this crawljob
             if e.detail == "invalid_org_id":
@@ -284,6 +335,10 @@ class CrawlOperator(BaseOperator):
             # only check on very first run, before any pods/pvcs created
             # for now, allow if crawl has already started (pods/pvcs created)
             if not pods and not data.children[PVC]:
+                # check quotas against current org, not a snapshot
+                org = await self.org_ops.get_org_snapshot(crawl.oid, fresh=True)
+                crawl.org = org
+
                 if self.org_ops.storage_quota_reached(org):
                     await self.mark_finished(
                         crawl, status, "skipped_storage_quota_reached"
@@ -350,6 +405,28 @@ class CrawlOperator(BaseOperator):
         if status.pagesFound < status.desiredScale:
             status.desiredScale = max(1, status.pagesFound)
 
+        # new crawls wait until cluster has browser slots available for them
+        if (
+            status.state in ("starting", "waiting_capacity")
+            and not pods
+            and not data.children[PVC]
+        ):
+            if not await self.admit_crawl(crawl, status, num_browser_windows):
+                return self._empty_response(status)
+
+        # redis pod may still be running while paused
+        elif crawl.paused_at and not self._has_crawler_pods(pods):
+            self.admission.release(crawl.id)
+
+        # resumed crawls restart their crawler pods, so must be admitted
+        # again, crawler pods stay paused until then
+        elif status.state in PAUSED_STATES and not self._has_crawler_pods(pods):
+            if not await self.admit_crawl(crawl, status, num_browser_windows):
+                is_paused = True
+
+        else:
+            self.admission.set_running(crawl, num_browser_windows)
+
         if status.scale:
             for pod_name, pod in pods.items():
                 # don't count redis pod
@@ -530,7 +607,7 @@ class CrawlOperator(BaseOperator):
 
         params["init_redis"] = status.initRedis and not restart_reason
 
-        return self.load_from_yaml("redis.yaml", params)
+        return self.load_from_yaml("redis.yaml", params, owner=crawl.id)
 
     def _filter_autoclick_behavior(
         self, behaviors: str | None, crawler_image: str
@@ -603,7 +680,7 @@ class CrawlOperator(BaseOperator):
                 unstructured_message=f"Updating config for {crawl.id}",
             )
 
-        return self.load_from_yaml("crawl_configmap.yaml", params)
+        return self.load_from_yaml("crawl_configmap.yaml", params, owner=crawl.id)
 
     async def _load_qa_configmap(self, params, children):
         qa_source_crawl_id = params["qa_source_crawl_id"]
@@ -728,7 +805,7 @@ class CrawlOperator(BaseOperator):
                 )
                 params["init_crawler"] = False
 
-        return self.load_from_yaml("crawler.yaml", params)
+        return self.load_from_yaml("crawler.yaml", params, owner=params["id"])
 
     async def resolve_scale_down(
         self,
@@ -966,6 +1043,48 @@ class CrawlOperator(BaseOperator):
 
         return False
 
+    async def admit_crawl(
+        self, crawl: CrawlSpec, status: CrawlStatus, num_browser_windows: int
+    ) -> bool:
+        """return true if crawl is admitted to cluster browser slots, otherwise
+        set crawl to 'waiting_capacity' with its position in admission queue"""
+        admitted, position, est_start = self.admission.request(
+            crawl, num_browser_windows
+        )
+
+        if admitted:
+            if status.state != "starting":
+                await self.set_state(
+                    "starting", status, crawl, allowed_from=["waiting_capacity"]
+                )
+        else:
+            await self.set_state(
+                "waiting_capacity", status, crawl, allowed_from=["starting"]
+            )
+
+        # avoid updating db on every sync if estimate only moves a little
+        prev_start = str_to_date(status.estimatedStartTime or "")
+        if position == status.queuePosition and (
+            est_start == prev_start
+            or (
+                est_start
+                and prev_start
+                and abs((est_start - prev_start).total_seconds())
+                < QUEUE_ESTIMATE_UPDATE_SECS
+            )
+        ):
+            return admitted
+
+        status.queuePosition = position
+        status.estimatedStartTime = date_to_str(est_start) if est_start else None
+
+        if not crawl.is_qa:
+            await self.crawl_ops.set_queue_position(
+                crawl.id, crawl.oid, position, est_start
+            )
+
+        return admitted
+
     async def is_waiting_for_dedupe_index(
         self, crawl: CrawlSpec, data: MCSyncData
     ) -> bool:
@@ -1075,6 +1194,9 @@ class CrawlOperator(BaseOperator):
 
         return True
 
+    def _has_crawler_pods(self, pods: dict) -> bool:
+        return any(not name.startswith("redis-") for name in pods)
+
     def _empty_response(self, status):
         """done response for removing crawl"""
         return {
@@ -1092,6 +1214,8 @@ class CrawlOperator(BaseOperator):
     ):
         """ensure crawl id ready for deletion"""
 
+        self.admission.release(crawl.id)
+
         redis_pod = f"redis-{crawl.id}"
         new_children = []
 
@@ -1110,6 +1234,8 @@ class CrawlOperator(BaseOperator):
             new_children.extend(list(children[PVC].values()))
 
         if not children[POD] and not children[PVC]:
+            self.clear_rendered(crawl.id)
+
             # keep parent until ttl expired, if any
             if status.finished:
                 ttl = spec.get("ttlSecondsAfterFinished", DEFAULT_TTL)
@@ -1221,32 +1347,32 @@ class CrawlOperator(BaseOperator):
             page_crawled = await redis.rpop(f"{crawl.id}:{self.pages_key}")
             qa_run_id = crawl.id if crawl.is_qa else None
 
+            qa_pages: list[dict[str, Any]] = []
+
             while page_crawled:
                 page_dict = json.loads(page_crawled)
-                await self.page_ops.add_page_to_db(
-                    page_dict, crawl.db_crawl_id, qa_run_id, crawl.oid
-                )
+                if qa_run_id:
+                    qa_pages.append(page_dict)
+                    if len(qa_pages) >= self.qa_page_batch_size:
+                        await self.page_ops.add_qa_pages_to_db(
+                            qa_pages, crawl.db_crawl_id, qa_run_id, crawl.oid
+                        )
+                        qa_pages = []
+                else:
+                    await self.page_ops.add_page_to_db(
+                        page_dict, crawl.db_crawl_id, qa_run_id, crawl.oid
+                    )
                 page_crawled = await redis.rpop(f"{crawl.id}:{self.pages_key}")
 
-            crawl_error = await redis.rpop(f"{crawl.id}:{self.errors_key}")
-            while crawl_error:
-                await self.crawl_log_ops.add_log_line(
-                    crawl.db_crawl_id,
-                    crawl.oid,
-                    log_line=crawl_error,
-                    qa_run_id=qa_run_id,
+            if qa_run_id and qa_pages:
+                await self.page_ops.add_qa_pages_to_db(
+                    qa_pages, crawl.db_crawl_id, qa_run_id, crawl.oid
                 )
-                crawl_error = await redis.rpop(f"{crawl.id}:{self.errors_key}")
 
-            behavior_log = await redis.rpop(f"{crawl.id}:{self.behavior_logs_key}")
-            while behavior_log:
-                await self.crawl_log_ops.add_log_line(
-                    crawl.db_crawl_id,
-                    crawl.oid,
-                    log_line=behavior_log,
-                    qa_run_id=qa_run_id,
+            for logs_key in (self.errors_key, self.behavior_logs_key):
+                await self.add_crawl_log_lines(
+                    redis, f"{crawl.id}:{logs_key}", crawl, qa_run_id
                 )
-                behavior_log = await redis.rpop(f"{crawl.id}:{self.behavior_logs_key}")
 
             # ensure filesAdded and filesAddedSize always set
             status.filesAdded = int(await redis.get("filesAdded") or 0)
@@ -1720,6 +1846,45 @@ class CrawlOperator(BaseOperator):
         }
         return json.dumps(err)
 
+    async def add_crawl_log_lines(
+        self, redis, key: str, crawl: CrawlSpec, qa_run_id: str | None
+    ) -> None:
+        """add log lines queued by crawler to db in batches. Lines are only
+        removed from redis once added, if adding fails they stay queued for
+        the next sync. The count of lines added so far is kept with the queue,
+        so a batch added again gets the same line positions"""
+        added_key = f"{key}:added"
+        while True:
+            # crawler pushes to head of list, oldest lines are at the tail
+            log_lines = await redis.lrange(key, -CRAWL_LOG_BATCH_SIZE, -1)
+            if not log_lines:
+                return
+
+            log_lines.reverse()
+            offset = int(await redis.get(added_key) or 0)
+
+            try:
+                await self.crawl_log_ops.add_log_lines(
+                    crawl.db_crawl_id, crawl.oid, log_lines, qa_run_id, offset
+                )
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.exception(
+                    "crawl_log_lines_add_failed",
+                    crawl_id=crawl.id,
+                    count=len(log_lines),
+                    unstructured_message="Error adding crawl log lines, will retry",
+                )
+                return
+
+            pipe = redis.pipeline(transaction=True)
+            pipe.ltrim(key, 0, -len(log_lines) - 1)
+            pipe.incrby(added_key, len(log_lines))
+            await pipe.execute()
+
+            if len(log_lines) < CRAWL_LOG_BATCH_SIZE:
+                return
+
     async def add_file_to_crawl(self, cc_data, crawl: CrawlSpec, redis) -> int:
         """Handle finished CrawlFile to db"""
 
@@ -2162,6 +2327,8 @@ class CrawlOperator(BaseOperator):
 
         status.finished = date_to_str(finished)
 
+        self.admission.release(crawl.id)
+
         if state in SUCCESSFUL_STATES:
             await self.inc_crawl_complete_stats(crawl, finished)
 
@@ -2233,6 +2400,8 @@ class CrawlOperator(BaseOperator):
             crawl.id, crawl.oid, state
         )
 
+        await self.crawl_log_ops.move_logs_to_segment(crawl.id, crawl.oid)
+
         # finally, delete job
         await self.k8s.delete_crawl_job(crawl.id)
 
@@ -2247,6 +2416,10 @@ class CrawlOperator(BaseOperator):
         if state in FAILED_STATES:
             await self.page_ops.delete_qa_run_from_pages(crawl.db_crawl_id, crawl.id)
 
+        await self.crawl_log_ops.move_logs_to_segment(
+            crawl.db_crawl_id, crawl.oid, crawl.id
+        )
+
         # finally, delete job
         await self.k8s.delete_crawl_job(crawl.id)
 
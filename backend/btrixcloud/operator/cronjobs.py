@@ -5,6 +5,7 @@ from uuid import UUID
 import structlog
 import yaml
 
+from btrixcloud.metrics import track_operator_sync
 from btrixcloud.utils import date_to_str, dt_now, run_async_task
 
 from ..models import CrawlConfig
@@ -27,7 +28,8 @@ class CronJobOperator(BaseOperator):
         async def mc_sync_cronjob_crawls(
             data: MCDecoratorSyncData,
         ) -> MCDecoratorSyncResponse:
-            return await self.sync_cronjob_crawl(data)
+            with track_operator_sync("CronJob"):
+                return await self.sync_cronjob_crawl(data)
 
     def get_finished_response(
         self, metadata: dict[str, str], set_status=True, finished: str | None = None
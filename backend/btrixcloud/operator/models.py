@@ -114,6 +114,36 @@ class CrawlSpec(BaseModel):
         return bool(self.qa_source_crawl_id)
 
 
+# ============================================================================
+class AdmissionEntry(BaseModel):
+    """crawl waiting for or holding browser slots in crawl admission"""
+
+    crawl_id: str
+    oid: UUID
+    slots: int
+    # higher weight gets a larger share of browser slots
+    weight: int
+    # when crawl was queued, or when admitted if running
+    since: datetime
+    timeout: int = 0
+    # monotonic time crawl was last synced
+    last_seen: float = 0
+
+
+# ============================================================================
+class AdmissionQueue(BaseModel):
+    """waiting crawls in fair share order, kept until admission state changes"""
+
+    entries: list[AdmissionEntry]
+    # crawl id -> index in entries
+    positions: dict[str, int]
+    # total slots of entries up to and including each index
+    slots_through: list[int]
+    # number of entries at the front of the queue that fit in free slots now
+    num_fit: int
+    free: int
+
+
 # ============================================================================
 class PodResourcePercentage(BaseModel):
     """Resource usage percentage ratios"""
@@ -285,6 +315,11 @@ class CrawlStatus(BaseModel):
     # if status is 'rate-limited', when first became rate-limited
     rateLimitedAtTime: str | None = None
 
+    # if waiting for cluster capacity, position in admission queue (1 is next)
+    # and estimated time crawl will be admitted
+    queuePosition: int | None = None
+    estimatedStartTime: str | None = None
+
     # don't include in status, use by metacontroller
     resync_after: int | None = Field(default=None, exclude=True)
 
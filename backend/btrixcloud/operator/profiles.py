@@ -1,5 +1,6 @@
 """Operator handler for ProfileJobs"""
 
+from btrixcloud.metrics import track_operator_sync
 from btrixcloud.models import StorageRef
 from btrixcloud.utils import dt_now, run_async_task, str_to_date
 
@@ -16,7 +17,8 @@ class ProfileOperator(BaseOperator):
 
         @app.post("/op/profilebrowsers/sync")
         async def mc_sync_profile_browsers(data: MCSyncData):
-            return await self.sync_profile_browsers(data)
+            with track_operator_sync("ProfileJob"):
+                return await self.sync_profile_browsers(data)
 
     async def sync_profile_browsers(self, data: MCSyncData):
         """sync profile browsers"""
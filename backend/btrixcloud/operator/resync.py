@@ -0,0 +1,160 @@
+"""Adaptive resync intervals for crawl jobs, based on crawl activity"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+import structlog
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# resync interval for crawls that changed since last sync
+MIN_RESYNC_SECS = int(os.environ.get("OPERATOR_RESYNC_SECS") or 10)
+
+# longest interval unchanged crawls back off to
+MAX_RESYNC_SECS = int(os.environ.get("OPERATOR_MAX_RESYNC_SECS") or 60)
+
+# budget of periodic crawl syncs per second across all crawls, 0 for no limit
+MAX_SYNCS_PER_SEC = float(os.environ.get("OPERATOR_MAX_SYNCS_PER_SEC") or 0)
+
+# crawls not synced for this many max intervals are assumed to no longer exist
+ENTRY_EXPIRE_INTERVALS = 10
+
+# status fields that change on every sync without any crawl activity
+IGNORED_STATUS_FIELDS = (
+    "lastActiveTime",
+    "lastUpdatedTime",
+    "crawlExecTime",
+    "elapsedCrawlTime",
+    "estimatedStartTime",
+    "sizeHuman",
+    "podStatus",
+)
+
+# pod status fields that reflect pod changes, not resource usage
+POD_STATUS_FIELDS = (
+    "exitTime",
+    "exitCode",
+    "reason",
+    "newCpu",
+    "newMemory",
+    "newStorage",
+    "signalAtMem",
+    "evicted",
+    "backoffWait",
+)
+
+
+# ============================================================================
+def get_sync_fingerprint(
+    spec: dict[str, Any], status: dict[str, Any], pods: dict[str, Any]
+) -> str:
+    """Hash of crawl job spec, crawl status and pod states, unchanged if
+    nothing happened between syncs"""
+    status_values = {
+        key: value for key, value in status.items() if key not in IGNORED_STATUS_FIELDS
+    }
+
+    pod_values = {}
+    for name, pod_status in (status.get("podStatus") or {}).items():
+        pod_values[name] = {key: pod_status.get(key) for key in POD_STATUS_FIELDS}
+
+    for name, pod in pods.items():
+        pod_state = pod.get("status") or {}
+        pod_values.setdefault(name, {})["phase"] = pod_state.get("phase")
+        pod_values[name]["containers"] = [
+            (
+                container.get("restartCount"),
+                container.get("ready"),
+                list((container.get("state") or {}).keys()),
+            )
+            for container in pod_state.get("containerStatuses") or []
+        ]
+
+    data = json.dumps([spec, status_values, pod_values], sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+# ============================================================================
+class CrawlResync:
+    """Resync interval per crawl job.
+
+    Crawls that changed since their last sync, from new pages, files, state,
+    pod changes or a user action updating the crawl job spec, are resynced
+    after the minimum interval, or sooner if the sync asked for a fast retry.
+    Interval doubles for each sync without changes, up to the maximum.
+
+    If the expected rate of periodic syncs across all crawls is above the
+    budget, all intervals are stretched to fit it. Syncs triggered by
+    changes to the crawl job or its pods are not delayed.
+    """
+
+    entries: dict[str, tuple[str, float, float]]
+
+    def __init__(
+        self,
+        min_secs: int = MIN_RESYNC_SECS,
+        max_secs: int = MAX_RESYNC_SECS,
+        max_syncs_per_sec: float = MAX_SYNCS_PER_SEC,
+    ):
+        self.min_secs = min_secs
+        self.max_secs = max(max_secs, min_secs)
+        self.max_syncs_per_sec = max_syncs_per_sec
+
+        # crawl id -> (fingerprint, interval, last synced)
+        self.entries = {}
+        self.sync_rate = 0.0
+
+    def get_resync_after(
+        self,
+        crawl_id: str,
+        spec: dict[str, Any],
+        status: dict[str, Any],
+        pods: dict[str, Any],
+        fast_retry: int | None = None,
+    ) -> int:
+        """return seconds until next periodic sync of crawl"""
+        now = time.monotonic()
+        fingerprint = get_sync_fingerprint(spec, status, pods)
+
+        # re-inserted on each sync, so entries stay ordered by last sync
+        prev = self.entries.pop(crawl_id, None)
+        if prev and prev[0] == fingerprint and not fast_retry:
+            interval = min(prev[1] * 2, self.max_secs)
+        else:
+            interval = self.min_secs
+
+        if prev:
+            self.sync_rate -= 1 / prev[1]
+        self.sync_rate += 1 / interval
+
+        self.entries[crawl_id] = (fingerprint, interval, now)
+
+        self._expire_entries(now)
+
+        resync_after = interval
+        if 0 < self.max_syncs_per_sec < self.sync_rate:
+            resync_after = interval * self.sync_rate / self.max_syncs_per_sec
+
+        if fast_retry:
+            resync_after = min(resync_after, fast_retry)
+
+        return round(resync_after)
+
+    def remove(self, crawl_id: str) -> None:
+        """stop tracking crawl, when finished or deleted"""
+        prev = self.entries.pop(crawl_id, None)
+        if prev:
+            self.sync_rate -= 1 / prev[1]
+
+    def _expire_entries(self, now: float) -> None:
+        expire_secs = self.max_secs * ENTRY_EXPIRE_INTERVALS
+        oldest = next(iter(self.entries.values()))
+        if now - oldest[2] < expire_secs:
+            return
+
+        for crawl_id, entry in list(self.entries.items()):
+            if now - entry[2] >= expire_secs:
+                self.remove(crawl_id)
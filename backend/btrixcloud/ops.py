@@ -1,154 +1,347 @@
 """shared helper to initialize ops classes"""
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
-
-from .background_jobs import BackgroundJobOps
-from .basecrawls import BaseCrawlOps
-from .colls import CollectionOps
-from .crawl_logs import CrawlLogOps
-from .crawlconfigs import CrawlConfigOps
-from .crawlmanager import CrawlManager
-from .crawls import CrawlOps
-from .db import init_db
-from .emailsender import EmailSender
-from .file_uploads import FileUploadOps
-from .invites import InviteOps
-from .orgs import OrgOps
-from .pages import PageOps
-from .profiles import ProfileOps
-from .storages import StorageOps
-from .uploads import UploadOps
-from .users import UserManager
-from .webhooks import EventWebhookOps
-
-
-# pylint: disable=too-many-locals
-def init_ops() -> tuple[
-    OrgOps,
-    CrawlConfigOps,
-    BaseCrawlOps,
-    CrawlOps,
-    UploadOps,
-    PageOps,
-    CollectionOps,
-    ProfileOps,
-    StorageOps,
-    BackgroundJobOps,
-    EventWebhookOps,
-    UserManager,
-    InviteOps,
-    FileUploadOps,
-    CrawlLogOps,
-    CrawlManager,
-    AsyncIOMotorClient,
-    AsyncIOMotorDatabase,
-]:
-    """Initialize and return ops classes"""
-    email = EmailSender()
-
-    dbclient, mdb = init_db()
-
-    crawl_manager = CrawlManager()
-
-    invite_ops = InviteOps(mdb, email)
-
-    user_manager = UserManager(mdb, email, invite_ops)
-
-    org_ops = OrgOps(dbclient, mdb, invite_ops, user_manager, crawl_manager)
-
-    event_webhook_ops = EventWebhookOps(mdb, org_ops)
-
-    crawl_log_ops = CrawlLogOps(mdb, org_ops)
-
-    storage_ops = StorageOps(org_ops, crawl_manager, mdb)
-
-    file_ops = FileUploadOps(mdb, org_ops, storage_ops)
-
-    background_job_ops = BackgroundJobOps(
-        mdb, email, user_manager, org_ops, crawl_manager, storage_ops
-    )
-
-    profile_ops = ProfileOps(
-        mdb, org_ops, crawl_manager, storage_ops, background_job_ops
-    )
-
-    # pylint: disable=duplicate-code
-    crawl_config_ops = CrawlConfigOps(
-        dbclient,
-        mdb,
-        user_manager,
-        org_ops,
-        crawl_manager,
-        profile_ops,
-        file_ops,
-        storage_ops,
-    )
-
-    coll_ops = CollectionOps(
-        mdb, org_ops, storage_ops, crawl_manager, event_webhook_ops, background_job_ops
-    )
-
-    base_crawl_init = (
-        mdb,
-        user_manager,
-        org_ops,
-        crawl_config_ops,
-        coll_ops,
-        storage_ops,
-        event_webhook_ops,
-        background_job_ops,
-        crawl_log_ops,
-    )
-
-    base_crawl_ops = BaseCrawlOps(*base_crawl_init)
-
-    crawl_ops = CrawlOps(crawl_manager, *base_crawl_init)
-
-    upload_ops = UploadOps(*base_crawl_init)
-
-    page_ops = PageOps(
-        mdb, crawl_ops, org_ops, storage_ops, background_job_ops, coll_ops
-    )
-
-    base_crawl_ops.set_page_ops(page_ops)
-    crawl_ops.set_page_ops(page_ops)
-    upload_ops.set_page_ops(page_ops)
-
-    org_ops.set_ops(
-        base_crawl_ops,
-        profile_ops,
-        coll_ops,
-        background_job_ops,
-        page_ops,
-        file_ops,
-        crawl_config_ops,
-    )
-
-    user_manager.set_ops(org_ops, crawl_config_ops, base_crawl_ops)
-
-    background_job_ops.set_ops(base_crawl_ops, profile_ops)
-
-    crawl_config_ops.set_coll_ops(coll_ops)
-
-    coll_ops.set_page_ops(page_ops)
-
-    return (
-        org_ops,
-        crawl_config_ops,
-        base_crawl_ops,
-        crawl_ops,
-        upload_ops,
-        page_ops,
-        coll_ops,
-        profile_ops,
-        storage_ops,
-        background_job_ops,
-        event_webhook_ops,
-        user_manager,
-        invite_ops,
-        file_ops,
-        crawl_log_ops,
-        crawl_manager,
-        dbclient,
-        mdb,
-    )
+from functools import cached_property
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+
+    from .background_jobs import BackgroundJobOps
+    from .basecrawls import BaseCrawlOps
+    from .colls import CollectionOps
+    from .crawl_logs import CrawlLogOps
+    from .crawlconfigs import CrawlConfigOps
+    from .crawlmanager import CrawlManager
+    from .crawls import CrawlOps
+    from .emailsender import EmailSender
+    from .file_uploads import FileUploadOps
+    from .invites import InviteOps
+    from .orgs import OrgOps
+    from .pages import PageOps
+    from .profiles import ProfileOps
+    from .storages import StorageOps
+    from .uploads import UploadOps
+    from .users import UserManager
+    from .webhooks import EventWebhookOps
+
+    OpsTuple = tuple[
+        OrgOps,
+        CrawlConfigOps,
+        BaseCrawlOps,
+        CrawlOps,
+        UploadOps,
+        PageOps,
+        CollectionOps,
+        ProfileOps,
+        StorageOps,
+        BackgroundJobOps,
+        EventWebhookOps,
+        UserManager,
+        InviteOps,
+        FileUploadOps,
+        CrawlLogOps,
+        CrawlManager,
+        AsyncIOMotorClient,
+        AsyncIOMotorDatabase,
+    ]
+else:
+    OpsTuple = tuple
+
+
+# ============================================================================
+class LazyOpsRef:
+    """Stand-in for an ops class that has not been created yet, passed to the
+    ops classes depending on it. The ops class is created on first attribute
+    access, and all further attribute access is forwarded to it."""
+
+    def __init__(self, ops: "Ops", name: str):
+        self._lazy_ops = ops
+        self._lazy_name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+
+        return getattr(getattr(self._lazy_ops, self._lazy_name), attr)
+
+    def __repr__(self) -> str:
+        return f"<LazyOpsRef {self._lazy_name}>"
+
+
+# ============================================================================
+# pylint: disable=import-outside-toplevel, too-many-public-methods
+class Ops:
+    """Container for ops classes, each created (and its module imported) only
+    when first used. Dependencies of an ops class are passed in as LazyOpsRef
+    if not yet created, so eg. a background job updating collection stats does
+    not load the k8s client, S3 client or email templates unless it needs them.
+    """
+
+    def __init__(self, db_role: str = "api"):
+        # process role, sets db connection pool size
+        self.db_role = db_role
+
+    def _ref(self, name: str) -> Any:
+        """return ops class if already created, otherwise lazy stand-in"""
+        if name in self.__dict__:
+            return self.__dict__[name]
+
+        return LazyOpsRef(self, name)
+
+    def is_created(self, name: str) -> bool:
+        """return true if ops class has been created"""
+        return name in self.__dict__
+
+    @cached_property
+    def _db(self) -> "tuple[AsyncIOMotorClient, AsyncIOMotorDatabase]":
+        from .db import init_db
+
+        return init_db(self.db_role)
+
+    @cached_property
+    def dbclient(self) -> "AsyncIOMotorClient":
+        """mongo client"""
+        return self._db[0]
+
+    @cached_property
+    def mdb(self) -> "AsyncIOMotorDatabase":
+        """mongo database"""
+        return self._db[1]
+
+    @cached_property
+    def email(self) -> "EmailSender":
+        """email sender"""
+        from .emailsender import EmailSender
+
+        email = EmailSender()
+        email.set_mdb(self.mdb)
+        return email
+
+    @cached_property
+    def crawl_manager(self) -> "CrawlManager":
+        """k8s crawl manager"""
+        from .crawlmanager import CrawlManager
+
+        return CrawlManager()
+
+    @cached_property
+    def invite_ops(self) -> "InviteOps":
+        """invite ops"""
+        from .invites import InviteOps
+
+        return InviteOps(self.mdb, self._ref("email"))
+
+    @cached_property
+    def user_manager(self) -> "UserManager":
+        """user manager"""
+        from .users import UserManager
+
+        user_manager = UserManager(
+            self.mdb, self._ref("email"), self._ref("invite_ops")
+        )
+        user_manager.set_ops(
+            self._ref("org_ops"),
+            self._ref("crawl_config_ops"),
+            self._ref("base_crawl_ops"),
+        )
+        return user_manager
+
+    @cached_property
+    def org_ops(self) -> "OrgOps":
+        """org ops"""
+        from .orgs import OrgOps
+
+        org_ops = OrgOps(
+            self.dbclient,
+            self.mdb,
+            self._ref("invite_ops"),
+            self._ref("user_manager"),
+            self._ref("crawl_manager"),
+        )
+        org_ops.set_ops(
+            self._ref("base_crawl_ops"),
+            self._ref("profile_ops"),
+            self._ref("coll_ops"),
+            self._ref("background_job_ops"),
+            self._ref("page_ops"),
+            self._ref("file_ops"),
+            self._ref("crawl_config_ops"),
+        )
+        return org_ops
+
+    @cached_property
+    def event_webhook_ops(self) -> "EventWebhookOps":
+        """event webhook ops"""
+        from .webhooks import EventWebhookOps
+
+        return EventWebhookOps(self.mdb, self._ref("org_ops"))
+
+    @cached_property
+    def crawl_log_ops(self) -> "CrawlLogOps":
+        """crawl log ops"""
+        from .crawl_logs import CrawlLogOps
+
+        return CrawlLogOps(self.mdb, self._ref("org_ops"), self._ref("storage_ops"))
+
+    @cached_property
+    def storage_ops(self) -> "StorageOps":
+        """storage ops"""
+        from .storages import StorageOps
+
+        return StorageOps(self._ref("org_ops"), self._ref("crawl_manager"), self.mdb)
+
+    @cached_property
+    def file_ops(self) -> "FileUploadOps":
+        """seed file upload ops"""
+        from .file_uploads import FileUploadOps
+
+        return FileUploadOps(self.mdb, self._ref("org_ops"), self._ref("storage_ops"))
+
+    @cached_property
+    def background_job_ops(self) -> "BackgroundJobOps":
+        """background job ops"""
+        from .background_jobs import BackgroundJobOps
+
+        background_job_ops = BackgroundJobOps(
+            self.mdb,
+            self._ref("email"),
+            self._ref("user_manager"),
+            self._ref("org_ops"),
+            self._ref("crawl_manager"),
+            self._ref("storage_ops"),
+        )
+        background_job_ops.set_ops(
+            self._ref("base_crawl_ops"), self._ref("profile_ops")
+        )
+        background_job_ops.set_coll_ops(self._ref("coll_ops"))
+        return background_job_ops
+
+    @cached_property
+    def profile_ops(self) -> "ProfileOps":
+        """browser profile ops"""
+        from .profiles import ProfileOps
+
+        return ProfileOps(
+            self.mdb,
+            self._ref("org_ops"),
+            self._ref("crawl_manager"),
+            self._ref("storage_ops"),
+            self._ref("background_job_ops"),
+        )
+
+    @cached_property
+    def crawl_config_ops(self) -> "CrawlConfigOps":
+        """crawl config ops"""
+        from .crawlconfigs import CrawlConfigOps
+
+        crawl_config_ops = CrawlConfigOps(
+            self.dbclient,
+            self.mdb,
+            self._ref("user_manager"),
+            self._ref("org_ops"),
+            self._ref("crawl_manager"),
+            self._ref("profile_ops"),
+            self._ref("file_ops"),
+            self._ref("storage_ops"),
+        )
+        crawl_config_ops.set_coll_ops(self._ref("coll_ops"))
+        return crawl_config_ops
+
+    @cached_property
+    def coll_ops(self) -> "CollectionOps":
+        """collection ops"""
+        from .colls import CollectionOps
+
+        coll_ops = CollectionOps(
+            self.mdb,
+            self._ref("org_ops"),
+            self._ref("storage_ops"),
+            self._ref("crawl_manager"),
+            self._ref("event_webhook_ops"),
+            self._ref("background_job_ops"),
+        )
+        coll_ops.set_page_ops(self._ref("page_ops"))
+        return coll_ops
+
+    def _base_crawl_init(self) -> tuple:
+        return (
+            self.mdb,
+            self._ref("user_manager"),
+            self._ref("org_ops"),
+            self._ref("crawl_config_ops"),
+            self._ref("coll_ops"),
+            self._ref("storage_ops"),
+            self._ref("event_webhook_ops"),
+            self._ref("background_job_ops"),
+            self._ref("crawl_log_ops"),
+        )
+
+    @cached_property
+    def base_crawl_ops(self) -> "BaseCrawlOps":
+        """ops for all archived item types"""
+        from .basecrawls import BaseCrawlOps
+
+        base_crawl_ops = BaseCrawlOps(*self._base_crawl_init())
+        base_crawl_ops.set_page_ops(self._ref("page_ops"))
+        return base_crawl_ops
+
+    @cached_property
+    def crawl_ops(self) -> "CrawlOps":
+        """crawl ops"""
+        from .crawls import CrawlOps
+
+        crawl_ops = CrawlOps(self._ref("crawl_manager"), *self._base_crawl_init())
+        crawl_ops.set_page_ops(self._ref("page_ops"))
+        return crawl_ops
+
+    @cached_property
+    def upload_ops(self) -> "UploadOps":
+        """upload ops"""
+        from .uploads import UploadOps
+
+        upload_ops = UploadOps(*self._base_crawl_init())
+        upload_ops.set_page_ops(self._ref("page_ops"))
+        return upload_ops
+
+    @cached_property
+    def page_ops(self) -> "PageOps":
+        """page ops"""
+        from .pages import PageOps
+
+        return PageOps(
+            self.mdb,
+            self._ref("crawl_ops"),
+            self._ref("org_ops"),
+            self._ref("storage_ops"),
+            self._ref("background_job_ops"),
+            self._ref("coll_ops"),
+        )
+
+    def as_tuple(self) -> OpsTuple:
+        """create all ops classes and return them as tuple"""
+        return (
+            self.org_ops,
+            self.crawl_config_ops,
+            self.base_crawl_ops,
+            self.crawl_ops,
+            self.upload_ops,
+            self.page_ops,
+            self.coll_ops,
+            self.profile_ops,
+            self.storage_ops,
+            self.background_job_ops,
+            self.event_webhook_ops,
+            self.user_manager,
+            self.invite_ops,
+            self.file_ops,
+            self.crawl_log_ops,
+            self.crawl_manager,
+            self.dbclient,
+            self.mdb,
+        )
+
+
+# ============================================================================
+def init_ops(db_role: str = "api") -> OpsTuple:
+    """Initialize and return all ops classes"""
+    return Ops(db_role).as_tuple()
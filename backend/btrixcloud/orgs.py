@@ -4,6 +4,7 @@ Organization API handling
 
 # pylint: disable=too-many-lines
 
+import asyncio
 import json
 import math
 import os
@@ -25,9 +26,10 @@ from motor.motor_asyncio import (
 )
 from pydantic import ValidationError
 from pymongo import ReturnDocument
-from pymongo.errors import AutoReconnect, DuplicateKeyError
+from pymongo.errors import AutoReconnect, DuplicateKeyError, OperationFailure
 
 from .logger import clear_log_context, set_log_context
+from .db import analytics_reads
 from .models import (
     MAX_BROWSER_WINDOWS,
     MAX_CRAWL_SCALE,
@@ -127,6 +129,15 @@ DEFAULT_ORG = os.environ.get("DEFAULT_ORG", "My Organization")
 # number of items to delete at a time
 DEL_ITEMS = 1000
 
+# seconds an org snapshot may be reused for frequent reads, eg. operator syncs
+ORG_SNAPSHOT_TTL = int(os.environ.get("ORG_SNAPSHOT_TTL_SECONDS", 10))
+
+# max org snapshots kept before expired snapshots are dropped
+ORG_SNAPSHOT_MAX = 1000
+
+# change streams not supported, eg. standalone mongo, not a replica set
+CHANGE_STREAM_UNSUPPORTED_CODES = (40573, 40324)
+
 
 # ============================================================================
 class BaseOrgs:
@@ -182,6 +193,104 @@ class BaseOrgs:
         except KeyError:
             return 0
 
+    def get_exec_seconds_update(self, yymm: str, duration: int) -> list[dict]:
+        """Return update pipeline adding exec seconds for month yymm to org
+
+        All seconds are added to crawlExecSeconds. If any exec time quota is
+        set, seconds are added to monthlyExecSeconds up to the monthly quota,
+        and any overage is taken from gifted, then extra seconds available,
+        and added to giftedExecSeconds and extraExecSeconds.
+        """
+
+        def value(field: str) -> dict:
+            return {"$ifNull": [f"${field}", 0]}
+
+        def take_available(field: str) -> dict:
+            return {"$min": ["$_exec.over", {"$max": [0, value(field)]}]}
+
+        def add_if_positive(field: str, amount: str) -> dict:
+            # leave field unchanged, or unset, if nothing to add
+            return {
+                "$cond": [
+                    {"$gt": [amount, 0]},
+                    {"$add": [value(field), amount]},
+                    f"${field}",
+                ]
+            }
+
+        has_quota = {
+            "$or": [
+                {"$gt": [value("quotas.maxExecMinutesPerMonth"), 0]},
+                {"$gt": [value("quotas.giftedExecMinutes"), 0]},
+                {"$gt": [value("quotas.extraExecMinutes"), 0]},
+            ]
+        }
+
+        monthly_remaining = {
+            "$max": [
+                0,
+                {
+                    "$subtract": [
+                        {"$multiply": [value("quotas.maxExecMinutesPerMonth"), 60]},
+                        value(f"monthlyExecSeconds.{yymm}"),
+                    ]
+                },
+            ]
+        }
+
+        return [
+            {
+                "$set": {
+                    "_exec.monthly": {
+                        "$cond": [has_quota, {"$min": [duration, monthly_remaining]}, 0]
+                    }
+                }
+            },
+            {
+                "$set": {
+                    "_exec.over": {
+                        "$cond": [
+                            has_quota,
+                            {"$subtract": [duration, "$_exec.monthly"]},
+                            0,
+                        ]
+                    }
+                }
+            },
+            {"$set": {"_exec.gifted": take_available("giftedExecSecondsAvailable")}},
+            {"$set": {"_exec.over": {"$subtract": ["$_exec.over", "$_exec.gifted"]}}},
+            {"$set": {"_exec.extra": take_available("extraExecSecondsAvailable")}},
+            {
+                "$set": {
+                    f"crawlExecSeconds.{yymm}": {
+                        "$add": [value(f"crawlExecSeconds.{yymm}"), duration]
+                    },
+                    f"monthlyExecSeconds.{yymm}": add_if_positive(
+                        f"monthlyExecSeconds.{yymm}", "$_exec.monthly"
+                    ),
+                    f"giftedExecSeconds.{yymm}": add_if_positive(
+                        f"giftedExecSeconds.{yymm}", "$_exec.gifted"
+                    ),
+                    f"extraExecSeconds.{yymm}": add_if_positive(
+                        f"extraExecSeconds.{yymm}", "$_exec.extra"
+                    ),
+                    "giftedExecSecondsAvailable": {
+                        "$subtract": [
+                            value("giftedExecSecondsAvailable"),
+                            "$_exec.gifted",
+                        ]
+                    },
+                    "extraExecSecondsAvailable": {
+                        "$subtract": [
+                            value("extraExecSecondsAvailable"),
+                            "$_exec.extra",
+                        ]
+                    },
+                }
+            },
+            {"$unset": "_exec"},
+        ]
+
 
 # ============================================================================
 # pylint: disable=too-many-public-methods, too-many-instance-attributes, too-many-locals, too-many-arguments
@@ -236,6 +345,9 @@ class OrgOps(BaseOrgs):
         self.crawl_manager = crawl_manager
         self.register_to_org_id = os.environ.get("REGISTER_TO_ORG_ID")
 
+        self.org_snapshots: dict[UUID, tuple[float, Organization]] = {}
+        self.org_snapshot_watch: asyncio.Task | None = None
+
     def set_ops(
         self,
         base_crawl_ops: BaseCrawlOps,
@@ -407,6 +519,80 @@ class OrgOps(BaseOrgs):
 
         return Organization.from_dict(res)
 
+    async def get_org_snapshot(self, oid: UUID, fresh=False) -> Organization:
+        """Get org for frequent read-only lookups, reusing an org read in the
+        last ORG_SNAPSHOT_TTL seconds. Snapshots are updated by this process'
+        own org stats updates and, if supported, a change stream on orgs.
+
+        If fresh is set, eg. for quota checks before starting a crawl, always
+        read the org from the db
+        """
+        if not fresh and ORG_SNAPSHOT_TTL > 0:
+            snapshot = self.org_snapshots.get(oid)
+            if snapshot and time.monotonic() - snapshot[0] < ORG_SNAPSHOT_TTL:
+                return snapshot[1]
+
+        if not self.org_snapshot_watch and ORG_SNAPSHOT_TTL > 0:
+            self.org_snapshot_watch = asyncio.create_task(self.watch_org_snapshots())
+
+        org = await self.get_org_by_id(oid)
+        self._set_org_snapshot(org)
+        return org
+
+    def _set_org_snapshot(self, org: Organization) -> None:
+        if len(self.org_snapshots) >= ORG_SNAPSHOT_MAX:
+            now = time.monotonic()
+            self.org_snapshots = {
+                oid: snapshot
+                for oid, snapshot in self.org_snapshots.items()
+                if now - snapshot[0] < ORG_SNAPSHOT_TTL
+            }
+            if len(self.org_snapshots) >= ORG_SNAPSHOT_MAX:
+                self.org_snapshots.clear()
+
+        self.org_snapshots[org.id] = (time.monotonic(), org)
+
+    def _refresh_org_snapshot(self, res: dict[str, Any] | None) -> None:
+        """update snapshot from updated org, only if already snapshotted"""
+        if res and res["_id"] in self.org_snapshots:
+            self._set_org_snapshot(Organization.from_dict(res))
+
+    async def watch_org_snapshots(self) -> None:
+        """keep org snapshots current from change stream, if supported,
+        otherwise snapshots expire after ORG_SNAPSHOT_TTL"""
+        pipeline = [
+            {"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}
+        ]
+        while True:
+            try:
+                async with self.orgs.watch(
+                    pipeline, full_document="updateLookup"
+                ) as change_stream:
+                    async for change in change_stream:
+                        oid = change["documentKey"]["_id"]
+                        if change["operationType"] == "delete":
+                            self.org_snapshots.pop(oid, None)
+                        else:
+                            self._refresh_org_snapshot(change.get("fullDocument"))
+
+            except OperationFailure as exc:
+                if exc.code in CHANGE_STREAM_UNSUPPORTED_CODES:
+                    logger.info(
+                        "org_snapshot_change_stream_unsupported",
+                        unstructured_message="Org snapshots refreshed by TTL only",
+                    )
+                    return
+
+                logger.warning("org_snapshot_change_stream_failed", exc_info=True)
+
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.warning("org_snapshot_change_stream_failed", exc_info=True)
+
+            # stream may have missed changes, drop snapshots before resuming
+            self.org_snapshots.clear()
+            await asyncio.sleep(ORG_SNAPSHOT_TTL)
+
     async def get_org_by_slug(self, slug: str) -> Organization:
         """Get an org by id"""
         res = await self.orgs.find_one({"slug": slug})
@@ -1013,21 +1199,31 @@ class OrgOps(BaseOrgs):
     async def inc_org_bytes_stored(self, oid: UUID, size: int, type_="crawl") -> None:
         """Increase org bytesStored count (pass negative value to subtract)."""
         if type_ == "crawl":
-            await self.orgs.find_one_and_update(
-                {"_id": oid},
-                {"$inc": {"bytesStored": size, "bytesStoredCrawls": size}},
+            await self._update_org_and_snapshot(
+                oid, {"$inc": {"bytesStored": size, "bytesStoredCrawls": size}}
             )
         elif type_ == "upload":
-            await self.orgs.find_one_and_update(
-                {"_id": oid},
-                {"$inc": {"bytesStored": size, "bytesStoredUploads": size}},
+            await self._update_org_and_snapshot(
+                oid, {"$inc": {"bytesStored": size, "bytesStoredUploads": size}}
             )
         elif type_ == "profile":
-            await self.orgs.find_one_and_update(
-                {"_id": oid},
-                {"$inc": {"bytesStored": size, "bytesStoredProfiles": size}},
+            await self._update_org_and_snapshot(
+                oid, {"$inc": {"bytesStored": size, "bytesStoredProfiles": size}}
             )
 
+    async def _update_org_and_snapshot(
+        self, oid: UUID, update: dict[str, Any] | list[dict[str, Any]]
+    ) -> None:
+        """update org, also updating snapshot of org if one is kept"""
+        if oid not in self.org_snapshots:
+            await self.orgs.update_one({"_id": oid}, update)
+            return
+
+        res = await self.orgs.find_one_and_update(
+            {"_id": oid}, update, return_document=ReturnDocument.AFTER
+        )
+        self._refresh_org_snapshot(res)
+
     def can_write_data(self, org: Organization, include_time=True) -> None:
         """check crawl quotas and readOnly state, throw if can not run"""
         if org.readOnly:
@@ -1064,96 +1260,22 @@ class OrgOps(BaseOrgs):
 
         If is_qa is true, also update seperate qa only counter
         """
-        # pylint: disable=too-many-return-statements, too-many-locals
         yymm = dt_now().strftime("%Y-%m")
-        inc_query = {}
-
-        if not is_qa:
-            key = "crawlExecSeconds" if is_exec_time else "usage"
-            inc_query[f"{key}.{yymm}"] = duration
-        else:
-            qa_key = "qaCrawlExecSeconds" if is_exec_time else "qaUsage"
-            inc_query[f"{qa_key}.{yymm}"] = duration
-
-        await self.orgs.find_one_and_update({"_id": oid}, {"$inc": inc_query})
-
-        if not is_exec_time or is_qa:
-            return
-
-        org = await self.get_org_by_id(oid)
-
-        monthly_exec_secs_used = self.get_monthly_crawl_exec_seconds(org)
-
-        monthly_quota_mins = org.quotas.maxExecMinutesPerMonth or 0
-        monthly_quota_secs = monthly_quota_mins * 60
-
-        if (
-            not monthly_quota_secs
-            and not org.quotas.extraExecMinutes
-            and not org.quotas.giftedExecMinutes
-        ):
-            return
 
-        monthly_remaining_time = monthly_quota_secs - monthly_exec_secs_used
-
-        # If adding duration won't pass monthly quota, add duration and return
-        if duration <= monthly_remaining_time:
-            await self.orgs.find_one_and_update(
-                {"_id": oid}, {"$inc": {f"monthlyExecSeconds.{yymm}": duration}}
+        if is_exec_time and not is_qa:
+            # split across quotas in a single atomic update, so that exec time
+            # of concurrent crawls in the same org is accounted correctly
+            await self._update_org_and_snapshot(
+                oid, self.get_exec_seconds_update(yymm, duration)
             )
             return
 
-        # Otherwise, add execution seconds to monthlyExecSeconds up to quota
-        await self.orgs.find_one_and_update(
-            {"_id": oid},
-            {"$inc": {f"monthlyExecSeconds.{yymm}": monthly_remaining_time}},
-        )
-
-        if not org.giftedExecSecondsAvailable and not org.extraExecSecondsAvailable:
-            return
-
-        secs_over_quota = duration - monthly_remaining_time
-
-        # If we've surpassed monthly base quota, use gifted and extra exec minutes
-        # in that order if available, track their usage per month, and recalculate
-        # extraExecSecondsAvailable and giftedExecSecondsAvailable as needed
-        gifted_secs_available = org.giftedExecSecondsAvailable
-        if gifted_secs_available:
-            if secs_over_quota <= gifted_secs_available:
-                await self.orgs.find_one_and_update(
-                    {"_id": oid},
-                    {
-                        "$inc": {
-                            f"giftedExecSeconds.{yymm}": secs_over_quota,
-                            "giftedExecSecondsAvailable": -secs_over_quota,
-                        }
-                    },
-                )
-                return
-
-            # If seconds over quota is higher than gifted seconds available,
-            # use remaining gifted gifted time and then move on
-            await self.orgs.find_one_and_update(
-                {"_id": oid},
-                {
-                    "$inc": {f"giftedExecSeconds.{yymm}": gifted_secs_available},
-                    "$set": {"giftedExecSecondsAvailable": 0},
-                },
-            )
-            secs_over_quota = secs_over_quota - gifted_secs_available
+        if not is_qa:
+            key = "usage"
+        else:
+            key = "qaCrawlExecSeconds" if is_exec_time else "qaUsage"
 
-        # If we still have an overage, apply to extra up to quota
-        secs_to_use = min(secs_over_quota, org.extraExecSecondsAvailable)
-        if secs_to_use:
-            await self.orgs.find_one_and_update(
-                {"_id": oid},
-                {
-                    "$inc": {
-                        f"extraExecSeconds.{yymm}": secs_to_use,
-                        "extraExecSecondsAvailable": -secs_to_use,
-                    }
-                },
-            )
+        await self.orgs.update_one({"_id": oid}, {"$inc": {f"{key}.{yymm}": duration}})
 
     async def get_org_metrics(self, org: Organization) -> dict[str, int]:
         """Calculate and return org metrics"""
@@ -1171,7 +1293,12 @@ class OrgOps(BaseOrgs):
         crawl_page_count = 0
         upload_page_count = 0
 
-        async for item_data in self.crawls_db.find({"oid": org.id}):
+        # counts can lag slightly behind writes
+        crawls_db = analytics_reads(self.crawls_db)
+        profiles_db = analytics_reads(self.profiles_db)
+        colls_db = analytics_reads(self.colls_db)
+
+        async for item_data in crawls_db.find({"oid": org.id}):
             item = BaseCrawl.from_dict(item_data)
             if item.state not in SUCCESSFUL_STATES:
                 continue
@@ -1185,15 +1312,15 @@ class OrgOps(BaseOrgs):
             if item.pageCount:
                 page_count += item.pageCount
 
-        profile_count = await self.profiles_db.count_documents({"oid": org.id})
-        workflows_running_count = await self.crawls_db.count_documents(
+        profile_count = await profiles_db.count_documents({"oid": org.id})
+        workflows_running_count = await crawls_db.count_documents(
             {"oid": org.id, "state": {"$in": RUNNING_STATES}}
         )
-        workflows_queued_count = await self.crawls_db.count_documents(
+        workflows_queued_count = await crawls_db.count_documents(
             {"oid": org.id, "state": {"$in": WAITING_STATES}}
         )
-        collections_count = await self.colls_db.count_documents({"oid": org.id})
-        public_collections_count = await self.colls_db.count_documents(
+        collections_count = await colls_db.count_documents({"oid": org.id})
+        public_collections_count = await colls_db.count_documents(
             {"oid": org.id, "access": {"$in": ["public", "unlisted"]}}
         )
 
@@ -1302,23 +1429,21 @@ class OrgOps(BaseOrgs):
         async def json_items_gen(
             key: str,
             cursor,
-            doc_count: int,
             skip_closing_comma=False,
         ) -> AsyncGenerator:
             """Async generator to add json items in list, keyed by supplied str"""
             yield f'"{key}": [\n'.encode()
 
-            doc_index = 1
+            # separators written before each item, so the list is valid
+            # json however many docs the cursor returns
+            separator = b""
 
             async for json_item in cursor:
+                yield separator
                 yield json.dumps(json_item, cls=JSONSerializer).encode("utf-8")
-                if doc_index < doc_count:
-                    yield b",\n"
-                else:
-                    yield b"\n"
-                doc_index += 1
+                separator = b",\n"
 
-            yield f"]{'' if skip_closing_comma else ','}\n".encode()
+            yield f"\n]{'' if skip_closing_comma else ','}\n".encode()
 
         async def json_closing_gen() -> AsyncGenerator:
             """Async generator to close JSON document"""
@@ -1326,46 +1451,43 @@ class OrgOps(BaseOrgs):
 
         export_stream_generators.append(json_opening_gen())
 
+        profiles_db = analytics_reads(self.profiles_db)
+        crawl_configs_db = analytics_reads(self.crawl_configs_db)
+        configs_revs_db = analytics_reads(self.configs_revs_db)
+        crawls_db = analytics_reads(self.crawls_db)
+        pages_db = analytics_reads(self.pages_db)
+        colls_db = analytics_reads(self.colls_db)
+
         # Profiles
-        count = await self.profiles_db.count_documents(oid_query)
-        cursor = self.profiles_db.find(oid_query)
-        export_stream_generators.append(json_items_gen("profiles", cursor, count))
+        cursor = profiles_db.find(oid_query)
+        export_stream_generators.append(json_items_gen("profiles", cursor))
 
         # Workflows
-        count = await self.crawl_configs_db.count_documents(oid_query)
-        cursor = self.crawl_configs_db.find(oid_query)
-        export_stream_generators.append(json_items_gen("workflows", cursor, count))
+        cursor = crawl_configs_db.find(oid_query)
+        export_stream_generators.append(json_items_gen("workflows", cursor))
 
         # Workflow IDs (needed for revisions)
         workflow_ids = []
-        cursor = self.crawl_configs_db.find(oid_query, projection=["_id"])
+        cursor = crawl_configs_db.find(oid_query, projection=["_id"])
         async for workflow_dict in cursor:
             workflow_ids.append(workflow_dict.get("_id"))
 
         # Workflow revisions
         workflow_revs_query = {"cid": {"$in": workflow_ids}}
-        count = await self.configs_revs_db.count_documents(workflow_revs_query)
-        cursor = self.configs_revs_db.find(workflow_revs_query)
-        export_stream_generators.append(
-            json_items_gen("workflowRevisions", cursor, count)
-        )
+        cursor = configs_revs_db.find(workflow_revs_query)
+        export_stream_generators.append(json_items_gen("workflowRevisions", cursor))
 
         # Items
-        count = await self.crawls_db.count_documents(oid_query)
-        cursor = self.crawls_db.find(oid_query)
-        export_stream_generators.append(json_items_gen("items", cursor, count))
+        cursor = crawls_db.find(oid_query)
+        export_stream_generators.append(json_items_gen("items", cursor))
 
         # Pages
-        count = await self.pages_db.count_documents(oid_query)
-        cursor = self.pages_db.find(oid_query)
-        export_stream_generators.append(json_items_gen("pages", cursor, count))
+        cursor = pages_db.find(oid_query)
+        export_stream_generators.append(json_items_gen("pages", cursor))
 
         # Collections
-        count = await self.colls_db.count_documents(oid_query)
-        cursor = self.colls_db.find(oid_query)
-        export_stream_generators.append(
-            json_items_gen("collections", cursor, count, True)
-        )
+        cursor = colls_db.find(oid_query)
+        export_stream_generators.append(json_items_gen("collections", cursor, True))
 
         export_stream_generators.append(json_closing_gen())
 
@@ -1566,8 +1688,9 @@ class OrgOps(BaseOrgs):
 
         # pages
         for page in org_data.get("pages", []):
-            page = json_stream.to_standard_types(page)
-            await self.pages_db.insert_one(PageWithAllQA.from_dict(page).to_dict())
+            page_obj = PageWithAllQA.from_dict(json_stream.to_standard_types(page))
+            page_obj.compute_host()
+            await self.pages_db.insert_one(page_obj.to_compact_dict())
 
         # collections
         for coll_raw in org_data.get("collections", []):
@@ -1703,9 +1826,8 @@ class OrgOps(BaseOrgs):
     async def set_last_crawl_finished(self, oid: UUID):
         """Recalculate and set lastCrawlFinished field on org"""
         last_crawl_finished = await self.base_crawl_ops.get_org_last_crawl_finished(oid)
-        await self.orgs.find_one_and_update(
-            {"_id": oid},
-            {"$set": {"lastCrawlFinished": last_crawl_finished}},
+        await self._update_org_and_snapshot(
+            oid, {"$set": {"lastCrawlFinished": last_crawl_finished}}
         )
 
     async def inc_org_bytes_stored_field(
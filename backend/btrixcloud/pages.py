@@ -3,6 +3,7 @@
 # pylint: disable=too-many-lines
 
 import asyncio
+import bisect
 import urllib.parse
 from collections.abc import AsyncGenerator, Callable
 from datetime import datetime
@@ -14,7 +15,10 @@ import pymongo
 from fastapi import Depends, HTTPException, Request, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from .db import max_time
+from .metrics import PAGES_ADDED
 from .models import (
+    PAGES_VERSION,
     CrawlFile,
     DeletedResponse,
     EmptyResponse,
@@ -42,10 +46,49 @@ from .models import (
     User,
 )
 from .pagination import DEFAULT_PAGE_SIZE, paginated_format
+from .responsecache import set_public_preflight_headers
 from .utils import dt_now, str_list_to_bools, str_to_date
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
+# optional page fields, removed from stored pages if null
+COMPACT_NULLABLE_FIELDS = (
+    "title",
+    "loadState",
+    "status",
+    "mime",
+    "filename",
+    "depth",
+    "favIconUrl",
+    "userid",
+    "modified",
+    "approved",
+)
+
+# host of page url, for pages stored before host was added in v3
+URL_HOST_EXPR = {
+    "$let": {
+        "vars": {
+            "match": {"$regexFind": {"input": "$url", "regex": "^https?://([^/]+)"}}
+        },
+        "in": {"$first": "$$match.captures"},
+    }
+}
+
+# fixed-width bins per score in QA run histograms, bucket thresholds that are
+# multiples of 1 / QA_SCORE_BINS are counted from the histogram
+QA_SCORE_BINS = 1000
+
+# scores compared by QA runs, each with its own histogram
+QA_SCORE_KEYS = ("screenshotMatch", "textMatch")
+
+# upper boundary of last QA score bucket, to be inclusive of scores of 1
+QA_SCORE_MAX = 1.1
+
+# pages scanned per URL when listing collection page URLs, URLs with more
+# snapshots than this are grouped in the database instead
+URL_SCAN_PAGES_PER_URL = 10
+
 if TYPE_CHECKING:
     from .background_jobs import BackgroundJobOps
     from .colls import CollectionOps
@@ -56,6 +99,50 @@ else:
     CrawlOps = StorageOps = OrgOps = BackgroundJobOps = CollectionOps = object
 
 
+# ============================================================================
+def get_qa_score_bin(score: Any) -> int | None:
+    """Return histogram bin of QA score, None if not bucketed by score
+
+    Bin i holds scores i / QA_SCORE_BINS <= score < (i + 1) / QA_SCORE_BINS,
+    compared as floats as mongo does for $bucket boundaries, with a last bin
+    for scores from 1 to QA_SCORE_MAX.
+    """
+    if isinstance(score, bool) or not isinstance(score, (int, float)):
+        return None
+
+    if score < 0 or score >= QA_SCORE_MAX:
+        return None
+
+    if score >= 1:
+        return QA_SCORE_BINS
+
+    index = min(int(score * QA_SCORE_BINS), QA_SCORE_BINS - 1)
+    # correct for rounding in multiplication near bin edges
+    if score < index / QA_SCORE_BINS:
+        index -= 1
+    elif score >= (index + 1) / QA_SCORE_BINS:
+        index += 1
+    return index
+
+
+def add_qa_score_bin_moves(
+    inc_query: dict[str, int], prev_compare: dict[str, Any], compare: dict[str, Any]
+) -> None:
+    """Add moves of a page between QA run histogram score bins, from scores
+    in prev_compare to scores in compare, to inc_query"""
+    for key in QA_SCORE_KEYS:
+        prev_bin = get_qa_score_bin(prev_compare.get(key))
+        new_bin = get_qa_score_bin(compare.get(key))
+        if prev_bin == new_bin:
+            continue
+        if prev_bin is not None:
+            field = f"{key}.{prev_bin}"
+            inc_query[field] = inc_query.get(field, 0) - 1
+        if new_bin is not None:
+            field = f"{key}.{new_bin}"
+            inc_query[field] = inc_query.get(field, 0) + 1
+
+
 # ============================================================================
 # pylint: disable=too-many-instance-attributes, too-many-arguments,too-many-public-methods
 class PageOps:
@@ -78,6 +165,7 @@ class PageOps:
     ):
         self.pages = mdb["pages"]
         self.crawls = mdb["crawls"]
+        self.qa_histograms = mdb["qa_score_histograms"]
         self.mdb = mdb
         self.crawl_ops = crawl_ops
         self.org_ops = org_ops
@@ -101,7 +189,15 @@ class PageOps:
                 ("url", pymongo.ASCENDING),
             ]
         )
+        # not hashed, so per-host counts are covered by the index
+        await self.pages.create_index(
+            [
+                ("crawl_id", pymongo.ASCENDING),
+                ("host", pymongo.ASCENDING),
+            ]
+        )
         await self.pages.create_index([("title", "text")])
+        await self.qa_histograms.create_index("crawl_id")
 
     async def set_ops(self, background_job_ops: BackgroundJobOps):
         """Set ops classes as needed"""
@@ -228,18 +324,14 @@ class PageOps:
             ts=(str_to_date(ts) if ts else dt_now()),
         )
         p.compute_page_type()
+        p.compute_host()
         return p
 
     async def _add_pages_to_db(self, crawl_id: str, pages: list[Page], ordered=True):
         """Add batch of pages to db in one insert"""
         try:
             result = await self.pages.insert_many(
-                [
-                    page.to_dict(
-                        exclude_unset=True, exclude_none=True, exclude_defaults=True
-                    )
-                    for page in pages
-                ],
+                [page.to_compact_dict() for page in pages],
                 ordered=ordered,
             )
         except pymongo.errors.BulkWriteError as bwe:
@@ -257,6 +349,8 @@ class PageOps:
             )
             return
 
+        PAGES_ADDED.inc("crawl", amount=len(result.inserted_ids))
+
         await self.update_crawl_file_and_error_counts(crawl_id, pages)
 
     async def add_page_to_db(
@@ -271,10 +365,12 @@ class PageOps:
 
         page_logger = logger.bind(crawl_id=crawl_id, oid=oid, qa_run_id=qa_run_id)
 
-        page_to_insert = page.to_dict(exclude_unset=True, exclude_none=True)
+        page_to_insert = page.to_compact_dict()
 
+        inserted = False
         try:
             await self.pages.insert_one(page_to_insert)
+            inserted = True
         except pymongo.errors.DuplicateKeyError:
             pass
 
@@ -287,6 +383,8 @@ class PageOps:
             )
             return
 
+        PAGES_ADDED.inc("qa" if qa_run_id else "crawl")
+
         if not qa_run_id and page:
             await self.update_crawl_file_and_error_counts(crawl_id, [page])
 
@@ -302,8 +400,254 @@ class PageOps:
 
             compare = PageQACompare(**compare_dict)
 
+            # page not in crawl, count it for no data in each QA run histogram
+            if inserted and not page.isFile and not page.isError:
+                await self.qa_histograms.update_many(
+                    {"crawl_id": crawl_id}, {"$inc": {"total": 1}}
+                )
+
             await self.add_qa_run_for_page(page.id, oid, qa_run_id, crawl_id, compare)
 
+    async def add_qa_pages_to_db(
+        self,
+        page_dicts: list[dict[str, Any]],
+        crawl_id: str,
+        qa_run_id: str,
+        oid: UUID,
+    ) -> dict[str, int]:
+        """Add batch of pages from QA run to database
+
+        Pages are almost always already in the crawl, so only pages not found
+        are inserted. QA comparison results are set with one unordered bulk
+        write, and the score bin moves of the batch's successful writes are
+        applied to the QA run histogram in a single update. Returns a summary
+        of the batch.
+        """
+        page_logger = logger.bind(crawl_id=crawl_id, oid=oid, qa_run_id=qa_run_id)
+
+        summary = {
+            "pages": 0,
+            "invalid": 0,
+            "inserted": 0,
+            "updated": 0,
+            "missingCompare": 0,
+        }
+
+        pages = self._get_qa_pages(page_dicts, crawl_id, oid, summary, page_logger)
+        if not pages:
+            return summary
+
+        summary["pages"] = len(pages)
+
+        existing = await self._get_or_insert_qa_pages(
+            pages, crawl_id, qa_run_id, oid, summary, page_logger
+        )
+
+        PAGES_ADDED.inc("qa", amount=len(pages))
+
+        updates, update_incs = self._get_qa_page_updates(
+            pages, existing, crawl_id, qa_run_id, oid
+        )
+
+        if updates:
+            await self._write_qa_pages(
+                updates, update_incs, qa_run_id, summary, page_logger
+            )
+
+        page_logger.debug("qa_pages_added", **summary)
+        return summary
+
+    def _get_qa_page_updates(
+        self,
+        pages: list[tuple[Page, PageQACompare | None]],
+        existing: dict[UUID, dict[str, Any]],
+        crawl_id: str,
+        qa_run_id: str,
+        oid: UUID,
+    ) -> tuple[list[pymongo.UpdateOne], list[dict[str, int]]]:
+        """Return updates setting QA run results of pages, with the QA run
+        histogram score bin moves of each update"""
+        updates = []
+        update_incs: list[dict[str, int]] = []
+
+        for page, compare in pages:
+            if compare is None:
+                continue
+
+            compare_dict = compare.dict()
+            updates.append(
+                pymongo.UpdateOne(
+                    {"_id": page.id, "oid": oid, "crawl_id": crawl_id},
+                    {"$set": {f"qa.{qa_run_id}": compare_dict}},
+                )
+            )
+            inc_query: dict[str, int] = {}
+            update_incs.append(inc_query)
+
+            page_raw = existing.get(page.id)
+            if not page_raw or page_raw.get("isFile") or page_raw.get("isError"):
+                continue
+
+            # move page to new score bins, if the page was already scored,
+            # including earlier in this batch
+            prev_compare = (page_raw.get("qa") or {}).get(qa_run_id) or {}
+            add_qa_score_bin_moves(inc_query, prev_compare, compare_dict)
+
+            page_raw["qa"] = {qa_run_id: compare_dict}
+
+        return updates, update_incs
+
+    def _get_qa_pages(
+        self,
+        page_dicts: list[dict[str, Any]],
+        crawl_id: str,
+        oid: UUID,
+        summary: dict[str, int],
+        page_logger,
+    ) -> list[tuple[Page, PageQACompare | None]]:
+        """Return pages and QA comparisons from QA run page dicts, skipping
+        invalid pages"""
+        pages: list[tuple[Page, PageQACompare | None]] = []
+        for page_dict in page_dicts:
+            try:
+                page = self._get_page_from_dict(
+                    page_dict, crawl_id, oid, new_uuid=False
+                )
+                compare_dict = page_dict.get("comparison")
+                compare = (
+                    PageQACompare(**compare_dict) if compare_dict is not None else None
+                )
+            except (TypeError, ValueError) as exc:
+                summary["invalid"] += 1
+                page_logger.warning(
+                    "qa_page_invalid", url=page_dict.get("url"), error=str(exc)
+                )
+                continue
+
+            if compare is None:
+                summary["missingCompare"] += 1
+            pages.append((page, compare))
+
+        return pages
+
+    async def _get_or_insert_qa_pages(
+        self,
+        pages: list[tuple[Page, PageQACompare | None]],
+        crawl_id: str,
+        qa_run_id: str,
+        oid: UUID,
+        summary: dict[str, int],
+        page_logger,
+    ) -> dict[UUID, dict[str, Any]]:
+        """Return crawl pages for QA run pages by id, with previous QA run
+        scores, inserting pages not in the crawl"""
+        projection = {"isFile": True, "isError": True}
+        projection.update({f"qa.{qa_run_id}.{key}": True for key in QA_SCORE_KEYS})
+
+        existing: dict[UUID, dict[str, Any]] = {}
+        async for page_raw in self.pages.find(
+            {
+                "_id": {"$in": list({page.id for page, _ in pages})},
+                "oid": oid,
+                "crawl_id": crawl_id,
+            },
+            projection=projection,
+        ):
+            existing[page_raw["_id"]] = page_raw
+
+        new_pages = {page.id: page for page, _ in pages if page.id not in existing}
+        if not new_pages:
+            return existing
+
+        inserted_ids = await self._insert_qa_pages(
+            list(new_pages.values()), page_logger
+        )
+        summary["inserted"] = len(inserted_ids)
+
+        # pages not in crawl, count them for no data in each QA run histogram
+        total = 0
+        for page_id in inserted_ids:
+            page = new_pages[page_id]
+            existing[page_id] = {"isFile": page.isFile, "isError": page.isError}
+            if not page.isFile and not page.isError:
+                total += 1
+
+        if total:
+            await self.qa_histograms.update_many(
+                {"crawl_id": crawl_id}, {"$inc": {"total": total}}
+            )
+
+        return existing
+
+    async def _write_qa_pages(
+        self,
+        updates: list[pymongo.UpdateOne],
+        update_incs: list[dict[str, int]],
+        qa_run_id: str,
+        summary: dict[str, int],
+        page_logger,
+    ) -> None:
+        """Bulk write QA run page updates, then apply score bin moves of each
+        successful update to QA run histogram"""
+        failed: set[int] = set()
+        try:
+            result = await self.pages.bulk_write(updates, ordered=False)
+            summary["updated"] = result.matched_count
+        except pymongo.errors.BulkWriteError as bwe:
+            write_errors = bwe.details.get("writeErrors", [])
+            failed = {write_error["index"] for write_error in write_errors}
+            summary["updated"] = bwe.details.get("nMatched", 0)
+            page_logger.error(
+                "qa_pages_update_failed",
+                batch_size=len(updates),
+                failed=len(failed),
+                unstructured_message=f"Error adding QA run {qa_run_id} data to pages",
+            )
+        # pylint: disable=broad-except
+        except Exception:
+            page_logger.exception(
+                "qa_pages_update_failed",
+                batch_size=len(updates),
+                unstructured_message=f"Error adding QA run {qa_run_id} data to pages",
+            )
+            return
+
+        inc_query: dict[str, int] = {}
+        for index, update_inc in enumerate(update_incs):
+            if index in failed:
+                continue
+            for field, amount in update_inc.items():
+                inc_query[field] = inc_query.get(field, 0) + amount
+
+        # only updates histograms created when QA run started
+        inc_query = {field: amount for field, amount in inc_query.items() if amount}
+        if inc_query:
+            await self.qa_histograms.update_one({"_id": qa_run_id}, {"$inc": inc_query})
+
+    async def _insert_qa_pages(self, pages: list[Page], page_logger) -> list[UUID]:
+        """Insert pages from QA run that are not in the crawl, returning ids
+        of inserted pages. Duplicates are ignored."""
+        inserted_ids = [page.id for page in pages]
+        try:
+            await self.pages.insert_many(
+                [page.to_compact_dict() for page in pages], ordered=False
+            )
+        except pymongo.errors.BulkWriteError as bwe:
+            failed = set()
+            for err in bwe.details.get("writeErrors", []):
+                failed.add(pages[err["index"]].id)
+                if err.get("code") != 11000:
+                    page_logger.error(
+                        "page_add_failed",
+                        page_id=pages[err["index"]].id,
+                        error=err.get("errmsg"),
+                    )
+            inserted_ids = [
+                page_id for page_id in inserted_ids if page_id not in failed
+            ]
+
+        return inserted_ids
+
     async def update_crawl_file_and_error_counts(
         self, crawl_id: str, pages: list[Page] | None = None
     ):
@@ -369,6 +713,7 @@ class PageOps:
             query["oid"] = oid
         try:
             await self.pages.delete_many(query)
+            await self.qa_histograms.delete_many({"crawl_id": crawl_id})
         # pylint: disable=broad-except
         except Exception:
             delete_logger.exception(
@@ -463,12 +808,24 @@ class PageOps:
         result = await self.pages.find_one_and_update(
             {"_id": page_id, "oid": oid, "crawl_id": crawl_id},
             {"$set": {f"qa.{qa_run_id}": compare.dict()}},
-            return_document=pymongo.ReturnDocument.AFTER,
+            return_document=pymongo.ReturnDocument.BEFORE,
         )
 
         if not result:
             raise HTTPException(status_code=404, detail="page_not_found")
 
+        if result.get("isFile") or result.get("isError"):
+            return True
+
+        # move page to new score bins, if the page was already scored
+        prev_compare = (result.get("qa") or {}).get(qa_run_id) or {}
+        inc_query: dict[str, int] = {}
+        add_qa_score_bin_moves(inc_query, prev_compare, compare.dict())
+
+        # only updates histograms created when QA run started
+        if inc_query:
+            await self.qa_histograms.update_one({"_id": qa_run_id}, {"$inc": inc_query})
+
         return True
 
     async def delete_qa_run_from_pages(self, crawl_id: str, qa_run_id: str):
@@ -476,6 +833,7 @@ class PageOps:
         result = await self.pages.update_many(
             {"crawl_id": crawl_id}, {"$unset": {f"qa.{qa_run_id}": ""}}
         )
+        await self.qa_histograms.delete_one({"_id": qa_run_id})
         return result
 
     async def update_page_approval(
@@ -687,8 +1045,11 @@ class PageOps:
         if ts:
             query["ts"] = ts
 
-        if is_seed in (True, False):
-            query["isSeed"] = is_seed
+        if is_seed:
+            query["isSeed"] = True
+        elif is_seed is False:
+            # isSeed is omitted from compact pages if false
+            query["isSeed"] = {"$ne": True}
 
         if isinstance(depth, int):
             query["depth"] = depth
@@ -801,7 +1162,7 @@ class PageOps:
                 ]
             )
 
-            cursor = self.pages.aggregate(aggregate)
+            cursor = self.pages.aggregate(aggregate, **max_time(self.pages))
             results = await cursor.to_list(length=1)
             result = results[0]
             items = result["items"]
@@ -816,14 +1177,16 @@ class PageOps:
                 aggregate.extend([{"$skip": skip}])
 
             aggregate.extend([{"$limit": page_size}])
-            cursor = self.pages.aggregate(aggregate)
+            cursor = self.pages.aggregate(aggregate, **max_time(self.pages))
             items = await cursor.to_list(page_size)
             total = 0
 
         if qa_run_id:
-            return [PageOutWithSingleQA.from_dict(data) for data in items], total
+            return [
+                PageOutWithSingleQA.from_dict_trusted(data) for data in items
+            ], total
 
-        return [PageOut.from_dict(data) for data in items], total
+        return [PageOut.from_dict_trusted(data) for data in items], total
 
     async def list_page_url_counts(
         self,
@@ -832,37 +1195,123 @@ class PageOps:
         url_prefix: str | None = None,
         page_size: int = DEFAULT_PAGE_SIZE,
     ) -> list[PageUrlCount]:
-        """List all page URLs in collection sorted desc by snapshot count
-        unless prefix is specified"""
+        """List page URLs in collection with their snapshots, seeds first then
+        by earliest snapshot, or by URL starting from prefix if specified.
+
+        Only URLs are read to find the first page_size distinct URLs, then
+        the snapshots for just those URLs are grouped in the database"""
         crawl_ids = await self.coll_ops.get_collection_crawl_ids(coll_id, oid)
+        if not crawl_ids:
+            return []
 
-        pages, _ = await self.list_pages(
-            crawl_ids=crawl_ids,
-            url_prefix=url_prefix,
-            page_size=page_size * len(crawl_ids),
-        )
+        query: dict[str, Any] = {"crawl_id": {"$in": crawl_ids}, "oid": oid}
+        if url_prefix:
+            query["url"] = {"$gte": urllib.parse.unquote(url_prefix)}
+            sort = [("url", 1)]
+        else:
+            sort = [("isSeed", -1), ("ts", 1)]
 
-        url_counts: dict[str, PageUrlCount] = {}
+        urls = await self._get_page_urls(query, sort, page_size)
+        if not urls:
+            return []
 
-        for page in pages:
-            url = page.url
-            count = url_counts.get(url)
-            if not count:
-                # if already at max pages, this would add a new page, so we're done
-                if len(url_counts) >= page_size:
-                    break
-                count = PageUrlCount(url=url, snapshots=[], count=0)
-                url_counts[url] = count
-            count.snapshots.append(
+        snapshots_by_url = await self._get_url_snapshots(query, urls)
+
+        url_counts = []
+        for url in urls:
+            snapshots = [
                 PageIdTimestamp(
-                    pageId=page.id,
-                    ts=page.ts,
-                    status=page.status or 200,
+                    pageId=snapshot["pageId"],
+                    ts=snapshot.get("ts"),
+                    status=snapshot.get("status") or 200,
                 )
+                for snapshot in snapshots_by_url.get(url, [])
+            ]
+            url_counts.append(
+                PageUrlCount(url=url, snapshots=snapshots, count=len(snapshots))
             )
-            count.count += 1
 
-        return list(url_counts.values())
+        return url_counts
+
+    async def _get_page_urls(
+        self, query: dict[str, Any], sort: list[tuple[str, int]], page_size: int
+    ) -> list[str]:
+        """Return first page_size distinct page URLs matching query in sort
+        order. Pages are scanned up to a limit, if there are fewer distinct
+        URLs in those, the rest are grouped by URL in the database"""
+        urls: list[str] = []
+        seen_urls: set[str] = set()
+        scan_limit = page_size * URL_SCAN_PAGES_PER_URL
+        scanned = 0
+
+        cursor = (
+            self.pages.find(query, projection={"_id": 0, "url": 1})
+            .sort(sort)
+            .limit(scan_limit)
+        )
+        async for page_raw in cursor.batch_size(max(page_size * 4, 100)):
+            scanned += 1
+            url = page_raw["url"]
+            if url in seen_urls:
+                continue
+            if len(urls) >= page_size:
+                break
+            urls.append(url)
+            seen_urls.add(url)
+
+        await cursor.close()
+
+        if len(urls) >= page_size or scanned < scan_limit:
+            return urls
+
+        group_sort = {"isSeed": -1, "ts": 1} if sort[0][0] == "isSeed" else {"_id": 1}
+        grouped = self.pages.aggregate(
+            [
+                {
+                    "$match": {
+                        **query,
+                        "url": {**query.get("url", {}), "$nin": list(urls)},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": "$url",
+                        "isSeed": {"$max": "$isSeed"},
+                        "ts": {"$min": "$ts"},
+                    }
+                },
+                {"$sort": group_sort},
+                {"$limit": page_size - len(urls)},
+                {"$project": {"_id": 1}},
+            ]
+        )
+        urls.extend([res["_id"] async for res in grouped])
+        return urls
+
+    async def _get_url_snapshots(
+        self, query: dict[str, Any], urls: list[str]
+    ) -> dict[str, list[dict[str, Any]]]:
+        """Return snapshots of pages matching query for each of urls, in
+        timestamp order"""
+        cursor = self.pages.aggregate(
+            [
+                {"$match": {**query, "url": {"$in": urls}}},
+                {"$sort": {"ts": 1}},
+                {
+                    "$group": {
+                        "_id": "$url",
+                        "snapshots": {
+                            "$push": {
+                                "pageId": "$_id",
+                                "ts": "$ts",
+                                "status": "$status",
+                            }
+                        },
+                    }
+                },
+            ]
+        )
+        return {res["_id"]: res["snapshots"] async for res in cursor}
 
     async def re_add_crawl_pages(self, crawl_id: str, oid: UUID | None = None):
         """Delete existing pages for crawl and re-add from WACZs."""
@@ -949,6 +1398,13 @@ class PageOps:
                     qa_temp_db_name=qa_temp_db_name,
                     unstructured_message=f"Dropped temp db {qa_temp_db_name}",
                 )
+
+                # pages, and so QA histograms, may differ after re-adding
+                crawl = await self.crawls.find_one(
+                    {"_id": crawl_id}, projection={"qaFinished": True}
+                )
+                for qa_run_id in (crawl or {}).get("qaFinished") or {}:
+                    await self.recompute_qa_run_histogram(crawl_id, qa_run_id)
         # pylint: disable=broad-exception-caught
         except Exception:
             readd_logger.exception("page_re_add_error")
@@ -978,14 +1434,117 @@ class PageOps:
             await self.re_add_crawl_pages(crawl.get("_id"), org.id)
             count += 1
 
+    def _get_qa_pages_query(self, crawl_id: str) -> dict[str, Any]:
+        """query for pages counted in QA run score buckets"""
+        return {
+            "crawl_id": crawl_id,
+            "isFile": {"$ne": True},
+            "isError": {"$ne": True},
+        }
+
+    async def init_qa_run_histogram(self, crawl_id: str, qa_run_id: str):
+        """Create empty score histograms for new QA run, updated as pages
+        are scored"""
+        total = await self.pages.count_documents(self._get_qa_pages_query(crawl_id))
+        histogram: dict[str, Any] = {"crawl_id": crawl_id, "total": total}
+        for key in QA_SCORE_KEYS:
+            histogram[key] = {}
+
+        await self.qa_histograms.replace_one({"_id": qa_run_id}, histogram, upsert=True)
+
+    async def recompute_qa_run_histogram(
+        self, crawl_id: str, qa_run_id: str
+    ) -> dict[str, Any]:
+        """Recompute exact score histograms for QA run from its pages, for QA
+        runs from before histograms were stored or after pages are re-added"""
+        histogram: dict[str, Any] = {"crawl_id": crawl_id, "total": 0}
+        for key in QA_SCORE_KEYS:
+            histogram[key] = {}
+
+        cursor = self.pages.find(
+            self._get_qa_pages_query(crawl_id),
+            projection={f"qa.{qa_run_id}.{key}": True for key in QA_SCORE_KEYS},
+        )
+        async for page in cursor:
+            histogram["total"] += 1
+            compare = (page.get("qa") or {}).get(qa_run_id) or {}
+            for key in QA_SCORE_KEYS:
+                index = get_qa_score_bin(compare.get(key))
+                if index is not None:
+                    bins = histogram[key]
+                    bins[str(index)] = bins.get(str(index), 0) + 1
+
+        await self.qa_histograms.replace_one({"_id": qa_run_id}, histogram, upsert=True)
+        return histogram
+
+    async def get_qa_run_histogram(
+        self, crawl_id: str, qa_run_id: str, backfill: bool = True
+    ) -> dict[str, Any] | None:
+        """Get score histograms for QA run, recomputing them if missing and
+        backfill is set. Only backfill QA runs that are no longer running, as
+        pages scored while recomputing would be missed."""
+        histogram = await self.qa_histograms.find_one(
+            {"_id": qa_run_id, "crawl_id": crawl_id}
+        )
+        if not histogram and backfill:
+            histogram = await self.recompute_qa_run_histogram(crawl_id, qa_run_id)
+
+        return histogram
+
+    def _get_histogram_bucket_counts(
+        self, histogram: dict[str, Any], key: str, boundaries: list[float]
+    ) -> list[dict[str, Any]] | None:
+        """Sum histogram bins into buckets, in same format as $bucket results.
+        Returns None if boundaries are not all on bin edges"""
+        edges = []
+        for boundary in boundaries[:-1]:
+            index = round(boundary * QA_SCORE_BINS)
+            if not 0 <= index <= QA_SCORE_BINS or index / QA_SCORE_BINS != boundary:
+                return None
+            edges.append(index)
+
+        if boundaries[-1] != QA_SCORE_MAX:
+            return None
+
+        if any(prev >= edge for prev, edge in zip(edges, edges[1:])):
+            return None
+
+        counts = [0] * len(edges)
+        scored = 0
+        for index, count in (histogram.get(key) or {}).items():
+            bucket = bisect.bisect_right(edges, int(index)) - 1
+            # scores below first boundary are "No data", as with $bucket
+            if bucket < 0:
+                continue
+
+            counts[bucket] += count
+            scored += count
+
+        results: list[dict[str, Any]] = [
+            {"_id": boundary, "count": count}
+            for boundary, count in zip(boundaries, counts)
+            if count > 0
+        ]
+
+        no_data = histogram.get("total", 0) - scored
+        if no_data > 0:
+            results.append({"_id": "No data", "count": no_data})
+
+        return results
+
     async def get_qa_run_aggregate_counts(
         self,
         crawl_id: str,
         qa_run_id: str,
         thresholds: dict[str, list[float]],
         key: str = "screenshotMatch",
+        histogram: dict[str, Any] | None = None,
     ):
-        """Get counts for pages in QA run in buckets by score key based on thresholds"""
+        """Get counts for pages in QA run in buckets by score key based on thresholds
+
+        Counts are summed from QA run score histogram if provided, otherwise or
+        if thresholds are not on histogram bin edges, aggregated from pages.
+        """
         boundaries = thresholds.get(key, [])
         if not boundaries:
             raise HTTPException(status_code=400, detail="missing_thresholds")
@@ -998,29 +1557,28 @@ class PageOps:
 
         # Make sure we have upper boundary just over 1 to be inclusive of scores of 1
         if boundaries[-1] <= 1:
-            boundaries.append(1.1)
+            boundaries.append(QA_SCORE_MAX)
 
-        aggregate: list[dict[str, dict[str, Any]]] = [
-            {
-                "$match": {
-                    "crawl_id": crawl_id,
-                    "isFile": {"$ne": True},
-                    "isError": {"$ne": True},
-                }
-            },
-            {
-                "$bucket": {
-                    "groupBy": f"$qa.{qa_run_id}.{key}",
-                    "default": "No data",
-                    "boundaries": boundaries,
-                    "output": {
-                        "count": {"$sum": 1},
-                    },
-                }
-            },
-        ]
-        cursor = self.pages.aggregate(aggregate)
-        results = await cursor.to_list(length=len(boundaries))
+        results = None
+        if histogram:
+            results = self._get_histogram_bucket_counts(histogram, key, boundaries)
+
+        if results is None:
+            aggregate: list[dict[str, dict[str, Any]]] = [
+                {"$match": self._get_qa_pages_query(crawl_id)},
+                {
+                    "$bucket": {
+                        "groupBy": f"$qa.{qa_run_id}.{key}",
+                        "default": "No data",
+                        "boundaries": boundaries,
+                        "output": {
+                            "count": {"$sum": 1},
+                        },
+                    }
+                },
+            ]
+            cursor = self.pages.aggregate(aggregate)
+            results = await cursor.to_list(length=len(boundaries))
 
         return_data = []
 
@@ -1079,25 +1637,20 @@ class PageOps:
         self, crawl_ids: list[str]
     ) -> list[dict[str, str | int]]:
         """Get count of top page hosts across all archived items"""
+        # pages from crawls not yet migrated to v3 may not have host set
+        unmigrated = await self.crawls.find_one(
+            {"_id": {"$in": crawl_ids}, "version": {"$not": {"$gte": PAGES_VERSION}}},
+            projection={"_id": 1},
+        )
+        if unmigrated:
+            host_expr: str | dict[str, Any] = {"$ifNull": ["$host", URL_HOST_EXPR]}
+        else:
+            host_expr = "$host"
+
         cursor = self.pages.aggregate(
             [
                 {"$match": {"crawl_id": {"$in": crawl_ids}}},
-                {
-                    "$addFields": {
-                        "host": {
-                            "$regexFind": {
-                                "input": "$url",
-                                "regex": "^https?://([^/]+)",
-                            }
-                        }
-                    }
-                },
-                {
-                    "$group": {
-                        "_id": {"$first": "$host.captures"},
-                        "count": {"$count": {}},
-                    }
-                },
+                {"$group": {"_id": host_expr, "count": {"$count": {}}}},
                 {"$sort": {"count": -1}},
             ]
         )
@@ -1114,7 +1667,40 @@ class PageOps:
             {"$set": {"uniquePageCount": unique_page_count, "pageCount": page_count}},
         )
 
-    async def optimize_crawl_pages(self, version: int = 2):
+    async def compact_crawl_pages(self, crawl_id: str) -> int:
+        """Migrate existing pages for crawl to compact v3 pages, setting host
+        and removing stored empty and default values, returns pages updated"""
+        unset_if_empty = {
+            field: {"$ifNull": [f"${field}", "$$REMOVE"]}
+            for field in COMPACT_NULLABLE_FIELDS
+        }
+        unset_if_false = {
+            field: {"$cond": [f"${field}", True, "$$REMOVE"]}
+            for field in ("isSeed", "isFile", "isError")
+        }
+
+        res = await self.pages.update_many(
+            {"crawl_id": crawl_id, "host": None},
+            [
+                {
+                    "$set": {
+                        "host": URL_HOST_EXPR,
+                        "notes": {
+                            "$cond": [
+                                {"$gt": [{"$size": {"$ifNull": ["$notes", []]}}, 0]},
+                                "$notes",
+                                "$$REMOVE",
+                            ]
+                        },
+                        **unset_if_empty,
+                        **unset_if_false,
+                    }
+                }
+            ],
+        )
+        return res.modified_count
+
+    async def optimize_crawl_pages(self, version: int = PAGES_VERSION):
         """Iterate through crawls, optimizing pages"""
 
         migrate_logger = logger.bind(version=version)
@@ -1179,6 +1765,16 @@ class PageOps:
                         unstructured_message="Pages already have filename, set to v2",
                     )
 
+                # Re-added pages are already compact, only converts remaining
+                if version >= 3:
+                    compacted = await self.compact_crawl_pages(crawl_id)
+                    migrate_logger.info(
+                        "pages_compacted_v3",
+                        crawl_id=crawl_id,
+                        count=compacted,
+                        unstructured_message=f"Compacted {compacted} pages for v3",
+                    )
+
                 # Update crawl version and unset isMigrating
                 await self.crawls.find_one_and_update(
                     {"_id": crawl_id},
@@ -1544,7 +2140,7 @@ def init_pages_api(
     )
     async def get_public_collection_pages_list(
         coll_id: UUID,
-        response: Response,
+        request: Request,
         org: Organization = Depends(org_public),
         search: str | None = None,
         url: str | None = None,
@@ -1557,24 +2153,32 @@ def init_pages_api(
         sortDirection: int | None = -1,
     ):
         """Retrieve paginated list of pages in collection"""
-        pages, _ = await ops.list_pages(
-            coll_id=coll_id,
-            org=org,
-            search=search,
-            url=url,
-            ts=ts,
-            is_seed=isSeed,
-            depth=depth,
-            page_size=pageSize,
-            page=page,
-            sort_by=sortBy,
-            sort_direction=sortDirection,
-            public_or_unlisted_only=True,
+        coll_raw = await ops.coll_ops.get_collection_raw(
+            coll_id, org.id, public_or_unlisted_only=True
         )
 
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        return {"items": pages}
+        async def render():
+            pages, _ = await ops.list_pages(
+                coll_id=coll_id,
+                org=org,
+                search=search,
+                url=url,
+                ts=ts,
+                is_seed=isSeed,
+                depth=depth,
+                page_size=pageSize,
+                page=page,
+                sort_by=sortBy,
+                sort_direction=sortDirection,
+                public_or_unlisted_only=True,
+            )
+            return {"items": pages}
+
+        return await ops.coll_ops.response_cache.get_public_response(
+            dict(request.headers),
+            ["public_pages", coll_raw, str(request.query_params)],
+            render,
+        )
 
     @app.options(
         "/orgs/{oid}/collections/{coll_id}/pages",
@@ -1592,9 +2196,7 @@ def init_pages_api(
         response_model=EmptyResponse,
     )
     async def get_replay_preflight(response: Response):
-        response.headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
-        response.headers["Access-Control-Allow-Origin"] = "*"
-        response.headers["Access-Control-Allow-Headers"] = "*"
+        set_public_preflight_headers(response)
         return {}
 
     @app.get(
@@ -1693,7 +2295,7 @@ def init_pages_api(
         org: Organization = Depends(org_viewer_dep),
         # page: int = 1,
     ):
-        """Retrieve paginated list of urls in collection sorted by snapshot count"""
+        """Retrieve list of urls in collection with their snapshots"""
         pages = await ops.list_page_url_counts(
             coll_id=coll_id,
             oid=org.id,
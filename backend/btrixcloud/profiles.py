@@ -14,6 +14,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from motor.motor_asyncio import AsyncIOMotorClientSession
 from starlette.requests import Headers
 
+from .db import analytics_reads, max_time
 from .models import (
     AddedResponseIdQuota,
     BrowserId,
@@ -522,7 +523,9 @@ class ProfileOps:
         )
 
         cursor = self.profiles.aggregate(
-            aggregate, collation=case_insensitive_collation
+            aggregate,
+            collation=case_insensitive_collation,
+            **max_time(self.profiles),
         )
         results = await cursor.to_list(length=1)
         result = results[0]
@@ -699,7 +702,7 @@ class ProfileOps:
 
     async def get_profile_search_values(self, org: Organization):
         """Return profile names for use in search"""
-        names = await self.profiles.distinct("name", {"oid": org.id})
+        names = await analytics_reads(self.profiles).distinct("name", {"oid": org.id})
         # Remove empty strings
         names = [name for name in names if name]
         return {"names": names}
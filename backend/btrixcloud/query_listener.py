@@ -0,0 +1,86 @@
+"""
+pymongo command listener keeping slow queries, for the query profiler.
+
+Kept apart from query_profiler so the db client can be created with the
+listener without importing models.
+"""
+
+import os
+import random
+import threading
+from collections import deque
+from typing import Any
+
+from pymongo import monitoring
+
+# queries taking at least this long are recorded, 0 to disable
+SLOW_QUERY_MS = int(os.environ.get("SLOW_QUERY_MS") or 0)
+
+# fraction of queries timed, to reduce overhead on busy processes
+SLOW_QUERY_SAMPLE_RATE = float(os.environ.get("SLOW_QUERY_SAMPLE_RATE") or 1)
+
+# slow queries kept in memory between writes, further ones are dropped
+SLOW_QUERY_MAX_PENDING = 1000
+
+PROFILED_COMMANDS = {
+    "find",
+    "aggregate",
+    "count",
+    "distinct",
+    "findAndModify",
+    "update",
+    "delete",
+}
+
+
+# ============================================================================
+class SlowQueryListener(monitoring.CommandListener):
+    """pymongo command listener keeping queries slower than threshold"""
+
+    def __init__(
+        self,
+        slow_ms: int = SLOW_QUERY_MS,
+        sample_rate: float = SLOW_QUERY_SAMPLE_RATE,
+    ):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[Any, int], Any] = {}
+        self.samples: deque[tuple[dict[str, Any], float]] = deque(
+            maxlen=SLOW_QUERY_MAX_PENDING
+        )
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if event.command_name not in PROFILED_COMMANDS:
+            return
+
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = event.command
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event)
+
+    def _finished(self, event) -> None:
+        with self._lock:
+            command = self._pending.pop((event.connection_id, event.request_id), None)
+
+        if command is None:
+            return
+
+        duration_ms = event.duration_micros / 1000
+        if duration_ms >= self.slow_ms:
+            self.samples.append((command, duration_ms))
+
+
+slow_query_listener = SlowQueryListener() if SLOW_QUERY_MS > 0 else None
+
+
+def get_slow_query_listeners() -> list[monitoring.CommandListener]:
+    """command listeners to pass to mongo client"""
+    return [slow_query_listener] if slow_query_listener else []
@@ -0,0 +1,356 @@
+"""
+Slow mongo query capture and index advice.
+
+A pymongo command listener, in query_listener, times queries in each
+process. Queries slower than SLOW_QUERY_MS are recorded by shape, with
+values removed from the filter, along with a summary of their query plan,
+in the capped slow_queries collection. Superusers can list slow query shapes, with an
+index suggested for those not supported by an existing index.
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+from collections.abc import AsyncGenerator, Callable
+from typing import Any
+
+import structlog
+from fastapi import Depends, HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import CollectionInvalid
+
+from .models import SlowQueriesResponse, SlowQueryShape, User
+from .query_listener import SlowQueryListener, slow_query_listener
+from .utils import dt_now
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# size of capped collection, oldest slow queries are removed first
+SLOW_QUERIES_MAX_BYTES = 16 * 1024 * 1024
+
+# seconds between writes of slow queries to db
+SLOW_QUERY_FLUSH_SECS = 10
+
+# plan of each query shape is explained at most once in this many seconds
+SLOW_QUERY_EXPLAIN_SECS = 600
+
+# max fields in a suggested index
+MAX_INDEX_FIELDS = 4
+
+# command fields not allowed or not needed in explain
+EXPLAIN_EXCLUDE_FIELDS = {
+    "lsid",
+    "txnNumber",
+    "autocommit",
+    "startTransaction",
+    "readConcern",
+    "writeConcern",
+    "maxTimeMS",
+}
+
+EQUALITY_OPS = {"$eq", "$in"}
+
+RANGE_OPS = {"$gt", "$gte", "$lt", "$lte", "$exists", "$regex"}
+
+LOGICAL_OPS = {"$and", "$or", "$nor"}
+
+
+# ============================================================================
+def get_query_shape(value: Any) -> Any:
+    """replace values in query filter with 1, keeping fields and operators"""
+    if not isinstance(value, dict):
+        return 1
+
+    shape: dict[str, Any] = {}
+    for key, val in value.items():
+        if key in LOGICAL_OPS and isinstance(val, list):
+            shape[key] = [get_query_shape(item) for item in val]
+        else:
+            shape[key] = get_query_shape(val)
+    return shape
+
+
+def get_command_query(command: dict[str, Any]) -> tuple[dict, dict | None]:
+    """return filter and sort of query command"""
+    name = next(iter(command))
+
+    if name == "find":
+        return command.get("filter") or {}, command.get("sort")
+
+    if name in ("count", "distinct", "findAndModify"):
+        return command.get("query") or {}, command.get("sort")
+
+    if name in ("update", "delete"):
+        statements = command.get(name + "s") or [{}]
+        return statements[0].get("q") or {}, None
+
+    # aggregate, filter and sort of leading $match and $sort stages
+    query: dict[str, Any] = {}
+    sort = None
+    for stage in command.get("pipeline") or []:
+        if "$match" in stage and not query and sort is None:
+            query = stage["$match"]
+        elif "$sort" in stage and sort is None:
+            sort = stage["$sort"]
+        else:
+            break
+    return query, sort
+
+
+def get_plan_summary(explain: dict[str, Any]) -> dict[str, Any]:
+    """return stages and indexes of winning plan from explain output"""
+    planner: dict[str, Any] = explain.get("queryPlanner") or {}
+    for stage in explain.get("stages") or []:
+        if planner:
+            break
+        planner = stage.get("$cursor", {}).get("queryPlanner") or {}
+
+    plan: dict[str, Any] = planner.get("winningPlan") or {}
+    plan = plan.get("queryPlan", plan)
+
+    stages = []
+    indexes = []
+    while plan:
+        stages.append(plan.get("stage"))
+        if plan.get("indexName"):
+            indexes.append(plan["indexName"])
+        plan = plan.get("inputStage") or next(iter(plan.get("inputStages") or []), {})
+
+    return {"stages": stages, "indexes": indexes, "collScan": "COLLSCAN" in stages}
+
+
+def get_suggested_index(
+    query: dict[str, Any], sort: dict[str, Any] | None
+) -> tuple[list[tuple[str, int]], int]:
+    """suggest index for query shape: equality fields, then sort fields, then
+    range fields. Return index keys and number of leading equality fields.
+    Queries on _id are already indexed, $or and negations are not indexable"""
+    equality: dict[str, None] = {}
+    ranges: dict[str, None] = {}
+
+    def add_fields(clause: dict[str, Any]) -> None:
+        for field, value in clause.items():
+            if field == "$and":
+                for item in value:
+                    add_fields(item)
+            elif field.startswith("$"):
+                continue
+            elif not isinstance(value, dict) or set(value) & EQUALITY_OPS:
+                equality[field] = None
+            elif set(value) & RANGE_OPS:
+                ranges[field] = None
+
+    add_fields(query)
+
+    if "_id" in equality:
+        return [], 0
+
+    sort = sort or {}
+
+    keys = [(field, 1) for field in equality]
+    keys.extend(
+        (field, 1 if direction == 1 else -1)
+        for field, direction in sort.items()
+        if field not in equality
+    )
+    keys.extend(
+        (field, 1) for field in ranges if field not in equality and field not in sort
+    )
+    keys = keys[:MAX_INDEX_FIELDS]
+
+    return keys, min(len(equality), len(keys))
+
+
+def find_supporting_index(
+    keys: list[tuple[str, int]], num_equality: int, indexes: dict[str, Any]
+) -> str | None:
+    """return name of existing index with suggested fields as its prefix,
+    with equality fields in any order"""
+    fields = [field for field, _ in keys]
+    for name, index in indexes.items():
+        index_fields = [field for field, _ in index["key"]][: len(fields)]
+        if set(index_fields[:num_equality]) == set(fields[:num_equality]) and (
+            index_fields[num_equality:] == fields[num_equality:]
+        ):
+            return name
+
+    return None
+
+
+# ============================================================================
+class QueryProfilerOps:
+    """Slow query recording and index advice"""
+
+    def __init__(
+        self,
+        mdb: AsyncIOMotorDatabase,
+        listener: SlowQueryListener | None = slow_query_listener,
+    ):
+        self.mdb = mdb
+        self.slow_queries = mdb["slow_queries"]
+        self.listener = listener
+
+        # shape id -> (plan summary, time explained)
+        self.plans: dict[str, tuple[dict[str, Any] | None, float]] = {}
+
+    async def run_flush(self) -> None:
+        """write slow queries from listener to db periodically"""
+        if not self.listener:
+            return
+
+        try:
+            await self.mdb.create_collection(
+                "slow_queries", capped=True, size=SLOW_QUERIES_MAX_BYTES
+            )
+        except CollectionInvalid:
+            pass
+
+        while True:
+            await asyncio.sleep(SLOW_QUERY_FLUSH_SECS)
+            try:
+                await self.flush()
+            # pylint: disable=broad-exception-caught
+            except Exception:
+                logger.exception("slow_queries_flush_failed")
+
+    async def flush(self) -> int:
+        """write slow queries recorded since last flush, return count"""
+        samples = []
+        while self.listener and self.listener.samples:
+            samples.append(self.listener.samples.popleft())
+
+        docs = []
+        for command, duration_ms in samples:
+            docs.append(await self.get_slow_query_doc(command, duration_ms))
+
+        if docs:
+            await self.slow_queries.insert_many(docs, ordered=False)
+
+        return len(docs)
+
+    async def get_slow_query_doc(
+        self, command: dict[str, Any], duration_ms: float
+    ) -> dict[str, Any]:
+        """slow query shape, timing and plan, without filter values"""
+        name = next(iter(command))
+        query, sort = get_command_query(command)
+        query_shape = get_query_shape(query)
+
+        shape_key = json.dumps(
+            [command[name], name, query_shape, sort], sort_keys=True, default=str
+        )
+        shape_id = hashlib.sha256(shape_key.encode("utf-8")).hexdigest()[:16]
+
+        plan, explained = self.plans.get(shape_id, (None, 0.0))
+        now = time.monotonic()
+        if now - explained >= SLOW_QUERY_EXPLAIN_SECS:
+            plan = await self.explain(command)
+            self.plans[shape_id] = (plan, now)
+
+        return {
+            "shapeId": shape_id,
+            "collection": command[name],
+            "command": name,
+            # stored as json, fields may contain dots and operators
+            "filter": json.dumps(query_shape, sort_keys=True),
+            "sort": json.dumps(sort, default=str),
+            "durationMs": duration_ms,
+            "plan": plan,
+            "created": dt_now(),
+        }
+
+    async def explain(self, command: dict[str, Any]) -> dict[str, Any] | None:
+        """return plan summary for command, without running it"""
+        name = next(iter(command))
+        explain_cmd = {
+            key: value
+            for key, value in command.items()
+            if not key.startswith("$") and key not in EXPLAIN_EXCLUDE_FIELDS
+        }
+        # only first statement of bulk update or delete
+        if name in ("update", "delete"):
+            explain_cmd[name + "s"] = explain_cmd[name + "s"][:1]
+
+        try:
+            res = await self.mdb.command(
+                {"explain": explain_cmd, "verbosity": "queryPlanner"}
+            )
+            return get_plan_summary(res)
+        # pylint: disable=broad-exception-caught
+        except Exception as exc:
+            logger.warning("slow_query_explain_failed", command=name, error=str(exc))
+            return None
+
+    async def get_slow_queries(self, limit: int = 50) -> list[SlowQueryShape]:
+        """slow query shapes by total time, with index suggested for shapes
+        with no supporting index"""
+        cursor = self.slow_queries.aggregate(
+            [
+                {"$sort": {"created": -1}},
+                {
+                    "$group": {
+                        "_id": "$shapeId",
+                        "collection": {"$first": "$collection"},
+                        "command": {"$first": "$command"},
+                        "filter": {"$first": "$filter"},
+                        "sort": {"$first": "$sort"},
+                        "plan": {"$first": "$plan"},
+                        "lastSeen": {"$first": "$created"},
+                        "count": {"$sum": 1},
+                        "totalMs": {"$sum": "$durationMs"},
+                        "maxMs": {"$max": "$durationMs"},
+                    }
+                },
+                {"$sort": {"totalMs": -1}},
+                {"$limit": limit},
+            ]
+        )
+
+        indexes: dict[str, Any] = {}
+        shapes = []
+        async for res in cursor:
+            res["filter"] = json.loads(res["filter"])
+            res["sort"] = json.loads(res["sort"])
+            shape = SlowQueryShape(shapeId=res.pop("_id"), **res)
+
+            keys, num_equality = get_suggested_index(shape.filter, shape.sort)
+            if keys:
+                if shape.collection not in indexes:
+                    indexes[shape.collection] = await self.mdb[
+                        shape.collection
+                    ].index_information()
+
+                shape.existingIndex = find_supporting_index(
+                    keys, num_equality, indexes[shape.collection]
+                )
+                if not shape.existingIndex:
+                    shape.suggestedIndex = keys
+
+            shapes.append(shape)
+
+        return shapes
+
+
+# ============================================================================
+def init_query_profiler_api(
+    app,
+    mdb: AsyncIOMotorDatabase,
+    user_dep: Callable[[str], AsyncGenerator[User, None]],
+) -> QueryProfilerOps:
+    """init slow query recording and api"""
+    ops = QueryProfilerOps(mdb)
+
+    @app.get(
+        "/orgs/all/slowQueries",
+        response_model=SlowQueriesResponse,
+        tags=["organizations"],
+    )
+    async def get_slow_queries(limit: int = 50, user: User = Depends(user_dep)):
+        """List slow query shapes across all processes, with suggested indexes"""
+        if not user.is_superuser:
+            raise HTTPException(status_code=403, detail="Not Allowed")
+
+        return {"items": await ops.get_slow_queries(limit)}
+
+    return ops
@@ -0,0 +1,121 @@
+"""
+Cache of rendered json responses for public endpoints, stored in mongo so it
+is shared across api replicas
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from typing import Any
+
+import structlog
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel
+
+logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
+
+# seconds a cached response is reused, also bounds how long presigned urls
+# and running job counts in a cached response can be stale, 0 to disable
+RESPONSE_CACHE_SECS = int(os.environ.get("PUBLIC_RESPONSE_CACHE_SECONDS") or 300)
+
+# responses are revalidated by clients with If-None-Match on every request
+CACHE_CONTROL = "no-cache"
+
+# public endpoints can be read from any origin, eg. by embedded replay
+PUBLIC_CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "*",
+}
+
+
+# ============================================================================
+def set_public_preflight_headers(response: Response) -> None:
+    """set headers allowing any origin to read public endpoint"""
+    response.headers["Access-Control-Allow-Methods"] = "GET, HEAD, OPTIONS"
+    response.headers.update(PUBLIC_CORS_HEADERS)
+
+
+# ============================================================================
+class ResponseCache:
+    """Cache of rendered responses, keyed by a hash of everything they are
+    rendered from, so that any change to the inputs is a new entry and ETag"""
+
+    def __init__(self, mdb: AsyncIOMotorDatabase):
+        self.cache = mdb["response_cache"]
+        self.cache_secs = RESPONSE_CACHE_SECS
+
+    async def init_index(self):
+        """expire entries at end of their cache window"""
+        await self.cache.create_index("expireAt", expireAfterSeconds=0)
+
+    def get_etag(self, window: int, parts: list[Any]) -> str:
+        """strong etag for response rendered from parts in cache window"""
+        data = json.dumps([window, *parts], sort_keys=True, default=str)
+        return '"' + hashlib.sha256(data.encode("utf-8")).hexdigest() + '"'
+
+    async def get_response(
+        self,
+        headers: dict,
+        key_parts: list[Any],
+        render: Callable[[], Awaitable[BaseModel | dict[str, Any]]],
+        extra_headers: dict[str, str] | None = None,
+    ) -> Response:
+        """return 304 if client has current response, cached response if any,
+        otherwise render response and cache it for rest of window"""
+        if self.cache_secs <= 0:
+            return JSONResponse(jsonable_encoder(await render()), headers=extra_headers)
+
+        # entries are only reused within one window
+        window = int(time.time()) // self.cache_secs
+        etag = self.get_etag(window, key_parts)
+        resp_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        resp_headers.update(extra_headers or {})
+
+        if_none_match = headers.get("if-none-match") or ""
+        if etag in (value.strip() for value in if_none_match.split(",")):
+            return Response(status_code=304, headers=resp_headers)
+
+        cached = await self.cache.find_one({"_id": etag})
+        if cached:
+            return Response(
+                cached["body"], media_type="application/json", headers=resp_headers
+            )
+
+        body = JSONResponse(jsonable_encoder(await render())).body
+
+        expire_at = (window + 1) * self.cache_secs
+        try:
+            await self.cache.replace_one(
+                {"_id": etag},
+                {
+                    "body": body,
+                    "expireAt": datetime.fromtimestamp(expire_at, UTC),
+                },
+                upsert=True,
+            )
+        # pylint: disable=broad-exception-caught
+        except Exception:
+            logger.warning(
+                "response_cache_store_failed",
+                exc_info=True,
+                unstructured_message="Unable to store response in cache",
+            )
+
+        return Response(body, media_type="application/json", headers=resp_headers)
+
+    async def get_public_response(
+        self,
+        headers: dict,
+        key_parts: list[Any],
+        render: Callable[[], Awaitable[BaseModel | dict[str, Any]]],
+    ) -> Response:
+        """get_response for public endpoint, readable from any origin"""
+        return await self.get_response(
+            headers, key_parts, render, extra_headers=PUBLIC_CORS_HEADERS
+        )
@@ -17,16 +17,13 @@ from urllib.parse import urlsplit
 from zipfile import ZipInfo
 
 import structlog
-import aiobotocore.session
 import pymongo
 import requests
-from aiobotocore.config import AioConfig
 from fastapi import APIRouter, Depends, HTTPException
 from remotezip import RemoteZip
 from stream_zip import NO_COMPRESSION_64, Method, stream_zip
-from types_aiobotocore_s3 import S3Client as AIOS3Client
-from types_aiobotocore_s3.type_defs import CompletedPartTypeDef
 
+from .metrics import register_s3_metrics
 from .models import (
     PRESIGN_DURATION_SECONDS,
     AddedResponseName,
@@ -48,10 +45,14 @@ from .utils import dt_now, get_origin, slug_from_name
 from .version import __version__
 
 if TYPE_CHECKING:
+    from types_aiobotocore_s3 import S3Client as AIOS3Client
+    from types_aiobotocore_s3.type_defs import CompletedPartTypeDef
+
     from .crawlmanager import CrawlManager
     from .orgs import OrgOps
 else:
     OrgOps = CrawlManager = object
+    AIOS3Client = CompletedPartTypeDef = object
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -292,6 +293,11 @@ class StorageOps:
         self, storage: S3Storage, for_presign=False
     ) -> AsyncIterator[tuple[AIOS3Client, str, str]]:
         """context manager for s3 client"""
+        # aiobotocore is only loaded once an s3 client is first needed
+        # pylint: disable=import-outside-toplevel
+        import aiobotocore.session
+        from aiobotocore.config import AioConfig
+
         # parse bucket and key from standard endpoint_url
         endpoint_url = storage.endpoint_url
 
@@ -323,6 +329,7 @@ class StorageOps:
             aws_secret_access_key=storage.secret_key,
             config=config,
         ) as client:
+            register_s3_metrics(client, parts.netloc)
             yield client, bucket, key
 
     async def verify_storage_upload(self, storage: S3Storage, filename: str) -> None:
@@ -403,6 +410,26 @@ class StorageOps:
 
             await client.put_object(Bucket=bucket, Key=key, Body=data)
 
+    async def get_file_range(
+        self,
+        org: Organization,
+        storage: StorageRef,
+        filename: str,
+        start: int,
+        end: int,
+    ) -> bytes:
+        """read bytes start to end (inclusive) of file from storage"""
+        s3storage = self.get_org_storage_by_ref(org, storage)
+
+        async with self.get_s3_client(s3storage) as (client, bucket, key):
+            key += filename
+
+            response = await client.get_object(
+                Bucket=bucket, Key=key, Range=f"bytes={start}-{end}"
+            )
+            async with response["Body"] as body:
+                return await body.read()
+
     # pylint: disable=too-many-arguments,too-many-locals
     async def do_upload_multipart(
         self,
@@ -627,9 +654,9 @@ class StorageOps:
 
     async def delete_file_object(self, org: Organization, crawlfile: BaseFile) -> bool:
         """delete crawl file from storage."""
-        return await self._delete_file(org, crawlfile.filename, crawlfile.storage)
+        return await self.delete_file(org, crawlfile.filename, crawlfile.storage)
 
-    async def _delete_file(
+    async def delete_file(
         self, org: Organization, filename: str, storage: StorageRef
     ) -> bool:
         """delete specified file from storage"""
@@ -19,6 +19,7 @@ from starlette.requests import Request
 from .basecrawls import BaseCrawlOps
 from .models import (
     MIN_UPLOAD_PART_SIZE,
+    PAGES_VERSION,
     AddedResponseIdQuota,
     CrawlFile,
     CrawlOut,
@@ -226,7 +227,7 @@ class UploadOps(BaseCrawlOps):
             fileSize=file_size,
             started=now,
             finished=now,
-            version=2,
+            version=PAGES_VERSION,
         )
 
         upload_logger = upload_logger.bind(file_count=len(files), file_size=file_size)
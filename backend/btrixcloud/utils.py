@@ -90,6 +90,21 @@ def register_exit_handler() -> None:
     loop.add_signal_handler(signal.SIGTERM, exit_handler)
 
 
+def kubernetes_detected() -> bool:
+    """return true if running in kubernetes, log critical error if not"""
+    if os.environ.get("KUBERNETES_SERVICE_HOST"):
+        return True
+
+    logger.critical(
+        "kubernetes_not_detected",
+        unstructured_message=(
+            "Sorry, the Browsertrix Backend must be run inside a Kubernetes environment. "
+            "Kubernetes not detected (KUBERNETES_SERVICE_HOST is not set), Exiting"
+        ),
+    )
+    return False
+
+
 def parse_jsonl_log_messages(log_lines: list[str]) -> list[dict]:
     """parse json-l error strings from redis/db into json"""
     parsed_log_lines = []
@@ -1,13 +1,19 @@
 """Webhook management"""
 
+import asyncio
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
 from typing import TYPE_CHECKING, cast
 from uuid import UUID, uuid4
 
 import structlog
 import aiohttp
-import backoff
+import pymongo
 from fastapi import APIRouter, Depends, HTTPException
 
+from .metrics import WEBHOOK_BACKLOG, WEBHOOK_DELIVERY_DELAY, WEBHOOK_REQUEST_DURATION
 from .models import (
     CollectionDeletedBody,
     CollectionItemAddedBody,
@@ -27,7 +33,7 @@ from .models import (
     WebhookNotification,
 )
 from .pagination import DEFAULT_PAGE_SIZE, paginated_format
-from .utils import dt_now, run_async_task
+from .utils import dt_now
 
 logger: structlog.stdlib.BoundLogger = structlog.get_logger(__name__)
 
@@ -37,6 +43,286 @@ if TYPE_CHECKING:
 else:
     OrgOps = CrawlOps = object
 
+# request timeout, and max concurrent requests overall and per webhook host
+WEBHOOK_TIMEOUT_SECS = int(os.environ.get("WEBHOOK_TIMEOUT_SECONDS") or 30)
+WEBHOOK_MAX_CONNECTIONS = 50
+WEBHOOK_MAX_CONNECTIONS_PER_HOST = int(
+    os.environ.get("WEBHOOK_MAX_CONNECTIONS_PER_HOST") or 4
+)
+
+# if > 1, consecutive notifications to the same url are sent together,
+# as a JSON array of up to this many notification bodies
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE") or 1)
+
+# max notifications claimed at once, and lease while delivery is attempted
+WEBHOOK_CLAIM_SIZE = 50
+WEBHOOK_LEASE_SECS = 120
+
+# exponential backoff for failed deliveries
+WEBHOOK_RETRY_SECS = 30
+WEBHOOK_MAX_RETRY_SECS = 3600
+WEBHOOK_MAX_ATTEMPTS = 8
+
+# seconds to wait for new notifications before checking for due retries
+WEBHOOK_POLL_SECS = 30
+
+
+# ============================================================================
+def get_webhook_url(org: Organization, notification: WebhookNotification) -> str | None:
+    """return org's webhook url for notification event, if configured"""
+    notify_logger = logger.bind(notification_id=notification.id, oid=org.id)
+
+    if not org.webhookUrls:
+        notify_logger.info(
+            "webhook_urls_not_configured",
+            unstructured_message="Webhook URLs not configured - skipping sending notification",
+        )
+        return None
+
+    webhook_url = getattr(org.webhookUrls, notification.event)
+    if not webhook_url:
+        notify_logger.info(
+            "webhook_url_not_configured_for_event",
+            event_type=notification.event,
+            unstructured_message=(
+                f"Webhook URL for event {notification.event} not configured, skipping"
+            ),
+        )
+        return None
+
+    return str(webhook_url)
+
+
+# ============================================================================
+class WebhookDispatcher:
+    """Delivers due webhook notifications, claimed from the queue in mongo
+    shared by all backend processes"""
+
+    org_ops: OrgOps
+
+    def __init__(self, webhooks, org_ops):
+        self.webhooks = webhooks
+        self.org_ops = org_ops
+
+        self.session: aiohttp.ClientSession | None = None
+        self.event = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.backlog_updated = 0.0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if not self.session or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=WEBHOOK_MAX_CONNECTIONS,
+                    limit_per_host=WEBHOOK_MAX_CONNECTIONS_PER_HOST,
+                ),
+                timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT_SECS),
+            )
+
+        return self.session
+
+    def wake(self):
+        """wake up dispatcher, starting it if not running in this process"""
+        self.event.set()
+        if not self.task or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        """deliver queued notifications until none are due, then wait for
+        new notifications or for retries to become due"""
+        while True:
+            try:
+                if await self.dispatch_batch():
+                    continue
+
+                await self._update_backlog()
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                logger.exception("webhook_dispatch_error", error=str(exc))
+
+            self.event.clear()
+            try:
+                await asyncio.wait_for(self.event.wait(), WEBHOOK_POLL_SECS)
+            except TimeoutError:
+                pass
+
+    async def _update_backlog(self):
+        """update backlog metric, at most once per poll interval"""
+        if time.monotonic() - self.backlog_updated < WEBHOOK_POLL_SECS:
+            return
+
+        self.backlog_updated = time.monotonic()
+        WEBHOOK_BACKLOG.set(
+            await self.webhooks.count_documents({"nextAttempt": {"$ne": None}})
+        )
+
+    async def claim_notifications(self) -> list[WebhookNotification]:
+        """claim due notifications, leasing them until delivery attempted"""
+        notifications: list[WebhookNotification] = []
+        while len(notifications) < WEBHOOK_CLAIM_SIZE:
+            now = dt_now()
+            res = await self.webhooks.find_one_and_update(
+                {"nextAttempt": {"$lte": now}},
+                {"$set": {"nextAttempt": now + timedelta(seconds=WEBHOOK_LEASE_SECS)}},
+                sort=[
+                    ("nextAttempt", pymongo.ASCENDING),
+                    ("created", pymongo.ASCENDING),
+                ],
+            )
+            if not res:
+                break
+
+            notifications.append(WebhookNotification.from_dict(res))
+
+        return notifications
+
+    async def dispatch_batch(self) -> int:
+        """deliver claimed notifications, concurrently across webhook urls and
+        in order for each url, returns number of notifications claimed"""
+        lease_until = time.monotonic() + WEBHOOK_LEASE_SECS
+        notifications = await self.claim_notifications()
+
+        orgs: dict[UUID, Organization | None] = {}
+        by_url: dict[str, list[WebhookNotification]] = defaultdict(list)
+
+        for notification in notifications:
+            if notification.oid not in orgs:
+                try:
+                    orgs[notification.oid] = await self.org_ops.get_org_by_id(
+                        notification.oid
+                    )
+                except HTTPException:
+                    orgs[notification.oid] = None
+
+            org = orgs[notification.oid]
+            url = get_webhook_url(org, notification) if org else None
+            if url:
+                by_url[url].append(notification)
+            else:
+                await self.webhooks.update_one(
+                    {"_id": notification.id}, {"$set": {"nextAttempt": None}}
+                )
+
+        await asyncio.gather(
+            *(
+                self.deliver_to_url(url, items, lease_until)
+                for url, items in by_url.items()
+            )
+        )
+
+        return len(notifications)
+
+    async def deliver_to_url(
+        self, url: str, notifications: list[WebhookNotification], lease_until: float
+    ):
+        """deliver notifications to one webhook url in order, batched into
+        a single request per WEBHOOK_BATCH_SIZE notifications if enabled.
+        Stops at the first failure, later notifications are retried after it"""
+        batch_size = max(WEBHOOK_BATCH_SIZE, 1)
+        for i in range(0, len(notifications), batch_size):
+            # keep undelivered notifications leased, so other processes don't
+            # deliver them while earlier requests to a slow url complete
+            if lease_until - time.monotonic() < WEBHOOK_TIMEOUT_SECS:
+                lease_until = await self._extend_lease(notifications[i:])
+
+            batch = notifications[i : i + batch_size]
+            if WEBHOOK_BATCH_SIZE > 1:
+                body: dict | list = [item.body.dict() for item in batch]
+            else:
+                body = batch[0].body.dict()
+
+            event = batch[0].event
+            success = False
+            start = time.monotonic()
+            try:
+                async with self._get_session().post(
+                    url, json=body, raise_for_status=True
+                ):
+                    success = True
+
+            # pylint: disable=broad-exception-caught
+            except Exception as exc:
+                logger.warning(
+                    "webhook_notification_failed",
+                    notification_id=batch[0].id,
+                    oid=batch[0].oid,
+                    event_type=event,
+                    batch_size=len(batch),
+                    error=str(exc),
+                    unstructured_message="Webhook notification failed",
+                )
+
+            WEBHOOK_REQUEST_DURATION.observe(
+                time.monotonic() - start, event, str(success).lower()
+            )
+
+            retry_at = await self._set_delivery_result(batch, success)
+            if retry_at:
+                await self._set_next_attempt(notifications[i + batch_size :], retry_at)
+                return
+
+    async def _extend_lease(self, notifications: list[WebhookNotification]) -> float:
+        await self._set_next_attempt(
+            notifications, dt_now() + timedelta(seconds=WEBHOOK_LEASE_SECS)
+        )
+        return time.monotonic() + WEBHOOK_LEASE_SECS
+
+    async def _set_next_attempt(
+        self, notifications: list[WebhookNotification], next_attempt: datetime
+    ):
+        if notifications:
+            await self.webhooks.update_many(
+                {"_id": {"$in": [item.id for item in notifications]}},
+                {"$set": {"nextAttempt": next_attempt}},
+            )
+
+    async def _set_delivery_result(
+        self, notifications: list[WebhookNotification], success: bool
+    ) -> datetime | None:
+        """record delivery attempt, returns when failed notifications are
+        retried, or None if delivered"""
+        now = dt_now()
+
+        if success:
+            await self.webhooks.update_many(
+                {"_id": {"$in": [item.id for item in notifications]}},
+                {
+                    "$set": {
+                        "success": True,
+                        "lastAttempted": now,
+                        "nextAttempt": None,
+                    },
+                    "$inc": {"attempts": 1},
+                },
+            )
+            for item in notifications:
+                WEBHOOK_DELIVERY_DELAY.observe(
+                    (now - item.created).total_seconds(), item.event
+                )
+            return None
+
+        retry_at = now
+        for item in notifications:
+            attempts = item.attempts + 1
+            next_attempt = None
+            if attempts < WEBHOOK_MAX_ATTEMPTS:
+                next_attempt = now + timedelta(
+                    seconds=min(
+                        WEBHOOK_RETRY_SECS * 2 ** (attempts - 1), WEBHOOK_MAX_RETRY_SECS
+                    )
+                )
+
+            await self.webhooks.update_one(
+                {"_id": item.id},
+                {
+                    "$set": {"lastAttempted": now, "nextAttempt": next_attempt},
+                    "$inc": {"attempts": 1},
+                },
+            )
+            retry_at = max(retry_at, next_attempt or now)
+
+        return retry_at
+
 
 # ============================================================================
 class EventWebhookOps:
@@ -49,14 +335,14 @@ class EventWebhookOps:
 
     def __init__(self, mdb, org_ops):
         self.webhooks = mdb["webhooks"]
-        self.colls = mdb["collections"]
-        self.crawls = mdb["crawls"]
 
         self.org_ops = org_ops
         self.crawl_ops = cast(CrawlOps, None)
 
         self.origin = None
 
+        self.dispatcher = WebhookDispatcher(self.webhooks, org_ops)
+
         self.router = APIRouter(
             prefix="/webhooks",
             tags=["webhooks"],
@@ -141,69 +427,38 @@ class EventWebhookOps:
 
         return WebhookNotification.from_dict(res)
 
-    @backoff.on_exception(
-        backoff.expo,
-        (aiohttp.ClientError, aiohttp.client_exceptions.ClientConnectorError),
-        max_tries=5,
-        max_time=60,
-    )
-    async def send_notification(
+    async def init_index(self):
+        """init index for webhook delivery"""
+        await self.webhooks.create_index("nextAttempt", sparse=True)
+
+    async def _add_notification(
         self, org: Organization, notification: WebhookNotification
     ):
-        """Send notification"""
-        notify_logger = logger.bind(notification_id=notification.id, oid=org.id)
+        """store notification, and queue for delivery if org has webhook url"""
+        if get_webhook_url(org, notification):
+            notification.nextAttempt = notification.created
 
-        if not org.webhookUrls:
-            notify_logger.info(
-                "webhook_urls_not_configured",
-                unstructured_message="Webhook URLs not configured - skipping sending notification",
-            )
-            return
+        await self.webhooks.insert_one(notification.to_dict())
 
-        webhook_url = getattr(org.webhookUrls, notification.event)
-        if not webhook_url:
-            notify_logger.info(
-                "webhook_url_not_configured_for_event",
-                event_type=notification.event,
-                unstructured_message=(
-                    f"Webhook URL for event {notification.event} not configured, skipping"
-                ),
-            )
+        if notification.nextAttempt:
+            self.dispatcher.wake()
+
+    async def retry_notification(
+        self, org: Organization, notification: WebhookNotification
+    ):
+        """queue notification for immediate delivery"""
+        if not get_webhook_url(org, notification):
             return
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.request(
-                    "POST",
-                    webhook_url,
-                    json=notification.body.dict(),
-                    raise_for_status=True,
-                ):
-                    await self.webhooks.find_one_and_update(
-                        {"_id": notification.id},
-                        {
-                            "$set": {
-                                "success": True,
-                                "lastAttempted": dt_now(),
-                            },
-                            "$inc": {"attempts": 1},
-                        },
-                    )
+        await self.webhooks.update_one(
+            {"_id": notification.id, "oid": org.id},
+            {"$set": {"nextAttempt": dt_now()}},
+        )
+        self.dispatcher.wake()
 
-        # pylint: disable=broad-exception-caught
-        except Exception:
-            notify_logger.exception(
-                "webhook_notification_failed",
-                event_type=notification.event,
-                unstructured_message="Webhook notification failed",
-            )
-            await self.webhooks.find_one_and_update(
-                {"_id": notification.id},
-                {
-                    "$set": {"lastAttempted": dt_now()},
-                    "$inc": {"attempts": 1},
-                },
-            )
+    def wake_dispatcher(self):
+        """wake up notification delivery"""
+        self.dispatcher.wake()
 
     async def _create_item_finished_notification(
         self,
@@ -235,9 +490,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
         if crawl.collectionIds:
             for coll_id in crawl.collectionIds:
@@ -260,9 +513,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def create_crawl_finished_notification(
         self, crawl_id: str, oid: UUID, state: str
@@ -327,9 +578,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def create_crawl_deleted_notification(
         self, crawl_id: str, org: Organization
@@ -409,9 +658,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def create_qa_analysis_started_notification(
         self, qa_run_id: str, oid: UUID, crawl_id: str
@@ -444,9 +691,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def create_crawl_reviewed_notification(
         self,
@@ -485,9 +730,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def _create_collection_items_modified_notification(
         self,
@@ -513,9 +756,7 @@ class EventWebhookOps:
             created=dt_now(),
         )
 
-        await self.webhooks.insert_one(notification.to_dict())
-
-        await self.send_notification(org, notification)
+        await self._add_notification(org, notification)
 
     async def create_added_to_collection_notification(
         self,
@@ -625,7 +866,7 @@ def init_event_webhooks_api(mdb, org_ops, app):
         org: Organization = Depends(org_owner_dep),
     ):
         notification = await ops.get_notification(org, notificationid)
-        run_async_task(ops.send_notification(org, notification))
+        await ops.retry_notification(org, notification)
         return {"success": True}
 
     init_openapi_webhooks(app)
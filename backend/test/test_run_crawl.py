@@ -286,7 +286,7 @@ def test_crawl_info(admin_auth_headers, default_org_id):
     assert data["fileSize"] == wacz_size
     assert data["fileCount"] == 1
     assert data["userName"]
-    assert data["version"] == 2
+    assert data["version"] == 3
     assert data["scale"] == 1
     assert data["browserWindows"] == 2
 
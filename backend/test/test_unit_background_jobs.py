@@ -7,6 +7,7 @@ from unittest.mock import AsyncMock, MagicMock
 import pytest
 from kubernetes_asyncio.client.exceptions import ApiException
 from kubernetes_asyncio.utils.create_from_yaml import FailToCreateError
+from pymongo.errors import DuplicateKeyError
 
 from btrixcloud.background_jobs import BackgroundJobOps
 from btrixcloud.models import (
@@ -54,12 +55,14 @@ _TYPE_EXTRAS = {
 
 @pytest.fixture
 def bg_job_ops():
+    crawl_manager = MagicMock()
+    crawl_manager.is_bg_worker_job = MagicMock(return_value=False)
     return BackgroundJobOps(
         mdb=MagicMock(),
         email=MagicMock(),
         user_manager=MagicMock(),
         org_ops=MagicMock(),
-        crawl_manager=MagicMock(),
+        crawl_manager=crawl_manager,
         storage_ops=MagicMock(),
     )
 
@@ -153,3 +156,81 @@ async def test_postprocess_upload_job_other_create_failure_returns_none(bg_job_o
         uuid.uuid4(), "upload-test-crawl"
     )
     assert job_id is None
+
+
+@pytest.mark.asyncio
+async def test_update_coll_stats_job_coalesced_when_pending(bg_job_ops):
+    """A stats request while a job for the collection is pending or running
+    marks that job dirty instead of starting another k8s job"""
+    bg_job_ops.crawl_manager.run_update_coll_stats_job = AsyncMock()
+    bg_job_ops.jobs.find_one_and_update = AsyncMock(
+        side_effect=[DuplicateKeyError("E11000"), {}]
+    )
+
+    coll_id = uuid.uuid4()
+    job_id = await bg_job_ops.create_update_collection_stats_job(uuid.uuid4(), coll_id)
+
+    assert job_id == f"update-coll-{coll_id}"
+    bg_job_ops.crawl_manager.run_update_coll_stats_job.assert_not_called()
+    args, _ = bg_job_ops.jobs.find_one_and_update.call_args
+    assert args == ({"_id": job_id, "finished": None}, {"$set": {"dirty": True}})
+
+
+@pytest.mark.asyncio
+async def test_update_coll_stats_job_dispatched_when_claimed(bg_job_ops):
+    bg_job_ops.crawl_manager.run_update_coll_stats_job = AsyncMock()
+    bg_job_ops.jobs.find_one_and_update = AsyncMock(return_value=None)
+
+    coll_id = uuid.uuid4()
+    job_id = await bg_job_ops.create_update_collection_stats_job(uuid.uuid4(), coll_id)
+
+    assert job_id == f"update-coll-{coll_id}"
+    bg_job_ops.crawl_manager.run_update_coll_stats_job.assert_awaited_once()
+    bg_job_ops.jobs.find_one_and_update.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_update_coll_stats_job_claim_released_on_failure(bg_job_ops):
+    bg_job_ops.crawl_manager.run_update_coll_stats_job = AsyncMock(
+        side_effect=FailToCreateError([ApiException(status=500)])
+    )
+    bg_job_ops.jobs.find_one_and_update = AsyncMock(return_value=None)
+
+    coll_id = uuid.uuid4()
+    job_id = await bg_job_ops.create_update_collection_stats_job(uuid.uuid4(), coll_id)
+
+    assert job_id is None
+    args, _ = bg_job_ops.jobs.find_one_and_update.call_args
+    assert args[0] == {"_id": f"update-coll-{coll_id}", "finished": None}
+    assert args[1]["$set"]["success"] is False
+
+
+@pytest.mark.asyncio
+async def test_dirty_update_coll_stats_job_redispatched_on_finish(bg_job_ops):
+    """Requests coalesced into a job are re-dispatched once it finishes,
+    if the collection still needs a stats update"""
+    oid = uuid.uuid4()
+    coll_id = uuid.uuid4()
+    job_id = f"update-coll-{coll_id}"
+
+    bg_job_ops.get_background_job = AsyncMock(
+        return_value=UpdateCollStatsJob(
+            id=job_id, oid=oid, collection_id=coll_id, started=datetime.now(UTC)
+        )
+    )
+    bg_job_ops.jobs.find_one_and_update = AsyncMock(return_value={"dirty": True})
+    bg_job_ops.coll_ops = MagicMock()
+    bg_job_ops.coll_ops.should_update_stats = AsyncMock(return_value=True)
+    bg_job_ops.create_update_collection_stats_job = AsyncMock()
+
+    await bg_job_ops.job_finished(
+        job_id,
+        BgJobType.UPDATE_COLL_STATS,
+        success=True,
+        finished=datetime.now(UTC),
+        oid=oid,
+    )
+
+    bg_job_ops.create_update_collection_stats_job.assert_awaited_once_with(
+        oid, coll_id
+    )
@@ -0,0 +1,113 @@
+"""Unit tests for long-running background job worker"""
+
+import uuid
+from datetime import UTC, datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from btrixcloud import bg_worker
+from btrixcloud.bg_worker import BgJobWorker, parse_concurrency
+from btrixcloud.models import BgJobType, PostProcessUploadJob, UpdateCollStatsJob
+
+
+def make_worker(jobs=None):
+    ops = MagicMock()
+    ops.background_job_ops.job_finished = AsyncMock()
+    ops.background_job_ops.get_background_job = AsyncMock()
+    ops.mdb = {"jobs": jobs or MagicMock()}
+    return BgJobWorker(ops)
+
+
+def test_parse_concurrency():
+    concurrency = parse_concurrency("update-coll-stats=8, delete-org=2,unknown=5,bad")
+    assert concurrency[BgJobType.UPDATE_COLL_STATS] == 8
+    assert concurrency[BgJobType.DELETE_ORG] == 2
+    assert concurrency[BgJobType.POSTPROCESS_UPLOAD] == 4
+    assert "unknown" not in concurrency
+
+
+@pytest.mark.asyncio
+async def test_claim_job_filters_unleased():
+    jobs = MagicMock()
+    jobs.find_one_and_update = AsyncMock(return_value={"_id": "job-1"})
+    worker = make_worker(jobs)
+
+    await worker.claim_job(BgJobType.UPDATE_COLL_STATS)
+
+    query, update = jobs.find_one_and_update.call_args.args
+    assert query["workerQueued"] is True
+    assert query["type"] == BgJobType.UPDATE_COLL_STATS
+    assert query["finished"] is None
+    assert {"leaseExpires": None} in query["$or"]
+    assert update["$set"]["leaseOwner"] == worker.worker_id
+    assert update["$inc"] == {"leaseAttempts": 1}
+    worker.background_job_ops.get_background_job.assert_awaited_once_with("job-1")
+
+
+@pytest.mark.asyncio
+async def test_claim_jobs_respects_concurrency():
+    worker = make_worker()
+    worker.concurrency = {
+        str(job_type): 0 for job_type in bg_worker.DEFAULT_CONCURRENCY
+    }
+    worker.concurrency[BgJobType.UPDATE_COLL_STATS] = 2
+
+    oid = uuid.uuid4()
+    jobs = [
+        UpdateCollStatsJob(
+            id=f"job-{i}",
+            oid=oid,
+            collection_id=uuid.uuid4(),
+            started=datetime.now(UTC),
+        )
+        for i in range(3)
+    ]
+    worker.claim_job = AsyncMock(side_effect=jobs)
+    worker.run_claimed_job = AsyncMock()
+
+    assert await worker.claim_jobs() == 2
+    assert worker.running_types[BgJobType.UPDATE_COLL_STATS] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_claimed_job_marks_finished(monkeypatch):
+    run_job = AsyncMock(return_value=0)
+    monkeypatch.setattr(bg_worker, "run_job", run_job)
+
+    worker = make_worker()
+    oid = uuid.uuid4()
+    job = PostProcessUploadJob(
+        id="job-1", oid=oid, crawl_id="upload-1", started=datetime.now(UTC)
+    )
+    job.leaseAttempts = 1
+    worker.running_types[job.type] = 1
+
+    await worker.run_claimed_job(job)
+
+    assert run_job.call_args.kwargs["crawl_type"] == "upload"
+    assert run_job.call_args.kwargs["crawl_id"] == "upload-1"
+    assert run_job.call_args.kwargs["oid"] == str(oid)
+    finished = worker.background_job_ops.job_finished.call_args
+    assert finished.kwargs["success"] is True
+    assert worker.running_types[job.type] == 0
+
+
+@pytest.mark.asyncio
+async def test_run_claimed_job_fails_after_max_attempts(monkeypatch):
+    run_job = AsyncMock(return_value=0)
+    monkeypatch.setattr(bg_worker, "run_job", run_job)
+
+    worker = make_worker()
+    job = PostProcessUploadJob(
+        id="job-1", oid=uuid.uuid4(), crawl_id="upload-1", started=datetime.now(UTC)
+    )
+    job.leaseAttempts = worker.max_attempts + 1
+    worker.running_types[job.type] = 1
+
+    await worker.run_claimed_job(job)
+
+    run_job.assert_not_called()
+    finished = worker.background_job_ops.job_finished.call_args
+    assert finished.kwargs["success"] is False
+
@@ -0,0 +1,153 @@
+"""Unit tests for fair-share crawl admission"""
+
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from btrixcloud.models import Organization, StorageRef
+from btrixcloud.operator.admission import CrawlAdmission
+from btrixcloud.operator.models import CrawlSpec
+from btrixcloud.utils import date_to_str, dt_now
+
+ORGS = {
+    name: Organization(
+        id=uuid.uuid4(), name=name, slug=name, storage=StorageRef(name="default")
+    )
+    for name in ("big", "small")
+}
+
+
+def make_crawl(crawl_id, org="big", scheduled=False, qa=False, age=0, timeout=0):
+    return CrawlSpec(
+        id=crawl_id,
+        cid=uuid.uuid4(),
+        oid=ORGS[org].id,
+        org=ORGS[org],
+        storage=StorageRef(name="default"),
+        started=date_to_str(dt_now() - timedelta(seconds=age)),
+        crawler_channel="default",
+        scheduled=scheduled,
+        timeout=timeout,
+        qa_source_crawl_id="source" if qa else None,
+    )
+
+
+def test_disabled_admits_all():
+    admission = CrawlAdmission(0, warmup_secs=0)
+    assert admission.request(make_crawl("a"), 100) == (True, None, None)
+    assert not admission.running
+
+
+def test_admit_until_capacity():
+    admission = CrawlAdmission(4, warmup_secs=0)
+    assert admission.request(make_crawl("a"), 2)[0]
+    assert admission.request(make_crawl("b"), 2)[0]
+
+    admitted, position, est_start = admission.request(make_crawl("c"), 2)
+    assert not admitted
+    assert position == 1
+    assert est_start
+
+    admission.release("a")
+    assert admission.request(make_crawl("c"), 2)[0]
+
+
+def test_warmup_delays_admission():
+    admission = CrawlAdmission(4, warmup_secs=60)
+    admitted, position, _ = admission.request(make_crawl("a"), 2)
+    assert not admitted
+    assert position == 1
+
+
+def test_fair_share_across_orgs():
+    admission = CrawlAdmission(4, warmup_secs=0)
+    admission.set_running(make_crawl("big-1", scheduled=True), 4)
+
+    # big org queues a burst of scheduled crawls before small org's crawl
+    for i in range(3):
+        admission.request(make_crawl(f"big-{i + 2}", scheduled=True, age=60), 2)
+
+    _, position, _ = admission.request(make_crawl("small-1", "small", True), 2)
+    assert position == 1
+
+
+def test_manual_ahead_of_scheduled_and_qa():
+    admission = CrawlAdmission(2, warmup_secs=0)
+    admission.set_running(make_crawl("running"), 2)
+
+    admission.request(make_crawl("qa", "small", qa=True, age=120), 2)
+    admission.request(make_crawl("scheduled", "small", scheduled=True, age=60), 2)
+    admission.request(make_crawl("manual", "small"), 2)
+
+    queue, num_fit, _ = admission.get_queue()
+    assert [entry.crawl_id for entry in queue] == ["manual", "scheduled", "qa"]
+    assert num_fit == 0
+
+
+def test_large_crawl_not_starved():
+    admission = CrawlAdmission(4, warmup_secs=0)
+    admission.set_running(make_crawl("running", "small"), 2)
+
+    admitted, position, _ = admission.request(make_crawl("large", age=60), 4)
+    assert not admitted
+    assert position == 1
+
+    # smaller crawl queued later doesn't jump ahead into free slots
+    admitted, position, _ = admission.request(make_crawl("small", "small"), 2)
+    assert not admitted
+    assert position == 2
+
+
+def test_estimate_uses_running_crawl_timeouts():
+    admission = CrawlAdmission(2, warmup_secs=0)
+    admission.request(make_crawl("running", timeout=600), 2)
+
+    _, _, est_start = admission.request(make_crawl("waiting", "small"), 2)
+    expected = dt_now() + timedelta(seconds=600)
+    assert abs((est_start - expected).total_seconds()) <= 2
+
+
+def test_queue_order_matches_fair_share_and_is_cached():
+    admission = CrawlAdmission(40, warmup_secs=3600)
+    rng = random.Random(7)
+    orgs = list(ORGS)
+    for i in range(10):
+        admission.set_running(make_crawl(f"running-{i}", rng.choice(orgs)), 3)
+
+    for i in range(60):
+        crawl = make_crawl(
+            f"waiting-{i}",
+            rng.choice(orgs),
+            scheduled=rng.random() < 0.5,
+            qa=rng.random() < 0.2,
+            age=rng.randrange(600),
+        )
+        admission.request(crawl, rng.randrange(1, 6))
+
+    # reference: repeatedly take the entry with the smallest fair share
+    used = defaultdict(int)
+    for entry in admission.running.values():
+        used[entry.oid] += entry.slots
+
+    pending = list(admission.waiting.values())
+    expected = []
+    while pending:
+        entry = min(
+            pending,
+            key=lambda e: ((used[e.oid] + e.slots) / e.weight, e.since, e.crawl_id),
+        )
+        pending.remove(entry)
+        used[entry.oid] += entry.slots
+        expected.append(entry.crawl_id)
+
+    queue, _, _ = admission.get_queue()
+    assert [entry.crawl_id for entry in queue] == expected
+    assert admission.get_queue()[0] is queue
+
+    _, position, _ = admission.request(make_crawl(expected[5]), 1)
+    assert position == 6
+    assert admission.get_queue()[0] is queue
+
+    admission.release("running-0")
+    assert admission.get_queue()[0] is not queue
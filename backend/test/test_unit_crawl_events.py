@@ -0,0 +1,143 @@
+"""Unit tests for live crawl status events"""
+
+import asyncio
+import json
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+
+from btrixcloud.crawl_events import CRAWL_EVENTS_QUEUE_SIZE, CrawlEventOps
+
+
+def get_change(coll, doc):
+    return {"ns": {"db": "browsertrixcloud", "coll": coll}, "fullDocument": doc}
+
+
+@pytest.fixture
+def event_ops():
+    ops = CrawlEventOps(MagicMock())
+    # don't start change stream watch
+    ops.watch_task = MagicMock()
+    ops.watch_task.done.return_value = False
+    return ops
+
+
+def get_messages(queue: asyncio.Queue) -> list[tuple[str, dict]]:
+    messages = []
+    while not queue.empty():
+        event, data = queue.get_nowait().strip().split("\n")
+        messages.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_only_changed_fields_sent_to_org(event_ops):
+    """Clients of an org get deltas of its crawls, unchanged updates are
+    skipped and other orgs' crawls are not sent"""
+    oid = uuid.uuid4()
+    queue = event_ops.subscribe(oid)
+    other_queue = event_ops.subscribe(uuid.uuid4())
+
+    crawl = {
+        "_id": "crawl-1",
+        "oid": oid,
+        "type": "crawl",
+        "state": "running",
+        "stats": {"found": 10, "done": 1, "size": 100},
+        "fileCount": 0,
+    }
+    event_ops.handle_change(get_change("crawls", crawl))
+    event_ops.handle_change(get_change("crawls", crawl))
+    event_ops.handle_change(
+        get_change("crawls", {**crawl, "stats": {"found": 10, "done": 2, "size": 200}})
+    )
+    workflow = {"_id": "cid-1", "oid": oid, "isCrawlRunning": True}
+    event_ops.handle_change(get_change("crawl_configs", workflow))
+    event_ops.handle_change(
+        get_change("crawls", {"_id": "upload-1", "oid": oid, "type": "upload"})
+    )
+
+    messages = get_messages(queue)
+    assert len(messages) == 3
+    assert messages[0][0] == "crawl"
+    assert messages[0][1]["state"] == "running"
+    assert messages[1] == (
+        "crawl",
+        {"id": "crawl-1", "stats": {"found": 10, "done": 2, "size": 200}},
+    )
+    assert messages[2][0] == "workflow"
+    assert messages[2][1]["isCrawlRunning"] is True
+
+    assert other_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_slow_client_stream_ended(event_ops):
+    """A client whose queue is full is removed and its stream ended"""
+    oid = uuid.uuid4()
+    queue = event_ops.subscribe(oid)
+
+    for done in range(CRAWL_EVENTS_QUEUE_SIZE + 1):
+        crawl = {"_id": "crawl-1", "oid": oid, "type": "crawl", "stats": {"done": done}}
+        event_ops.handle_change(get_change("crawls", crawl))
+
+    assert queue not in event_ops.subscribers[oid]
+
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    assert items[-1] is None
+
+
+@pytest.mark.asyncio
+async def test_stream_unsubscribes_on_close(event_ops):
+    """Event stream ends when closed, and removes its client"""
+    oid = uuid.uuid4()
+    stream = event_ops.stream_events(oid)
+
+    assert await stream.__anext__() == ": connected\n\n"
+    assert event_ops.num_subscribers() == 1
+
+    event_ops._close_all()
+    with pytest.raises(StopAsyncIteration):
+        await stream.__anext__()
+
+    assert event_ops.num_subscribers() == 0
+
+
+@pytest.mark.asyncio
+async def test_new_client_gets_full_values(event_ops):
+    """A client connecting after a crawl was last sent gets all its fields on
+    the next event, existing clients only get the delta"""
+    oid = uuid.uuid4()
+    queue = event_ops.subscribe(oid)
+
+    crawl = {"_id": "crawl-1", "oid": oid, "type": "crawl", "state": "running"}
+    event_ops.handle_change(get_change("crawls", crawl))
+    get_messages(queue)
+
+    late_queue = event_ops.subscribe(oid)
+    event_ops.handle_change(get_change("crawls", {**crawl, "fileCount": 1}))
+
+    assert get_messages(queue) == [("crawl", {"id": "crawl-1", "fileCount": 1})]
+    late = get_messages(late_queue)
+    assert late[0][1]["state"] == "running"
+    assert late[0][1]["fileCount"] == 1
+
+
+@pytest.mark.asyncio
+async def test_close_all_with_full_queue(event_ops):
+    """Closing streams ends clients whose queue is full"""
+    oid = uuid.uuid4()
+    queue = event_ops.subscribe(oid)
+    for index in range(CRAWL_EVENTS_QUEUE_SIZE):
+        queue.put_nowait(str(index))
+
+    event_ops._close_all()
+
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    assert items[-1] is None
+    assert not event_ops.sent_keys
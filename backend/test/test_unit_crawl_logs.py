@@ -0,0 +1,284 @@
+"""Unit tests for batched crawl log ingest and log segments in storage"""
+
+import json
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+import pymongo
+import pytest
+
+from btrixcloud import crawl_logs
+from btrixcloud.crawl_logs import CrawlLogOps
+from btrixcloud.models import StorageRef
+
+
+class AsyncCursor:
+    """Minimal async-iterable stand-in for a motor cursor"""
+
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def sort(self, *_args):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._docs:
+            raise StopAsyncIteration
+        return self._docs.pop(0)
+
+
+def get_line(index, level="info", context="general"):
+    return json.dumps(
+        {
+            "timestamp": f"2024-01-01T00:00:{index:02}Z",
+            "logLevel": level,
+            "context": context,
+            "message": f"line {index}",
+        }
+    )
+
+
+@pytest.fixture
+def log_ops():
+    ops = CrawlLogOps(MagicMock(), MagicMock(), MagicMock())
+    ops.logs = MagicMock()
+    ops.segments = MagicMock()
+    return ops
+
+
+@pytest.mark.asyncio
+async def test_add_log_lines_idempotent(log_ops):
+    """Batch is added in one insert with ids derived from each line and its
+    position, so re-adding it after a failure ignores lines already added,
+    while identical lines are kept"""
+    log_ops.logs.insert_many = AsyncMock()
+
+    lines = [get_line(1), "not json", get_line(2, "error"), get_line(2, "error")]
+    assert await log_ops.add_log_lines("crawl-1", uuid4(), lines) == 3
+
+    log_ops.logs.insert_many.assert_awaited_once()
+    docs = log_ops.logs.insert_many.call_args.args[0]
+    assert [doc["message"] for doc in docs] == ["line 1", "line 2", "line 2"]
+    assert docs[1]["_id"] != docs[2]["_id"]
+
+    await log_ops.add_log_lines("crawl-1", uuid4(), lines, offset=4)
+    moved = log_ops.logs.insert_many.call_args.args[0]
+    assert moved[0]["_id"] != docs[0]["_id"]
+
+    log_ops.logs.insert_many = AsyncMock(
+        side_effect=pymongo.errors.BulkWriteError(
+            {"writeErrors": [{"code": 11000}, {"code": 11000}]}
+        )
+    )
+    assert await log_ops.add_log_lines("crawl-1", uuid4(), lines) == 3
+    retried = log_ops.logs.insert_many.call_args.args[0]
+    assert [doc["_id"] for doc in retried] == [doc["_id"] for doc in docs]
+
+    log_ops.logs.insert_many = AsyncMock(
+        side_effect=pymongo.errors.BulkWriteError({"writeErrors": [{"code": 2}]})
+    )
+    with pytest.raises(pymongo.errors.BulkWriteError):
+        await log_ops.add_log_lines("crawl-1", uuid4(), lines)
+
+
+@pytest.mark.asyncio
+async def test_segment_round_trip(log_ops, monkeypatch):
+    """Logs moved to a segment are read back by page, reading only the
+    blocks for the page, with filters and either sort direction"""
+    monkeypatch.setattr(crawl_logs, "CRAWL_LOG_SEGMENTS_ENABLED", True)
+    monkeypatch.setattr(crawl_logs, "CRAWL_LOG_SEGMENT_BLOCK_LINES", 3)
+
+    oid = uuid4()
+    start = datetime(2024, 1, 1)
+    docs = [
+        {
+            "_id": uuid4(),
+            "crawlId": "crawl-1",
+            "oid": oid,
+            "qaRunId": None,
+            "timestamp": start + timedelta(seconds=index),
+            "logLevel": "error" if index % 4 == 0 else "info",
+            "context": "general",
+            "message": f"line {index}",
+            "details": None,
+        }
+        for index in range(10)
+    ]
+
+    org = MagicMock(id=oid, storage=StorageRef(name="default"))
+    log_ops.org_ops.get_org_by_id = AsyncMock(return_value=org)
+
+    stored = {}
+
+    async def upload(_org, filename, data):
+        stored[filename] = data
+
+    reads = []
+
+    async def get_file_range(_org, _storage, filename, range_start, range_end):
+        reads.append((range_start, range_end))
+        return stored[filename][range_start : range_end + 1]
+
+    log_ops.storage_ops.do_upload_single = upload
+    log_ops.storage_ops.get_file_range = get_file_range
+
+    log_ops.logs.find = lambda _query: AsyncCursor(docs)
+    log_ops.logs.find_one = AsyncMock(return_value=None)
+    log_ops.logs.delete_many = AsyncMock()
+    log_ops.segments.find_one = AsyncMock(return_value=None)
+    log_ops.segments.insert_one = AsyncMock()
+
+    await log_ops.move_logs_to_segment("crawl-1", oid)
+
+    segment = log_ops.segments.insert_one.call_args.args[0]
+    assert segment["filename"] == f"{oid}/logs/crawl-1.log.gz"
+    assert segment["total"] == 10
+    assert len(segment["blocks"]) == 4
+    log_ops.logs.delete_many.assert_awaited_once_with(
+        {"_id": {"$in": [doc["_id"] for doc in docs]}}
+    )
+
+    log_ops.segments.find_one = AsyncMock(side_effect=lambda _query: dict(segment))
+
+    lines, total = await log_ops.get_crawl_logs(
+        org, "crawl-1", page_size=2, page=2, sort_direction=1
+    )
+    assert total == 10
+    assert [line.message for line in lines] == ["line 2", "line 3"]
+    # one read of the two blocks with lines on the page
+    blocks = segment["blocks"]
+    assert reads == [(0, blocks[0]["length"] + blocks[1]["length"] - 1)]
+
+    lines, total = await log_ops.get_crawl_logs(org, "crawl-1", page_size=4)
+    assert [line.message for line in lines] == [f"line {i}" for i in (9, 8, 7, 6)]
+    assert lines[0].id == docs[9]["_id"]
+
+    lines, total = await log_ops.get_crawl_logs(
+        org, "crawl-1", page_size=2, log_levels=["error"]
+    )
+    assert total == 3
+    assert [line.message for line in lines] == ["line 8", "line 4"]
+
+
+@pytest.mark.asyncio
+async def test_late_lines_merged_then_folded(log_ops, monkeypatch):
+    """Lines added after logs were moved are merged with the segment's lines
+    when read, without writing, and folded into a new segment replacing it
+    when logs are moved again. The replaced file is kept for readers until
+    the segment is replaced again"""
+    monkeypatch.setattr(crawl_logs, "CRAWL_LOG_SEGMENTS_ENABLED", True)
+
+    oid = uuid4()
+    start = datetime(2024, 1, 1)
+
+    def get_doc(index):
+        return {
+            "_id": uuid4(),
+            "crawlId": "crawl-1",
+            "oid": oid,
+            "qaRunId": None,
+            "timestamp": start + timedelta(seconds=index),
+            "logLevel": "info",
+            "context": "general",
+            "message": f"line {index}",
+            "details": None,
+        }
+
+    org = MagicMock(id=oid, storage=StorageRef(name="default"))
+    log_ops.org_ops.get_org_by_id = AsyncMock(return_value=org)
+
+    stored = {}
+
+    async def upload(_org, filename, data):
+        stored[filename] = data
+
+    async def delete_file(_org, filename, _storage):
+        del stored[filename]
+
+    async def get_file_range(_org, _storage, filename, range_start, range_end):
+        return stored[filename][range_start : range_end + 1]
+
+    log_ops.storage_ops.do_upload_single = upload
+    log_ops.storage_ops.delete_file = delete_file
+    log_ops.storage_ops.get_file_range = get_file_range
+
+    segments = []
+
+    async def find_segment(_query):
+        return dict(segments[-1]) if segments else None
+
+    async def insert_segment(segment):
+        segments.append(segment)
+
+    async def replace_segment(query, segment):
+        current = segments[-1]
+        if query != {"_id": current["_id"], "filename": current["filename"]}:
+            return MagicMock(matched_count=0)
+        segments.append(segment)
+        return MagicMock(matched_count=1)
+
+    log_ops.segments.find_one = find_segment
+    log_ops.segments.insert_one = insert_segment
+    log_ops.segments.replace_one = replace_segment
+    log_ops.logs.delete_many = AsyncMock()
+
+    def set_db_logs(docs):
+        log_ops.logs.find = lambda _query: AsyncCursor(docs)
+        log_ops.logs.find_one = AsyncMock(return_value=docs[0] if docs else None)
+        log_ops.logs.aggregate = MagicMock()
+        log_ops.logs.aggregate.return_value.to_list = AsyncMock(
+            return_value=[
+                {
+                    "items": [dict(doc) for doc in docs],
+                    "total": [{"count": len(docs)}],
+                }
+            ]
+        )
+
+    set_db_logs([get_doc(index) for index in (0, 2)])
+    await log_ops.move_logs_to_segment("crawl-1", oid)
+
+    # line added after logs were moved
+    late_docs = [get_doc(1)]
+    set_db_logs(late_docs)
+
+    lines, total = await log_ops.get_crawl_logs(
+        org, "crawl-1", page_size=2, page=1, sort_direction=1
+    )
+    assert total == 3
+    assert [line.message for line in lines] == ["line 0", "line 1"]
+    assert len(segments) == 1
+
+    await log_ops.move_logs_to_segment("crawl-1", oid)
+    assert segments[1]["_id"] == segments[0]["_id"]
+    assert segments[1]["prevFilename"] == segments[0]["filename"]
+    assert set(stored) == {segments[0]["filename"], segments[1]["filename"]}
+    log_ops.logs.delete_many.assert_awaited_with(
+        {"_id": {"$in": [late_docs[0]["_id"]]}}
+    )
+
+    set_db_logs([])
+    lines, total = await log_ops.get_crawl_logs(
+        org, "crawl-1", page_size=5, sort_direction=1
+    )
+    assert [line.message for line in lines] == ["line 0", "line 1", "line 2"]
+
+    # another process replaced the segment after it was read, so the file
+    # written is removed and lines are kept in db
+    stale = dict(segments[1])
+    segments.append({**stale, "filename": "other.log.gz"})
+    stored["other.log.gz"] = stored[stale["filename"]]
+    before = set(stored)
+
+    set_db_logs([get_doc(3)])
+    log_ops.logs.delete_many.reset_mock()
+    log_ops.segments.find_one = AsyncMock(return_value=stale)
+
+    await log_ops.move_logs_to_segment("crawl-1", oid)
+    assert len(segments) == 3
+    assert set(stored) == before
+    log_ops.logs.delete_many.assert_not_awaited()
@@ -0,0 +1,147 @@
+"""Unit tests for CrawlOps crawl queue matching and snapshot reuse"""
+
+import asyncio
+import contextlib
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from btrixcloud import crawls
+from btrixcloud.crawls import CrawlOps
+
+
+class FakeQueueRedis:
+    """Minimal stand-in for a crawl redis with a sorted set queue"""
+
+    def __init__(self, urls):
+        self.entries = [json.dumps({"url": url}) for url in urls]
+        self.script_calls = 0
+
+    async def zcard(self, key):
+        return len(self.entries)
+
+    async def evalsha(self, sha, numkeys, *args):
+        self.script_calls += 1
+        await asyncio.sleep(0)
+        offset, count = args[numkeys:]
+        return [json.loads(e)["url"] for e in self.entries[offset : offset + count]]
+
+
+@pytest.fixture
+def crawl_ops():
+    ops = CrawlOps(
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+    )
+    ops.get_crawl_state = AsyncMock(return_value=("running", None))
+    return ops
+
+
+def _use_redis(ops, redis):
+    @contextlib.asynccontextmanager
+    async def get_redis(crawl_id):
+        yield redis
+
+    ops.get_redis = get_redis
+
+
+@pytest.mark.asyncio
+async def test_match_queue_reuses_snapshot(crawl_ops):
+    """Successive regex edits match against the same snapshot"""
+    redis = FakeQueueRedis(
+        [f"https://example.com/page-{i}" for i in range(120)]
+        + ["https://other.example.org/"]
+    )
+    _use_redis(crawl_ops, redis)
+
+    res = await crawl_ops.match_crawl_queue("crawl-1", "other")
+    assert res.total == 121
+    assert [str(url) for url in res.matched] == ["https://other.example.org/"]
+    assert res.nextOffset == -1
+    assert redis.script_calls == 1
+
+    res = await crawl_ops.match_crawl_queue("crawl-1", r"page-1\d\d$")
+    assert len(res.matched) == 20
+    assert redis.script_calls == 1
+
+
+@pytest.mark.asyncio
+async def test_match_queue_rescans_when_queue_changes(crawl_ops):
+    """A large change in queue size invalidates the snapshot"""
+    redis = FakeQueueRedis([f"https://example.com/{i}" for i in range(100)])
+    _use_redis(crawl_ops, redis)
+
+    await crawl_ops.match_crawl_queue("crawl-1", "example")
+    assert redis.script_calls == 1
+
+    redis.entries = redis.entries[:10]
+    res = await crawl_ops.match_crawl_queue("crawl-1", "example")
+    assert res.total == 10
+    assert len(res.matched) == 10
+    assert redis.script_calls == 2
+
+
+@pytest.mark.asyncio
+async def test_match_queue_concurrent_fill(crawl_ops):
+    """Concurrent requests fill the shared snapshot only once"""
+    redis = FakeQueueRedis([f"https://example.com/{i}" for i in range(300)])
+    _use_redis(crawl_ops, redis)
+
+    results = await asyncio.gather(
+        crawl_ops.match_crawl_queue("crawl-1", "example"),
+        crawl_ops.match_crawl_queue("crawl-1", "example"),
+    )
+    assert [len(res.matched) for res in results] == [300, 300]
+    assert len(crawl_ops.queue_snapshots["crawl-1"].urls) == 300
+
+
+@pytest.mark.asyncio
+async def test_match_queue_bounds_total_snapshot_urls(crawl_ops, monkeypatch):
+    """Oldest snapshots of other crawls are dropped past the total url limit"""
+    monkeypatch.setattr(crawls, "QUEUE_SNAPSHOT_MAX_TOTAL_URLS", 250)
+    for crawl_id in ("crawl-1", "crawl-2", "crawl-3"):
+        _use_redis(
+            crawl_ops, FakeQueueRedis([f"https://example.com/{i}" for i in range(100)])
+        )
+        await crawl_ops.match_crawl_queue(crawl_id, "example")
+
+    assert list(crawl_ops.queue_snapshots) == ["crawl-2", "crawl-3"]
+
+    # the snapshot being matched is kept even if over the limit on its own
+    _use_redis(
+        crawl_ops, FakeQueueRedis([f"https://example.com/{i}" for i in range(300)])
+    )
+    await crawl_ops.match_crawl_queue("crawl-4", "example")
+
+    assert list(crawl_ops.queue_snapshots) == ["crawl-4"]
+
+
+@pytest.mark.asyncio
+async def test_match_queue_offset(crawl_ops):
+    """Matching from an offset only returns urls at or after it"""
+    redis = FakeQueueRedis([f"https://example.com/{i}" for i in range(200)])
+    _use_redis(crawl_ops, redis)
+
+    res = await crawl_ops.match_crawl_queue("crawl-1", "example", 150)
+    assert len(res.matched) == 50
+    assert str(res.matched[0]) == "https://example.com/150"
+
+
+@pytest.mark.asyncio
+async def test_match_queue_invalid_regex(crawl_ops):
+    _use_redis(crawl_ops, FakeQueueRedis([]))
+
+    with pytest.raises(HTTPException) as exc:
+        await crawl_ops.match_crawl_queue("crawl-1", "(")
+
+    assert exc.value.detail == "invalid_regex"
@@ -0,0 +1,64 @@
+"""Unit tests for adaptive crawl job resync intervals"""
+
+from btrixcloud.operator.resync import CrawlResync
+
+SPEC = {"id": "crawl-1", "scale": 1, "stopping": False}
+
+PODS = {"crawl-crawl-1-0": {"status": {"phase": "Running"}}}
+
+
+def get_status(pages_done=0, used_memory=100):
+    return {
+        "state": "running",
+        "pagesDone": pages_done,
+        "lastActiveTime": f"2024-01-01T00:00:{pages_done:02}Z",
+        "podStatus": {
+            "crawl-crawl-1-0": {"used": {"memory": used_memory}, "exitCode": None}
+        },
+    }
+
+
+def test_unchanged_crawl_backs_off():
+    """Interval doubles while nothing changes, ignoring resource usage and
+    timestamps, and snaps back when pages are crawled"""
+    resync = CrawlResync(min_secs=10, max_secs=60)
+
+    intervals = [
+        resync.get_resync_after("crawl-1", SPEC, get_status(0, used), PODS)
+        for used in (100, 200, 300, 400, 500)
+    ]
+    assert intervals == [10, 20, 40, 60, 60]
+
+    assert resync.get_resync_after("crawl-1", SPEC, get_status(5), PODS) == 10
+
+
+def test_spec_change_and_fast_retry_reset_interval():
+    """User actions updating the spec and fast retries reset the interval"""
+    resync = CrawlResync(min_secs=10, max_secs=60)
+
+    resync.get_resync_after("crawl-1", SPEC, get_status(), PODS)
+    assert resync.get_resync_after("crawl-1", SPEC, get_status(), PODS) == 20
+
+    stopping = {**SPEC, "stopping": True}
+    assert resync.get_resync_after("crawl-1", stopping, get_status(), PODS) == 10
+
+    assert resync.get_resync_after("crawl-1", stopping, get_status(), PODS) == 20
+    assert resync.get_resync_after("crawl-1", stopping, get_status(), PODS, 3) == 3
+    assert resync.get_resync_after("crawl-1", stopping, get_status(), PODS) == 20
+
+
+def test_sync_budget_stretches_intervals():
+    """With more crawls than fit in the sync budget, intervals are stretched"""
+    resync = CrawlResync(min_secs=10, max_secs=60, max_syncs_per_sec=1)
+
+    for i in range(10):
+        assert resync.get_resync_after(f"crawl-{i}", SPEC, get_status(), PODS) == 10
+
+    # 20 crawls every 10 seconds is twice the budget
+    for i in range(10, 20):
+        resync.get_resync_after(f"crawl-{i}", SPEC, get_status(), PODS)
+    assert resync.get_resync_after("crawl-0", SPEC, get_status(1), PODS) == 20
+
+    for i in range(10, 20):
+        resync.remove(f"crawl-{i}")
+    assert resync.get_resync_after("crawl-0", SPEC, get_status(2), PODS) == 10
@@ -0,0 +1,41 @@
+"""Unit tests for mongo client pool options, read routing and time limits"""
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import SecondaryPreferred
+
+from btrixcloud import db
+
+
+def test_pool_options_per_role(monkeypatch):
+    """Pool sizes default per role and can be set per role"""
+    monkeypatch.setenv("MONGO_OPERATOR_MAX_POOL_SIZE", "25")
+    monkeypatch.delenv("MONGO_OPERATOR_MIN_POOL_SIZE", raising=False)
+    monkeypatch.delenv("MONGO_BG_MAX_POOL_SIZE", raising=False)
+    monkeypatch.delenv("MONGO_MAX_IDLE_TIME_MS", raising=False)
+
+    assert db.get_pool_options("operator") == {"maxPoolSize": 25, "minPoolSize": 5}
+    assert db.get_pool_options("bg")["maxPoolSize"] == 20
+
+    monkeypatch.setenv("MONGO_MAX_IDLE_TIME_MS", "60000")
+    assert db.get_pool_options("api")["maxIdleTimeMS"] == 60000
+
+
+def test_analytics_reads_and_max_time(monkeypatch):
+    """Analytics reads use configured read preference, and aggregations get
+    the default or per-collection time limit"""
+    client = AsyncIOMotorClient("mongodb://localhost:27017", connect=False)
+    pages = client["browsertrixcloud"]["pages"]
+
+    read_pref = db.analytics_reads(pages).read_preference
+    assert isinstance(read_pref, SecondaryPreferred)
+    assert pages.read_preference.mongos_mode == "primary"
+
+    monkeypatch.setattr(db, "ANALYTICS_READ_PREFERENCE", "primary")
+    assert db.analytics_reads(pages) is pages
+
+    monkeypatch.setattr(db, "MAX_TIME_MS", 30000)
+    assert db.max_time(pages) == {"maxTimeMS": 30000}
+
+    monkeypatch.setenv("MONGO_MAX_TIME_MS_PAGES", "0")
+    assert not db.max_time(pages)
+    assert db.max_time(client["browsertrixcloud"]["crawls"]) == {"maxTimeMS": 30000}
@@ -0,0 +1,179 @@
+"""Unit tests for queued email delivery and pooled SMTP connections"""
+
+import json
+import smtplib
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from btrixcloud.emailsender import (
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_SMTP_TIMEOUT_SECS,
+    EmailSender,
+    SMTPConnectionPool,
+)
+
+
+@pytest.fixture
+def email_sender(monkeypatch):
+    monkeypatch.setenv("EMAIL_TEMPLATE_ENDPOINT", "http://emails/api/emails")
+    monkeypatch.setenv("EMAIL_SMTP_HOST", "smtp.example.com")
+    monkeypatch.setenv("EMAIL_SENDER", "sender@example.com")
+    monkeypatch.setenv("EMAIL_PASSWORD", "password")
+    monkeypatch.setenv("LOG_SENT_EMAILS", "")
+
+    sender = EmailSender()
+    sender._render = AsyncMock(return_value=("<p>hi</p>", "hi", "Subject"))
+
+    emails = MagicMock()
+    emails.insert_one = AsyncMock()
+    emails.find_one_and_update = AsyncMock()
+    emails.delete_one = AsyncMock()
+    emails.update_one = AsyncMock()
+    sender.set_mdb({"email_queue": emails})
+
+    # don't start delivery loop
+    sender.delivery_task = MagicMock()
+    sender.delivery_task.done.return_value = False
+    return sender
+
+
+def queued_email(sender, attempts=0):
+    body = json.dumps({"text": "hi", "html": ""}).encode()
+    return {
+        "_id": "email-id",
+        "receiver": "user@example.com",
+        "template": "invite",
+        "subject": "Subject",
+        "body": sender.cipher.encrypt(body).decode(),
+        "attempts": attempts,
+    }
+
+
+@pytest.mark.asyncio
+async def test_send_queues_email(email_sender):
+    email_sender.smtp_pool.send_batch = AsyncMock()
+
+    await email_sender._send_encrypted("user@example.com", "invite", token="abc")
+
+    email_sender.smtp_pool.send_batch.assert_not_awaited()
+    email = email_sender.emails.insert_one.call_args.args[0]
+    assert email["receiver"] == "user@example.com"
+    assert email["template"] == "invite"
+    assert email["attempts"] == 0
+    assert email_sender.queue_event.is_set()
+
+    # rendered text and html are only stored encrypted
+    assert "text" not in email and "html" not in email
+    body = json.loads(email_sender.cipher.decrypt(email["body"].encode()))
+    assert body == {"text": "hi", "html": "<p>hi</p>"}
+
+
+@pytest.mark.asyncio
+async def test_deliver_batch(email_sender):
+    email_sender.emails.find_one_and_update.side_effect = [
+        queued_email(email_sender),
+        dict(queued_email(email_sender), _id="email-2"),
+        None,
+    ]
+    email_sender.smtp_pool.send_batch = AsyncMock(return_value=[None, None])
+
+    assert await email_sender.deliver_batch() == 2
+
+    msgs = email_sender.smtp_pool.send_batch.call_args.args[0]
+    assert len(msgs) == 2
+    assert msgs[0]["To"] == "user@example.com"
+    assert msgs[0].get_content().strip() == "hi"
+    assert email_sender.emails.delete_one.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_retried_then_failed(email_sender):
+    error = smtplib.SMTPDataError(451, "try again")
+    email_sender.smtp_pool.send_batch = AsyncMock(return_value=[error])
+
+    email_sender.emails.find_one_and_update.side_effect = [
+        queued_email(email_sender),
+        None,
+    ]
+    await email_sender.deliver_batch()
+
+    update = email_sender.emails.update_one.call_args.args[1]["$set"]
+    assert update["attempts"] == 1
+    assert update["nextAttempt"]
+    email_sender.emails.delete_one.assert_not_awaited()
+
+    email_sender.emails.find_one_and_update.side_effect = [
+        queued_email(email_sender, attempts=EMAIL_MAX_ATTEMPTS - 1),
+        None,
+    ]
+    await email_sender.deliver_batch()
+
+    update = email_sender.emails.update_one.call_args.args[1]["$set"]
+    assert update["attempts"] == EMAIL_MAX_ATTEMPTS
+    assert update["nextAttempt"] is None
+
+
+@pytest.mark.asyncio
+async def test_undecryptable_email_not_sent(email_sender):
+    email_sender.smtp_pool.send_batch = AsyncMock(return_value=[])
+    email_sender.emails.find_one_and_update.side_effect = [
+        dict(queued_email(email_sender), body="invalid"),
+        None,
+    ]
+
+    await email_sender.deliver_batch()
+
+    email_sender.smtp_pool.send_batch.assert_awaited_once_with([])
+    update = email_sender.emails.update_one.call_args.args[1]["$set"]
+    assert update["attempts"] == 1
+    assert update["lastError"] == "queued email can't be decrypted"
+
+
+@pytest.mark.asyncio
+async def test_start_delivery_runs_one_loop(email_sender):
+    email_sender.delivery_task = None
+    email_sender.run_delivery = AsyncMock()
+
+    email_sender.start_delivery()
+    task = email_sender.delivery_task
+    email_sender.start_delivery()
+    assert email_sender.delivery_task is task
+
+    await task
+    email_sender.run_delivery.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_authenticated_connection():
+    pool = SMTPConnectionPool("smtp.example.com", 587, True, "user", "password")
+
+    with patch("btrixcloud.emailsender.smtplib.SMTP") as smtp:
+        server = smtp.return_value
+        assert await pool.send_batch(["msg1", "msg2"]) == [None, None]
+        assert await pool.send_batch(["msg3"]) == [None]
+
+    smtp.assert_called_once_with(
+        "smtp.example.com", 587, timeout=EMAIL_SMTP_TIMEOUT_SECS
+    )
+    server.starttls.assert_called_once()
+    server.login.assert_called_once_with("user", "password")
+    assert server.send_message.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_pool_reconnects_when_disconnected():
+    pool = SMTPConnectionPool("smtp.example.com", 25, False, "user", "")
+
+    with patch("btrixcloud.emailsender.smtplib.SMTP") as smtp:
+        server = smtp.return_value
+        assert await pool.send_batch(["msg1"]) == [None]
+
+        server.send_message.side_effect = [
+            smtplib.SMTPServerDisconnected("closed"),
+            None,
+        ]
+        assert await pool.send_batch(["msg2"]) == [None]
+
+    assert smtp.call_count == 2
+    server.login.assert_not_called()
@@ -0,0 +1,61 @@
+"""Unit tests for prometheus metrics rendering and cardinality limits"""
+
+from types import SimpleNamespace
+
+from btrixcloud import metrics
+from btrixcloud.metrics import Counter, Histogram
+
+
+def test_histogram_render_cumulative():
+    hist = Histogram("test_latency_seconds", "test", ["op"], buckets=(0.1, 1))
+    hist.observe(0.05, "find")
+    hist.observe(0.5, "find")
+    hist.observe(5, "find")
+
+    lines = hist.render()
+    assert 'test_latency_seconds_bucket{op="find",le="0.1"} 1.0' in lines
+    assert 'test_latency_seconds_bucket{op="find",le="1"} 2.0' in lines
+    assert 'test_latency_seconds_bucket{op="find",le="+Inf"} 3.0' in lines
+    assert 'test_latency_seconds_count{op="find"} 3.0' in lines
+    assert 'test_latency_seconds_sum{op="find"} 5.55' in lines
+
+
+def test_counter_series_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_SERIES_PER_METRIC", 2)
+    counter = Counter("test_events_total", "test", ["route"])
+    for i in range(10):
+        counter.inc(f"/path/{i}")
+
+    lines = counter.render()
+    assert 'test_events_total{route="/path/0"} 1.0' in lines
+    assert 'test_events_total{route="other"} 8.0' in lines
+    assert len(lines) == 5
+
+
+def test_http_request_labeled_by_route_template():
+    request = SimpleNamespace(
+        method="GET",
+        scope={"route": SimpleNamespace(path="/api/orgs/{oid}/crawls")},
+    )
+    response = SimpleNamespace(status_code=200)
+    metrics.observe_http_request(request, response, 0.01)
+
+    unmatched = SimpleNamespace(method="GET", scope={})
+    metrics.observe_http_request(unmatched, None, 0.01)
+
+    rendered = metrics.render_metrics()
+    assert 'route="/api/orgs/{oid}/crawls",status="2xx"' in rendered
+    assert 'route="unmatched",status="5xx"' in rendered
+
+
+def test_operator_sync_counts_redis_calls():
+    with metrics.track_operator_sync("TestJob"):
+        # pylint: disable=protected-access
+        metrics._count_redis_call()
+        metrics._count_redis_call()
+
+    # calls outside of a sync are not counted
+    metrics._count_redis_call()
+
+    lines = metrics.OPERATOR_SYNC_REDIS_CALLS.render()
+    assert 'btrix_operator_sync_redis_calls_sum{kind="TestJob"} 2.0' in lines
@@ -0,0 +1,124 @@
+"""Unit tests for batched, resumable migrations"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from btrixcloud.migrations import BatchedMigration
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args):
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    def _matching(self, query):
+        last_id = query.get("_id", {}).get("$gt", -1)
+        return [doc for doc in self.docs if doc["_id"] > last_id]
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        return FakeCursor(self._matching(query))
+
+    async def count_documents(self, query):
+        return len(self._matching(query))
+
+
+class DoubleMigration(BatchedMigration):
+    collection = "items"
+    batch_size = 3
+
+    def __init__(self, mdb):
+        super().__init__(mdb, migration_version="9999")
+        self.migrated = []
+
+    async def migrate_doc(self, doc):
+        # let other workers run between documents
+        await asyncio.sleep(0)
+        self.migrated.append(doc["_id"])
+
+
+def make_migration(monkeypatch, docs, checkpoint=None, workers=3):
+    monkeypatch.setenv("MIGRATION_WORKERS", str(workers))
+
+    progress = MagicMock()
+    progress.find_one = AsyncMock(return_value=checkpoint)
+    progress.update_one = AsyncMock()
+    progress.delete_one = AsyncMock()
+
+    colls = {"items": FakeCollection(docs), "migration_progress": progress}
+    mdb = MagicMock()
+    mdb.__getitem__ = MagicMock(side_effect=colls.__getitem__)
+
+    return DoubleMigration(mdb), progress
+
+
+@pytest.mark.asyncio
+async def test_all_docs_migrated_by_workers(monkeypatch):
+    docs = [{"_id": i} for i in range(10)]
+    migration, progress = make_migration(monkeypatch, docs)
+    assert migration.num_workers == 3
+
+    await migration.migrate_up()
+
+    assert sorted(migration.migrated) == list(range(10))
+    progress.delete_one.assert_awaited_once_with({"_id": "9999"})
+
+    first = progress.update_one.call_args_list[0]
+    assert first.args[1]["$set"]["total"] == 10
+    assert first.kwargs["upsert"]
+
+    last = progress.update_one.call_args.args[1]["$set"]
+    assert last["lastId"] == 9
+    assert last["count"] == 10
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_only_advances_over_completed_batches(monkeypatch):
+    docs = [{"_id": i} for i in range(9)]
+    migration, progress = make_migration(monkeypatch, docs)
+
+    await migration.migrate_up()
+
+    checkpoints = [
+        call.args[1]["$set"] for call in progress.update_one.call_args_list[1:]
+    ]
+    # each checkpoint is at the end of a batch, in order
+    assert [cp["lastId"] for cp in checkpoints] == sorted(
+        cp["lastId"] for cp in checkpoints
+    )
+    assert all(cp["lastId"] % 3 == 2 for cp in checkpoints)
+    assert all(cp["count"] == cp["lastId"] + 1 for cp in checkpoints)
+
+
+@pytest.mark.asyncio
+async def test_resume_from_checkpoint(monkeypatch):
+    docs = [{"_id": i} for i in range(10)]
+    checkpoint = {"_id": "9999", "lastId": 5, "count": 6}
+    migration, progress = make_migration(monkeypatch, docs, checkpoint, workers=1)
+
+    await migration.migrate_up()
+
+    assert migration.migrated == [6, 7, 8, 9]
+    assert migration.mdb["items"].queries == [{"_id": {"$gt": 5}}]
+    assert progress.update_one.call_args_list[0].args[1]["$set"]["total"] == 10
+    assert progress.update_one.call_args.args[1]["$set"]["count"] == 10
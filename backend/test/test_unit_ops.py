@@ -0,0 +1,47 @@
+"""Unit tests for lazily initialized ops classes"""
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from btrixcloud.colls import CollectionOps
+from btrixcloud.ops import LazyOpsRef, Ops
+from btrixcloud.pages import PageOps
+
+
+@pytest.fixture
+def ops():
+    ops = Ops()
+    ops.dbclient = MagicMock()
+    ops.mdb = MagicMock()
+    return ops
+
+
+def test_only_used_ops_created(ops):
+    coll_ops = ops.coll_ops
+
+    assert isinstance(coll_ops, CollectionOps)
+    assert ops.is_created("coll_ops")
+    assert not ops.is_created("crawl_manager")
+    assert not ops.is_created("storage_ops")
+    assert not ops.is_created("page_ops")
+
+    assert isinstance(coll_ops.crawl_manager, LazyOpsRef)
+    assert isinstance(coll_ops.page_ops, LazyOpsRef)
+
+
+def test_lazy_ref_creates_on_access(ops):
+    coll_ops = ops.coll_ops
+
+    # attribute access through stand-in creates page ops once
+    assert coll_ops.page_ops.pages is ops.page_ops.pages
+    assert ops.is_created("page_ops")
+    assert isinstance(ops.page_ops, PageOps)
+    assert ops.page_ops is ops.page_ops
+
+
+def test_created_deps_passed_directly(ops):
+    page_ops = ops.page_ops
+    coll_ops = ops.coll_ops
+
+    assert coll_ops.page_ops is page_ops
@@ -0,0 +1,168 @@
+"""Unit tests for splitting org exec time across quotas in one update"""
+
+import copy
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from btrixcloud.orgs import BaseOrgs, OrgOps
+from btrixcloud.utils import dt_now
+
+YYMM = "2025-06"
+
+MISSING = object()
+
+
+def get_path(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return MISSING
+        doc = doc[part]
+    return doc
+
+
+def set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    if value is MISSING:
+        doc.pop(parts[-1], None)
+    else:
+        doc[parts[-1]] = value
+
+
+def evaluate(expr, doc):
+    """evaluate the subset of aggregation expressions used for exec time"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return get_path(doc, expr[1:])
+    if not isinstance(expr, dict):
+        return expr
+
+    ((op, args),) = expr.items()
+    values = [evaluate(arg, doc) for arg in args]
+    if op == "$ifNull":
+        return values[1] if values[0] in (MISSING, None) else values[0]
+    if op == "$cond":
+        return values[1] if values[0] else values[2]
+    if op == "$or":
+        return any(values)
+    if op == "$gt":
+        return values[0] > values[1]
+    if op == "$min":
+        return min(values)
+    if op == "$max":
+        return max(values)
+    if op == "$add":
+        return sum(values)
+    if op == "$subtract":
+        return values[0] - values[1]
+    if op == "$multiply":
+        return values[0] * values[1]
+    raise NotImplementedError(op)
+
+
+def apply_pipeline(doc, pipeline):
+    doc = copy.deepcopy(doc)
+    for stage in pipeline:
+        if "$unset" in stage:
+            doc.pop(stage["$unset"], None)
+            continue
+
+        values = {key: evaluate(expr, doc) for key, expr in stage["$set"].items()}
+        for key, value in values.items():
+            set_path(doc, key, value)
+    return doc
+
+
+def get_org_doc(monthly_quota=0, gifted=0, extra=0, monthly_used=0):
+    doc = {
+        "quotas": {
+            "maxExecMinutesPerMonth": monthly_quota,
+            "giftedExecMinutes": gifted,
+            "extraExecMinutes": extra,
+        },
+        "crawlExecSeconds": {},
+        "monthlyExecSeconds": {},
+        "giftedExecSeconds": {},
+        "extraExecSeconds": {},
+        "giftedExecSecondsAvailable": gifted * 60,
+        "extraExecSecondsAvailable": extra * 60,
+    }
+    if monthly_used:
+        doc["monthlyExecSeconds"][YYMM] = monthly_used
+    return doc
+
+
+def test_no_quotas():
+    doc = apply_pipeline(get_org_doc(), BaseOrgs().get_exec_seconds_update(YYMM, 100))
+    assert doc["crawlExecSeconds"] == {YYMM: 100}
+    assert doc["monthlyExecSeconds"] == {}
+    assert doc["giftedExecSeconds"] == {}
+    assert doc["extraExecSeconds"] == {}
+    assert "_exec" not in doc
+
+
+def test_within_monthly_quota():
+    doc = get_org_doc(monthly_quota=10, gifted=1, extra=1, monthly_used=60)
+    doc = apply_pipeline(doc, BaseOrgs().get_exec_seconds_update(YYMM, 100))
+    assert doc["crawlExecSeconds"] == {YYMM: 100}
+    assert doc["monthlyExecSeconds"] == {YYMM: 160}
+    assert doc["giftedExecSeconds"] == {}
+    assert doc["giftedExecSecondsAvailable"] == 60
+
+
+def test_overage_uses_gifted_then_extra():
+    doc = get_org_doc(monthly_quota=1, gifted=1, extra=1, monthly_used=30)
+    doc = apply_pipeline(doc, BaseOrgs().get_exec_seconds_update(YYMM, 100))
+    assert doc["crawlExecSeconds"] == {YYMM: 100}
+    # 30 secs left in monthly quota, then 60 gifted, then 10 extra
+    assert doc["monthlyExecSeconds"] == {YYMM: 60}
+    assert doc["giftedExecSeconds"] == {YYMM: 60}
+    assert doc["giftedExecSecondsAvailable"] == 0
+    assert doc["extraExecSeconds"] == {YYMM: 10}
+    assert doc["extraExecSecondsAvailable"] == 50
+
+
+def test_overage_past_all_quotas():
+    doc = get_org_doc(monthly_quota=1, extra=1, monthly_used=90)
+    doc = apply_pipeline(doc, BaseOrgs().get_exec_seconds_update(YYMM, 100))
+    assert doc["crawlExecSeconds"] == {YYMM: 100}
+    # monthly quota already exceeded, not incremented further
+    assert doc["monthlyExecSeconds"] == {YYMM: 90}
+    assert doc["extraExecSeconds"] == {YYMM: 60}
+    assert doc["extraExecSecondsAvailable"] == 0
+
+
+def test_concurrent_updates_split_correctly():
+    # two crawls in the same org, each applied atomically in turn
+    doc = get_org_doc(monthly_quota=1, gifted=1)
+    update = BaseOrgs().get_exec_seconds_update(YYMM, 45)
+    doc = apply_pipeline(apply_pipeline(doc, update), update)
+    assert doc["crawlExecSeconds"] == {YYMM: 90}
+    assert doc["monthlyExecSeconds"] == {YYMM: 60}
+    assert doc["giftedExecSeconds"] == {YYMM: 30}
+    assert doc["giftedExecSecondsAvailable"] == 30
+
+
+@pytest.mark.asyncio
+async def test_inc_org_time_stats_single_update():
+    mdb = MagicMock()
+    orgs = MagicMock()
+    orgs.update_one = AsyncMock()
+    mdb.__getitem__ = MagicMock(return_value=orgs)
+
+    org_ops = OrgOps(MagicMock(), mdb, MagicMock(), MagicMock(), MagicMock())
+    oid = "org-id"
+
+    await org_ops.inc_org_time_stats(oid, 100, is_exec_time=True)
+    assert orgs.update_one.await_count == 1
+    query, update = orgs.update_one.call_args.args
+    assert query == {"_id": oid}
+    assert isinstance(update, list)
+
+    yymm = dt_now().strftime("%Y-%m")
+    await org_ops.inc_org_time_stats(oid, 5, is_exec_time=True, is_qa=True)
+    assert orgs.update_one.call_args.args[1] == {
+        "$inc": {f"qaCrawlExecSeconds.{yymm}": 5}
+    }
+    assert orgs.update_one.await_count == 2
@@ -0,0 +1,92 @@
+"""Unit tests for org snapshots used by the operator"""
+
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from btrixcloud.models import Organization, StorageRef
+from btrixcloud.orgs import OrgOps
+
+
+def get_org_dict(**kwargs):
+    return Organization(
+        id=uuid.uuid4(),
+        name="Test Organization",
+        slug="test-org",
+        storage=StorageRef(name="test-storage"),
+        **kwargs,
+    ).to_dict()
+
+
+@pytest.fixture
+def org_ops():
+    orgs = MagicMock()
+    orgs.find_one = AsyncMock()
+    orgs.find_one_and_update = AsyncMock()
+    orgs.update_one = AsyncMock()
+
+    mdb = MagicMock()
+    mdb.__getitem__ = MagicMock(return_value=orgs)
+
+    org_ops = OrgOps(MagicMock(), mdb, MagicMock(), MagicMock(), MagicMock())
+    # don't start change stream watch
+    org_ops.org_snapshot_watch = MagicMock()
+    return org_ops
+
+
+@pytest.mark.asyncio
+async def test_snapshot_reused_until_fresh_requested(org_ops):
+    org_dict = get_org_dict()
+    org_ops.orgs.find_one.side_effect = lambda *args, **kwargs: dict(org_dict)
+
+    org = await org_ops.get_org_snapshot(org_dict["_id"])
+    again = await org_ops.get_org_snapshot(org_dict["_id"])
+
+    assert again is org
+    assert org_ops.orgs.find_one.await_count == 1
+
+    await org_ops.get_org_snapshot(org_dict["_id"], fresh=True)
+    assert org_ops.orgs.find_one.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_org_update_refreshes_snapshot(org_ops):
+    org_dict = get_org_dict()
+    oid = org_dict["_id"]
+    org_ops.orgs.find_one.side_effect = lambda *args, **kwargs: dict(org_dict)
+    await org_ops.get_org_snapshot(oid)
+
+    updated = dict(org_dict, bytesStored=100)
+    org_ops.orgs.find_one_and_update.return_value = updated
+
+    await org_ops.inc_org_bytes_stored(oid, 100)
+
+    org_ops.orgs.update_one.assert_not_awaited()
+    org = await org_ops.get_org_snapshot(oid)
+    assert org.bytesStored == 100
+    assert org_ops.orgs.find_one.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_org_update_without_snapshot(org_ops):
+    oid = uuid.uuid4()
+    await org_ops.inc_org_time_stats(oid, 10, is_exec_time=True)
+
+    org_ops.orgs.update_one.assert_awaited_once()
+    org_ops.orgs.find_one_and_update.assert_not_awaited()
+    assert oid not in org_ops.org_snapshots
+
+
+@pytest.mark.asyncio
+async def test_watch_stops_without_change_streams(org_ops):
+    stream = MagicMock()
+    stream.__aenter__ = AsyncMock(
+        side_effect=OperationFailure("not a replica set", code=40573)
+    )
+    org_ops.orgs.watch = MagicMock(return_value=stream)
+
+    await org_ops.watch_org_snapshots()
+
+    org_ops.orgs.watch.assert_called_once()
@@ -1,10 +1,14 @@
-"""Unit tests for PageOps page-count idempotency"""
+"""Unit tests for PageOps page counts, compact page storage and QA histograms"""
 
+import math
 from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
 
+import pymongo
 import pytest
 
-from btrixcloud.pages import PageOps
+from btrixcloud.models import Page, PageOutWithSingleQA, PageQACompare
+from btrixcloud.pages import QA_SCORE_BINS, QA_SCORE_MAX, PageOps, get_qa_score_bin
 
 
 class AsyncCursor:
@@ -72,3 +76,402 @@ async def test_all_duplicate_insert_does_not_raise_or_inc(page_ops: PageOps):
     await page_ops._add_pages_to_db("crawl-1", [page], ordered=False)
 
     page_ops.crawls.find_one_and_update.assert_not_awaited()
+
+
+def test_page_from_dict_is_stored_compact(page_ops: PageOps):
+    """New pages have host set and omit empty and default values"""
+    page = page_ops._get_page_from_dict(
+        {
+            "id": "2ee72e44-2a4b-4a5d-9b9a-0b2a0f9b1e11",
+            "url": "https://Example.com:8080/path?q=1",
+            "ts": "2024-01-01T00:00:00Z",
+            "loadState": 4,
+            "status": 200,
+            "title": "Example",
+        },
+        "crawl-1",
+        uuid4(),
+        new_uuid=False,
+    )
+
+    assert page.host == "example.com:8080"
+
+    stored = page.to_compact_dict()
+    assert stored["host"] == "example.com:8080"
+    assert stored["title"] == "Example"
+    for field in ("isSeed", "isFile", "isError", "notes", "approved", "favIconUrl"):
+        assert field not in stored
+
+    loaded = Page.from_dict(dict(stored))
+    assert loaded.isSeed is False
+    assert loaded.notes == []
+    assert loaded.host == "example.com:8080"
+
+
+def test_page_trusted_read_matches_from_dict():
+    """Trusted reads skip url parsing but load the same page as from_dict"""
+    doc = {
+        "_id": uuid4(),
+        "oid": uuid4(),
+        "crawl_id": "crawl-1",
+        "url": "https://example.com/",
+        "ts": "2024-01-01T00:00:00Z",
+        "status": 200,
+        "qa": {"screenshotMatch": 0.5, "resourceCounts": {"crawlGood": 3}},
+        "notes": [
+            {
+                "id": uuid4(),
+                "text": "checked",
+                "created": "2024-01-02T00:00:00Z",
+                "userid": uuid4(),
+                "userName": "user",
+            }
+        ],
+    }
+
+    validated = PageOutWithSingleQA.from_dict(dict(doc))
+    trusted = PageOutWithSingleQA.from_dict_trusted(dict(doc))
+    assert trusted == validated
+    assert trusted.notes[0].created == validated.notes[0].created
+
+    # stored urls are not parsed again
+    doc["url"] = "not a url"
+    assert PageOutWithSingleQA.from_dict_trusted(dict(doc)).url == "not a url"
+
+
+@pytest.mark.asyncio
+async def test_top_page_hosts_groups_by_stored_host(page_ops: PageOps):
+    """Host is only extracted from url while unmigrated crawls remain"""
+    page_ops.pages.aggregate = MagicMock()
+    page_ops.pages.aggregate.return_value.to_list = AsyncMock(
+        return_value=[{"_id": "example.com", "count": 3}]
+    )
+
+    page_ops.crawls.find_one = AsyncMock(return_value=None)
+    res = await page_ops.get_top_page_hosts(["crawl-1"])
+    assert res == [{"host": "example.com", "count": 3}]
+
+    pipeline = page_ops.pages.aggregate.call_args.args[0]
+    assert pipeline[1]["$group"]["_id"] == "$host"
+
+    page_ops.crawls.find_one = AsyncMock(return_value={"_id": "crawl-1"})
+    await page_ops.get_top_page_hosts(["crawl-1"])
+
+    pipeline = page_ops.pages.aggregate.call_args.args[0]
+    assert pipeline[1]["$group"]["_id"]["$ifNull"][0] == "$host"
+
+
+class UrlCursor(AsyncCursor):
+    """Sorted url cursor, counting how many docs were read"""
+
+    def __init__(self, docs):
+        super().__init__(docs)
+        self.read = 0
+
+    def sort(self, _sort):
+        return self
+
+    def limit(self, limit):
+        self._docs = self._docs[:limit]
+        return self
+
+    def batch_size(self, _size):
+        return self
+
+    async def __anext__(self):
+        doc = await super().__anext__()
+        self.read += 1
+        return doc
+
+    async def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_url_counts_only_reads_urls_returned(page_ops: PageOps):
+    """Only enough urls are read to fill the page, and snapshots are grouped
+    for just those urls"""
+    oid = uuid4()
+    page_ops.coll_ops.get_collection_crawl_ids = AsyncMock(return_value=["c1", "c2"])
+
+    urls = ["https://a.example/", "https://a.example/", "https://b.example/"]
+    urls += [f"https://c.example/{num}" for num in range(100)]
+    cursor = UrlCursor([{"url": url} for url in urls])
+    page_ops.pages.find = MagicMock(return_value=cursor)
+
+    page_a1, page_a2, page_b = uuid4(), uuid4(), uuid4()
+    page_ops.pages.aggregate = MagicMock(
+        return_value=AsyncCursor(
+            [
+                {
+                    "_id": "https://b.example/",
+                    "snapshots": [{"pageId": page_b, "status": 404}],
+                },
+                {
+                    "_id": "https://a.example/",
+                    "snapshots": [{"pageId": page_a1}, {"pageId": page_a2}],
+                },
+            ]
+        )
+    )
+
+    res = await page_ops.list_page_url_counts(uuid4(), oid, page_size=2)
+
+    assert [(str(count.url), count.count) for count in res] == [
+        ("https://a.example/", 2),
+        ("https://b.example/", 1),
+    ]
+    assert [snap.pageId for snap in res[0].snapshots] == [page_a1, page_a2]
+    assert res[0].snapshots[0].status == 200
+    assert res[1].snapshots[0].status == 404
+
+    # stops at the first url past the page
+    assert cursor.read == 4
+
+    match = page_ops.pages.aggregate.call_args.args[0][0]["$match"]
+    assert match["url"] == {"$in": ["https://a.example/", "https://b.example/"]}
+    assert match["crawl_id"] == {"$in": ["c1", "c2"]}
+    assert match["oid"] == oid
+
+
+@pytest.mark.asyncio
+async def test_url_counts_stops_scan_for_few_urls(page_ops: PageOps, monkeypatch):
+    """With fewer distinct urls in the scanned pages than the page size, the
+    scan stops at its limit and the remaining urls are grouped in the db"""
+    monkeypatch.setattr("btrixcloud.pages.URL_SCAN_PAGES_PER_URL", 2)
+    page_ops.coll_ops.get_collection_crawl_ids = AsyncMock(return_value=["c1"])
+
+    cursor = UrlCursor([{"url": "https://a.example/"}] * 100)
+    page_ops.pages.find = MagicMock(return_value=cursor)
+    page_ops.pages.aggregate = MagicMock(
+        side_effect=[
+            AsyncCursor([{"_id": "https://b.example/"}]),
+            AsyncCursor([]),
+        ]
+    )
+
+    res = await page_ops.list_page_url_counts(uuid4(), uuid4(), page_size=3)
+
+    assert [str(count.url) for count in res] == [
+        "https://a.example/",
+        "https://b.example/",
+    ]
+    assert cursor.read == 6
+
+    pipeline = page_ops.pages.aggregate.call_args_list[0].args[0]
+    assert pipeline[0]["$match"]["url"] == {"$nin": ["https://a.example/"]}
+    assert pipeline[3] == {"$limit": 2}
+
+
+def test_qa_score_bins_match_bucket_boundaries():
+    """Scores are binned as compared with boundaries on bin edges"""
+    for index in range(QA_SCORE_BINS):
+        edge = index / QA_SCORE_BINS
+        assert get_qa_score_bin(edge) == index
+        if index:
+            assert get_qa_score_bin(math.nextafter(edge, 0)) == index - 1
+
+    assert get_qa_score_bin(1) == QA_SCORE_BINS
+    assert get_qa_score_bin(1.05) == QA_SCORE_BINS
+    for score in (None, -0.1, 1.1, True, "0.5"):
+        assert get_qa_score_bin(score) is None
+
+
+@pytest.mark.asyncio
+async def test_qa_aggregate_counts_from_histogram(page_ops: PageOps):
+    """Bucket counts are summed from recomputed histogram, unless thresholds
+    are not on bin edges"""
+    scores = [0.0, 0.1, 0.29, 0.3, 0.5, 0.75, 0.999, 1.0, None]
+    pages = [{"qa": {"qa-1": {"screenshotMatch": score}}} for score in scores]
+    pages.append({})
+    page_ops.pages.find = MagicMock(return_value=AsyncCursor(pages))
+    page_ops.qa_histograms.replace_one = AsyncMock()
+
+    histogram = await page_ops.recompute_qa_run_histogram("crawl-1", "qa-1")
+    assert histogram["total"] == 10
+    page_ops.qa_histograms.replace_one.assert_awaited_once()
+
+    page_ops.pages.aggregate = MagicMock()
+    thresholds = {"screenshotMatch": [0.3, 0.75]}
+    res = await page_ops.get_qa_run_aggregate_counts(
+        "crawl-1", "qa-1", thresholds, histogram=histogram
+    )
+    page_ops.pages.aggregate.assert_not_called()
+
+    assert [(bucket.lowerBoundary, bucket.count) for bucket in res] == [
+        ("0.0", 3),
+        ("0.3", 2),
+        ("0.75", 3),
+        ("No data", 2),
+    ]
+
+    page_ops.pages.aggregate.return_value.to_list = AsyncMock(return_value=[])
+    thresholds = {"screenshotMatch": [0.3333]}
+    await page_ops.get_qa_run_aggregate_counts(
+        "crawl-1", "qa-1", thresholds, histogram=histogram
+    )
+    page_ops.pages.aggregate.assert_called_once()
+
+
+def test_qa_histogram_scores_below_first_boundary(page_ops: PageOps):
+    """Scores below the first boundary are counted as no data"""
+    histogram = {
+        "total": 3,
+        "screenshotMatch": {
+            str(get_qa_score_bin(score)): 1 for score in (0.2, 0.6, 0.95)
+        },
+    }
+    res = page_ops._get_histogram_bucket_counts(
+        histogram, "screenshotMatch", [0.5, 0.9, QA_SCORE_MAX]
+    )
+    assert res == [
+        {"_id": 0.5, "count": 1},
+        {"_id": 0.9, "count": 1},
+        {"_id": "No data", "count": 1},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_qa_rescored_page_moves_histogram_bin(page_ops: PageOps):
+    """Re-scoring a page moves it between bins, rather than counting it twice"""
+    page_ops.pages.find_one_and_update = AsyncMock(
+        return_value={"qa": {"qa-1": {"screenshotMatch": 0.5, "textMatch": 0.9}}}
+    )
+    page_ops.qa_histograms.update_one = AsyncMock()
+
+    compare = PageQACompare(screenshotMatch=0.25, textMatch=0.9)
+    await page_ops.add_qa_run_for_page(uuid4(), uuid4(), "qa-1", "crawl-1", compare)
+
+    page_ops.qa_histograms.update_one.assert_awaited_once_with(
+        {"_id": "qa-1"},
+        {"$inc": {"screenshotMatch.500": -1, "screenshotMatch.250": 1}},
+    )
+
+
+@pytest.mark.asyncio
+async def test_qa_pages_batch_bulk_write(page_ops: PageOps):
+    """QA pages are updated with one bulk write, only pages missing from the
+    crawl are inserted and histogram bin moves are summed per batch"""
+    oid = uuid4()
+    scored_id = uuid4()
+    unscored_id = uuid4()
+    new_id = uuid4()
+
+    page_ops.pages.find = MagicMock(
+        return_value=AsyncCursor(
+            [
+                {
+                    "_id": scored_id,
+                    "qa": {"qa-1": {"screenshotMatch": 0.5, "textMatch": 0.9}},
+                },
+                {"_id": unscored_id},
+            ]
+        )
+    )
+    page_ops.pages.insert_many = AsyncMock()
+    page_ops.pages.insert_one = AsyncMock()
+    bulk_result = MagicMock()
+    bulk_result.matched_count = 4
+    page_ops.pages.bulk_write = AsyncMock(return_value=bulk_result)
+    page_ops.qa_histograms.update_many = AsyncMock()
+    page_ops.qa_histograms.update_one = AsyncMock()
+
+    def page_dict(page_id, screenshot):
+        return {
+            "id": str(page_id),
+            "url": "https://example.com/",
+            "ts": "2024-01-01T00:00:00Z",
+            "comparison": {"screenshotMatch": screenshot, "textMatch": 0.9},
+        }
+
+    summary = await page_ops.add_qa_pages_to_db(
+        [
+            page_dict(scored_id, 0.25),
+            page_dict(unscored_id, 0.25),
+            page_dict(new_id, 0.75),
+            # re-scored within the same batch
+            page_dict(new_id, 0.8),
+            {"id": str(uuid4()), "url": "https://example.com/missing"},
+        ],
+        "crawl-1",
+        "qa-1",
+        oid,
+    )
+
+    assert summary == {
+        "pages": 5,
+        "invalid": 0,
+        "inserted": 2,
+        "updated": 4,
+        "missingCompare": 1,
+    }
+
+    page_ops.pages.insert_one.assert_not_awaited()
+    inserted = page_ops.pages.insert_many.call_args.args[0]
+    assert new_id in [doc["_id"] for doc in inserted]
+    assert len(inserted) == 2
+    page_ops.qa_histograms.update_many.assert_awaited_once_with(
+        {"crawl_id": "crawl-1"}, {"$inc": {"total": 2}}
+    )
+
+    page_ops.pages.bulk_write.assert_awaited_once()
+    updates = page_ops.pages.bulk_write.call_args.args[0]
+    assert len(updates) == 4
+    assert page_ops.pages.bulk_write.call_args.kwargs == {"ordered": False}
+
+    page_ops.qa_histograms.update_one.assert_awaited_once_with(
+        {"_id": "qa-1"},
+        {
+            "$inc": {
+                "screenshotMatch.500": -1,
+                "screenshotMatch.250": 2,
+                "textMatch.900": 2,
+                "screenshotMatch.800": 1,
+            }
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_qa_pages_batch_partial_failure(page_ops: PageOps):
+    """Invalid pages are skipped, and when some updates of the bulk write
+    fail, histogram bin moves are applied for the updates that succeeded"""
+    page_ids = [uuid4(), uuid4()]
+
+    page_ops.pages.find = MagicMock(
+        return_value=AsyncCursor([{"_id": page_id} for page_id in page_ids])
+    )
+    page_ops.pages.insert_many = AsyncMock()
+    page_ops.pages.bulk_write = AsyncMock(
+        side_effect=pymongo.errors.BulkWriteError(
+            {"writeErrors": [{"index": 1, "code": 2}], "nMatched": 1}
+        )
+    )
+    page_ops.qa_histograms.update_one = AsyncMock()
+
+    def page_dict(page_id, screenshot):
+        return {
+            "id": str(page_id),
+            "url": "https://example.com/",
+            "comparison": {"screenshotMatch": screenshot},
+        }
+
+    summary = await page_ops.add_qa_pages_to_db(
+        [
+            page_dict(page_ids[0], 0.5),
+            page_dict(uuid4(), "not a score"),
+            page_dict(page_ids[1], 0.25),
+        ],
+        "crawl-1",
+        "qa-1",
+        uuid4(),
+    )
+
+    assert summary["invalid"] == 1
+    assert summary["updated"] == 1
+    page_ops.pages.insert_many.assert_not_awaited()
+    assert len(page_ops.pages.bulk_write.call_args.args[0]) == 2
+
+    page_ops.qa_histograms.update_one.assert_awaited_once_with(
+        {"_id": "qa-1"}, {"$inc": {"screenshotMatch.500": 1}}
+    )
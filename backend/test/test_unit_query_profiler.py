@@ -0,0 +1,137 @@
+"""Unit tests for slow query capture and index advice"""
+
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from btrixcloud.query_listener import SlowQueryListener
+from btrixcloud.query_profiler import (
+    QueryProfilerOps,
+    find_supporting_index,
+    get_command_query,
+    get_plan_summary,
+    get_query_shape,
+    get_suggested_index,
+)
+
+
+def get_event(request_id, command=None, duration_ms=0):
+    command = command or {}
+    return SimpleNamespace(
+        connection_id=("localhost", 27017),
+        request_id=request_id,
+        command_name=next(iter(command), "find"),
+        command=command,
+        duration_micros=duration_ms * 1000,
+    )
+
+
+def test_listener_keeps_only_slow_queries():
+    """Only profiled commands at or over the threshold are kept"""
+    listener = SlowQueryListener(slow_ms=100, sample_rate=1)
+
+    find = {"find": "crawls", "filter": {"oid": "x"}, "lsid": {}}
+    listener.started(get_event(1, find))
+    listener.succeeded(get_event(1, find, duration_ms=20))
+
+    listener.started(get_event(2, find))
+    listener.failed(get_event(2, find, duration_ms=150))
+
+    insert = {"insert": "crawls", "documents": []}
+    listener.started(get_event(3, insert))
+    listener.succeeded(get_event(3, insert, duration_ms=500))
+
+    assert list(listener.samples) == [(find, 150)]
+
+
+def test_query_shape_and_suggested_index():
+    """Values are removed from query shape, and index keys suggested with
+    equality, then sort, then range fields"""
+    command = {
+        "aggregate": "crawls",
+        "pipeline": [
+            {"$match": {"oid": "x", "state": {"$in": ["a"]}, "started": {"$gt": 1}}},
+            {"$sort": {"finished": -1}},
+            {"$skip": 10},
+        ],
+    }
+    query, sort = get_command_query(command)
+    shape = get_query_shape(query)
+    assert shape == {"oid": 1, "state": {"$in": 1}, "started": {"$gt": 1}}
+    assert sort == {"finished": -1}
+
+    keys, num_equality = get_suggested_index(shape, sort)
+    assert keys == [("oid", 1), ("state", 1), ("finished", -1), ("started", 1)]
+    assert num_equality == 2
+
+    assert get_suggested_index({"_id": 1, "oid": 1}, None) == ([], 0)
+    assert get_suggested_index({"$or": [{"a": 1}, {"b": 1}]}, None) == ([], 0)
+
+    indexes = {
+        "_id_": {"key": [("_id", 1)]},
+        "state_oid": {"key": [("state", 1), ("oid", 1), ("finished", -1)]},
+    }
+    assert find_supporting_index(keys[:3], 2, indexes) == "state_oid"
+    assert find_supporting_index(keys, 2, indexes) is None
+
+
+def test_plan_summary():
+    """Stages and indexes are read from find and aggregate explain output"""
+    find_explain = {
+        "queryPlanner": {
+            "winningPlan": {
+                "stage": "FETCH",
+                "inputStage": {"stage": "IXSCAN", "indexName": "oid_1"},
+            }
+        }
+    }
+    assert get_plan_summary(find_explain) == {
+        "stages": ["FETCH", "IXSCAN"],
+        "indexes": ["oid_1"],
+        "collScan": False,
+    }
+
+    agg_explain = {
+        "stages": [
+            {"$cursor": {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}},
+            {"$group": {}},
+        ]
+    }
+    assert get_plan_summary(agg_explain)["collScan"]
+
+
+@pytest.mark.asyncio
+async def test_flush_records_shape_and_explains_once():
+    """Slow queries are written without values, and each shape is explained
+    once, without session fields"""
+    listener = SlowQueryListener(slow_ms=100, sample_rate=1)
+    mdb = MagicMock()
+    mdb.command = AsyncMock(
+        return_value={"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+    )
+    ops = QueryProfilerOps(mdb, listener)
+    ops.slow_queries.insert_many = AsyncMock()
+
+    for oid in ("a", "b"):
+        command = {
+            "find": "crawls",
+            "filter": {"oid": oid},
+            "lsid": {"id": 1},
+            "$db": "browsertrixcloud",
+        }
+        listener.samples.append((command, 200.0))
+
+    assert await ops.flush() == 2
+
+    mdb.command.assert_awaited_once_with(
+        {
+            "explain": {"find": "crawls", "filter": {"oid": "a"}},
+            "verbosity": "queryPlanner",
+        }
+    )
+
+    docs = ops.slow_queries.insert_many.call_args.args[0]
+    assert docs[0]["shapeId"] == docs[1]["shapeId"]
+    assert docs[0]["filter"] == '{"oid": 1}'
+    assert docs[1]["plan"]["collScan"]
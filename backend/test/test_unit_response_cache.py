@@ -0,0 +1,75 @@
+"""Unit tests for the shared public response cache"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from btrixcloud.responsecache import ResponseCache
+
+
+class FakeCache:
+    """Minimal stand-in for the response_cache mongo collection"""
+
+    def __init__(self):
+        self.docs = {}
+
+    async def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = doc
+
+
+@pytest.fixture
+def cache():
+    mdb = MagicMock()
+    mdb.__getitem__.return_value = FakeCache()
+    return ResponseCache(mdb)
+
+
+@pytest.mark.asyncio
+async def test_response_rendered_once_then_cached(cache):
+    render = AsyncMock(return_value={"items": [1, 2]})
+
+    resp = await cache.get_response({}, ["coll", {"modified": "a"}], render)
+    assert resp.status_code == 200
+    assert resp.body == b'{"items":[1,2]}'
+    etag = resp.headers["etag"]
+
+    resp = await cache.get_response({}, ["coll", {"modified": "a"}], render)
+    assert resp.body == b'{"items":[1,2]}'
+    assert resp.headers["etag"] == etag
+    render.assert_awaited_once()
+
+    # collection changed, new etag and rendered again
+    resp = await cache.get_response({}, ["coll", {"modified": "b"}], render)
+    assert resp.headers["etag"] != etag
+    assert render.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_if_none_match_returns_not_modified(cache):
+    render = AsyncMock(return_value={"items": []})
+
+    resp = await cache.get_public_response({}, ["coll"], render)
+    etag = resp.headers["etag"]
+
+    resp = await cache.get_public_response(
+        {"if-none-match": f'"other", {etag}'}, ["coll"], render
+    )
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert resp.headers["access-control-allow-origin"] == "*"
+    render.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_cache_disabled_always_renders(cache):
+    cache.cache_secs = 0
+    render = AsyncMock(return_value={"items": []})
+
+    resp = await cache.get_response({}, ["coll"], render)
+    await cache.get_response({}, ["coll"], render)
+
+    assert "etag" not in resp.headers
+    assert render.await_count == 2
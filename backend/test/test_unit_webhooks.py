@@ -0,0 +1,190 @@
+"""Unit tests for queued webhook delivery"""
+
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import aiohttp
+import pytest
+
+from btrixcloud import webhooks
+from btrixcloud.models import (
+    CrawlStartedBody,
+    Organization,
+    OrgWebhookUrls,
+    StorageRef,
+    WebhookNotification,
+)
+from btrixcloud.utils import dt_now
+from btrixcloud.webhooks import WEBHOOK_MAX_ATTEMPTS, EventWebhookOps
+
+URL = "https://example.com/hook"
+
+
+class FakeResponse:
+    def __init__(self, error=None):
+        self.error = error
+
+    async def __aenter__(self):
+        if self.error:
+            raise self.error
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+def make_org(url=URL):
+    return Organization(
+        id=uuid.uuid4(),
+        name="Test Org",
+        slug="test-org",
+        storage=StorageRef(name="default"),
+        webhookUrls=OrgWebhookUrls(crawlStarted=url) if url else None,
+    )
+
+
+def make_notification(org, attempts=0):
+    return WebhookNotification(
+        id=uuid.uuid4(),
+        event="crawlStarted",
+        oid=org.id,
+        body=CrawlStartedBody(itemId="crawl", orgId=str(org.id)),
+        created=dt_now(),
+        attempts=attempts,
+    )
+
+
+@pytest.fixture
+def ops():
+    coll = MagicMock()
+    for method in ("insert_one", "update_one", "update_many", "find_one_and_update"):
+        setattr(coll, method, AsyncMock())
+
+    mdb = MagicMock()
+    mdb.__getitem__ = MagicMock(return_value=coll)
+
+    ops = EventWebhookOps(mdb, MagicMock())
+    ops.org_ops.get_org_by_id = AsyncMock()
+
+    # don't start dispatch loop
+    ops.dispatcher.task = MagicMock()
+    ops.dispatcher.task.done.return_value = False
+
+    session = MagicMock()
+    session.post = MagicMock(return_value=FakeResponse())
+    ops.dispatcher._get_session = MagicMock(return_value=session)
+    return ops
+
+
+def queue(ops, org, notifications):
+    ops.org_ops.get_org_by_id.return_value = org
+    ops.webhooks.find_one_and_update.side_effect = [
+        item.to_dict() for item in notifications
+    ] + [None]
+
+
+@pytest.mark.asyncio
+async def test_add_notification_queued_only_with_url(ops):
+    org = make_org(url=None)
+    await ops._add_notification(org, make_notification(org))
+    assert ops.webhooks.insert_one.call_args.args[0]["nextAttempt"] is None
+    assert not ops.dispatcher.event.is_set()
+
+    org = make_org()
+    await ops._add_notification(org, make_notification(org))
+    assert ops.webhooks.insert_one.call_args.args[0]["nextAttempt"]
+    assert ops.dispatcher.event.is_set()
+
+
+@pytest.mark.asyncio
+async def test_dispatch_success(ops):
+    org = make_org()
+    notifications = [make_notification(org), make_notification(org)]
+    queue(ops, org, notifications)
+
+    assert await ops.dispatcher.dispatch_batch() == 2
+
+    session = ops.dispatcher._get_session()
+    assert session.post.call_count == 2
+    assert session.post.call_args.args[0] == URL
+    assert session.post.call_args.kwargs["json"]["itemId"] == "crawl"
+    # org looked up once for both notifications
+    ops.org_ops.get_org_by_id.assert_awaited_once()
+
+    query, update = ops.webhooks.update_many.call_args.args
+    assert query == {"_id": {"$in": [notifications[1].id]}}
+    assert update["$set"]["success"] is True
+    assert update["$set"]["nextAttempt"] is None
+
+
+@pytest.mark.asyncio
+async def test_dispatch_failure_retried_with_backoff(ops):
+    org = make_org()
+    ops.dispatcher._get_session().post.return_value = FakeResponse(
+        aiohttp.ClientError()
+    )
+
+    queue(ops, org, [make_notification(org)])
+    await ops.dispatcher.dispatch_batch()
+
+    update = ops.webhooks.update_one.call_args.args[1]
+    assert update["$inc"] == {"attempts": 1}
+    next_attempt = update["$set"]["nextAttempt"]
+    assert 25 < (next_attempt - dt_now()).total_seconds() <= 30
+    ops.webhooks.update_many.assert_not_awaited()
+
+    queue(ops, org, [make_notification(org, attempts=WEBHOOK_MAX_ATTEMPTS - 1)])
+    await ops.dispatcher.dispatch_batch()
+    assert ops.webhooks.update_one.call_args.args[1]["$set"]["nextAttempt"] is None
+
+
+@pytest.mark.asyncio
+async def test_dispatch_batches_same_url(ops, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_BATCH_SIZE", 2)
+    org = make_org()
+    notifications = [make_notification(org) for _ in range(3)]
+    queue(ops, org, notifications)
+
+    await ops.dispatcher.dispatch_batch()
+
+    session = ops.dispatcher._get_session()
+    bodies = [call.kwargs["json"] for call in session.post.call_args_list]
+    assert [len(body) for body in bodies] == [2, 1]
+    assert ops.webhooks.update_many.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_dispatch_stops_at_first_failure_for_url(ops):
+    """Later notifications for a url are not sent after a failure, and are
+    retried after the failed one"""
+    org = make_org()
+    session = ops.dispatcher._get_session()
+    session.post.return_value = FakeResponse(aiohttp.ClientError())
+
+    notifications = [make_notification(org) for _ in range(3)]
+    queue(ops, org, notifications)
+    await ops.dispatcher.dispatch_batch()
+
+    assert session.post.call_count == 1
+    retry_at = ops.webhooks.update_one.call_args.args[1]["$set"]["nextAttempt"]
+    query, update = ops.webhooks.update_many.call_args.args
+    assert query == {"_id": {"$in": [item.id for item in notifications[1:]]}}
+    assert update == {"$set": {"nextAttempt": retry_at}}
+
+
+@pytest.mark.asyncio
+async def test_dispatch_extends_lease(ops, monkeypatch):
+    """Lease of undelivered notifications is extended before it expires"""
+    monkeypatch.setattr(webhooks, "WEBHOOK_LEASE_SECS", 0)
+    org = make_org()
+    notifications = [make_notification(org) for _ in range(2)]
+    queue(ops, org, notifications)
+
+    await ops.dispatcher.dispatch_batch()
+
+    leases = [
+        call.args[0]["_id"]["$in"]
+        for call in ops.webhooks.update_many.call_args_list
+        if "success" not in call.args[1]["$set"]
+    ]
+    assert leases == [[item.id for item in notifications], [notifications[1].id]]
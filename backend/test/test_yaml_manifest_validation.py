@@ -380,6 +380,38 @@ def test_cron_job_schedule_renders_as_single_document():
     assert docs[0]["spec"]["schedule"] == "0 0 * * *"
 
 
+def test_rendered_objects_cached_per_owner_until_params_change(monkeypatch):
+    holder = _TemplateHolder()
+    holder.rendered = {}
+
+    env = holder.k8s.templates.env
+    rendered = []
+    get_template = env.get_template
+    monkeypatch.setattr(
+        env,
+        "get_template",
+        lambda name: rendered.append(name) or get_template(name),
+    )
+
+    params = {"id": "cron1", "name": "cron1", "schedule": "0 0 * * *"}
+    docs = BaseOperator.load_from_yaml(holder, "crawl_cron_job.yaml", params, "c1")
+    again = BaseOperator.load_from_yaml(
+        holder, "crawl_cron_job.yaml", dict(params), "c1"
+    )
+
+    assert again == docs
+    assert again[0] is docs[0]
+    assert len(rendered) == 1
+
+    params["schedule"] = "0 1 * * *"
+    docs = BaseOperator.load_from_yaml(holder, "crawl_cron_job.yaml", params, "c1")
+    assert docs[0]["spec"]["schedule"] == "0 1 * * *"
+    assert len(rendered) == 2
+
+    BaseOperator.clear_rendered(holder, "c1")
+    assert not holder.rendered
+
+
 # --- yaml-safe rendering of template values ---------------------------------
 
 